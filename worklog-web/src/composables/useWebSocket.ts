@@ -123,6 +123,15 @@ export function useWebSocket() {
     }))
   }
 
+  // 服务端推送的未读数量为准，覆盖本地累加的计数
+  const handleUnreadCountEvent = (event: Event) => {
+    const customEvent = event as CustomEvent
+    unreadCount.value = customEvent.detail.unread_count ?? 0
+    window.dispatchEvent(new CustomEvent('message-count-updated', { 
+      detail: { count: unreadCount.value } 
+    }))
+  }
+
   // 事件处理函数
   const handleNewMessageEvent = (event: Event) => {
     const customEvent = event as CustomEvent
@@ -173,6 +182,7 @@ export function useWebSocket() {
     wsService.on('team_notification', handleTeamNotification)
 
     // 监听自定义事件
+    window.addEventListener('unread-count', handleUnreadCountEvent)
     window.addEventListener('new-message', handleNewMessageEvent)
     window.addEventListener('task-update', handleTaskUpdateEvent)
     window.addEventListener('team-notification', handleTeamNotificationEvent)
@@ -240,6 +250,7 @@ export function useWebSocket() {
   // 组件卸载时清理
   onUnmounted(() => {
     // 移除事件监听器
+    window.removeEventListener('unread-count', handleUnreadCountEvent)
     window.removeEventListener('new-message', handleNewMessageEvent)
     window.removeEventListener('task-update', handleTaskUpdateEvent)
     window.removeEventListener('team-notification', handleTeamNotificationEvent)
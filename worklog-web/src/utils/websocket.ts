@@ -6,6 +6,7 @@ export interface WebSocketMessage {
   timestamp?: number
   message?: string
   status?: string
+  idle?: boolean
 }
 
 export interface MessageNotification {
@@ -29,6 +30,8 @@ class WebSocketService {
   private heartbeatInterval: number | null = null
   private isConnecting = false
   private messageHandlers: Map<string, (data: any) => void> = new Map()
+  // 最后收到的消息id，重连时带给服务端用于补发断线期间的消息
+  private lastSeenId: number | null = null
 
   // 事件回调
   private onConnectCallback: (() => void) | null = null
@@ -40,6 +43,13 @@ class WebSocketService {
     window.addEventListener('beforeunload', () => {
       this.disconnect()
     })
+
+    // 页面切换到后台或回到前台时立即上报，团队成员看到的在线状态随之变化
+    document.addEventListener('visibilitychange', () => {
+      if (this.isConnected()) {
+        this.sendHeartbeat()
+      }
+    })
   }
 
   /**
@@ -61,7 +71,10 @@ class WebSocketService {
     }
 
     try {
-      const wsUrl = `${import.meta.env.VITE_WS_URL || 'ws://localhost:8000'}/api/v1/ws/messages/?token=${token}`
+      let wsUrl = `${import.meta.env.VITE_WS_URL || 'ws://localhost:8000'}/api/v1/ws/messages/?token=${token}`
+      if (this.lastSeenId !== null) {
+        wsUrl += `&last_seen_id=${this.lastSeenId}`
+      }
       this.ws = new WebSocket(wsUrl)
 
       this.ws.onopen = () => {
@@ -106,6 +119,8 @@ class WebSocketService {
    */
   disconnect(): void {
     this.stopHeartbeat()
+    // 主动断开（如退出登录）后不再补发
+    this.lastSeenId = null
     if (this.ws) {
       this.ws.close(1000, '主动断开连接')
       this.ws = null
@@ -129,7 +144,8 @@ class WebSocketService {
   private sendHeartbeat(): void {
     this.send({
       type: 'heartbeat',
-      timestamp: Date.now()
+      timestamp: Date.now(),
+      idle: document.hidden
     })
   }
 
@@ -165,6 +181,32 @@ class WebSocketService {
         return
       }
 
+      // 记录最后收到的消息id
+      const messageId = (message as any).message_id
+      if (typeof messageId === 'number' && (this.lastSeenId === null || messageId > this.lastSeenId)) {
+        this.lastSeenId = messageId
+      }
+
+      // 补发结束；补发数量超过上限时需要重新拉取消息列表
+      if (message.type === 'replay_complete') {
+        if ((message as any).truncated) {
+          window.dispatchEvent(new CustomEvent('messages-refresh', { detail: message }))
+        }
+        return
+      }
+
+      // 处理未读数量（服务端在连接建立和计数变化时推送）
+      if (message.type === 'unread_count') {
+        window.dispatchEvent(new CustomEvent('unread-count', { detail: message }))
+        return
+      }
+
+      // 处理团队成员在线状态变化
+      if (message.type === 'presence') {
+        window.dispatchEvent(new CustomEvent('presence-update', { detail: message }))
+        return
+      }
+
       // 处理新消息通知
       if (message.type === 'new_message') {
         this.handleNewMessage(message.data)
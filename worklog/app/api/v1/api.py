@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import users, work_logs, reminders, templates, team, project, tasks, messages, ws
+from app.api.v1.endpoints import users, work_logs, reminders, templates, team, project, tasks, messages, ws, analytics, search
 
 api_router = APIRouter()
 
@@ -11,4 +11,6 @@ api_router.include_router(team.router, prefix="/teams", tags=["teams"])
 api_router.include_router(project.router, prefix="/projects", tags=["projects"])
 api_router.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
 api_router.include_router(messages.router, prefix="/messages", tags=["messages"])
-api_router.include_router(ws.router, tags=["websocket"]) 
\ No newline at end of file
+api_router.include_router(ws.router, tags=["websocket"])
+api_router.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
+api_router.include_router(search.router, prefix="/search", tags=["search"])
@@ -1,12 +1,11 @@
 from typing import Generator
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
 from sqlalchemy.orm import Session
 import logging
 
 from app.core.config import settings
-from app.core.security import ALGORITHM
+from app.core import user_cache
 from app.db.session import SessionLocal
 from app.models.user import User
 
@@ -46,17 +45,7 @@ def get_current_user(
         detail="无效的认证凭据",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[ALGORITHM]
-        )
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-        
-    user = db.query(User).filter(User.username == username).first()
+    user = user_cache.get_user_from_token(db, token)
     if user is None:
         raise credentials_exception
     return user 
\ No newline at end of file
@@ -0,0 +1,93 @@
+from typing import Any, Dict, List, Optional
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+
+from app.core.security import get_current_user
+from app.core.membership import membership_service
+from app.core import timesheet
+from app.core.work_hours_cube import parse_dimensions, work_hours_cube
+from app.db.session import get_db
+from app.models.user import User
+from app.schemas.analytics import CubeResponse, TimesheetResponse
+
+router = APIRouter()
+
+def _check_team_admin(db: Session, user: User, team_id: int):
+    if not membership_service.is_member(db, user.id, team_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="您不是该团队成员"
+        )
+    if not membership_service.is_admin(db, user.id, team_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="只有团队管理员可以查看团队工时统计"
+        )
+
+def _parse_ids(value: str) -> List[int]:
+    try:
+        return [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise ValueError(f"ID格式错误: {value}")
+
+@router.get("/timesheet", response_model=TimesheetResponse)
+def get_timesheet(
+    *,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    team_id: int = Query(..., description="团队ID"),
+    start_date: date = Query(..., alias="from", description="开始日期（含）"),
+    end_date: date = Query(..., alias="to", description="结束日期（含）"),
+    group_by: str = Query("user,day", description="分组维度，逗号分隔：user,project,work_type,day")
+) -> Any:
+    """
+    团队工时表
+    按分组维度返回工时和日志条数矩阵，可直接用于周/月透视表；仅团队管理员可查看
+    """
+    _check_team_admin(db, current_user, team_id)
+    
+    try:
+        return timesheet.build_timesheet(db, team_id, start_date, end_date, group_by)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/cube", response_model=CubeResponse)
+def query_work_hours_cube(
+    *,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    team_id: int = Query(..., description="团队ID"),
+    start_date: date = Query(..., alias="from", description="开始日期（含），按粒度对齐到周期开始"),
+    end_date: date = Query(..., alias="to", description="结束日期（含）"),
+    grain: str = Query("week", description="粒度：week / month，day 为按天下钻"),
+    group_by: str = Query("period", description="保留的维度，逗号分隔：period,project,user,work_type,task"),
+    project: Optional[str] = Query(None, description="项目ID，逗号分隔，0 表示无项目"),
+    user: Optional[str] = Query(None, description="用户ID，逗号分隔"),
+    work_type: Optional[str] = Query(None, description="工作类型，逗号分隔"),
+    task: Optional[str] = Query(None, description="任务ID，逗号分隔，0 表示无任务")
+) -> Any:
+    """
+    工时立方体查询
+    按 group_by 上卷，project/user/work_type/task 过滤做切片或切块；仅团队管理员可查看
+    """
+    _check_team_admin(db, current_user, team_id)
+    
+    try:
+        filters: Dict[str, list] = {}
+        for dim, value in (("project", project), ("user", user), ("task", task)):
+            if value:
+                filters[dim] = _parse_ids(value)
+        if work_type:
+            filters["work_type"] = [item.strip() for item in work_type.split(",") if item.strip()]
+        return work_hours_cube.query(
+            db, team_id, grain, start_date, end_date, parse_dimensions(group_by), filters
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
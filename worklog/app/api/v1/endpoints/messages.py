@@ -1,5 +1,5 @@
 from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 
 from app.core.security import get_current_user
@@ -16,8 +16,10 @@ from app.schemas.message import (
     MessageStats
 )
 from app.crud.message import message_crud, message_template_crud
-from app.core.ws_manager import ws_manager
-from app.core.message_service import message_push_service
+from app.core.membership import membership_service
+from app.core.presence import OFFLINE, presence_service
+from app.core.notification_outbox import notification_outbox
+from app.core.pagination import decode_cursor
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,16 +28,36 @@ router = APIRouter()
 # 消息相关端点
 @router.get("/", response_model=List[MessageResponse])
 def read_messages(
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     skip: int = 0,
     limit: int = 50,
     unread_only: bool = Query(False, description="只获取未读消息"),
-    message_type: Optional[str] = Query(None, description="消息类型过滤")
+    message_type: Optional[str] = Query(None, description="消息类型过滤"),
+    cursor: Optional[str] = Query(None, description="分页游标，传空字符串获取第一页并启用游标分页")
 ) -> Any:
     """
     获取用户消息列表
+    游标模式下，下一页游标通过响应头 X-Next-Cursor 返回，保持列表响应格式不变
     """
+    if cursor is not None:
+        try:
+            cursor_key = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
+        messages, next_cursor = message_crud.get_by_receiver_after(
+            db=db,
+            receiver_id=current_user.id,
+            cursor_key=cursor_key,
+            limit=limit,
+            unread_only=unread_only,
+            message_type=message_type
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return messages
+    
     messages = message_crud.get_by_receiver(
         db=db,
         receiver_id=current_user.id,
@@ -68,6 +90,41 @@ def get_unread_count(
     count = message_crud.get_unread_count(db=db, user_id=current_user.id)
     return {"unread_count": count}
 
+# WebSocket连接状态，必须在 /{message_id} 之前注册
+@router.get("/connection-status")
+def get_connection_status(
+    *,
+    db: Session = Depends(get_db),
+    team_id: Optional[int] = Query(None, description="传入时返回该团队成员的在线状态"),
+    current_user: User = Depends(get_current_user)
+) -> dict:
+    """
+    获取用户WebSocket连接状态和在线状态（online/idle/offline）
+    之后的状态变化通过WebSocket的 presence 消息推送给团队成员
+    """
+    # 连接可能在其他进程上，状态和在线用户来自共享的在线状态存储
+    user_status = presence_service.get_status(current_user.id)
+    connected_users = presence_service.connected_users()
+    
+    result = {
+        "is_connected": user_status != OFFLINE,
+        "status": user_status,
+        "connected_users_count": len(connected_users),
+        "connected_users": connected_users
+    }
+    if team_id is not None:
+        if not membership_service.is_member(db, current_user.id, team_id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="您不是该团队的成员，无法查看成员在线状态"
+            )
+        member_ids = membership_service.get_team_member_ids(db, team_id)
+        result["team_presence"] = [
+            {"user_id": user_id, "status": user_status}
+            for user_id, user_status in presence_service.get_statuses(member_ids).items()
+        ]
+    return result
+
 @router.get("/{message_id}", response_model=MessageResponse)
 def read_message(
     *,
@@ -78,8 +135,8 @@ def read_message(
     """
     获取指定消息
     """
-    message = message_crud.get(db=db, message_id=message_id)
-    if not message or current_user.id not in message.recipients:
+    message = message_crud.get_for_receiver(db=db, message_id=message_id, user_id=current_user.id)
+    if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="消息不存在"
@@ -245,22 +302,7 @@ def delete_message_template(
         )
     return template
 
-# WebSocket连接状态和测试功能
-@router.get("/connection-status")
-def get_connection_status(
-    *,
-    current_user: User = Depends(get_current_user)
-) -> dict:
-    """获取用户WebSocket连接状态"""
-    is_connected = ws_manager.is_user_connected(current_user.id)
-    connected_users = ws_manager.get_connected_users()
-    
-    return {
-        "is_connected": is_connected,
-        "connected_users_count": len(connected_users),
-        "connected_users": connected_users
-    }
-
+# WebSocket测试功能
 @router.post("/test-notification")
 def send_test_notification(
     *,
@@ -269,34 +311,15 @@ def send_test_notification(
 ) -> dict:
     """发送测试通知（仅用于开发测试）"""
     try:
-        # 使用后台任务发送通知，避免阻塞
-        import threading
-        
-        def send_test_notification():
-            try:
-                import asyncio
-                # 创建新的事件循环
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(
-                    message_push_service.send_system_notification(
-                        db=db,
-                        title="测试通知",
-                        content="这是一条测试通知消息",
-                        recipients=[current_user.id],
-                        notification_type="test"
-                    )
-                )
-                loop.close()
-            except Exception as e:
-                logger.error(f"后台发送测试通知失败: {e}")
-        
-        # 在后台线程中执行
-        thread = threading.Thread(target=send_test_notification)
-        thread.daemon = True
-        thread.start()
+        notification_outbox.publish(
+            "send_system_notification",
+            title="测试通知",
+            content="这是一条测试通知消息",
+            recipients=[current_user.id],
+            notification_type="test"
+        )
         
-        return {"message": "测试通知已启动后台发送"}
+        return {"message": "测试通知已加入发送队列"}
     except Exception as e:
         logger.error(f"发送测试通知失败: {e}")
         raise HTTPException(
@@ -5,8 +5,8 @@ from app.api.v1.deps import get_db, get_current_user
 from app.crud import project as project_crud
 from app.schemas.project import ProjectCreate, ProjectUpdate, ProjectResponse
 from app.models.user import User
-from app.models.team_member import TeamMember
-from app.core.message_service import message_push_service
+from app.core.notification_outbox import notification_outbox
+from app.core.membership import membership_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,10 +23,7 @@ def create_project(
     创建项目
     """
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == project_in.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, project_in.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -36,29 +33,7 @@ def create_project(
     project = project_crud.create_project(db=db, project_in=project_in, creator_id=current_user.id)
     
     # 发送项目创建通知
-    try:
-        # 使用后台任务发送通知，避免阻塞
-        import threading
-        
-        def send_project_notification():
-            try:
-                import asyncio
-                # 创建新的事件循环
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(message_push_service.notify_project_created(db, project))
-                loop.close()
-            except Exception as e:
-                logger.error(f"后台发送项目创建通知失败: {e}")
-        
-        # 在后台线程中执行
-        thread = threading.Thread(target=send_project_notification)
-        thread.daemon = True
-        thread.start()
-        logger.info(f"已启动后台任务发送项目创建通知：project_id={project.id}")
-    except Exception as e:
-        logger.error(f"发送项目创建通知失败: {e}")
-        # 不影响项目创建，只记录错误
+    notification_outbox.publish("notify_project_created", project, current_user.id)
     
     return project
 
@@ -99,10 +74,7 @@ def get_project(
         )
     
     # 检查用户是否有权限查看项目
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == project.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, project.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -132,12 +104,7 @@ def update_project(
     # 检查用户是否有权限编辑项目
     if project.creator_id != current_user.id:
         # 检查是否是团队管理员
-        member = db.query(TeamMember).filter(
-            TeamMember.team_id == project.team_id,
-            TeamMember.user_id == current_user.id,
-            TeamMember.role == "team_admin"
-        ).first()
-        if not member:
+        if not membership_service.is_admin(db, current_user.id, project.team_id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="您没有权限编辑该项目"
@@ -166,12 +133,7 @@ def delete_project(
     # 检查用户是否有权限删除项目
     if project.creator_id != current_user.id:
         # 检查是否是团队管理员
-        member = db.query(TeamMember).filter(
-            TeamMember.team_id == project.team_id,
-            TeamMember.user_id == current_user.id,
-            TeamMember.role == "team_admin"
-        ).first()
-        if not member:
+        if not membership_service.is_admin(db, current_user.id, project.team_id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="您没有权限删除该项目"
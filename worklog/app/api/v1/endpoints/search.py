@@ -0,0 +1,45 @@
+from typing import Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+
+from app.core.security import get_current_user
+from app.core.membership import membership_service
+from app.core import search as search_index
+from app.db.session import get_db
+from app.models.user import User
+from app.schemas.search import SearchResponse
+
+router = APIRouter()
+
+@router.get("", response_model=SearchResponse)
+def search(
+    *,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    q: str = Query(..., min_length=1, max_length=100, description="搜索关键词，多个词用空格分隔，需全部命中"),
+    types: Optional[str] = Query(None, description="搜索类型，逗号分隔：task,work_log,comment，默认全部"),
+    team_id: Optional[int] = Query(None, description="只搜索该团队"),
+    limit: int = Query(20, ge=1, le=100, description="返回数量"),
+    offset: int = Query(0, ge=0, le=1000, description="偏移量")
+) -> Any:
+    """
+    全文搜索任务、工作日志和任务评论，按相关度排序
+    范围为所在团队的内容及自己的个人工作日志
+    """
+    if team_id is not None and not membership_service.is_member(db, current_user.id, team_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="您不是该团队成员"
+        )
+    
+    try:
+        doc_types = search_index.parse_doc_types(types)
+        return search_index.search(
+            db, current_user.id, membership_service.team_ids(db, current_user.id), q,
+            doc_types=doc_types, team_id=team_id, limit=limit, offset=offset
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
@@ -1,7 +1,7 @@
 from typing import Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Form
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc, asc, case
+from sqlalchemy import or_, func, desc, asc, case
 from datetime import datetime, timedelta
 import json
 import os
@@ -12,19 +12,26 @@ import logging
 from app.api.v1.deps import get_db, get_current_user
 from app.models.user import User
 from app.models.team import Team
-from app.models.team_member import TeamMember
 from app.models.task import Task, TaskDependency, TaskComment, TaskAttachment, TaskStatus, TaskPriority, TaskType
 from app.models.work_log import WorkLog, WorkLogType
 from app.models.enums import TEAM_ADMIN, TEAM_MEMBER
 from app.schemas.task import (
     TaskCreate, TaskUpdate, TaskResponse, TaskListResponse,
     TaskCommentBase, TaskCommentResponse,
-    TaskStatistics, TaskFilter, TaskQuickCreate
+    TaskStatistics, TeamTaskStatistics, TaskFilter, TaskQuickCreate,
+    TaskDependencyCreate, TaskDependencyGraph, TaskDependencyList, CriticalPathResponse,
+    TaskTreeNode, ProjectTaskTree
 )
 from app.models.project import Project
-from app.crud import task_log
+from app.crud import task_log, task_statistics, task_tree
+from app.crud.task_relations import load_task_relations
 from app.models.task_log import TaskLog
-from app.core.message_service import message_push_service
+from app.core.notification_outbox import notification_outbox
+from app.core.pagination import decode_cursor, apply_keyset, split_page
+from app.core.membership import membership_service
+from app.core.task_graph import task_graph_service
+from app.core import search as search_index
+from app.core import tags as tag_index
 
 logger = logging.getLogger(__name__)
 
@@ -44,15 +51,13 @@ def create_task_quick(
     team_id = task_in.team_id
     if not team_id:
         # 如果没有指定团队，使用用户的第一个团队
-        member = db.query(TeamMember).filter(
-            TeamMember.user_id == current_user.id
-        ).first()
-        if not member:
+        user_team_ids = membership_service.team_ids(db, current_user.id)
+        if not user_team_ids:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="您还没有加入任何团队，请先加入团队"
             )
-        team_id = member.team_id
+        team_id = min(user_team_ids)
         logger.info(f"使用用户默认团队：team_id={team_id}")
     
     # 检查团队是否存在且用户是团队成员
@@ -65,10 +70,7 @@ def create_task_quick(
         )
 
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, team_id)
     if not member:
         logger.error(f"用户不是团队成员：user_id={current_user.id}, team_id={team_id}")
         raise HTTPException(
@@ -120,49 +122,10 @@ def create_task_quick(
         # 不影响任务创建，只记录错误
     
     # 加载关联信息
-    task.creator = current_user
-    if task.assignee_id:
-        task.assignee = db.query(User).filter(User.id == task.assignee_id).first()
-        logger.info(f"已加载负责人信息：assignee_id={task.assignee_id}, username={task.assignee.username if task.assignee else None}")
-    task.comments = []
-    task.comment_count = 0
+    load_task_relations(db, [task], known_users=[current_user])
 
     # 发送任务创建通知
-    try:
-        # 直接发送通知，不使用后台线程
-        from app.core.message_service import message_push_service
-        import asyncio
-
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_task_created(db, task, current_user.id)
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_task_created(db, task, current_user.id)
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_task_created(db, task, current_user.id)
-                )
-            finally:
-                loop.close()
-
-        logger.info(f"已发送任务创建通知：task_id={task.id}")
-    except Exception as e:
-        logger.error(f"发送任务创建通知失败: {e}")
-        # 不影响任务创建，只记录错误
+    notification_outbox.publish("notify_task_created", task, current_user.id)
     
     return TaskResponse.from_orm(task)
 
@@ -185,10 +148,7 @@ def create_task(
         )
 
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task_in.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task_in.team_id)
     if not member:
         logger.error(f"用户不是团队成员：user_id={current_user.id}, team_id={task_in.team_id}")
         raise HTTPException(
@@ -211,10 +171,7 @@ def create_task(
 
     # 如果指定了负责人，检查负责人是否是团队成员
     if task_in.assignee_id:
-        assignee_member = db.query(TeamMember).filter(
-            TeamMember.team_id == task_in.team_id,
-            TeamMember.user_id == task_in.assignee_id
-        ).first()
+        assignee_member = membership_service.get_membership(db, task_in.assignee_id, task_in.team_id)
         if not assignee_member:
             logger.error(f"指定的负责人不是团队成员：assignee_id={task_in.assignee_id}, team_id={task_in.team_id}")
             raise HTTPException(
@@ -255,49 +212,10 @@ def create_task(
         # 不影响任务创建，只记录错误
     
     # 加载关联信息
-    task.creator = current_user
-    if task.assignee_id:
-        task.assignee = db.query(User).filter(User.id == task.assignee_id).first()
-        logger.info(f"已加载负责人信息：assignee_id={task.assignee_id}, username={task.assignee.username if task.assignee else None}")
-    task.comments = []
-    task.comment_count = 0
+    load_task_relations(db, [task], known_users=[current_user])
 
     # 发送任务创建通知
-    try:
-        # 直接发送通知，不使用后台线程
-        from app.core.message_service import message_push_service
-        import asyncio
-
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_task_created(db, task, current_user.id)
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_task_created(db, task, current_user.id)
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_task_created(db, task, current_user.id)
-                )
-            finally:
-                loop.close()
-
-        logger.info(f"已发送任务创建通知：task_id={task.id}")
-    except Exception as e:
-        logger.error(f"发送任务创建通知失败: {e}")
-        # 不影响任务创建，只记录错误
+    notification_outbox.publish("notify_task_created", task, current_user.id)
     
     return TaskResponse.from_orm(task)
 
@@ -312,22 +230,28 @@ def get_tasks(
     priority: Optional[str] = Query(None, description="任务优先级"),
     assignee_id: Optional[int] = Query(None, description="负责人ID"),
     search: Optional[str] = Query(None, description="搜索关键词"),
+    tags: Optional[str] = Query(None, description="标签，逗号分隔，需全部包含"),
     page: int = Query(1, ge=1, description="页码"),
-    page_size: int = Query(20, ge=1, le=100, description="每页数量")
+    page_size: int = Query(20, ge=1, le=100, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="分页游标，传空字符串获取第一页并启用游标分页"),
+    include_total: Optional[bool] = Query(None, description="是否统计总数，游标模式下默认不统计")
 ) -> Any:
     """获取任务列表"""
+    # 参数名status遮蔽了fastapi.status，这里直接使用状态码
+    try:
+        cursor_key = decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    
     # 构建查询
     query = db.query(Task).filter(Task.is_deleted == False)
     
     # 如果指定了团队ID，检查用户是否是团队成员
     if team_id:
-        member = db.query(TeamMember).filter(
-            TeamMember.team_id == team_id,
-            TeamMember.user_id == current_user.id
-        ).first()
+        member = membership_service.get_membership(db, current_user.id, team_id)
         if not member:
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
+                status_code=403,
                 detail="您不是该团队成员"
             )
         query = query.filter(Task.team_id == team_id)
@@ -337,26 +261,12 @@ def get_tasks(
             query = query.filter(Task.assignee_id == current_user.id)
     else:
         # 如果没有指定团队，只查询用户所在团队的任务
-        user_teams = db.query(TeamMember.team_id).filter(
-            TeamMember.user_id == current_user.id
-        ).subquery()
-        query = query.filter(Task.team_id.in_(user_teams))
-        
-        # 添加调试日志
-        logger.info(f"用户ID {current_user.id} 所在的团队查询")
-        user_team_list = db.query(TeamMember.team_id).filter(
-            TeamMember.user_id == current_user.id
-        ).all()
-        logger.info(f"用户所在团队: {[t[0] for t in user_team_list]}")
-        
-        # 检查用户是否是团队管理员
-        user_admin_teams = db.query(TeamMember.team_id).filter(
-            TeamMember.user_id == current_user.id,
-            TeamMember.role == TEAM_ADMIN
-        ).subquery()
+        user_team_ids = membership_service.team_ids(db, current_user.id)
+        query = query.filter(Task.team_id.in_(user_team_ids))
+        logger.info(f"用户ID {current_user.id} 所在团队: {user_team_ids}")
         
         # 如果用户不是任何团队的管理员，只能查看自己的任务
-        admin_teams_count = db.query(user_admin_teams).count()
+        admin_teams_count = len(membership_service.admin_team_ids(db, current_user.id))
         logger.info(f"用户是管理员的团队数量: {admin_teams_count}")
         
         if admin_teams_count == 0:
@@ -370,18 +280,15 @@ def get_tasks(
         project = db.query(Project).filter(Project.id == project_id).first()
         if not project:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
+                status_code=404,
                 detail="项目不存在"
             )
         
         # 检查用户是否是项目所属团队的成员
-        member = db.query(TeamMember).filter(
-            TeamMember.team_id == project.team_id,
-            TeamMember.user_id == current_user.id
-        ).first()
+        member = membership_service.get_membership(db, current_user.id, project.team_id)
         if not member:
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
+                status_code=403,
                 detail="您没有权限访问该项目"
             )
         
@@ -400,49 +307,49 @@ def get_tasks(
         # 直接使用assignee_id，不再需要特殊处理'me'
         query = query.filter(Task.assignee_id == assignee_id)
     if search:
-        search_filter = or_(
-            Task.title.contains(search),
-            Task.description.contains(search)
-        )
-        query = query.filter(search_filter)
-    
-    # 计算总数
-    total = query.count()
+        # 通过全文索引匹配，关键词中没有可检索的文字（如只有标点）时退回子串匹配
+        matched_ids = search_index.matching_doc_ids(db.connection(), "task", search)
+        if matched_ids is not None:
+            query = query.filter(Task.id.in_(matched_ids))
+        else:
+            query = query.filter(or_(
+                Task.title.contains(search),
+                Task.description.contains(search)
+            ))
+    if tags:
+        query = tag_index.filter_by_tags(db, query, "task", tags)
+    
+    # 计算总数，游标模式下只在显式要求时统计
+    if include_total is None:
+        include_total = cursor is None
+    total = query.count() if include_total else None
     
     # 分页
-    tasks = query.order_by(desc(Task.created_at)).offset((page - 1) * page_size).limit(page_size).all()
+    next_cursor = None
+    if cursor is not None:
+        tasks = apply_keyset(query, Task.created_at, Task.id, cursor_key, page_size).all()
+        tasks, next_cursor = split_page(tasks, page_size, lambda t: t.created_at, lambda t: t.id)
+    else:
+        tasks = query.order_by(desc(Task.created_at)).offset((page - 1) * page_size).limit(page_size).all()
     
     # 添加调试日志
     logger.info(f"查询到 {len(tasks)} 个任务，总数: {total}")
     for task in tasks:
         logger.info(f"任务ID: {task.id}, 标题: {task.title}, 团队: {task.team_id}, 状态: {task.status}, 负责人: {task.assignee_id}, 创建者: {task.creator_id}")
     
-    # 加载关联数据
-    for task in tasks:
-        # 加载创建者信息
-        task.creator = db.query(User).filter(User.id == task.creator_id).first()
-        
-        # 加载负责人信息
-        if task.assignee_id:
-            task.assignee = db.query(User).filter(User.id == task.assignee_id).first()
-        
-        # 加载项目信息
-        if task.project_id:
-            task.project = db.query(Project).filter(Project.id == task.project_id).first()
-        
-        # 加载评论数量
-        task.comment_count = db.query(TaskComment).filter(TaskComment.task_id == task.id).count()
-        task.comments = []
+    # 批量加载关联数据
+    load_task_relations(db, tasks, known_users=[current_user])
     
     # 计算总页数
-    total_pages = (total + page_size - 1) // page_size
+    total_pages = (total + page_size - 1) // page_size if total is not None else None
     
     return TaskListResponse(
         items=tasks,
         total=total,
         page=page,
         page_size=page_size,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor
     )
 
 # 统计相关路由 - 必须在 /{task_id} 路由之前
@@ -468,10 +375,7 @@ def get_task_statistics(
     
     # 如果指定了团队ID，检查用户是否是团队成员
     if team_id:
-        member = db.query(TeamMember).filter(
-            TeamMember.team_id == team_id,
-            TeamMember.user_id == current_user.id
-        ).first()
+        member = membership_service.get_membership(db, current_user.id, team_id)
         if not member:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -484,26 +388,12 @@ def get_task_statistics(
             query = query.filter(Task.assignee_id == current_user.id)
     else:
         # 如果没有指定团队，只统计用户所在团队的任务
-        user_teams = db.query(TeamMember.team_id).filter(
-            TeamMember.user_id == current_user.id
-        ).subquery()
-        query = query.filter(Task.team_id.in_(user_teams))
-        
-        # 添加调试日志
-        logger.info(f"统计接口 - 用户ID {current_user.id} 所在的团队查询")
-        user_team_list = db.query(TeamMember.team_id).filter(
-            TeamMember.user_id == current_user.id
-        ).all()
-        logger.info(f"统计接口 - 用户所在团队: {[t[0] for t in user_team_list]}")
-        
-        # 检查用户是否是团队管理员
-        user_admin_teams = db.query(TeamMember.team_id).filter(
-            TeamMember.user_id == current_user.id,
-            TeamMember.role == TEAM_ADMIN
-        ).subquery()
+        user_team_ids = membership_service.team_ids(db, current_user.id)
+        query = query.filter(Task.team_id.in_(user_team_ids))
+        logger.info(f"统计接口 - 用户所在团队: {user_team_ids}")
         
         # 如果用户不是任何团队的管理员，只能统计自己的任务
-        admin_teams_count = db.query(user_admin_teams).count()
+        admin_teams_count = len(membership_service.admin_team_ids(db, current_user.id))
         logger.info(f"统计接口 - 用户是管理员的团队数量: {admin_teams_count}")
         
         if admin_teams_count == 0:
@@ -522,10 +412,7 @@ def get_task_statistics(
             )
         
         # 检查用户是否是项目所属团队的成员
-        member = db.query(TeamMember).filter(
-            TeamMember.team_id == project.team_id,
-            TeamMember.user_id == current_user.id
-        ).first()
+        member = membership_service.get_membership(db, current_user.id, project.team_id)
         if not member:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -538,44 +425,46 @@ def get_task_statistics(
     if assignee_id:
         query = query.filter(Task.assignee_id == assignee_id)
     
-    # 统计各状态的任务数量
-    total_tasks = query.count()
-    pending_tasks = query.filter(Task.status == 'pending').count()
-    in_progress_tasks = query.filter(Task.status == 'in_progress').count()
-    completed_tasks = query.filter(Task.status == 'completed').count()
-    review_tasks = query.filter(Task.status == 'review').count()
-    cancelled_tasks = query.filter(Task.status == 'cancelled').count()
+    # 一次聚合查询得到全部统计字段
+    statistics = task_statistics.get_statistics(query)
+    logger.info(f"统计结果 - 总数: {statistics.total}, 待分派: {statistics.pending}, 进行中: {statistics.in_progress}, 已完成: {statistics.completed}")
+    return statistics
+
+@router.get("/statistics/teams", response_model=List[TeamTaskStatistics])
+def get_teams_task_statistics(
+    *,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    team_ids: Optional[str] = Query(None, description="团队ID列表，逗号分隔，默认为用户所在的全部团队")
+) -> Any:
+    """一次获取多个团队的任务统计信息，团队管理员统计全部任务，普通成员只统计自己负责的任务"""
+    roles = membership_service.get_roles(db, current_user.id)
     
-    # 添加调试日志
-    logger.info(f"统计结果 - 总数: {total_tasks}, 待分派: {pending_tasks}, 进行中: {in_progress_tasks}, 已完成: {completed_tasks}")
-    
-    # 统计逾期任务
-    overdue_tasks = query.filter(
-        and_(
-            Task.due_date < datetime.now(),
-            Task.status.in_(['pending', 'in_progress', 'review'])
-        )
-    ).count()
-    
-    # 统计工时
-    total_estimated_hours = query.with_entities(func.sum(Task.estimated_hours)).scalar() or 0
-    completed_hours = query.filter(Task.status == 'completed').with_entities(func.sum(Task.actual_hours)).scalar() or 0
-    
-    # 计算完成率
-    completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-    
-    return TaskStatistics(
-        total=total_tasks,
-        pending=pending_tasks,
-        in_progress=in_progress_tasks,
-        completed=completed_tasks,
-        review=review_tasks,
-        cancelled=cancelled_tasks,
-        overdue=overdue_tasks,
-        total_estimated_hours=total_estimated_hours,
-        completed_hours=completed_hours,
-        completion_rate=completion_rate
+    if team_ids:
+        try:
+            requested = [int(t) for t in team_ids.split(",") if t.strip()]
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="团队ID格式错误"
+            )
+        if any(t not in roles for t in requested):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="您不是该团队成员"
+            )
+    else:
+        requested = list(roles)
+    
+    admin_team_ids = [t for t in requested if roles[t] == TEAM_ADMIN]
+    statistics = task_statistics.get_statistics_by(
+        db, Task.team_id, requested,
+        or_(Task.team_id.in_(admin_team_ids), Task.assignee_id == current_user.id)
     )
+    return [
+        TeamTaskStatistics(team_id=team_id, **statistics[team_id].dict())
+        for team_id in requested
+    ]
 
 @router.get("/statistics/team/{team_id}", response_model=TaskStatistics)
 def get_team_task_statistics(
@@ -586,55 +475,14 @@ def get_team_task_statistics(
 ) -> Any:
     """获取团队任务统计信息"""
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="您不是该团队成员"
         )
     
-    # 构建查询
-    query = db.query(Task).filter(
-        Task.team_id == team_id,
-        Task.is_deleted == False
-    )
-    
-    # 统计各状态的任务数量
-    total_tasks = query.count()
-    pending_tasks = query.filter(Task.status == 'pending').count()
-    in_progress_tasks = query.filter(Task.status == 'in_progress').count()
-    completed_tasks = query.filter(Task.status == 'completed').count()
-    
-    # 统计逾期任务
-    overdue_tasks = query.filter(
-        and_(
-            Task.due_date < datetime.now(),
-            Task.status.in_(['pending', 'in_progress', 'review'])
-        )
-    ).count()
-    
-    # 统计工时
-    total_estimated_hours = query.with_entities(func.sum(Task.estimated_hours)).scalar() or 0
-    total_actual_hours = query.filter(Task.status == 'completed').with_entities(func.sum(Task.actual_hours)).scalar() or 0
-    
-    # 计算完成率
-    completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-    
-    return TaskStatistics(
-        total=total_tasks,
-        pending=pending_tasks,
-        in_progress=in_progress_tasks,
-        completed=completed_tasks,
-        review=0,  # 团队统计中没有review状态
-        cancelled=0,  # 团队统计中没有cancelled状态
-        overdue=overdue_tasks,
-        total_estimated_hours=total_estimated_hours,
-        completed_hours=total_actual_hours,
-        completion_rate=completion_rate
-    )
+    return task_statistics.get_statistics_by(db, Task.team_id, [team_id])[team_id]
 
 @router.get("/statistics/project/{project_id}", response_model=TaskStatistics)
 def get_project_task_statistics(
@@ -653,57 +501,88 @@ def get_project_task_statistics(
         )
     
     # 检查用户是否是项目所属团队的成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == project.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, project.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="您没有权限访问该项目"
         )
     
-    # 构建查询
-    query = db.query(Task).filter(
-        Task.project_id == project_id,
-        Task.is_deleted == False
-    )
+    return task_statistics.get_statistics_by(db, Task.project_id, [project_id])[project_id]
+
+# 依赖图相关路由 - 必须在 /{task_id} 路由之前
+def _load_team_graph(db: Session, team_id: int, project_id: Optional[int], current_user: User):
+    """检查团队成员身份，返回团队依赖图和要展示的任务ID"""
+    if not membership_service.is_member(db, current_user.id, team_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="您不是该团队成员"
+        )
+    graph = task_graph_service.get(db, team_id)
+    if project_id is None:
+        return graph, list(graph.nodes)
+    return graph, graph.project_task_ids(project_id)
+
+@router.get("/dependency-graph", response_model=TaskDependencyGraph)
+def get_dependency_graph(
+    *,
+    db: Session = Depends(get_db),
+    team_id: int = Query(..., description="团队ID"),
+    project_id: Optional[int] = Query(None, description="项目ID，只看项目内任务之间的依赖"),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """获取任务依赖图：任务阻塞状态、依赖关系和拓扑顺序"""
+    graph, task_ids = _load_team_graph(db, team_id, project_id, current_user)
+    # 阻塞状态按整个团队的依赖计算，排序只看展示范围内的任务
+    view = graph.subgraph(task_ids) if project_id is not None else graph
+    order, cycle = view.topological_order()
+    return {
+        "team_id": team_id,
+        "project_id": project_id,
+        "nodes": [graph.describe(task_id) for task_id in sorted(task_ids)],
+        "edges": [
+            {"prerequisite_task_id": prerequisite_id, "dependent_task_id": dependent_id}
+            for prerequisite_id, dependent_id in view.edges()
+        ],
+        "order": order,
+        "cycle": cycle
+    }
+
+@router.get("/critical-path", response_model=CriticalPathResponse)
+def get_critical_path(
+    *,
+    db: Session = Depends(get_db),
+    team_id: int = Query(..., description="团队ID"),
+    project_id: Optional[int] = Query(None, description="项目ID，只看项目内任务之间的依赖"),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """根据预估工时和截止日期计算关键路径"""
+    graph, task_ids = _load_team_graph(db, team_id, project_id, current_user)
+    view = graph.subgraph(task_ids) if project_id is not None else graph
+    return {"team_id": team_id, "project_id": project_id, **view.critical_path()}
+
+@router.get("/tree", response_model=ProjectTaskTree)
+def get_project_task_tree(
+    *,
+    db: Session = Depends(get_db),
+    project_id: int = Query(..., description="项目ID"),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """获取项目的任务树，带工时和完成度汇总"""
+    project = db.query(Project).filter(Project.id == project_id).first()
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="项目不存在"
+        )
     
-    # 统计各状态的任务数量
-    total_tasks = query.count()
-    pending_tasks = query.filter(Task.status == 'pending').count()
-    in_progress_tasks = query.filter(Task.status == 'in_progress').count()
-    completed_tasks = query.filter(Task.status == 'completed').count()
-    review_tasks = query.filter(Task.status == 'review').count()
-    cancelled_tasks = query.filter(Task.status == 'cancelled').count()
-    
-    # 统计逾期任务
-    overdue_tasks = query.filter(
-        and_(
-            Task.due_date < datetime.now(),
-            Task.status.in_(['pending', 'in_progress', 'review'])
-        )
-    ).count()
-    
-    # 统计工时
-    total_estimated_hours = query.with_entities(func.sum(Task.estimated_hours)).scalar() or 0
-    completed_hours = query.filter(Task.status == 'completed').with_entities(func.sum(Task.actual_hours)).scalar() or 0
-    
-    # 计算完成率
-    completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-    
-    return TaskStatistics(
-        total=total_tasks,
-        pending=pending_tasks,
-        in_progress=in_progress_tasks,
-        completed=completed_tasks,
-        review=review_tasks,
-        cancelled=cancelled_tasks,
-        overdue=overdue_tasks,
-        total_estimated_hours=total_estimated_hours,
-        completed_hours=completed_hours,
-        completion_rate=completion_rate
-    )
+    if not membership_service.is_member(db, current_user.id, project.team_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="您没有权限访问该项目"
+        )
+    
+    return task_tree.get_project_tree(db, project_id)
 
 # 单个任务相关路由
 @router.get("/{task_id}", response_model=TaskResponse)
@@ -722,10 +601,7 @@ def get_task(
         )
     
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -733,13 +609,7 @@ def get_task(
         )
     
     # 加载关联数据
-    task.creator = db.query(User).filter(User.id == task.creator_id).first()
-    
-    if task.assignee_id:
-        task.assignee = db.query(User).filter(User.id == task.assignee_id).first()
-    
-    task.comment_count = db.query(TaskComment).filter(TaskComment.task_id == task.id).count()
-    task.comments = []
+    load_task_relations(db, [task], known_users=[current_user])
     
     return task
 
@@ -760,10 +630,7 @@ def update_task(
         )
     
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -901,43 +768,10 @@ def update_task(
         logger.info(f"检查是否需要发送状态变更通知：old_status={old_status}, new_status={task.status}, 是否相等={old_status == task.status}")
         if old_status != task.status:
             logger.info(f"状态发生变化，准备发送通知：{old_status.value} -> {task.status.value}")
-            # 直接发送通知，不使用后台线程
-            from app.core.message_service import message_push_service
-            import asyncio
-            
-            # 获取当前事件循环
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # 如果事件循环正在运行，使用call_soon_threadsafe
-                    loop.call_soon_threadsafe(
-                        lambda: asyncio.create_task(
-                            message_push_service.notify_task_status_changed(
-                                db, task, old_status.value, task.status.value, current_user.id
-                            )
-                        )
-                    )
-                else:
-                    # 如果事件循环没有运行，直接运行
-                    loop.run_until_complete(
-                        message_push_service.notify_task_status_changed(
-                            db, task, old_status.value, task.status.value, current_user.id
-                        )
-                    )
-            except RuntimeError:
-                # 如果没有事件循环，创建一个新的
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_task_status_changed(
-                        db, task, old_status.value, task.status.value, current_user.id
-                    )
-                )
-            finally:
-                loop.close()
-            
-            logger.info(f"已发送状态变更通知：{old_status.value} -> {task.status.value}")
+            notification_outbox.publish(
+                "notify_task_status_changed", task, old_status.value, task.status.value, current_user.id
+            )
+            logger.info(f"已登记状态变更通知：{old_status.value} -> {task.status.value}")
         else:
             logger.info("状态没有发生变化，不发送通知")
     except Exception as e:
@@ -966,10 +800,7 @@ def assign_task(
         )
     
     # 检查当前用户是否有权限分配任务（必须是团队成员）
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -977,10 +808,7 @@ def assign_task(
         )
     
     # 检查指定的负责人是否是团队成员
-    assignee_member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == assignee_id
-    ).first()
+    assignee_member = membership_service.get_membership(db, assignee_id, task.team_id)
     if not assignee_member:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -1010,42 +838,7 @@ def assign_task(
         logger.error(f"记录任务分配日志失败：{str(e)}")
     
     # 发送任务分配通知
-    try:
-        logger.info(f"准备发送任务分配通知：task_id={task_id}, assignee_id={assignee_id}")
-        # 直接发送通知，不使用后台线程
-        from app.core.message_service import message_push_service
-        import asyncio
-
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_task_assigned(db, task, assignee_id, current_user.id)
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_task_assigned(db, task, assignee_id, current_user.id)
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_task_assigned(db, task, assignee_id, current_user.id)
-                )
-            finally:
-                loop.close()
-
-        logger.info(f"已发送任务分配通知：assignee_id={assignee_id}")
-    except Exception as e:
-        logger.error(f"发送任务分配通知失败: {e}")
-        # 不影响任务分配，只记录错误
+    notification_outbox.publish("notify_task_assigned", task, assignee_id, current_user.id)
     
     return TaskResponse.from_orm(task)
 
@@ -1065,10 +858,7 @@ def delete_task(
         )
     
     # 检查用户是否是团队管理员或任务创建者
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1111,10 +901,7 @@ def create_task_comment(
         )
     
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1133,40 +920,7 @@ def create_task_comment(
     db.refresh(comment)
     
     # 发送任务评论通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_task_comment_added(db, task, comment.id, current_user.id)
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_task_comment_added(db, task, comment.id, current_user.id)
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_task_comment_added(db, task, comment.id, current_user.id)
-                )
-            finally:
-                loop.close()
-        
-        logger.info(f"已发送任务评论通知：comment_id={comment.id}")
-    except Exception as e:
-        logger.error(f"发送任务评论通知失败: {e}")
-        # 不影响评论创建，只记录错误
+    notification_outbox.publish("notify_task_comment_added", task, comment.id, current_user.id)
     
     return comment
 
@@ -1187,10 +941,7 @@ def get_task_comments(
         )
     
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1200,6 +951,142 @@ def get_task_comments(
     comments = db.query(TaskComment).filter(TaskComment.task_id == task_id).order_by(TaskComment.created_at.desc()).all()
     return comments
 
+@router.get("/{task_id}/tree", response_model=TaskTreeNode)
+def get_task_tree(
+    *,
+    db: Session = Depends(get_db),
+    task_id: int,
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """获取任务及其全部子任务，带工时和完成度汇总"""
+    team_id = db.query(Task.team_id).filter(Task.id == task_id, Task.is_deleted == False).scalar()
+    if team_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    
+    if not membership_service.is_member(db, current_user.id, team_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="您不是该团队成员"
+        )
+    
+    return task_tree.get_task_tree(db, task_id)
+
+# 任务依赖接口
+def _get_task_for_dependencies(db: Session, task_id: int, current_user: User, modify: bool = False) -> Task:
+    task = db.query(Task).filter(Task.id == task_id, Task.is_deleted == False).first()
+    if not task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
+    if not member:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="您不是该团队成员"
+        )
+    
+    # 只有任务创建者、负责人或团队管理员可以修改依赖
+    if modify and not (
+        task.creator_id == current_user.id or
+        task.assignee_id == current_user.id or
+        member.role == TEAM_ADMIN
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="您没有权限修改此任务的依赖"
+        )
+    return task
+
+@router.get("/{task_id}/dependencies", response_model=TaskDependencyList)
+def get_task_dependencies(
+    *,
+    db: Session = Depends(get_db),
+    task_id: int,
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """获取任务的前置任务、后续任务和阻塞状态"""
+    task = _get_task_for_dependencies(db, task_id, current_user)
+    graph = task_graph_service.get(db, task.team_id)
+    return {
+        "task_id": task_id,
+        "blocked": bool(graph.blocked_by(task_id)),
+        "prerequisites": [graph.describe(p) for p in sorted(graph.predecessors.get(task_id, ()))],
+        "dependents": [graph.describe(d) for d in sorted(graph.successors.get(task_id, ()))]
+    }
+
+@router.post("/{task_id}/dependencies", response_model=TaskDependencyList)
+def add_task_dependency(
+    *,
+    db: Session = Depends(get_db),
+    task_id: int,
+    dependency_in: TaskDependencyCreate,
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """添加前置任务，形成循环依赖时拒绝"""
+    task = _get_task_for_dependencies(db, task_id, current_user, modify=True)
+    prerequisite = db.query(Task).filter(
+        Task.id == dependency_in.prerequisite_task_id, Task.is_deleted == False
+    ).first()
+    if not prerequisite:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="前置任务不存在"
+        )
+    if prerequisite.team_id != task.team_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="前置任务必须属于同一团队"
+        )
+    
+    # 环检测不使用可能过期的缓存
+    graph = task_graph_service.get(db, task.team_id, fresh=True)
+    if prerequisite.id in graph.predecessors.get(task_id, ()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="依赖关系已存在"
+        )
+    cycle = graph.would_create_cycle(prerequisite.id, task_id)
+    if cycle:
+        path = " → ".join(graph.nodes[t].title for t in cycle + [cycle[0]])
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"添加该依赖会形成循环依赖：{path}"
+        )
+    
+    db.add(TaskDependency(prerequisite_task_id=prerequisite.id, dependent_task_id=task_id))
+    db.commit()
+    return get_task_dependencies(db=db, task_id=task_id, current_user=current_user)
+
+@router.delete("/{task_id}/dependencies/{prerequisite_task_id}", response_model=TaskDependencyList)
+def remove_task_dependency(
+    *,
+    db: Session = Depends(get_db),
+    task_id: int,
+    prerequisite_task_id: int,
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """删除前置任务"""
+    _get_task_for_dependencies(db, task_id, current_user, modify=True)
+    dependencies = db.query(TaskDependency).filter(
+        TaskDependency.dependent_task_id == task_id,
+        TaskDependency.prerequisite_task_id == prerequisite_task_id
+    ).all()
+    if not dependencies:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="依赖关系不存在"
+        )
+    
+    for dependency in dependencies:
+        db.delete(dependency)
+    db.commit()
+    return get_task_dependencies(db=db, task_id=task_id, current_user=current_user)
+
 # 任务日志接口
 @router.get("/{task_id}/logs")
 def get_task_logs(
@@ -1220,10 +1107,7 @@ def get_task_logs(
         )
     
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1253,10 +1137,7 @@ def get_task_status_changes(
         )
     
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1286,10 +1167,7 @@ def get_task_activity_logs(
         )
     
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1318,10 +1196,7 @@ def claim_task(
         )
     
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1523,10 +1398,7 @@ def approve_task(
         )
     
     # 检查用户权限（团队管理员或任务创建者）
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1595,10 +1467,7 @@ def reject_task(
         )
     
     # 检查用户权限（团队管理员或任务创建者）
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == task.team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, task.team_id)
     if not member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1749,39 +1618,6 @@ def complete_task(
     task_response = TaskResponse.model_validate(task)
     
     # 发送任务完成通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_task_completed(db, task, current_user.id)
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_task_completed(db, task, current_user.id)
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_task_completed(db, task, current_user.id)
-                )
-            finally:
-                loop.close()
-        
-        logger.info(f"已发送任务完成通知：task_id={task.id}")
-    except Exception as e:
-        logger.error(f"发送任务完成通知失败: {e}")
-        # 不影响任务完成，只记录错误
+    notification_outbox.publish("notify_task_completed", task, current_user.id)
     
     return {"message": "任务已完成", "task": task_response} 
\ No newline at end of file
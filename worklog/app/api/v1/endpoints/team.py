@@ -1,5 +1,5 @@
 from typing import Any, List, Dict, Optional, Union
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
 from sqlalchemy.orm import Session
 from datetime import datetime, date, timedelta
 from sqlalchemy import desc
@@ -15,7 +15,12 @@ from app.models.team import Team
 from app.models.team_member import TeamMember
 from app.models.enums import TEAM_ADMIN, TEAM_MEMBER
 from app.core import deps
+from app.core.membership import membership_service
+from app.core import work_log_rollup
+from app.core import tags as tag_index
+from app.core.notification_outbox import notification_outbox
 from app.schemas.work_log import WorkLogResponse
+from app.schemas.tag import TagCount
 from app.schemas.team import TeamCreate, TeamUpdate, TeamResponse, TeamMemberCreate, TeamMemberResponse, TeamMemberUpdate
 from app.schemas.team_invite import TeamInviteCreate, TeamInviteResponse, TeamInviteInDB
 from app.models.team_invite import TeamInvite
@@ -110,6 +115,7 @@ def create_team(
             print("开始提交事务...")
             db.commit()
             print("事务提交成功")
+            membership_service.invalidate(current_user.id, db=db)
             
             # 重新查询团队，确保加载所有关系
             print("重新查询团队信息...")
@@ -212,6 +218,64 @@ def get_teams(
     
     return team_responses
 
+@router.get("/team-wall", response_model=TeamWallResponse)
+def get_team_wall(
+    *,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    target_date: date = None,
+    page: int = 1,
+    size: int = 20
+) -> Any:
+    """
+    获取团队工作墙
+    - target_date: 目标日期，默认为今天
+    - page: 页码，从1开始
+    - size: 每页数量
+    """
+    if target_date is None:
+        target_date = date.today()
+    
+    # 计算分页
+    skip = (page - 1) * size
+    
+    # 查询当天的工作日志
+    query = db.query(WorkLog).filter(
+        WorkLog.created_at >= datetime.combine(target_date, datetime.min.time()),
+        WorkLog.created_at <= datetime.combine(target_date, datetime.max.time())
+    ).order_by(desc(WorkLog.created_at))
+    
+    # 获取总数
+    total = query.count()
+    
+    # 分页查询
+    work_logs = query.offset(skip).limit(size).all()
+    
+    return {
+        "items": work_logs,
+        "total": total,
+        "page": page,
+        "size": size,
+        "pages": (total + size - 1) // size
+    }
+
+@router.get("/team-daily-report", response_model=TeamDailyReportResponse)
+def get_team_daily_report(
+    *,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    target_date: date = None
+) -> Any:
+    """
+    获取团队日报
+    - target_date: 目标日期，默认为今天
+    """
+    if target_date is None:
+        target_date = date.today()
+    
+    # 读取按天预聚合的汇总行，不再加载当天全部日志
+    return work_log_rollup.get_daily_report(db, target_date)
+
 @router.get("/{team_id}", response_model=TeamResponse)
 def get_team(
     *,
@@ -236,6 +300,26 @@ def get_team(
         )
     return TeamResponse.from_orm(team)
 
+@router.get("/{team_id}/tags", response_model=List[TagCount])
+def get_team_tags(
+    *,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    team_id: int,
+    prefix: Optional[str] = Query(None, max_length=50, description="标签名前缀，用于自动补全"),
+    entity_type: Optional[str] = Query(None, pattern="^(task|work_log)$", description="task / work_log，默认全部"),
+    limit: int = Query(20, ge=1, le=100, description="返回数量")
+) -> Any:
+    """
+    获取团队常用标签，按使用次数降序
+    """
+    if not membership_service.is_member(db, current_user.id, team_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="您不是该团队成员"
+        )
+    return tag_index.get_team_tags(db, team_id, prefix=prefix, entity_type=entity_type, limit=limit)
+
 @router.put("/{team_id}", response_model=TeamResponse)
 def update_team(
     *,
@@ -254,12 +338,7 @@ def update_team(
             detail="团队不存在"
         )
     # 检查用户是否是团队管理员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == team_id,
-        TeamMember.user_id == current_user.id,
-        TeamMember.role == TEAM_ADMIN
-    ).first()
-    if not member:
+    if not membership_service.is_admin(db, current_user.id, team_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="您不是团队管理员"
@@ -289,10 +368,7 @@ def add_team_member(
         )
     
     # 检查当前用户是否是团队管理员
-    current_member = db.query(TeamMember).filter(
-        TeamMember.team_id == team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    current_member = membership_service.get_membership(db, current_user.id, team_id)
     
     if not current_member or current_member.role != TEAM_ADMIN:
         raise HTTPException(
@@ -323,48 +399,10 @@ def add_team_member(
     db.add(team_member)
     db.commit()
     db.refresh(team_member)
+    membership_service.invalidate(member.user_id, db=db)
     
     # 发送团队成员加入通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_team_member_joined(
-                            db, team_id, member.user_id
-                        )
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_team_member_joined(
-                        db, team_id, member.user_id
-                    )
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_team_member_joined(
-                        db, team_id, member.user_id
-                    )
-                )
-            finally:
-                loop.close()
-        
-        print(f"已发送团队成员加入通知：team_id={team_id}, user_id={member.user_id}")
-    except Exception as e:
-        print(f"发送团队成员加入通知失败: {e}")
-        # 不影响成员加入流程，只记录错误
+    notification_outbox.publish("notify_team_member_joined", team_id, member.user_id)
     
     return team_member
 
@@ -386,10 +424,7 @@ def update_member_role(
         )
     
     # 检查当前用户是否是团队管理员
-    current_member = db.query(TeamMember).filter(
-        TeamMember.team_id == team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    current_member = membership_service.get_membership(db, current_user.id, team_id)
     
     if not current_member or current_member.role != TEAM_ADMIN:
         raise HTTPException(
@@ -425,6 +460,7 @@ def update_member_role(
     member.role = role_update.role
     db.commit()
     db.refresh(member)
+    membership_service.invalidate(member.user_id, db=db)
     
     return member
 
@@ -448,13 +484,7 @@ def remove_team_member(
         )
     
     # 检查用户是否是团队管理员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == team_id,
-        TeamMember.user_id == current_user.id,
-        TeamMember.role == TEAM_ADMIN
-    ).first()
-    
-    if not member:
+    if not membership_service.is_admin(db, current_user.id, team_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="您不是团队管理员"
@@ -475,48 +505,10 @@ def remove_team_member(
     # 移除团队成员
     db.delete(target_member)
     db.commit()
+    membership_service.invalidate(user_id, db=db)
     
     # 发送团队成员离开通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_team_member_left(
-                            db, team_id, user_id
-                        )
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_team_member_left(
-                        db, team_id, user_id
-                    )
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_team_member_left(
-                        db, team_id, user_id
-                    )
-                )
-            finally:
-                loop.close()
-        
-        print(f"已发送团队成员离开通知：team_id={team_id}, user_id={user_id}")
-    except Exception as e:
-        print(f"发送团队成员离开通知失败: {e}")
-        # 不影响成员离开流程，只记录错误
+    notification_outbox.publish("notify_team_member_left", team_id, user_id)
     
     return {"message": "成员已从团队中移除"}
 
@@ -563,106 +555,6 @@ def get_team_members(
     return members_response
 
 # 团队工作墙接口
-@router.get("/team-wall", response_model=TeamWallResponse)
-def get_team_wall(
-    *,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-    target_date: date = None,
-    page: int = 1,
-    size: int = 20
-) -> Any:
-    """
-    获取团队工作墙
-    - target_date: 目标日期，默认为今天
-    - page: 页码，从1开始
-    - size: 每页数量
-    """
-    if target_date is None:
-        target_date = date.today()
-    
-    # 计算分页
-    skip = (page - 1) * size
-    
-    # 查询当天的工作日志
-    query = db.query(WorkLog).filter(
-        WorkLog.created_at >= datetime.combine(target_date, datetime.min.time()),
-        WorkLog.created_at <= datetime.combine(target_date, datetime.max.time())
-    ).order_by(desc(WorkLog.created_at))
-    
-    # 获取总数
-    total = query.count()
-    
-    # 分页查询
-    work_logs = query.offset(skip).limit(size).all()
-    
-    return {
-        "items": work_logs,
-        "total": total,
-        "page": page,
-        "size": size,
-        "pages": (total + size - 1) // size
-    }
-
-@router.get("/team-daily-report", response_model=TeamDailyReportResponse)
-def get_team_daily_report(
-    *,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-    target_date: date = None
-) -> Any:
-    """
-    获取团队日报
-    - target_date: 目标日期，默认为今天
-    """
-    if target_date is None:
-        target_date = date.today()
-    
-    # 查询当天的工作日志
-    work_logs = db.query(WorkLog).filter(
-        WorkLog.created_at >= datetime.combine(target_date, datetime.min.time()),
-        WorkLog.created_at <= datetime.combine(target_date, datetime.max.time())
-    ).all()
-    
-    # 按工作类型统计
-    work_type_stats = {}
-    for log in work_logs:
-        if log.work_type not in work_type_stats:
-            work_type_stats[log.work_type] = {
-                "count": 0,
-                "total_duration": 0
-            }
-        work_type_stats[log.work_type]["count"] += 1
-        work_type_stats[log.work_type]["total_duration"] += log.duration
-    
-    # 按用户统计
-    user_stats = {}
-    for log in work_logs:
-        if log.user_id not in user_stats:
-            user_stats[log.user_id] = {
-                "username": log.user.username,
-                "count": 0,
-                "total_duration": 0,
-                "work_types": {}
-            }
-        user_stats[log.user_id]["count"] += 1
-        user_stats[log.user_id]["total_duration"] += log.duration
-        
-        if log.work_type not in user_stats[log.user_id]["work_types"]:
-            user_stats[log.user_id]["work_types"][log.work_type] = {
-                "count": 0,
-                "total_duration": 0
-            }
-        user_stats[log.user_id]["work_types"][log.work_type]["count"] += 1
-        user_stats[log.user_id]["work_types"][log.work_type]["total_duration"] += log.duration
-    
-    return {
-        "date": target_date,
-        "total_logs": len(work_logs),
-        "work_type_stats": work_type_stats,
-        "user_stats": user_stats
-    }
-
 @router.post("/{team_id}/invite", response_model=Union[TeamMemberResponse, dict])
 async def invite_team_member(
     team_id: int,
@@ -677,10 +569,7 @@ async def invite_team_member(
     print(f"邀请请求数据: {invite_in.dict()}")
     
     # 检查用户是否是团队管理员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, team_id)
     
     print(f"检查用户 {current_user.id} 是否是团队 {team_id} 的管理员")
     if not member:
@@ -734,48 +623,10 @@ async def invite_team_member(
         db.add(team_member)
         db.commit()
         db.refresh(team_member)
+        membership_service.invalidate(existing_user.id, db=db)
         
         # 发送团队成员加入通知
-        try:
-            from app.core.message_service import message_push_service
-            import asyncio
-            
-            # 获取当前事件循环
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # 如果事件循环正在运行，使用call_soon_threadsafe
-                    loop.call_soon_threadsafe(
-                        lambda: asyncio.create_task(
-                            message_push_service.notify_team_member_joined(
-                                db, team_id, existing_user.id
-                            )
-                        )
-                    )
-                else:
-                    # 如果事件循环没有运行，直接运行
-                    loop.run_until_complete(
-                        message_push_service.notify_team_member_joined(
-                            db, team_id, existing_user.id
-                        )
-                    )
-            except RuntimeError:
-                # 如果没有事件循环，创建一个新的
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    loop.run_until_complete(
-                        message_push_service.notify_team_member_joined(
-                            db, team_id, existing_user.id
-                        )
-                    )
-                finally:
-                    loop.close()
-            
-            print(f"已发送团队成员加入通知：team_id={team_id}, user_id={existing_user.id}")
-        except Exception as e:
-            print(f"发送团队成员加入通知失败: {e}")
-            # 不影响成员加入流程，只记录错误
+        notification_outbox.publish("notify_team_member_joined", team_id, existing_user.id)
         
         return TeamMemberResponse(
             id=team_member.id,
@@ -839,46 +690,7 @@ async def invite_team_member(
             )
             
             # 发送团队邀请通知
-            try:
-                from app.core.message_service import message_push_service
-                import asyncio
-                
-                # 获取当前事件循环
-                try:
-                    loop = asyncio.get_event_loop()
-                    if loop.is_running():
-                        # 如果事件循环正在运行，使用call_soon_threadsafe
-                        loop.call_soon_threadsafe(
-                            lambda: asyncio.create_task(
-                                message_push_service.notify_team_invitation(
-                                    db, team_id, current_user.id, existing_user.id if existing_user else 0
-                                )
-                            )
-                        )
-                    else:
-                        # 如果事件循环没有运行，直接运行
-                        loop.run_until_complete(
-                            message_push_service.notify_team_invitation(
-                                db, team_id, current_user.id, existing_user.id if existing_user else 0
-                            )
-                        )
-                except RuntimeError:
-                    # 如果没有事件循环，创建一个新的
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        loop.run_until_complete(
-                            message_push_service.notify_team_invitation(
-                                db, team_id, current_user.id, existing_user.id if existing_user else 0
-                            )
-                        )
-                    finally:
-                        loop.close()
-                
-                print(f"已发送团队邀请通知：team_id={team_id}")
-            except Exception as e:
-                print(f"发送团队邀请通知失败: {e}")
-                # 不影响邀请流程，只记录错误
+            notification_outbox.publish("notify_team_invitation", team_id, current_user.id, existing_user.id if existing_user else 0)
             
             return {
                 "message": "邀请验证码已发送",
@@ -902,10 +714,7 @@ async def get_team_invites(
     获取团队的邀请记录
     """
     # 检查用户是否是团队成员
-    member = db.query(TeamMember).filter(
-        TeamMember.team_id == team_id,
-        TeamMember.user_id == current_user.id
-    ).first()
+    member = membership_service.get_membership(db, current_user.id, team_id)
     
     if not member:
         raise HTTPException(
@@ -966,13 +775,7 @@ def delete_team(
             )
 
         # 检查用户是否是团队管理员
-        member = db.query(TeamMember).filter(
-            TeamMember.team_id == team_id,
-            TeamMember.user_id == current_user.id,
-            TeamMember.role == TEAM_ADMIN
-        ).first()
-        
-        if not member:
+        if not membership_service.is_admin(db, current_user.id, team_id):
             print(f"用户不是团队管理员: user_id={current_user.id}, team_id={team_id}")
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -983,6 +786,7 @@ def delete_team(
             print("开始删除团队...")
             db.delete(team)
             db.commit()
+            membership_service.invalidate_team(team_id, db=db)
             print(f"团队删除成功: team_id={team_id}")
             return {"message": "团队删除成功"}
         except Exception as e:
@@ -1063,6 +867,7 @@ def verify_invitation(
         db.add(team_member)
         db.commit()
         db.refresh(team_member)
+        membership_service.invalidate(existing_user.id, db=db)
         
         return VerifyInvitationResponse(
             message="邀请验证成功，已加入团队",
@@ -1111,6 +916,7 @@ def verify_invitation(
         db.add(team_member)
         db.commit()
         db.refresh(team_member)
+        membership_service.invalidate(new_user.id, db=db)
         
         return VerifyInvitationResponse(
             message="账户创建成功，已加入团队",
@@ -1137,13 +943,7 @@ async def resend_invite(
         )
     
     # 检查用户是否是团队管理员
-    team_member = db.query(TeamMember).filter(
-        TeamMember.team_id == invite.team_id,
-        TeamMember.user_id == current_user.id,
-        TeamMember.role == TEAM_ADMIN
-    ).first()
-    
-    if not team_member:
+    if not membership_service.is_admin(db, current_user.id, invite.team_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="只有团队管理员可以重新发送邀请"
@@ -15,6 +15,8 @@ from app.models.team_invite import TeamInvite
 from app.models.enums import TEAM_ADMIN, TEAM_MEMBER
 from app.schemas.user import UserCreate, UserUpdate, UserInDB, UserResponse, Token
 from app.core import deps
+from app.core.membership import membership_service
+from app.core import user_cache
 
 router = APIRouter()
 
@@ -124,6 +126,7 @@ def register_user(
         db.commit()
         print("事务提交成功")
         db.refresh(db_user)
+        membership_service.invalidate(db_user.id, db=db)
         print(f"用户注册成功: user_id={db_user.id}")
         print("=== 用户注册流程完成 ===\n")
         
@@ -268,6 +271,7 @@ def update_user_me(
     db.add(current_user)
     db.commit()
     db.refresh(current_user)
+    user_cache.invalidate_user(current_user.username)
     return current_user
 
 @router.get("/{user_id}", response_model=UserResponse)
@@ -7,8 +7,16 @@ import json
 from math import ceil
 
 from app.core.security import get_current_user
+from app.core.pagination import decode_cursor, apply_keyset, split_page
+from app.core.membership import membership_service
+from app.core import work_log_rollup
+from app.core import tags as tag_index
+from app.core.notification_outbox import notification_outbox
 from app.db.session import get_db
 from app.models.user import User
+from app.models.team import Team
+from app.models.project import Project
+from app.models.task import Task
 from app.models.work_log import WorkLog, Comment
 from app.models.work_log_template import WorkLogTemplate
 from app.schemas.work_log import WorkLogCreate, WorkLogUpdate, WorkLogResponse, CommentCreate, CommentResponse
@@ -19,13 +27,90 @@ from typing import List
 
 class WorkLogListResponse(BaseModel):
     items: List[WorkLogResponse]
-    total: int
+    total: Optional[int] = None  # 游标模式下默认不统计总数
     page: int
     size: int
-    pages: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = None  # 游标模式下的下一页游标，没有更多数据时为空
 
 router = APIRouter()
 
+# 工作类型映射（兼容旧的工作类型值）
+WORK_TYPE_MAPPING = {
+    'development': 'dev',
+    'testing': 'test',
+    'documentation': 'research',
+    'bug_fix': 'dev',
+    'other': 'dev'
+}
+
+def _serialize_work_log(
+    work_log: WorkLog,
+    user_name: Optional[str] = None,
+    team_name: Optional[str] = None,
+    project_name: Optional[str] = None,
+    task_title: Optional[str] = None
+) -> dict:
+    """
+    将工作日志转换为响应数据，关联字段由调用方预先查询好传入，避免逐条懒加载
+    """
+    converted_data = {
+        'id': work_log.id,
+        'user_id': work_log.user_id,
+        'work_type': work_log.work_type,
+        'content': work_log.content,
+        'start_time': work_log.start_time,
+        'end_time': work_log.end_time,
+        'duration': work_log.duration,
+        'remark': work_log.remark,
+        'tags': work_log.tags,
+        'attachments': work_log.attachments,
+        'project_id': work_log.project_id,
+        'task_id': work_log.task_id,
+        'team_id': work_log.team_id,
+        'progress_percentage': work_log.progress_percentage,
+        'issues_encountered': work_log.issues_encountered,
+        'solutions_applied': work_log.solutions_applied,
+        'blockers': work_log.blockers,
+        'created_at': work_log.created_at,
+        'updated_at': work_log.updated_at,
+        'title': work_log.content if work_log.content else f"工作日志 #{work_log.id}",
+        'user_name': user_name,
+        'team_name': team_name,
+        'project_name': project_name,
+        'task_title': task_title
+    }
+    if converted_data['work_type'] in WORK_TYPE_MAPPING:
+        converted_data['work_type'] = WORK_TYPE_MAPPING[converted_data['work_type']]
+    return converted_data
+
+def _serialize_loaded_work_log(work_log: WorkLog) -> dict:
+    """
+    将单条工作日志转换为响应数据，关联名称通过关系属性读取
+    """
+    return _serialize_work_log(
+        work_log,
+        user_name=work_log.user.username if work_log.user else None,
+        team_name=work_log.team.name if work_log.team else None,
+        project_name=work_log.project.name if work_log.project else None,
+        task_title=work_log.task.title if work_log.task else None
+    )
+
+def _with_relation_names(query):
+    """
+    为工作日志查询追加用户名、团队名、项目名、任务标题列，一次查询取回
+    """
+    return query.outerjoin(User, WorkLog.user_id == User.id) \
+        .outerjoin(Team, WorkLog.team_id == Team.id) \
+        .outerjoin(Project, WorkLog.project_id == Project.id) \
+        .outerjoin(Task, WorkLog.task_id == Task.id) \
+        .add_columns(
+            User.username.label('user_name'),
+            Team.name.label('team_name'),
+            Project.name.label('project_name'),
+            Task.title.label('task_title')
+        )
+
 @router.post("", response_model=WorkLogResponse)
 def create_work_log(
     *,
@@ -111,93 +196,9 @@ def create_work_log(
             db.commit()
     
     # 发送工作日志提交通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_worklog_submitted(
-                            db, work_log.id, current_user.id, work_log.team_id
-                        )
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, work_log.id, current_user.id, work_log.team_id
-                    )
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, work_log.id, current_user.id, work_log.team_id
-                    )
-                )
-            finally:
-                loop.close()
-        
-        print(f"已发送工作日志提交通知：worklog_id={work_log.id}")
-    except Exception as e:
-        print(f"发送工作日志提交通知失败: {e}")
-        # 不影响工作日志创建，只记录错误
-    
-    # 转换工作日志数据，处理work_type映射
-    converted_data = {
-        'id': work_log.id,
-        'user_id': work_log.user_id,
-        'work_type': work_log.work_type,
-        'content': work_log.content,
-        'start_time': work_log.start_time,
-        'end_time': work_log.end_time,
-        'duration': work_log.duration,
-        'remark': work_log.remark,
-        'tags': work_log.tags,
-        'attachments': work_log.attachments,
-        'project_id': work_log.project_id,
-        'task_id': work_log.task_id,
-        'team_id': work_log.team_id,
-        'progress_percentage': work_log.progress_percentage,
-        'issues_encountered': work_log.issues_encountered,
-        'solutions_applied': work_log.solutions_applied,
-        'blockers': work_log.blockers,
-        'created_at': work_log.created_at,
-        'updated_at': work_log.updated_at,
-        'title': work_log.content if work_log.content else f"工作日志 #{work_log.id}"
-    }
+    notification_outbox.publish("notify_worklog_submitted", work_log.id, current_user.id, work_log.team_id)
     
-    # 处理work_type映射
-    work_type_mapping = {
-        'development': 'dev',
-        'testing': 'test',
-        'documentation': 'research',
-        'bug_fix': 'dev',
-        'other': 'dev'
-    }
-    if converted_data['work_type'] in work_type_mapping:
-        converted_data['work_type'] = work_type_mapping[converted_data['work_type']]
-    
-    # 添加关联字段
-    if work_log.user:
-        converted_data['user_name'] = work_log.user.username if hasattr(work_log.user, 'username') else None
-    if work_log.team:
-        converted_data['team_name'] = work_log.team.name if hasattr(work_log.team, 'name') else None
-    if work_log.project:
-        converted_data['project_name'] = work_log.project.name if hasattr(work_log.project, 'name') else None
-    if work_log.task:
-        converted_data['task_title'] = work_log.task.title if hasattr(work_log.task, 'title') else None
-    
-    return converted_data
+    return _serialize_loaded_work_log(work_log)
 
 @router.get("", response_model=WorkLogListResponse)
 def read_work_logs(
@@ -212,10 +213,17 @@ def read_work_logs(
     task_id: Optional[int] = None,  # 按任务ID筛选
     project_id: Optional[int] = None,  # 按项目ID筛选
     team_id: Optional[int] = None,  # 按团队ID筛选
+    cursor: Optional[str] = Query(None, description="分页游标，传空字符串获取第一页并启用游标分页"),
+    include_total: Optional[bool] = Query(None, description="是否统计总数，游标模式下默认不统计"),
 ) -> Any:
     """
     获取工作日志列表
     """
+    try:
+        cursor_key = decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    
     query = db.query(WorkLog).filter(WorkLog.user_id == current_user.id)
     
     # 转换日期字符串为datetime对象
@@ -236,9 +244,7 @@ def read_work_logs(
     if work_type:
         query = query.filter(WorkLog.work_type == work_type)
     if tags:
-        tag_list = tags.split(",")
-        for tag in tag_list:
-            query = query.filter(WorkLog.tags.contains(tag))
+        query = tag_index.filter_by_tags(db, query, "work_log", tags)
     if task_id:
         query = query.filter(WorkLog.task_id == task_id)
     if project_id:
@@ -246,69 +252,45 @@ def read_work_logs(
     if team_id:
         query = query.filter(WorkLog.team_id == team_id)
     
-    # 计算分页
-    skip = (page - 1) * page_size
-    total = query.count()
-    pages = ceil(total / page_size) if total > 0 else 0
-    
-    work_logs = query.order_by(WorkLog.start_time.desc()).offset(skip).limit(page_size).all()
-    
-    # 转换工作日志数据，处理字段映射
-    converted_work_logs = []
-    for work_log in work_logs:
-        # 创建转换后的数据字典
-        converted_data = {
-            'id': work_log.id,
-            'user_id': work_log.user_id,
-            'work_type': work_log.work_type,
-            'content': work_log.content,  # 直接使用content
-            'start_time': work_log.start_time,
-            'end_time': work_log.end_time,
-            'duration': work_log.duration,  # 直接使用duration
-            'remark': work_log.remark,
-            'tags': work_log.tags,
-            'attachments': work_log.attachments,
-            'project_id': work_log.project_id,
-            'task_id': work_log.task_id,
-            'team_id': work_log.team_id,
-            'progress_percentage': work_log.progress_percentage,
-            'issues_encountered': work_log.issues_encountered,
-            'solutions_applied': work_log.solutions_applied,
-            'blockers': work_log.blockers,
-            'created_at': work_log.created_at,
-            'updated_at': work_log.updated_at,
-            'title': work_log.content if work_log.content else f"工作日志 #{work_log.id}"
-        }
-        
-        # 处理work_type映射
-        work_type_mapping = {
-            'development': 'dev',
-            'testing': 'test',
-            'documentation': 'research',
-            'bug_fix': 'dev',
-            'other': 'dev'
-        }
-        if converted_data['work_type'] in work_type_mapping:
-            converted_data['work_type'] = work_type_mapping[converted_data['work_type']]
-        
-        # 添加关联字段
-        if work_log.user:
-            converted_data['user_name'] = work_log.user.username if hasattr(work_log.user, 'username') else None
-        if work_log.team:
-            converted_data['team_name'] = work_log.team.name if hasattr(work_log.team, 'name') else None
-        if work_log.project:
-            converted_data['project_name'] = work_log.project.name if hasattr(work_log.project, 'name') else None
-        if work_log.task:
-            converted_data['task_title'] = work_log.task.title if hasattr(work_log.task, 'title') else None
-        
-        converted_work_logs.append(converted_data)
+    # 游标模式下只在显式要求时统计总数，避免每页都做一次全量计数
+    if include_total is None:
+        include_total = cursor is None
+    total = query.count() if include_total else None
+    pages = (ceil(total / page_size) if total > 0 else 0) if total is not None else None
+    
+    # 关联名称通过外连接一次取回，查询次数与分页大小无关
+    next_cursor = None
+    if cursor is not None:
+        rows = apply_keyset(
+            _with_relation_names(query), WorkLog.start_time, WorkLog.id, cursor_key, page_size
+        ).all()
+        rows, next_cursor = split_page(
+            rows, page_size, lambda row: row.WorkLog.start_time, lambda row: row.WorkLog.id
+        )
+    else:
+        skip = (page - 1) * page_size
+        rows = _with_relation_names(query).order_by(
+            WorkLog.start_time.desc()
+        ).offset(skip).limit(page_size).all()
+    
+    converted_work_logs = [
+        _serialize_work_log(
+            row.WorkLog,
+            user_name=row.user_name,
+            team_name=row.team_name,
+            project_name=row.project_name,
+            task_title=row.task_title
+        )
+        for row in rows
+    ]
     
     return WorkLogListResponse(
         items=converted_work_logs,
         total=total,
         page=page,
         size=page_size,
-        pages=pages
+        pages=pages,
+        next_cursor=next_cursor
     )
 
 @router.get("/{work_log_id}", response_model=WorkLogResponse)
@@ -333,52 +315,7 @@ def read_work_log(
             detail="权限不足"
         )
     
-    # 转换工作日志数据，处理字段映射
-    converted_data = {
-        'id': work_log.id,
-        'user_id': work_log.user_id,
-        'work_type': work_log.work_type,
-        'content': work_log.content,
-        'start_time': work_log.start_time,
-        'end_time': work_log.end_time,
-        'duration': work_log.duration,
-        'remark': work_log.remark,
-        'tags': work_log.tags,
-        'attachments': work_log.attachments,
-        'project_id': work_log.project_id,
-        'task_id': work_log.task_id,
-        'team_id': work_log.team_id,
-        'progress_percentage': work_log.progress_percentage,
-        'issues_encountered': work_log.issues_encountered,
-        'solutions_applied': work_log.solutions_applied,
-        'blockers': work_log.blockers,
-        'created_at': work_log.created_at,
-        'updated_at': work_log.updated_at,
-        'title': work_log.content if work_log.content else f"工作日志 #{work_log.id}"
-    }
-    
-    # 处理work_type映射
-    work_type_mapping = {
-        'development': 'dev',
-        'testing': 'test',
-        'documentation': 'research',
-        'bug_fix': 'dev',
-        'other': 'dev'
-    }
-    if converted_data['work_type'] in work_type_mapping:
-        converted_data['work_type'] = work_type_mapping[converted_data['work_type']]
-    
-    # 添加关联字段
-    if work_log.user:
-        converted_data['user_name'] = work_log.user.username if hasattr(work_log.user, 'username') else None
-    if work_log.team:
-        converted_data['team_name'] = work_log.team.name if hasattr(work_log.team, 'name') else None
-    if work_log.project:
-        converted_data['project_name'] = work_log.project.name if hasattr(work_log.project, 'name') else None
-    if work_log.task:
-        converted_data['task_title'] = work_log.task.title if hasattr(work_log.task, 'title') else None
-    
-    return converted_data
+    return _serialize_loaded_work_log(work_log)
 
 @router.put("/{work_log_id}", response_model=WorkLogResponse)
 def update_work_log(
@@ -436,93 +373,9 @@ def update_work_log(
     db.refresh(work_log)
     
     # 发送工作日志提交通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_worklog_submitted(
-                            db, work_log.id, current_user.id, work_log.team_id
-                        )
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, work_log.id, current_user.id, work_log.team_id
-                    )
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, work_log.id, current_user.id, work_log.team_id
-                    )
-                )
-            finally:
-                loop.close()
-        
-        print(f"已发送工作日志提交通知：worklog_id={work_log.id}")
-    except Exception as e:
-        print(f"发送工作日志提交通知失败: {e}")
-        # 不影响工作日志创建，只记录错误
+    notification_outbox.publish("notify_worklog_submitted", work_log.id, current_user.id, work_log.team_id)
     
-    # 转换工作日志数据，处理work_type映射
-    converted_data = {
-        'id': work_log.id,
-        'user_id': work_log.user_id,
-        'work_type': work_log.work_type,
-        'content': work_log.content,
-        'start_time': work_log.start_time,
-        'end_time': work_log.end_time,
-        'duration': work_log.duration,
-        'remark': work_log.remark,
-        'tags': work_log.tags,
-        'attachments': work_log.attachments,
-        'project_id': work_log.project_id,
-        'task_id': work_log.task_id,
-        'team_id': work_log.team_id,
-        'progress_percentage': work_log.progress_percentage,
-        'issues_encountered': work_log.issues_encountered,
-        'solutions_applied': work_log.solutions_applied,
-        'blockers': work_log.blockers,
-        'created_at': work_log.created_at,
-        'updated_at': work_log.updated_at,
-        'title': work_log.content if work_log.content else f"工作日志 #{work_log.id}"
-    }
-    
-    # 处理work_type映射
-    work_type_mapping = {
-        'development': 'dev',
-        'testing': 'test',
-        'documentation': 'research',
-        'bug_fix': 'dev',
-        'other': 'dev'
-    }
-    if converted_data['work_type'] in work_type_mapping:
-        converted_data['work_type'] = work_type_mapping[converted_data['work_type']]
-    
-    # 添加关联字段
-    if work_log.user:
-        converted_data['user_name'] = work_log.user.username if hasattr(work_log.user, 'username') else None
-    if work_log.team:
-        converted_data['team_name'] = work_log.team.name if hasattr(work_log.team, 'name') else None
-    if work_log.project:
-        converted_data['project_name'] = work_log.project.name if hasattr(work_log.project, 'name') else None
-    if work_log.task:
-        converted_data['task_title'] = work_log.task.title if hasattr(work_log.task, 'title') else None
-    
-    return converted_data
+    return _serialize_loaded_work_log(work_log)
 
 @router.delete("/{work_log_id}")
 def delete_work_log(
@@ -652,93 +505,9 @@ def quick_create_work_log(
         db.commit()
     
     # 发送工作日志提交通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_worklog_submitted(
-                            db, work_log.id, current_user.id, work_log.team_id
-                        )
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, work_log.id, current_user.id, work_log.team_id
-                    )
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, work_log.id, current_user.id, work_log.team_id
-                    )
-                )
-            finally:
-                loop.close()
-        
-        print(f"已发送工作日志提交通知：worklog_id={work_log.id}")
-    except Exception as e:
-        print(f"发送工作日志提交通知失败: {e}")
-        # 不影响工作日志创建，只记录错误
-    
-    # 转换工作日志数据，处理work_type映射
-    converted_data = {
-        'id': work_log.id,
-        'user_id': work_log.user_id,
-        'work_type': work_log.work_type,
-        'content': work_log.content,
-        'start_time': work_log.start_time,
-        'end_time': work_log.end_time,
-        'duration': work_log.duration,
-        'remark': work_log.remark,
-        'tags': work_log.tags,
-        'attachments': work_log.attachments,
-        'project_id': work_log.project_id,
-        'task_id': work_log.task_id,
-        'team_id': work_log.team_id,
-        'progress_percentage': work_log.progress_percentage,
-        'issues_encountered': work_log.issues_encountered,
-        'solutions_applied': work_log.solutions_applied,
-        'blockers': work_log.blockers,
-        'created_at': work_log.created_at,
-        'updated_at': work_log.updated_at,
-        'title': work_log.content if work_log.content else f"工作日志 #{work_log.id}"
-    }
-    
-    # 处理work_type映射
-    work_type_mapping = {
-        'development': 'dev',
-        'testing': 'test',
-        'documentation': 'research',
-        'bug_fix': 'dev',
-        'other': 'dev'
-    }
-    if converted_data['work_type'] in work_type_mapping:
-        converted_data['work_type'] = work_type_mapping[converted_data['work_type']]
+    notification_outbox.publish("notify_worklog_submitted", work_log.id, current_user.id, work_log.team_id)
     
-    # 添加关联字段
-    if work_log.user:
-        converted_data['user_name'] = work_log.user.username if hasattr(work_log.user, 'username') else None
-    if work_log.team:
-        converted_data['team_name'] = work_log.team.name if hasattr(work_log.team, 'name') else None
-    if work_log.project:
-        converted_data['project_name'] = work_log.project.name if hasattr(work_log.project, 'name') else None
-    if work_log.task:
-        converted_data['task_title'] = work_log.task.title if hasattr(work_log.task, 'title') else None
-    
-    return converted_data
+    return _serialize_loaded_work_log(work_log)
 
 @router.post("/voice", response_model=WorkLogResponse)
 async def create_work_log_from_voice(
@@ -776,93 +545,9 @@ async def create_work_log_from_voice(
         db.refresh(work_log)
         
         # 发送工作日志提交通知
-        try:
-            from app.core.message_service import message_push_service
-            import asyncio
-            
-            # 获取当前事件循环
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # 如果事件循环正在运行，使用call_soon_threadsafe
-                    loop.call_soon_threadsafe(
-                        lambda: asyncio.create_task(
-                            message_push_service.notify_worklog_submitted(
-                                db, work_log.id, current_user.id, work_log.team_id
-                            )
-                        )
-                    )
-                else:
-                    # 如果事件循环没有运行，直接运行
-                    loop.run_until_complete(
-                        message_push_service.notify_worklog_submitted(
-                            db, work_log.id, current_user.id, work_log.team_id
-                        )
-                    )
-            except RuntimeError:
-                # 如果没有事件循环，创建一个新的
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    loop.run_until_complete(
-                        message_push_service.notify_worklog_submitted(
-                            db, work_log.id, current_user.id, work_log.team_id
-                        )
-                    )
-                finally:
-                    loop.close()
-            
-            print(f"已发送工作日志提交通知：worklog_id={work_log.id}")
-        except Exception as e:
-            print(f"发送工作日志提交通知失败: {e}")
-            # 不影响工作日志创建，只记录错误
-        
-        # 转换工作日志数据，处理work_type映射
-        converted_data = {
-            'id': work_log.id,
-            'user_id': work_log.user_id,
-            'work_type': work_log.work_type,
-            'content': work_log.content,
-            'start_time': work_log.start_time,
-            'end_time': work_log.end_time,
-            'duration': work_log.duration,
-            'remark': work_log.remark,
-            'tags': work_log.tags,
-            'attachments': work_log.attachments,
-            'project_id': work_log.project_id,
-            'task_id': work_log.task_id,
-            'team_id': work_log.team_id,
-            'progress_percentage': work_log.progress_percentage,
-            'issues_encountered': work_log.issues_encountered,
-            'solutions_applied': work_log.solutions_applied,
-            'blockers': work_log.blockers,
-            'created_at': work_log.created_at,
-            'updated_at': work_log.updated_at,
-            'title': work_log.content if work_log.content else f"工作日志 #{work_log.id}"
-        }
+        notification_outbox.publish("notify_worklog_submitted", work_log.id, current_user.id, work_log.team_id)
         
-        # 处理work_type映射
-        work_type_mapping = {
-            'development': 'dev',
-            'testing': 'test',
-            'documentation': 'research',
-            'bug_fix': 'dev',
-            'other': 'dev'
-        }
-        if converted_data['work_type'] in work_type_mapping:
-            converted_data['work_type'] = work_type_mapping[converted_data['work_type']]
-        
-        # 添加关联字段
-        if work_log.user:
-            converted_data['user_name'] = work_log.user.username if hasattr(work_log.user, 'username') else None
-        if work_log.team:
-            converted_data['team_name'] = work_log.team.name if hasattr(work_log.team, 'name') else None
-        if work_log.project:
-            converted_data['project_name'] = work_log.project.name if hasattr(work_log.project, 'name') else None
-        if work_log.task:
-            converted_data['task_title'] = work_log.task.title if hasattr(work_log.task, 'title') else None
-        
-        return converted_data
+        return _serialize_loaded_work_log(work_log)
         
     except Exception as e:
         raise HTTPException(
@@ -906,93 +591,9 @@ def copy_work_log(
     db.refresh(new_work_log)
     
     # 发送工作日志提交通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_worklog_submitted(
-                            db, new_work_log.id, current_user.id, new_work_log.team_id
-                        )
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, new_work_log.id, current_user.id, new_work_log.team_id
-                    )
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, new_work_log.id, current_user.id, new_work_log.team_id
-                    )
-                )
-            finally:
-                loop.close()
-        
-        print(f"已发送工作日志提交通知：worklog_id={new_work_log.id}")
-    except Exception as e:
-        print(f"发送工作日志提交通知失败: {e}")
-        # 不影响工作日志创建，只记录错误
+    notification_outbox.publish("notify_worklog_submitted", new_work_log.id, current_user.id, new_work_log.team_id)
     
-    # 转换工作日志数据，处理work_type映射
-    converted_data = {
-        'id': new_work_log.id,
-        'user_id': new_work_log.user_id,
-        'work_type': new_work_log.work_type,
-        'content': new_work_log.content,
-        'start_time': new_work_log.start_time,
-        'end_time': new_work_log.end_time,
-        'duration': new_work_log.duration,
-        'remark': new_work_log.remark,
-        'tags': new_work_log.tags,
-        'attachments': new_work_log.attachments,
-        'project_id': new_work_log.project_id,
-        'task_id': new_work_log.task_id,
-        'team_id': new_work_log.team_id,
-        'progress_percentage': new_work_log.progress_percentage,
-        'issues_encountered': new_work_log.issues_encountered,
-        'solutions_applied': new_work_log.solutions_applied,
-        'blockers': new_work_log.blockers,
-        'created_at': new_work_log.created_at,
-        'updated_at': new_work_log.updated_at,
-        'title': new_work_log.content if new_work_log.content else f"工作日志 #{new_work_log.id}"
-    }
-    
-    # 处理work_type映射
-    work_type_mapping = {
-        'development': 'dev',
-        'testing': 'test',
-        'documentation': 'research',
-        'bug_fix': 'dev',
-        'other': 'dev'
-    }
-    if converted_data['work_type'] in work_type_mapping:
-        converted_data['work_type'] = work_type_mapping[converted_data['work_type']]
-    
-    # 添加关联字段
-    if new_work_log.user:
-        converted_data['user_name'] = new_work_log.user.username if hasattr(new_work_log.user, 'username') else None
-    if new_work_log.team:
-        converted_data['team_name'] = new_work_log.team.name if hasattr(new_work_log.team, 'name') else None
-    if new_work_log.project:
-        converted_data['project_name'] = new_work_log.project.name if hasattr(new_work_log.project, 'name') else None
-    if new_work_log.task:
-        converted_data['task_title'] = new_work_log.task.title if hasattr(new_work_log.task, 'title') else None
-    
-    return converted_data
+    return _serialize_loaded_work_log(new_work_log)
 
 @router.get("/last", response_model=WorkLogResponse)
 def get_last_work_log(
@@ -1014,93 +615,9 @@ def get_last_work_log(
         )
     
     # 发送工作日志提交通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_worklog_submitted(
-                            db, work_log.id, current_user.id, work_log.team_id
-                        )
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, work_log.id, current_user.id, work_log.team_id
-                    )
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, work_log.id, current_user.id, work_log.team_id
-                    )
-                )
-            finally:
-                loop.close()
-        
-        print(f"已发送工作日志提交通知：worklog_id={work_log.id}")
-    except Exception as e:
-        print(f"发送工作日志提交通知失败: {e}")
-        # 不影响工作日志创建，只记录错误
+    notification_outbox.publish("notify_worklog_submitted", work_log.id, current_user.id, work_log.team_id)
     
-    # 转换工作日志数据，处理字段映射
-    converted_data = {
-        'id': work_log.id,
-        'user_id': work_log.user_id,
-        'work_type': work_log.work_type,
-        'content': work_log.content,  # 直接使用content
-        'start_time': work_log.start_time,
-        'end_time': work_log.end_time,
-        'duration': work_log.duration,
-        'remark': work_log.remark,
-        'tags': work_log.tags,
-        'attachments': work_log.attachments,
-        'project_id': work_log.project_id,
-        'task_id': work_log.task_id,
-        'team_id': work_log.team_id,
-        'progress_percentage': work_log.progress_percentage,
-        'issues_encountered': work_log.issues_encountered,
-        'solutions_applied': work_log.solutions_applied,
-        'blockers': work_log.blockers,
-        'created_at': work_log.created_at,
-        'updated_at': work_log.updated_at,
-        'title': work_log.content if work_log.content else f"工作日志 #{work_log.id}"
-    }
-    
-    # 处理work_type映射
-    work_type_mapping = {
-        'development': 'dev',
-        'testing': 'test',
-        'documentation': 'research',
-        'bug_fix': 'dev',
-        'other': 'dev'
-    }
-    if converted_data['work_type'] in work_type_mapping:
-        converted_data['work_type'] = work_type_mapping[converted_data['work_type']]
-    
-    # 添加关联字段
-    if work_log.user:
-        converted_data['user_name'] = work_log.user.username if hasattr(work_log.user, 'username') else None
-    if work_log.team:
-        converted_data['team_name'] = work_log.team.name if hasattr(work_log.team, 'name') else None
-    if work_log.project:
-        converted_data['project_name'] = work_log.project.name if hasattr(work_log.project, 'name') else None
-    if work_log.task:
-        converted_data['task_title'] = work_log.task.title if hasattr(work_log.task, 'title') else None
-    
-    return converted_data
+    return _serialize_loaded_work_log(work_log)
 
 @router.get("/templates/recommend", response_model=List[WorkLogCreate])
 def recommend_templates(
@@ -1179,115 +696,28 @@ def get_task_work_logs(
     
     # 如果是团队成员，也可以查看
     if not can_view:
-        from app.models.team_member import TeamMember
-        team_member = db.query(TeamMember).filter(
-            TeamMember.team_id == task.team_id,
-            TeamMember.user_id == current_user.id
-        ).first()
+        team_member = membership_service.get_membership(db, current_user.id, task.team_id)
         if not team_member:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="您没有权限查看该任务的工作日志"
             )
     
-    # 查询任务相关的工作日志
-    work_logs = db.query(WorkLog).filter(
+    # 查询任务相关的工作日志，关联名称通过外连接一次取回
+    rows = _with_relation_names(db.query(WorkLog).filter(
         WorkLog.task_id == task_id
-    ).order_by(WorkLog.start_time.desc()).offset(skip).limit(limit).all()
-    
-    # 发送工作日志提交通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_worklog_submitted(
-                            db, work_logs[0].id, current_user.id, work_logs[0].team_id
-                        )
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, work_logs[0].id, current_user.id, work_logs[0].team_id
-                    )
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, work_logs[0].id, current_user.id, work_logs[0].team_id
-                    )
-                )
-            finally:
-                loop.close()
-        
-        print(f"已发送工作日志提交通知：worklog_id={work_logs[0].id}")
-    except Exception as e:
-        print(f"发送工作日志提交通知失败: {e}")
-        # 不影响工作日志创建，只记录错误
-    
-    # 转换工作日志数据，处理字段映射
-    converted_work_logs = []
-    for work_log in work_logs:
-        # 创建转换后的数据字典
-        converted_data = {
-            'id': work_log.id,
-            'user_id': work_log.user_id,
-            'work_type': work_log.work_type,
-            'content': work_log.content,  # 直接使用content
-            'start_time': work_log.start_time,
-            'end_time': work_log.end_time,
-            'duration': work_log.duration,
-            'remark': work_log.remark,
-            'tags': work_log.tags,
-            'attachments': work_log.attachments,
-            'project_id': work_log.project_id,
-            'task_id': work_log.task_id,
-            'team_id': work_log.team_id,
-            'progress_percentage': work_log.progress_percentage,
-            'issues_encountered': work_log.issues_encountered,
-            'solutions_applied': work_log.solutions_applied,
-            'blockers': work_log.blockers,
-            'created_at': work_log.created_at,
-            'updated_at': work_log.updated_at,
-            'title': work_log.content if work_log.content else f"工作日志 #{work_log.id}"
-        }
-        
-        # 处理work_type映射
-        work_type_mapping = {
-            'development': 'dev',
-            'testing': 'test',
-            'documentation': 'research',
-            'bug_fix': 'dev',
-            'other': 'dev'
-        }
-        if converted_data['work_type'] in work_type_mapping:
-            converted_data['work_type'] = work_type_mapping[converted_data['work_type']]
-        
-        # 添加关联字段
-        if work_log.user:
-            converted_data['user_name'] = work_log.user.username if hasattr(work_log.user, 'username') else None
-        if work_log.team:
-            converted_data['team_name'] = work_log.team.name if hasattr(work_log.team, 'name') else None
-        if work_log.project:
-            converted_data['project_name'] = work_log.project.name if hasattr(work_log.project, 'name') else None
-        if work_log.task:
-            converted_data['task_title'] = work_log.task.title if hasattr(work_log.task, 'title') else None
-        
-        converted_work_logs.append(converted_data)
-    
-    return converted_work_logs
+    )).order_by(WorkLog.start_time.desc()).offset(skip).limit(limit).all()
+    
+    return [
+        _serialize_work_log(
+            row.WorkLog,
+            user_name=row.user_name,
+            team_name=row.team_name,
+            project_name=row.project_name,
+            task_title=row.task_title
+        )
+        for row in rows
+    ]
 
 @router.get("/task/{task_id}/summary")
 def get_task_work_summary(
@@ -1316,71 +746,22 @@ def get_task_work_summary(
     
     # 如果是团队成员，也可以查看
     if not can_view:
-        from app.models.team_member import TeamMember
-        team_member = db.query(TeamMember).filter(
-            TeamMember.team_id == task.team_id,
-            TeamMember.user_id == current_user.id
-        ).first()
+        team_member = membership_service.get_membership(db, current_user.id, task.team_id)
         if not team_member:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="您没有权限查看该任务的工作汇总"
             )
     
-    # 查询任务相关的工作日志统计
-    from sqlalchemy import func
-    
-    # 总工时
-    total_hours = db.query(func.sum(WorkLog.duration)).filter(
-        WorkLog.task_id == task_id
-    ).scalar() or 0.0
-    
-    # 工作日志数量
-    work_log_count = db.query(func.count(WorkLog.id)).filter(
-        WorkLog.task_id == task_id
-    ).scalar() or 0
-    
-    # 按工作类型统计
-    work_type_stats = db.query(
-        WorkLog.work_type,
-        func.count(WorkLog.id).label('count'),
-        func.sum(WorkLog.duration).label('hours')
-    ).filter(
-        WorkLog.task_id == task_id
-    ).group_by(WorkLog.work_type).all()
-    
-    # 按用户统计
-    user_stats = db.query(
-        WorkLog.user_id,
-        func.count(WorkLog.id).label('count'),
-        func.sum(WorkLog.duration).label('hours')
-    ).filter(
-        WorkLog.task_id == task_id
-    ).group_by(WorkLog.user_id).all()
+    # 读取按天预聚合的汇总行
+    summary = work_log_rollup.get_task_summary(db, task_id)
     
     return {
         "task_id": task_id,
         "task_title": task.title,
-        "total_hours": total_hours,
-        "work_log_count": work_log_count,
         "estimated_hours": task.estimated_hours,
         "actual_hours": task.actual_hours,
-        "work_type_stats": [
-            {
-                "work_type": stat.work_type,
-                "count": stat.count,
-                "hours": stat.hours or 0.0
-            }
-            for stat in work_type_stats
-        ],
-        "user_stats": [
-            {
-                "user_id": stat.user_id,
-                "count": stat.count,
-                "hours": stat.hours or 0.0
-            }
-            for stat in user_stats
-        ]
+        **summary
     }
 
 @router.put("/task/{task_id}/update-latest", response_model=WorkLogResponse)
@@ -1445,90 +826,6 @@ def update_latest_task_work_log(
     db.refresh(latest_work_log)
     
     # 发送工作日志提交通知
-    try:
-        from app.core.message_service import message_push_service
-        import asyncio
-        
-        # 获取当前事件循环
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用call_soon_threadsafe
-                loop.call_soon_threadsafe(
-                    lambda: asyncio.create_task(
-                        message_push_service.notify_worklog_submitted(
-                            db, latest_work_log.id, current_user.id, latest_work_log.team_id
-                        )
-                    )
-                )
-            else:
-                # 如果事件循环没有运行，直接运行
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, latest_work_log.id, current_user.id, latest_work_log.team_id
-                    )
-                )
-        except RuntimeError:
-            # 如果没有事件循环，创建一个新的
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    message_push_service.notify_worklog_submitted(
-                        db, latest_work_log.id, current_user.id, latest_work_log.team_id
-                    )
-                )
-            finally:
-                loop.close()
-        
-        print(f"已发送工作日志提交通知：worklog_id={latest_work_log.id}")
-    except Exception as e:
-        print(f"发送工作日志提交通知失败: {e}")
-        # 不影响工作日志创建，只记录错误
-    
-    # 转换工作日志数据，处理work_type映射
-    converted_data = {
-        'id': latest_work_log.id,
-        'user_id': latest_work_log.user_id,
-        'work_type': latest_work_log.work_type,
-        'content': latest_work_log.content,
-        'start_time': latest_work_log.start_time,
-        'end_time': latest_work_log.end_time,
-        'duration': latest_work_log.duration,
-        'remark': latest_work_log.remark,
-        'tags': latest_work_log.tags,
-        'attachments': latest_work_log.attachments,
-        'project_id': latest_work_log.project_id,
-        'task_id': latest_work_log.task_id,
-        'team_id': latest_work_log.team_id,
-        'progress_percentage': latest_work_log.progress_percentage,
-        'issues_encountered': latest_work_log.issues_encountered,
-        'solutions_applied': latest_work_log.solutions_applied,
-        'blockers': latest_work_log.blockers,
-        'created_at': latest_work_log.created_at,
-        'updated_at': latest_work_log.updated_at,
-        'title': latest_work_log.content if latest_work_log.content else f"工作日志 #{latest_work_log.id}"
-    }
-    
-    # 处理work_type映射
-    work_type_mapping = {
-        'development': 'dev',
-        'testing': 'test',
-        'documentation': 'research',
-        'bug_fix': 'dev',
-        'other': 'dev'
-    }
-    if converted_data['work_type'] in work_type_mapping:
-        converted_data['work_type'] = work_type_mapping[converted_data['work_type']]
-    
-    # 添加关联字段
-    if latest_work_log.user:
-        converted_data['user_name'] = latest_work_log.user.username if hasattr(latest_work_log.user, 'username') else None
-    if latest_work_log.team:
-        converted_data['team_name'] = latest_work_log.team.name if hasattr(latest_work_log.team, 'name') else None
-    if latest_work_log.project:
-        converted_data['project_name'] = latest_work_log.project.name if hasattr(latest_work_log.project, 'name') else None
-    if latest_work_log.task:
-        converted_data['task_title'] = latest_work_log.task.title if hasattr(latest_work_log.task, 'title') else None
+    notification_outbox.publish("notify_worklog_submitted", latest_work_log.id, current_user.id, latest_work_log.team_id)
     
-    return converted_data 
\ No newline at end of file
+    return _serialize_loaded_work_log(latest_work_log) 
\ No newline at end of file
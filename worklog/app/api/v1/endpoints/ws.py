@@ -1,10 +1,17 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query, HTTPException
+from app.core.config import settings
+from app.core.membership import membership_service
+from app.core.presence import presence_service
 from app.core.ws_manager import ws_manager
+from app.core.message_counters import unread_count_frame
+from app.crud.message import message_crud
 from app.core.security import get_current_user_from_token
 from app.db.session import get_db
 from sqlalchemy.orm import Session
+from app.models.message import Message
 from app.models.user import User
 from typing import Optional
+import asyncio
 import json
 import logging
 
@@ -21,14 +28,74 @@ async def get_user_id_from_token(token: str = Query(...), db: Session = Depends(
         logger.error(f"验证token失败: {e}")
         raise HTTPException(status_code=401, detail="token验证失败")
 
+def _replay_frame(message: Message) -> str:
+    """补发消息的格式与实时推送一致，没有推送数据的旧消息按 new_message 发送"""
+    data = dict(message.message_data or {})
+    if "type" not in data:
+        data = {
+            "type": "new_message",
+            "data": {
+                "id": message.id,
+                "title": message.title,
+                "content": message.content,
+                "message_type": message.message_type,
+                "priority": message.priority,
+                "created_at": message.created_at.isoformat() if message.created_at else None
+            }
+        }
+    data["message_id"] = message.id
+    data["replayed"] = True
+    return json.dumps(data, ensure_ascii=False, default=str)
+
 @router.websocket("/ws/messages/")
 async def websocket_endpoint(
     websocket: WebSocket,
-    user_id: int = Depends(get_user_id_from_token)
+    user_id: int = Depends(get_user_id_from_token),
+    db: Session = Depends(get_db),
+    last_seen_id: Optional[int] = Query(None, description="断线前收到的最后一条消息id，传入时先补发之后的消息")
 ):
-    await ws_manager.connect(user_id, websocket)
+    # 数据库查询在线程池中执行，重连高峰时不阻塞事件循环
+    team_ids = await asyncio.to_thread(membership_service.team_ids, db, user_id)
+    # 按成员关系登记到团队频道，团队通知只需发布一次
+    connection = await ws_manager.connect(
+        user_id, websocket,
+        replay=last_seen_id is not None,
+        team_ids=team_ids
+    )
     logger.info(f"用户 {user_id} 建立WebSocket连接")
     
+    # 连接建立后推送当前未读数量（补发时在补发完成后送达），之后计数变化时由服务端主动推送
+    try:
+        connection.send(json.dumps(
+            unread_count_frame(await asyncio.to_thread(message_crud.get_stats, db, user_id)), ensure_ascii=False
+        ))
+    except Exception as e:
+        logger.error(f"推送未读数量失败: {e}")
+    
+    # 补发断线期间的消息，补发完成后再发送期间到达的实时消息
+    if last_seen_id is not None:
+        frames, last_id = [], None
+        try:
+            messages, truncated = await asyncio.to_thread(
+                message_crud.get_missed, db, user_id, last_seen_id, settings.WS_REPLAY_LIMIT
+            )
+            last_id = messages[-1].id if messages else last_seen_id
+            frames = [_replay_frame(message) for message in messages]
+            # truncated为True时客户端应重新拉取消息列表
+            frames.append(json.dumps({
+                "type": "replay_complete",
+                "last_id": last_id,
+                "count": len(messages),
+                "truncated": truncated
+            }))
+        except Exception as e:
+            logger.error(f"补发用户 {user_id} 的消息失败: {e}")
+        connection.finish_replay(frames, last_id)
+    
+    # 连接期间不再使用数据库，及时归还连接
+    db.close()
+    
+    # 回复也经由连接的发送队列，避免与服务端推送同时写同一个socket
     try:
         while True:
             # 等待客户端消息（心跳或命令）
@@ -37,30 +104,33 @@ async def websocket_endpoint(
                 # 尝试解析JSON消息
                 message = json.loads(data)
                 message_type = message.get("type", "heartbeat")
+                # 任何客户端消息都说明连接存活；心跳可带上 idle 报告页面是否空闲
+                presence_service.touch(connection, message.get("idle") if message_type == "heartbeat" else None)
                 
                 if message_type == "heartbeat":
                     # 心跳响应
-                    await websocket.send_text(json.dumps({
+                    connection.send(json.dumps({
                         "type": "heartbeat",
                         "status": "ok"
                     }))
                 elif message_type == "ping":
                     # Ping响应
-                    await websocket.send_text(json.dumps({
+                    connection.send(json.dumps({
                         "type": "pong",
                         "timestamp": message.get("timestamp")
                     }))
                 else:
                     # 其他消息类型
                     logger.info(f"收到用户 {user_id} 的消息: {message_type}")
-                    await websocket.send_text(json.dumps({
+                    connection.send(json.dumps({
                         "type": "ack",
                         "message": "消息已收到"
                     }))
                     
             except json.JSONDecodeError:
                 # 如果不是JSON，当作心跳处理
-                await websocket.send_text(json.dumps({
+                presence_service.touch(connection)
+                connection.send(json.dumps({
                     "type": "heartbeat",
                     "status": "ok"
                 }))
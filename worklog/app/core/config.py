@@ -49,6 +49,30 @@ class Settings(BaseSettings):
     REDIS_PASSWORD: Optional[str] = None
     REDIS_DB: int = 0
     
+    # 缓存配置
+    MEMBERSHIP_CACHE_TTL: int = 60  # 团队成员角色缓存有效期（秒）
+    MEMBERSHIP_CACHE_MAX_SIZE: int = 10000  # 最多缓存的用户数
+    USER_CACHE_TTL: int = 300  # 已认证用户缓存有效期（秒），令牌缓存不会超过令牌本身的过期时间
+    USER_CACHE_MAX_SIZE: int = 10000  # 最多缓存的令牌/用户数
+    MESSAGE_COUNTER_CACHE_TTL: int = 300  # 用户消息计数缓存有效期（秒）
+    MESSAGE_COUNTER_CACHE_MAX_SIZE: int = 10000  # 最多缓存计数的用户数
+
+    # 通知投递配置
+    NOTIFICATION_BATCH_SIZE: int = 200  # 每批最多处理的通知事件数，同一批消息一次提交
+    NOTIFICATION_FLUSH_INTERVAL: float = 0.05  # 收到事件后等待凑批的最长时间（秒）
+    NOTIFICATION_QUEUE_MAX_SIZE: int = 10000  # 待投递事件上限，超出时丢弃新事件并记录日志
+
+    # WebSocket 推送配置
+    WS_SEND_QUEUE_SIZE: int = 256  # 每个连接待发送消息的上限
+    WS_SEND_TIMEOUT: float = 10  # 单条消息发送超时（秒），超时的连接会被移除
+    WS_SLOW_CONSUMER_POLICY: str = "drop_oldest"  # 队列已满时的处理：drop_oldest / drop_newest / disconnect
+    WS_REPLAY_LIMIT: int = 100  # 重连时最多补发的消息数，应小于 WS_SEND_QUEUE_SIZE
+    WS_BROKER: str = "memory"  # 推送消息代理：memory 单进程 / redis 多 worker 通过 Redis pub/sub 互通
+    PRESENCE_IDLE_AFTER: float = 75  # 超过该时间（秒）未收到心跳视为空闲，客户端每30秒发送一次心跳
+    PRESENCE_EXPIRE_AFTER: float = 120  # 超过该时间（秒）未收到任何消息的连接视为僵尸连接并移除
+    PRESENCE_PUBLISH_INTERVAL: float = 5  # 在线状态变化合并推送的间隔（秒）
+    PRESENCE_STORE: Optional[str] = None  # 在线状态存储：memory 单进程 / redis 多进程共享，默认与 WS_BROKER 一致
+    
     # 邮件配置
     SMTP_TLS: bool = False  # 使用 SSL 时不需要 TLS
     SMTP_PORT: int = 465    # 163邮箱 SSL 端口
@@ -66,6 +90,38 @@ class Settings(BaseSettings):
     DEFAULT_REMINDER_INTERVAL: int = 30  # 默认提醒间隔（分钟）
     WORK_HOURS_START: str = "09:00"  # 工作时间开始
     WORK_HOURS_END: str = "18:00"    # 工作时间结束
+    REMINDER_MIN_INTERVAL: int = 5  # 用户提醒间隔下限（分钟）
+    REMINDER_REFRESH_INTERVAL: float = 60  # 重新加载用户提醒设置的间隔（秒）
+    REMINDER_LOAD_BATCH_SIZE: int = 1000  # 每批加载的用户数
+    WORKLOG_REMINDER_HOUR: int = 17  # 在该小时之后提醒当天还没有提交工作日志的成员，每天一次
+    DAILY_SUMMARY_HOUR: int = 18  # 每日总结在该小时之后发送，每天一次
+
+    # 定时任务协调（多实例部署时只有一个实例执行）
+    JOB_LOCK_BACKEND: str = "database"  # 租约后端：database 使用 job_leases 表 / redis
+    JOB_LEASE_TTL: float = 120  # 租约有效期（秒），持有者失效后最多经过该时间由其他实例接管
+    JOB_CHECK_INTERVAL: float = 300  # 整点任务检查间隔（秒）
+
+    # 工时统计
+    TIMESHEET_MAX_DAYS: int = 366  # 单次查询的最大天数
+    TIMESHEET_MAX_CELLS: int = 1000000  # 返回矩阵的最大单元格数
+    TIMESHEET_FETCH_SIZE: int = 5000  # 流式读取汇总行的批大小
+    CUBE_CACHE_TTL: float = 600  # 团队工时立方体缓存有效期（秒）
+    CUBE_CACHE_SIZE: int = 200  # 最多缓存的团队立方体数
+    CUBE_HISTORY_MONTHS: int = 24  # 立方体保存的月数，更早的范围从汇总表查询
+
+    # 任务依赖图
+    TASK_GRAPH_CACHE_TTL: float = 600  # 团队依赖图缓存有效期（秒），本进程内的修改提交后立即失效
+    TASK_GRAPH_CACHE_SIZE: int = 200  # 最多缓存的团队依赖图数
+    TASK_TREE_MAX_DEPTH: int = 20  # 任务树最多返回的子任务层数
+
+    # 全文搜索
+    SEARCH_MAX_TERMS: int = 10  # 一次查询最多使用的词数
+    SEARCH_SNIPPET_LENGTH: int = 80  # 搜索结果摘要长度（字符）
+    SEARCH_REBUILD_BATCH: int = 1000  # 重建索引时的批大小
+
+    # 标签
+    TAG_MAX_LENGTH: int = 50  # 单个标签的最大长度，超出部分截断
+    TAG_SYNC_BATCH: int = 1000  # 回填标签时每批处理的任务/工作日志数
     
     class Config:
         case_sensitive = True
@@ -0,0 +1,240 @@
+"""
+定时任务协调
+
+多个实例同时运行提醒服务时，通过租约和幂等键保证每个任务只执行一次：
+1. 租约（JobLease / Redis 键）：持续运行的任务（如 ReminderScheduler）只在持有租约的实例上执行，
+   持有者每轮续约；持有者失效后租约在 JOB_LEASE_TTL 秒内过期，由其他实例接管
+2. 幂等键（JobRun）：整点/每日任务按时间窗口生成键（如 daily_summary:2024-06-03），
+   先插入执行记录再执行，主键冲突说明其他实例已经执行过或正在执行；
+   执行期间每 JOB_LEASE_TTL / 3 秒延长记录的有效期，执行时间超过 JOB_LEASE_TTL 也不会被接管；
+   执行者中途失效时记录在到期后可被接管，任务抛出异常时删除记录以便重试
+租约后端由 JOB_LOCK_BACKEND 选择，幂等键始终保存在数据库中。时间统一使用 UTC
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.job import JobLease, JobRun
+
+logger = logging.getLogger(__name__)
+
+
+def default_owner() -> str:
+    """实例标识：主机名:进程号:随机后缀"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseBackend(ABC):
+    """租约接口"""
+
+    @abstractmethod
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """获取或续约租约，成功返回True"""
+
+    @abstractmethod
+    def release(self, name: str, owner: str):
+        """释放自己持有的租约"""
+
+
+class DatabaseLease(LeaseBackend):
+    """基于 job_leases 表的租约，依靠条件更新和主键冲突保证原子性，SQLite 和 MySQL 都适用"""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+
+    def acquire(self, name: str, owner: str, ttl: float, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+        db = self.session_factory()
+        try:
+            # 自己持有时续约，已过期时接管
+            updated = db.query(JobLease).filter(
+                JobLease.name == name,
+                (JobLease.owner == owner) | (JobLease.expires_at < now)
+            ).update({"owner": owner, "expires_at": expires_at, "acquired_at": now}, synchronize_session=False)
+            if updated:
+                db.commit()
+                return True
+            db.add(JobLease(name=name, owner=owner, expires_at=expires_at, acquired_at=now))
+            db.commit()
+            return True
+        except IntegrityError:
+            # 租约由其他实例持有且未过期
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def release(self, name: str, owner: str):
+        db = self.session_factory()
+        try:
+            db.query(JobLease).filter(JobLease.name == name, JobLease.owner == owner).delete(
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+class RedisLease(LeaseBackend):
+    """基于 Redis 键的租约：SET NX PX 获取，持有者用脚本比较后续约或删除"""
+
+    _RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, client=None, prefix: str = "job_lease:"):
+        self._client = client
+        self.prefix = prefix
+
+    @property
+    def client(self):
+        if self._client is None:
+            # 仅在启用redis租约时才需要安装redis
+            import redis
+            self._client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD,
+                db=settings.REDIS_DB
+            )
+        return self._client
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        key = self.prefix + name
+        ttl_ms = int(ttl * 1000)
+        if self.client.set(key, owner, nx=True, px=ttl_ms):
+            return True
+        return bool(self.client.eval(self._RENEW, 1, key, owner, ttl_ms))
+
+    def release(self, name: str, owner: str):
+        self.client.eval(self._RELEASE, 1, self.prefix + name, owner)
+
+
+def create_lease_backend(kind: Optional[str] = None) -> LeaseBackend:
+    kind = kind or settings.JOB_LOCK_BACKEND
+    if kind == "database":
+        return DatabaseLease()
+    if kind == "redis":
+        return RedisLease()
+    raise ValueError(f"未知的租约后端: {kind}")
+
+
+class JobCoordinator:
+    """定时任务的租约和幂等控制"""
+
+    def __init__(
+        self,
+        backend: Optional[LeaseBackend] = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        owner: Optional[str] = None,
+        ttl: float = settings.JOB_LEASE_TTL
+    ):
+        self.backend = backend or create_lease_backend()
+        self.session_factory = session_factory
+        self.owner = owner or default_owner()
+        self.ttl = ttl
+
+    def is_leader(self, name: str) -> bool:
+        """获取或续约租约，返回本实例是否负责该任务；后端异常时按非负责处理"""
+        try:
+            return self.backend.acquire(name, self.owner, self.ttl)
+        except Exception as e:
+            logger.error(f"获取任务租约 {name} 失败: {e}")
+            return False
+
+    def resign(self, name: str):
+        try:
+            self.backend.release(name, self.owner)
+        except Exception as e:
+            logger.error(f"释放任务租约 {name} 失败: {e}")
+
+    def claim(self, key: str, now: Optional[datetime] = None) -> bool:
+        """登记一次执行，返回False表示该窗口已执行过或其他实例正在执行"""
+        now = now or datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        db = self.session_factory()
+        try:
+            # 执行者失效留下的记录到期后可以接管
+            updated = db.query(JobRun).filter(
+                JobRun.key == key,
+                JobRun.status == "running",
+                JobRun.expires_at < now
+            ).update({"owner": self.owner, "expires_at": expires_at}, synchronize_session=False)
+            if not updated:
+                db.add(JobRun(key=key, owner=self.owner, status="running", expires_at=expires_at))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def renew(self, key: str, now: Optional[datetime] = None) -> bool:
+        """延长本实例正在执行的记录的有效期，返回False表示记录已被其他实例接管"""
+        now = now or datetime.utcnow()
+        db = self.session_factory()
+        try:
+            updated = db.query(JobRun).filter(
+                JobRun.key == key,
+                JobRun.owner == self.owner,
+                JobRun.status == "running"
+            ).update({"expires_at": now + timedelta(seconds=self.ttl)}, synchronize_session=False)
+            db.commit()
+            return bool(updated)
+        finally:
+            db.close()
+
+    async def _heartbeat(self, key: str):
+        """任务执行期间定期续期执行记录"""
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                if not await asyncio.to_thread(self.renew, key):
+                    logger.warning(f"任务 {key} 的执行记录已被其他实例接管")
+                    return
+            except Exception as e:
+                logger.error(f"续期任务 {key} 失败: {e}")
+
+    def finish(self, key: str, succeeded: bool = True):
+        """标记执行完成；失败时删除记录，下次检查时重试"""
+        db = self.session_factory()
+        try:
+            query = db.query(JobRun).filter(JobRun.key == key, JobRun.owner == self.owner)
+            if succeeded:
+                query.update({"status": "done", "finished_at": datetime.utcnow()}, synchronize_session=False)
+            else:
+                query.delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def run_once(self, key: str, job: Callable[[], Awaitable]) -> bool:
+        """同一个 key 在所有实例中只执行一次，返回本次是否执行了任务"""
+        if not self.claim(key):
+            return False
+        heartbeat = asyncio.get_running_loop().create_task(self._heartbeat(key))
+        try:
+            await job()
+        except Exception as e:
+            logger.error(f"执行任务 {key} 失败: {e}")
+            self.finish(key, succeeded=False)
+            return False
+        finally:
+            heartbeat.cancel()
+        self.finish(key)
+        logger.info(f"任务 {key} 执行完成")
+        return True
+
+
+job_coordinator = JobCoordinator()
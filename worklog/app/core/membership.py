@@ -0,0 +1,201 @@
+"""
+团队成员关系与角色缓存
+
+权限校验统一通过 membership_service 获取用户的 {team_id: role} 映射：
+1. 同一请求内映射保存在数据库会话的 info 中，多次校验只查询一次
+2. 跨请求使用进程内 TTL + LRU 缓存
+3. 团队成员名单 {user_id: role} 同样缓存，发送团队通知时无需查询 TeamMember
+4. 成员关系变更（添加/移除成员、修改角色、接受邀请等）提交后必须调用 invalidate 使缓存失效，
+   通过 add_listener 注册的回调随后被调用（WebSocket 连接管理据此更新团队频道）
+5. 多进程部署时通过 set_publisher 注册的发布函数把变更通知其他进程，
+   其他进程收到后调用 apply_remote 清除自己的缓存并调用回调，被移出团队的用户不再收到该团队的推送
+"""
+import logging
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.enums import TEAM_ADMIN
+from app.models.team_member import TeamMember
+
+logger = logging.getLogger(__name__)
+
+# 请求级映射在 Session.info 中的键
+_SESSION_KEY = "team_roles"
+
+# 成员关系变更回调：listener(user_ids, team_id)，团队整体变更时 team_id 不为空
+MembershipListener = Callable[[Tuple[int, ...], Optional[int]], None]
+
+
+class Membership(NamedTuple):
+    """成员关系的只读视图，可替代 TeamMember 用于权限判断"""
+    team_id: int
+    user_id: int
+    role: str
+
+
+class MembershipService:
+    """用户团队角色查询服务"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.cache = TTLCache(ttl, max_size)
+        # team_id -> {user_id: role}
+        self.team_cache = TTLCache(ttl, max_size)
+        self._listeners: List[MembershipListener] = []
+        self._publisher: Optional[MembershipListener] = None
+
+    def add_listener(self, listener: MembershipListener):
+        self._listeners.append(listener)
+
+    def set_publisher(self, publisher: Optional[MembershipListener]):
+        """设置把本进程的成员关系变更通知其他进程的函数：publisher(user_ids, team_id)"""
+        self._publisher = publisher
+
+    def get_roles(self, db: Session, user_id: int) -> Dict[int, str]:
+        """
+        获取用户的 {team_id: role} 映射
+        返回的字典为共享缓存，调用方不要修改
+        """
+        request_roles = db.info.setdefault(_SESSION_KEY, {})
+        roles = request_roles.get(user_id)
+        if roles is not None:
+            return roles
+
+        roles = self.cache.get(user_id)
+        if roles is None:
+            roles = {
+                team_id: role
+                for team_id, role in db.query(TeamMember.team_id, TeamMember.role).filter(
+                    TeamMember.user_id == user_id
+                ).all()
+            }
+            self.cache.set(user_id, roles)
+        request_roles[user_id] = roles
+        return roles
+
+    def get_role(self, db: Session, user_id: int, team_id: int) -> Optional[str]:
+        """获取用户在团队中的角色，不是成员时返回None"""
+        return self.get_roles(db, user_id).get(team_id)
+
+    def get_membership(self, db: Session, user_id: int, team_id: int) -> Optional[Membership]:
+        """获取用户在团队中的成员关系，不是成员时返回None"""
+        role = self.get_role(db, user_id, team_id)
+        return Membership(team_id, user_id, role) if role is not None else None
+
+    def is_member(self, db: Session, user_id: int, team_id: int) -> bool:
+        return team_id in self.get_roles(db, user_id)
+
+    def is_admin(self, db: Session, user_id: int, team_id: int) -> bool:
+        return self.get_role(db, user_id, team_id) == TEAM_ADMIN
+
+    def team_ids(self, db: Session, user_id: int) -> List[int]:
+        """用户所在的全部团队ID"""
+        return list(self.get_roles(db, user_id))
+
+    def admin_team_ids(self, db: Session, user_id: int) -> List[int]:
+        """用户担任管理员的团队ID"""
+        return [team_id for team_id, role in self.get_roles(db, user_id).items() if role == TEAM_ADMIN]
+
+    def get_team_roles(self, db: Session, team_id: int) -> Dict[int, str]:
+        """
+        获取团队的 {user_id: role} 名单
+        返回的字典为共享缓存，调用方不要修改
+        """
+        roles = self.team_cache.get(team_id)
+        if roles is None:
+            roles = {
+                user_id: role
+                for user_id, role in db.query(TeamMember.user_id, TeamMember.role).filter(
+                    TeamMember.team_id == team_id
+                ).all()
+            }
+            self.team_cache.set(team_id, roles)
+        return roles
+
+    def prefetch_teams(self, db: Session, team_ids: List[int]):
+        """一次查询加载多个团队的成员名单到缓存，已缓存的团队跳过"""
+        missing = [team_id for team_id in dict.fromkeys(team_ids) if self.team_cache.get(team_id) is None]
+        if not missing:
+            return
+        rosters: Dict[int, Dict[int, str]] = {team_id: {} for team_id in missing}
+        rows = db.query(TeamMember.team_id, TeamMember.user_id, TeamMember.role).filter(
+            TeamMember.team_id.in_(missing)
+        ).all()
+        for team_id, user_id, role in rows:
+            rosters[team_id][user_id] = role
+        for team_id, roles in rosters.items():
+            self.team_cache.set(team_id, roles)
+
+    def get_team_member_ids(self, db: Session, team_id: int) -> List[int]:
+        return list(self.get_team_roles(db, team_id))
+
+    def get_team_admin_ids(self, db: Session, team_id: int) -> List[int]:
+        return [user_id for user_id, role in self.get_team_roles(db, team_id).items() if role == TEAM_ADMIN]
+
+    def invalidate(self, *user_ids: int, db: Optional[Session] = None):
+        """
+        成员关系变更后使缓存失效，应在事务提交之后调用
+        传入db时同时清除当前请求内的映射
+        """
+        self._forget_users(user_ids)
+        if db is not None:
+            for user_id in user_ids:
+                db.info.get(_SESSION_KEY, {}).pop(user_id, None)
+        self._notify(user_ids, None)
+        self._publish(user_ids, None)
+
+    def invalidate_team(self, team_id: int, db: Optional[Session] = None):
+        """团队被删除等影响全部成员时，使包含该团队的缓存全部失效"""
+        affected = tuple(self._forget_team(team_id))
+        if db is not None:
+            db.info.pop(_SESSION_KEY, None)
+        self._notify(affected, team_id)
+        self._publish(affected, team_id)
+
+    def apply_remote(self, user_ids: Iterable[int], team_id: Optional[int] = None):
+        """其他进程发生的成员关系变更：清除本进程的缓存并调用回调，不再转发"""
+        user_ids = set(user_ids)
+        if team_id is not None:
+            user_ids.update(self._forget_team(team_id))
+        self._forget_users(user_ids)
+        self._notify(tuple(user_ids), team_id)
+
+    def _forget_users(self, user_ids: Iterable[int]):
+        for user_id in user_ids:
+            self.cache.pop(user_id)
+        # 调用方不一定知道变更涉及哪些团队，成员变更不频繁，直接清空全部团队名单
+        self.team_cache.clear()
+
+    def _forget_team(self, team_id: int) -> Set[int]:
+        """清除包含该团队的缓存，返回受影响的用户"""
+        affected = set(self.team_cache.get(team_id) or ())
+        for user_id in self.cache.keys():
+            roles = self.cache.get(user_id)
+            if roles is not None and team_id in roles:
+                self.cache.pop(user_id)
+                affected.add(user_id)
+        self.team_cache.pop(team_id)
+        return affected
+
+    def _publish(self, user_ids: Tuple[int, ...], team_id: Optional[int]):
+        if self._publisher is None:
+            return
+        try:
+            self._publisher(list(user_ids), team_id)
+        except Exception as e:
+            logger.error(f"发布成员关系变更失败: {e}")
+
+    def _notify(self, user_ids: Tuple[int, ...], team_id: Optional[int]):
+        for listener in self._listeners:
+            try:
+                listener(user_ids, team_id)
+            except Exception as e:
+                logger.error(f"成员关系变更回调失败: {e}")
+
+
+membership_service = MembershipService(
+    ttl=settings.MEMBERSHIP_CACHE_TTL,
+    max_size=settings.MEMBERSHIP_CACHE_MAX_SIZE
+)
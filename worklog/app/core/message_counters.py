@@ -0,0 +1,192 @@
+"""
+用户消息计数器
+
+每个用户的消息统计（总数、未读、紧急、重要、按类型）保存在进程内 TTL 缓存中：
+1. 缓存未命中时通过 loader 从收件箱表分组统计一次；统计期间有变更提交时不缓存本次结果
+   （无法确定变更是否已包含在统计结果中），下次读取重新统计
+2. 消息创建、已读、全部已读、删除提交后增量更新已缓存的计数，不再查询数据库
+3. 计数变化后向本进程的在线用户推送 {"type": "unread_count"}，客户端无需轮询
+4. 同时通过 ws_manager 的进程间事件通知其他进程（包括运行提醒脚本的进程创建消息时）：
+   其他进程清除这些用户的计数缓存，用户的连接在该进程上时从数据库重新统计并推送
+"""
+import asyncio
+import copy
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.ws_manager import ws_manager
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+Stats = Dict[str, Any]
+StatsLoader = Callable[[Session, int], Stats]
+
+# 进程间事件类型
+EVENT_KIND = "message_counters"
+
+
+def empty_stats() -> Stats:
+    return {
+        "total_messages": 0,
+        "unread_messages": 0,
+        "urgent_messages": 0,
+        "important_messages": 0,
+        "messages_by_type": {}
+    }
+
+
+def add_message(stats: Stats, message_type: str, priority: str, is_read: bool, sign: int = 1):
+    """把一条消息计入（sign=1）或移出（sign=-1）统计"""
+    stats["total_messages"] += sign
+    if not is_read:
+        stats["unread_messages"] += sign
+    if priority == "urgent":
+        stats["urgent_messages"] += sign
+    elif priority == "important":
+        stats["important_messages"] += sign
+    by_type = stats["messages_by_type"]
+    by_type[message_type] = by_type.get(message_type, 0) + sign
+    if by_type[message_type] <= 0:
+        del by_type[message_type]
+
+
+def unread_count_frame(stats: Stats) -> Dict[str, Any]:
+    """推送给客户端的未读数量消息"""
+    return {
+        "type": "unread_count",
+        "unread_count": stats["unread_messages"],
+        "total_messages": stats["total_messages"],
+        "urgent_messages": stats["urgent_messages"],
+        "important_messages": stats["important_messages"],
+    }
+
+
+class MessageCounterService:
+    """用户消息计数缓存"""
+
+    def __init__(self, ttl: float, max_size: int, session_factory: Callable[[], Session] = SessionLocal):
+        self.cache = TTLCache(ttl, max_size)
+        self.session_factory = session_factory
+        # 收到其他进程的变更时重新统计所用的 loader，由 message_crud 绑定
+        self.loader: Optional[StatsLoader] = None
+        self._lock = threading.Lock()
+        # 每个用户的计数变更次数，用于判断统计期间是否有变更提交
+        self._versions: Dict[int, int] = defaultdict(int)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind_loop(self, loop: Optional[asyncio.AbstractEventLoop]):
+        """绑定推送所用的事件循环，应用启动时调用；未绑定时只更新计数不推送"""
+        self._loop = loop
+
+    def bind_loader(self, loader: StatsLoader):
+        self.loader = loader
+
+    def get(self, db: Session, user_id: int, loader: StatsLoader) -> Stats:
+        """获取用户的消息统计，返回副本"""
+        stats = self.cache.get(user_id)
+        if stats is None:
+            stats = self._load(db, user_id, loader)
+        with self._lock:
+            return copy.deepcopy(stats)
+
+    def _load(self, db: Session, user_id: int, loader: StatsLoader) -> Stats:
+        with self._lock:
+            version = self._versions[user_id]
+        stats = loader(db, user_id)
+        self._cache_if_unchanged({user_id: version}, {user_id: stats})
+        return stats
+
+    def _cache_if_unchanged(self, versions: Dict[int, int], loaded: Dict[int, Stats]):
+        with self._lock:
+            for user_id, stats in loaded.items():
+                # 统计期间提交的变更不会合并到尚未缓存的计数，这时只用于本次读取
+                if self._versions[user_id] == versions[user_id]:
+                    self.cache.set(user_id, stats)
+
+    def update(self, db: Session, user_ids: Iterable[int], change: Callable[[Stats], None], loader: StatsLoader):
+        """
+        在事务提交后调用，对已缓存的用户执行 change 增量更新计数
+        未缓存但在本进程在线的用户从数据库重新统计，以便推送准确的数值；
+        其他进程收到事件后自行重新统计
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        for user_id in user_ids:
+            with self._lock:
+                self._versions[user_id] += 1
+                stats = self.cache.get(user_id)
+                if stats is not None:
+                    change(stats)
+            if stats is None:
+                if not ws_manager.is_user_connected(user_id):
+                    continue
+                stats = self._load(db, user_id, loader)
+            self._push(user_id, stats)
+        ws_manager.publish_event(EVENT_KIND, user_ids)
+
+    def invalidate(self, *user_ids: int):
+        with self._lock:
+            for user_id in user_ids:
+                self._versions[user_id] += 1
+                self.cache.pop(user_id)
+
+    def apply_remote(self, user_ids: Iterable[int]):
+        """
+        其他进程改变了这些用户的计数：清除缓存，用户在本进程在线时重新统计并推送
+        在事件循环中调用，统计在线程池中执行
+        """
+        self.invalidate(*user_ids)
+        connected = [user_id for user_id in user_ids if ws_manager.is_user_connected(user_id)]
+        if connected and self.loader is not None:
+            asyncio.get_running_loop().create_task(self._reload(connected))
+
+    async def _reload(self, user_ids: List[int]):
+        with self._lock:
+            versions = {user_id: self._versions[user_id] for user_id in user_ids}
+        try:
+            reloaded = await asyncio.to_thread(self._load_many, user_ids)
+        except Exception as e:
+            logger.error(f"重新统计用户消息计数失败: {e}")
+            return
+        self._cache_if_unchanged(versions, reloaded)
+        for user_id, stats in reloaded.items():
+            self._push(user_id, stats)
+
+    def _load_many(self, user_ids: List[int]) -> Dict[int, Stats]:
+        db = self.session_factory()
+        try:
+            return {user_id: self.loader(db, user_id) for user_id in user_ids}
+        finally:
+            db.close()
+
+    def _push(self, user_id: int, stats: Stats):
+        """把未读数量放入用户在本进程的连接，其他进程上的连接由该进程自己推送"""
+        loop = self._loop
+        if loop is None or loop.is_closed() or not ws_manager.is_user_connected(user_id):
+            return
+        message = json.dumps(unread_count_frame(stats), ensure_ascii=False)
+        try:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                ws_manager.deliver_local([user_id], message)
+            else:
+                loop.call_soon_threadsafe(ws_manager.deliver_local, [user_id], message)
+        except RuntimeError as e:
+            logger.error(f"推送未读数量给用户 {user_id} 失败: {e}")
+
+
+message_counters = MessageCounterService(
+    ttl=settings.MESSAGE_COUNTER_CACHE_TTL,
+    max_size=settings.MESSAGE_COUNTER_CACHE_MAX_SIZE
+)
+ws_manager.add_event_handler(EVENT_KIND, message_counters.apply_remote)
@@ -1,6 +1,7 @@
 import json
 import logging
-from typing import Dict, Any, List, Optional
+from contextvars import ContextVar
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 from datetime import datetime
 from sqlalchemy.orm import Session
 from jinja2 import Template
@@ -11,17 +12,33 @@ from app.models.user import User
 from app.core.notification import send_notification
 from app.core.email import send_email
 from app.models.message import Message, MessageTemplate
-from app.models.team_member import TeamMember
+from app.core.membership import membership_service
 from app.models.task import Task
 from app.models.project import Project
 from app.core.ws_manager import ws_manager
 from app.schemas.message import MessageUpdate
 from app.models.team import Team
 from app.models.work_log import WorkLog
-from app.models.enums import TEAM_ADMIN
 
 logger = logging.getLogger(__name__)
 
+
+class Delivery(NamedTuple):
+    """
+    待推送的消息
+    team_id 不为空时通过团队频道推送给团队在线成员（排除 exclude_user_ids），
+    其余接收者（direct_user_ids）逐个推送；否则逐个推送给全部接收者
+    """
+    message: MessageCreate
+    team_id: Optional[int] = None
+    exclude_user_ids: Tuple[int, ...] = ()
+    direct_user_ids: Tuple[int, ...] = ()
+
+
+# 通知分发器批量处理时设置此变量，send_*_notification 生成的消息先收集到列表中，
+# 由分发器统一入库和推送；未设置时立即入库并推送
+delivery_collector: ContextVar[Optional[List[Delivery]]] = ContextVar("delivery_collector", default=None)
+
 class MessageService:
     """消息服务类"""
     
@@ -373,6 +390,50 @@ message_service = MessageService()
 class MessagePushService:
     """消息推送服务 - 扩展版本"""
     
+    @staticmethod
+    async def deliver(db: Session, message_create: MessageCreate, team_id: Optional[int] = None):
+        """
+        保存消息并通过WebSocket推送给接收者，没有接收者时跳过
+        传入team_id且接收者主要是该团队成员时，通过团队频道推送
+        """
+        if not message_create.recipients:
+            return
+        delivery = MessagePushService.plan_delivery(db, message_create, team_id)
+        collector = delivery_collector.get()
+        if collector is not None:
+            collector.append(delivery)
+            return
+        message = message_crud.create(db, obj_in=message_create)
+        await MessagePushService.push(delivery, message.id)
+    
+    @staticmethod
+    def plan_delivery(db: Session, message_create: MessageCreate, team_id: Optional[int] = None) -> Delivery:
+        """决定按团队频道还是逐个用户推送，团队名单来自成员关系缓存"""
+        if team_id is None:
+            return Delivery(message_create)
+        members = membership_service.get_team_roles(db, team_id)
+        recipients = set(message_create.recipients)
+        in_team = [user_id for user_id in members if user_id in recipients]
+        excluded = tuple(user_id for user_id in members if user_id not in recipients)
+        # 只有少数成员收到时逐个推送更省事
+        if len(in_team) <= len(excluded):
+            return Delivery(message_create)
+        direct = tuple(user_id for user_id in dict.fromkeys(message_create.recipients) if user_id not in members)
+        return Delivery(message_create, team_id, excluded, direct)
+    
+    @staticmethod
+    async def push(delivery: Delivery, message_id: int):
+        """消息入库后推送，推送内容带上消息id"""
+        message = json.dumps(
+            {**delivery.message.message_data, "message_id": message_id}, ensure_ascii=False
+        )
+        if delivery.team_id is None:
+            await ws_manager.publish(delivery.message.recipients, message)
+            return
+        await ws_manager.publish_team(delivery.team_id, message, delivery.exclude_user_ids)
+        if delivery.direct_user_ids:
+            await ws_manager.publish(list(delivery.direct_user_ids), message)
+    
     @staticmethod
     async def send_task_notification(
         db: Session,
@@ -400,10 +461,7 @@ class MessagePushService:
                 "extra_data": extra_data or {}
             }
             
-            # 发送WebSocket消息
-            await ws_manager.send_team_message(recipients, message_data)
-            
-            # 保存到数据库
+            # 保存到数据库并推送
             message_create = MessageCreate(
                 title=f"任务通知: {task.title}",
                 content=json.dumps(message_data, ensure_ascii=False),
@@ -413,7 +471,7 @@ class MessagePushService:
                 message_data=message_data
             )
             
-            message_crud.create(db, obj_in=message_create)
+            await MessagePushService.deliver(db, message_create, task.team_id)
             logger.info(f"任务通知已发送: {notification_type} - 任务ID: {task.id}")
             
         except Exception as e:
@@ -443,10 +501,7 @@ class MessagePushService:
                 "extra_data": extra_data or {}
             }
             
-            # 发送WebSocket消息
-            await ws_manager.send_team_message(recipients, message_data)
-            
-            # 保存到数据库
+            # 保存到数据库并推送
             message_create = MessageCreate(
                 title=f"项目通知: {project.name}",
                 content=json.dumps(message_data, ensure_ascii=False),
@@ -456,7 +511,7 @@ class MessagePushService:
                 message_data=message_data
             )
             
-            message_crud.create(db, obj_in=message_create)
+            await MessagePushService.deliver(db, message_create, project.team_id)
             logger.info(f"项目通知已发送: {notification_type} - 项目ID: {project.id}")
             
         except Exception as e:
@@ -486,10 +541,7 @@ class MessagePushService:
                 "extra_data": extra_data or {}
             }
             
-            # 发送WebSocket消息
-            await ws_manager.send_team_message(recipients, message_data)
-            
-            # 保存到数据库
+            # 保存到数据库并推送
             message_create = MessageCreate(
                 title=f"团队通知: {notification_type}",
                 content=json.dumps(message_data, ensure_ascii=False),
@@ -499,7 +551,7 @@ class MessagePushService:
                 message_data=message_data
             )
             
-            message_crud.create(db, obj_in=message_create)
+            await MessagePushService.deliver(db, message_create, team_id)
             logger.info(f"团队通知已发送: {notification_type} - 团队ID: {team_id}")
             
         except Exception as e:
@@ -526,10 +578,7 @@ class MessagePushService:
                 "extra_data": extra_data or {}
             }
             
-            # 发送WebSocket消息
-            await ws_manager.send_team_message(recipients, message_data)
-            
-            # 保存到数据库
+            # 保存到数据库并推送
             message_create = MessageCreate(
                 title=title,
                 content=content,
@@ -539,7 +588,7 @@ class MessagePushService:
                 message_data=message_data
             )
             
-            message_crud.create(db, obj_in=message_create)
+            await MessagePushService.deliver(db, message_create)
             logger.info(f"系统通知已发送: {title}")
             
         except Exception as e:
@@ -573,10 +622,7 @@ class MessagePushService:
                 "extra_data": extra_data or {}
             }
             
-            # 发送WebSocket消息
-            await ws_manager.send_team_message(recipients, message_data)
-            
-            # 保存到数据库
+            # 保存到数据库并推送
             message_create = MessageCreate(
                 title=f"工作日志通知: {notification_type}",
                 content=json.dumps(message_data, ensure_ascii=False),
@@ -586,7 +632,7 @@ class MessagePushService:
                 message_data=message_data
             )
             
-            message_crud.create(db, obj_in=message_create)
+            await MessagePushService.deliver(db, message_create)
             logger.info(f"工作日志通知已发送: {notification_type} - 工作日志ID: {worklog_id}")
             
         except Exception as e:
@@ -594,11 +640,11 @@ class MessagePushService:
     
     @staticmethod
     def get_team_member_ids(db: Session, team_id: int, exclude_user_id: Optional[int] = None) -> List[int]:
-        """获取团队成员ID列表"""
-        query = db.query(TeamMember.user_id).filter(TeamMember.team_id == team_id)
-        if exclude_user_id:
-            query = query.filter(TeamMember.user_id != exclude_user_id)
-        return [row[0] for row in query.all()]
+        """获取团队成员ID列表，来自成员关系缓存"""
+        return [
+            user_id for user_id in membership_service.get_team_member_ids(db, team_id)
+            if user_id != exclude_user_id
+        ]
     
     @staticmethod
     def get_task_related_users(db: Session, task: Task, exclude_user_id: Optional[int] = None) -> List[int]:
@@ -668,13 +714,9 @@ class MessagePushService:
             recipients.append(task.creator_id)
         
         # 添加团队管理员
-        admin_ids = db.query(TeamMember.user_id).filter(
-            TeamMember.team_id == task.team_id,
-            TeamMember.role == TEAM_ADMIN
-        ).all()
-        for admin_id in admin_ids:
-            if admin_id[0] != completer_id and admin_id[0] not in recipients:
-                recipients.append(admin_id[0])
+        for admin_id in membership_service.get_team_admin_ids(db, task.team_id):
+            if admin_id != completer_id and admin_id not in recipients:
+                recipients.append(admin_id)
         
         await MessagePushService.send_task_notification(
             db, task, "task_completed", recipients,
@@ -760,21 +802,67 @@ class MessagePushService:
     @staticmethod
     async def notify_worklog_reminder(db: Session, user_id: int, team_id: int):
         """通知工作日志提醒"""
-        await MessagePushService.send_worklog_notification(
-            db, 0, "worklog_reminder", [user_id],
-            {"team_id": team_id}
-        )
+        await MessagePushService.notify_worklog_reminders(db, team_id, [user_id])
+    
+    @staticmethod
+    async def notify_work_record_reminder(db: Session, user_id: int, minutes_since_last_record: Optional[int] = None):
+        """按用户设置的间隔提醒记录工作内容"""
+        try:
+            now = datetime.now()
+            if minutes_since_last_record is None:
+                content = f"现在是 {now:%H:%M}，您今天还没有记录工作内容"
+            else:
+                content = f"现在是 {now:%H:%M}，距离上次记录已经 {minutes_since_last_record} 分钟，请及时记录工作内容"
+            message_data = {
+                "type": "worklog_notification",
+                "notification_type": "work_record_reminder",
+                "minutes_since_last_record": minutes_since_last_record,
+                "timestamp": now.isoformat(),
+                "extra_data": {}
+            }
+            await MessagePushService.deliver(db, MessageCreate(
+                title="工作记录提醒",
+                content=content,
+                message_type="worklog",
+                recipients=[user_id],
+                message_data=message_data
+            ))
+            
+        except Exception as e:
+            logger.error(f"发送工作记录提醒失败: {e}")
+    
+    @staticmethod
+    async def notify_worklog_reminders(db: Session, team_id: int, user_ids: List[int]):
+        """提醒团队中今天还没有提交工作日志的成员，所有成员共用一条消息"""
+        try:
+            message_data = {
+                "type": "worklog_notification",
+                "notification_type": "worklog_reminder",
+                "team_id": team_id,
+                "timestamp": datetime.now().isoformat(),
+                "extra_data": {"team_id": team_id}
+            }
+            message_create = MessageCreate(
+                title="工作日志提醒",
+                content="您今天还没有提交工作日志，请及时填写",
+                message_type="worklog",
+                priority="important",
+                recipients=user_ids,
+                message_data=message_data
+            )
+            await MessagePushService.deliver(db, message_create, team_id)
+            logger.info(f"工作日志提醒已发送: 团队ID: {team_id}，{len(user_ids)} 人")
+            
+        except Exception as e:
+            logger.error(f"发送工作日志提醒失败: {e}")
     
     @staticmethod
     async def notify_worklog_submitted(db: Session, worklog_id: int, submitter_id: int, team_id: int):
         """通知工作日志提交"""
         # 通知团队管理员
-        admin_ids = db.query(TeamMember.user_id).filter(
-            TeamMember.team_id == team_id,
-            TeamMember.role == TEAM_ADMIN
-        ).all()
+        admin_ids = membership_service.get_team_admin_ids(db, team_id)
         
-        recipients = [admin_id[0] for admin_id in admin_ids if admin_id[0] != submitter_id]
+        recipients = [admin_id for admin_id in admin_ids if admin_id != submitter_id]
         
         await MessagePushService.send_worklog_notification(
             db, worklog_id, "worklog_submitted", recipients,
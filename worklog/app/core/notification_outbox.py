@@ -0,0 +1,225 @@
+"""
+通知发件箱
+
+请求处理函数只调用 notification_outbox.publish(...) 登记通知事件，随即返回，
+不再为每条通知新建事件循环。应用启动时在主事件循环中运行唯一的分发任务：
+1. 从线程安全队列中取出事件并凑批（最多 NOTIFICATION_BATCH_SIZE 条，最多等待 NOTIFICATION_FLUSH_INTERVAL 秒）
+2. 在线程池中用独立的数据库会话执行 message_push_service 对应的 notify_* 方法，
+   生成的消息收集起来一次性批量入库、一次提交，数据库操作不阻塞事件循环
+3. 提交成功后再回到事件循环通过 ws_manager 推送（团队通知发布到团队频道），推送内容带上消息id
+事件参数中的 ORM 对象在登记时复制各列的当前值，通知内容反映登记时的状态，
+也避免跨线程共享请求的会话。
+"""
+import asyncio
+import logging
+import queue
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.state import InstanceState
+
+from app.core.config import settings
+from app.core.message_service import Delivery, MessagePushService, delivery_collector, message_push_service
+from app.crud.message import message_crud
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDeliveryError(Exception):
+    """通知消息保存失败"""
+
+
+class ModelSnapshot(NamedTuple):
+    """ORM 对象在登记时的列值，分发时还原成只读的属性对象"""
+    model: type
+    values: Dict[str, Any]
+
+
+class NotificationEvent(NamedTuple):
+    method: str
+    args: tuple
+    kwargs: dict
+
+
+def _snapshot(value):
+    state = inspect(value, raiseerr=False)
+    if not isinstance(state, InstanceState):
+        return value
+    if state.identity is None:
+        raise ValueError(f"{type(value).__name__} 尚未入库，无法登记通知")
+    return ModelSnapshot(state.class_, {attr.key: getattr(value, attr.key) for attr in state.mapper.column_attrs})
+
+
+def _resolve(value):
+    if not isinstance(value, ModelSnapshot):
+        return value
+    return SimpleNamespace(**value.values)
+
+
+def _run_collecting(coro):
+    """
+    在当前线程中执行 notify_* 协程：收集模式下消息只登记不推送，协程不会挂起
+    """
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("通知方法在收集模式下不应等待异步操作")
+
+
+class NotificationOutbox:
+    """通知事件队列和分发器"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        batch_size: int = settings.NOTIFICATION_BATCH_SIZE,
+        flush_interval: float = settings.NOTIFICATION_FLUSH_INTERVAL,
+        max_pending: int = settings.NOTIFICATION_QUEUE_MAX_SIZE
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[NotificationEvent]" = queue.Queue(maxsize=max_pending)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def publish(self, method: str, *args, **kwargs) -> bool:
+        """
+        登记一条通知事件，method 为 message_push_service 的方法名，参数不含 db
+        可在任意线程调用，不会抛出异常；登记失败时记录日志并返回False
+        """
+        try:
+            if not hasattr(message_push_service, method):
+                raise AttributeError(f"未知的通知方法: {method}")
+            event = NotificationEvent(
+                method,
+                tuple(_snapshot(arg) for arg in args),
+                {key: _snapshot(value) for key, value in kwargs.items()}
+            )
+            self._queue.put_nowait(event)
+        except queue.Full:
+            logger.error(f"通知队列已满，丢弃通知: {method}")
+            return False
+        except Exception as e:
+            logger.error(f"登记通知失败: {method} - {e}")
+            return False
+
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                # 事件循环已关闭，事件留在队列中
+                pass
+        return True
+
+    def pending(self) -> int:
+        """队列中待分发的事件数"""
+        return self._queue.qsize()
+
+    async def start(self):
+        """在当前事件循环中启动分发任务，应用启动时调用"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        if not self._queue.empty():
+            self._wakeup.set()
+        logger.info("通知分发器已启动")
+
+    async def stop(self):
+        """停止分发任务，并投递队列中剩余的事件"""
+        task = self._task
+        if task is None:
+            return
+        self._task = None
+        self._loop = None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await self.drain()
+        logger.info("通知分发器已停止")
+
+    async def drain(self, raise_on_failure: bool = False):
+        """
+        分发队列中当前的全部事件
+        raise_on_failure 为True时，有批次保存失败则在分发完其余批次后抛出 NotificationDeliveryError，
+        供定时任务据此判定执行失败并重试
+        """
+        failed = 0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                break
+            if not await self._dispatch(batch):
+                failed += len(batch)
+        if failed and raise_on_failure:
+            raise NotificationDeliveryError(f"{failed} 个通知事件保存失败")
+
+    def _take_batch(self) -> List[NotificationEvent]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.flush_interval > 0 and self._queue.qsize() < self.batch_size:
+                # 稍等片刻，让同一时刻的多条通知合并成一批
+                await asyncio.sleep(self.flush_interval)
+            try:
+                await self.drain()
+            except Exception as e:
+                logger.error(f"分发通知失败: {e}")
+
+    async def _dispatch(self, batch: List[NotificationEvent]) -> bool:
+        """保存并推送一批事件，消息保存失败时返回False"""
+        stored = await asyncio.to_thread(self._store, batch)
+        if stored is None:
+            return False
+        collected, message_ids = stored
+        for delivery, message_id in zip(collected, message_ids):
+            await MessagePushService.push(delivery, message_id)
+        logger.info(f"已分发 {len(batch)} 个通知事件，生成 {len(message_ids)} 条消息")
+        return True
+
+    def _store(self, batch: List[NotificationEvent]) -> Optional[Tuple[List[Delivery], List[int]]]:
+        """在线程池中执行：生成一批事件的消息并一次提交，返回 (投递计划, 消息id)，失败时返回None"""
+        collected: List[Delivery] = []
+        db = self.session_factory()
+        token = delivery_collector.set(collected)
+        try:
+            for event in batch:
+                try:
+                    args = [_resolve(arg) for arg in event.args]
+                    kwargs = {key: _resolve(value) for key, value in event.kwargs.items()}
+                    _run_collecting(getattr(message_push_service, event.method)(db, *args, **kwargs))
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"处理通知失败: {event.method} - {e}")
+            message_ids = message_crud.create_many(db, objs_in=[delivery.message for delivery in collected])
+        except Exception as e:
+            db.rollback()
+            logger.error(f"保存通知消息失败，丢弃 {len(collected)} 条: {e}")
+            return None
+        finally:
+            delivery_collector.reset(token)
+            db.close()
+        return collected, message_ids
+
+
+notification_outbox = NotificationOutbox()
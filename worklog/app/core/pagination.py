@@ -0,0 +1,71 @@
+"""
+游标（keyset）分页工具
+
+按 (排序字段, id) 倒序翻页，下一页条件为 "排序字段 < 上一页末条" 或 "排序字段相同且 id 更小"，
+深分页不再需要 OFFSET 扫描前面的行。排序字段为 NULL 的行在倒序中排在最后（MySQL/SQLite 一致）。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+CursorKey = Tuple[Optional[datetime], int]
+
+
+def encode_cursor(sort_value: Optional[datetime], row_id: int) -> str:
+    """将 (排序值, id) 编码为不透明的游标字符串"""
+    payload = {
+        "v": sort_value.isoformat() if sort_value is not None else None,
+        "id": row_id,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[CursorKey]:
+    """
+    解析游标字符串，空字符串表示第一页
+    格式错误时抛出 ValueError
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        sort_value = payload["v"]
+        return (
+            datetime.fromisoformat(sort_value) if sort_value is not None else None,
+            int(payload["id"]),
+        )
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+def apply_keyset(query, sort_column, id_column, key: Optional[CursorKey], limit: int):
+    """
+    为查询追加游标条件与排序，多取一条用于判断是否还有下一页
+    """
+    if key is not None:
+        sort_value, last_id = key
+        if sort_value is None:
+            query = query.filter(sort_column.is_(None), id_column < last_id)
+        else:
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < last_id),
+                sort_column.is_(None)
+            ))
+    return query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def split_page(rows: List[Any], limit: int, sort_getter, id_getter) -> Tuple[List[Any], Optional[str]]:
+    """
+    截取一页数据并生成下一页游标，没有更多数据时游标为 None
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(sort_getter(last), id_getter(last))
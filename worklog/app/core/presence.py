@@ -0,0 +1,396 @@
+"""
+在线状态
+
+每个 WebSocket 连接在共享存储中有一条记录（连接标识 -> 是否空闲、最后心跳时间），
+用户状态由其在所有进程上的连接共同决定：
+- online：有连接最近 PRESENCE_IDLE_AFTER 秒内收到过心跳，且客户端未报告空闲
+- idle：有连接，但客户端都报告空闲（页面不可见等）或心跳间隔超过 PRESENCE_IDLE_AFTER 秒
+- offline：没有连接，或连接的最后心跳已超过 PRESENCE_EXPIRE_AFTER 秒（进程退出后留下的记录）
+本进程的连接实时计算，其他进程的连接来自存储。
+超过 PRESENCE_EXPIRE_AFTER 秒没有任何消息的本进程连接视为僵尸连接，直接移除。
+
+后台任务每 PRESENCE_PUBLISH_INTERVAL 秒扫描一次：刷新本进程连接的记录、删除已断开连接的记录，
+再计算本进程关注的用户（现在或上次扫描时有连接）的状态，与上次结果比较，把变化按团队合并后
+发布到团队频道：{"type": "presence", "team_id": ..., "changes": [{"user_id": ..., "status": ...}]}
+间隔内的多次变化只发布最终状态，状态来回切换不会产生推送。
+同一用户在多个进程上有连接时各进程会发现同一变化，存储中记录最后发布的状态，只有改写它的进程发布；
+在一个进程上断开而其他进程上仍有连接时状态不变，不会发布离线。
+存储由 PRESENCE_STORE 选择：memory 进程内，适用于单进程部署和测试；redis 多进程共享（需要 Redis 6.2+）
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.ws_manager import Connection, ConnectionManager, ws_manager
+
+logger = logging.getLogger(__name__)
+
+ONLINE = "online"
+IDLE = "idle"
+OFFLINE = "offline"
+
+# 连接记录：(是否空闲, 最后心跳的时间戳 time.time())
+Record = Tuple[bool, float]
+
+
+class PresenceStore(ABC):
+    """在线状态的共享存储"""
+
+    @abstractmethod
+    def put(self, records: Dict[int, Dict[str, Record]], ttl: float):
+        """写入或刷新连接记录 {user_id: {连接标识: 记录}}，ttl 秒内没有刷新的记录可以丢弃"""
+
+    @abstractmethod
+    def remove(self, connections: Dict[int, List[str]]):
+        """删除已断开连接的记录 {user_id: [连接标识]}"""
+
+    @abstractmethod
+    def load(self, user_ids: List[int]) -> Dict[int, Dict[str, Record]]:
+        """读取这些用户在所有进程上的连接记录"""
+
+    @abstractmethod
+    def users(self, since: float) -> List[int]:
+        """since 之后有过心跳的用户"""
+
+    @abstractmethod
+    def swap_statuses(self, statuses: Dict[int, str]) -> Dict[int, Optional[str]]:
+        """记录最后发布的状态并返回原来的值（没有记录时为None），离线用户的记录删除"""
+
+
+class InMemoryPresenceStore(PresenceStore):
+    """进程内存储，多个 PresenceService 共享同一实例时相当于多个进程"""
+
+    def __init__(self):
+        self.records: Dict[int, Dict[str, Record]] = {}
+        self.published: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def put(self, records, ttl):
+        with self._lock:
+            for user_id, connections in records.items():
+                self.records.setdefault(user_id, {}).update(connections)
+
+    def remove(self, connections):
+        with self._lock:
+            for user_id, keys in connections.items():
+                records = self.records.get(user_id, {})
+                for key in keys:
+                    records.pop(key, None)
+                if not records:
+                    self.records.pop(user_id, None)
+
+    def load(self, user_ids):
+        with self._lock:
+            return {user_id: dict(self.records.get(user_id, {})) for user_id in user_ids}
+
+    def users(self, since):
+        with self._lock:
+            return [
+                user_id for user_id, records in self.records.items()
+                if any(seen_at >= since for _, seen_at in records.values())
+            ]
+
+    def swap_statuses(self, statuses):
+        with self._lock:
+            previous = {}
+            for user_id, status in statuses.items():
+                previous[user_id] = self.published.get(user_id)
+                if status == OFFLINE:
+                    self.published.pop(user_id, None)
+                else:
+                    self.published[user_id] = status
+            return previous
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+            self.published.clear()
+
+
+class RedisPresenceStore(PresenceStore):
+    """
+    Redis 存储：presence:conn:{user_id} 哈希保存连接记录，presence:users 有序集合按最后心跳排序，
+    presence:status:{user_id} 保存最后发布的状态。每次扫描用一个 pipeline 批量读写
+    """
+
+    # 最后发布的状态的保留时间，用户一直在线时每次状态变化都会刷新
+    STATUS_TTL = 86400
+
+    def __init__(self, client=None, prefix: str = "presence:"):
+        self._client = client
+        self.prefix = prefix
+
+    @property
+    def client(self):
+        if self._client is None:
+            # 仅在启用redis存储时才需要安装redis
+            import redis
+            self._client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD,
+                db=settings.REDIS_DB
+            )
+        return self._client
+
+    def _connections_key(self, user_id: int) -> str:
+        return f"{self.prefix}conn:{user_id}"
+
+    def _status_key(self, user_id: int) -> str:
+        return f"{self.prefix}status:{user_id}"
+
+    @property
+    def _users_key(self) -> str:
+        return f"{self.prefix}users"
+
+    def put(self, records, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        for user_id, connections in records.items():
+            key = self._connections_key(user_id)
+            pipe.hset(key, mapping={
+                connection_key: f"{int(idle)}:{seen_at}" for connection_key, (idle, seen_at) in connections.items()
+            })
+            pipe.expire(key, math.ceil(ttl))
+            pipe.zadd(self._users_key, {str(user_id): max(seen_at for _, seen_at in connections.values())})
+        pipe.execute()
+
+    def remove(self, connections):
+        user_ids = list(connections)
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hdel(self._connections_key(user_id), *connections[user_id])
+            pipe.hlen(self._connections_key(user_id))
+        results = pipe.execute()
+        emptied = [str(user_id) for user_id, remaining in zip(user_ids, results[1::2]) if not remaining]
+        if emptied:
+            self.client.zrem(self._users_key, *emptied)
+
+    def load(self, user_ids):
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(self._connections_key(user_id))
+        result = {}
+        for user_id, fields in zip(user_ids, pipe.execute()):
+            records = {}
+            for key, value in fields.items():
+                idle, _, seen_at = value.decode().partition(":")
+                records[key.decode()] = (idle == "1", float(seen_at))
+            result[user_id] = records
+        return result
+
+    def users(self, since):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(self._users_key, "-inf", f"({since}")
+        pipe.zrange(self._users_key, 0, -1)
+        return [int(user_id) for user_id in pipe.execute()[1]]
+
+    def swap_statuses(self, statuses):
+        user_ids = list(statuses)
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            status = statuses[user_id]
+            if status == OFFLINE:
+                pipe.getdel(self._status_key(user_id))
+            else:
+                pipe.set(self._status_key(user_id), status, ex=self.STATUS_TTL, get=True)
+        return {
+            user_id: previous.decode() if previous is not None else None
+            for user_id, previous in zip(user_ids, pipe.execute())
+        }
+
+
+def create_presence_store(kind: Optional[str] = None) -> PresenceStore:
+    kind = kind or settings.PRESENCE_STORE or settings.WS_BROKER
+    if kind == "memory":
+        return InMemoryPresenceStore()
+    if kind == "redis":
+        return RedisPresenceStore()
+    raise ValueError(f"未知的在线状态存储: {kind}")
+
+
+class PresenceService:
+    """用户在线状态跟踪与推送"""
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        store: Optional[PresenceStore] = None,
+        idle_after: float = settings.PRESENCE_IDLE_AFTER,
+        expire_after: float = settings.PRESENCE_EXPIRE_AFTER,
+        publish_interval: float = settings.PRESENCE_PUBLISH_INTERVAL
+    ):
+        self.manager = manager
+        self.store = store or create_presence_store()
+        self.idle_after = idle_after
+        self.expire_after = expire_after
+        self.publish_interval = publish_interval
+        # 上次扫描时的状态和所在团队，用于计算变化；只保留在本进程有连接的用户
+        self.states: Dict[int, str] = {}
+        self._teams: Dict[int, FrozenSet[int]] = {}
+        # 上次写入存储的本进程连接，user_id -> 连接标识
+        self._written: Dict[int, Set[str]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, connection: Connection, idle: Optional[bool] = None):
+        """收到客户端消息时调用，idle 为客户端报告的空闲状态，None 表示未报告"""
+        connection.last_seen = time.monotonic()
+        if idle is not None:
+            connection.idle = bool(idle)
+
+    def _connection_key(self, connection: Connection) -> str:
+        return f"{self.manager.instance_id}:{id(connection)}"
+
+    def _local_records(self, user_id: int) -> Dict[str, Record]:
+        """本进程连接的记录，心跳时间换算成时间戳"""
+        offset = time.time() - time.monotonic()
+        return {
+            self._connection_key(connection): (connection.idle, connection.last_seen + offset)
+            for connection in self.manager.active_connections.get(user_id, ())
+        }
+
+    def _status(self, records: Iterable[Record], now: float) -> str:
+        status = OFFLINE
+        for idle, seen_at in records:
+            age = now - seen_at
+            if age > self.expire_after:
+                continue
+            if not idle and age <= self.idle_after:
+                return ONLINE
+            status = IDLE
+        return status
+
+    def get_statuses(self, user_ids: List[int]) -> Dict[int, str]:
+        """用户当前状态：本进程的连接实时计算，其他进程的连接来自存储；存储不可用时只看本进程"""
+        user_ids = list(dict.fromkeys(user_ids))
+        try:
+            stored = self.store.load(user_ids)
+        except Exception as e:
+            logger.error(f"读取在线状态失败: {e}")
+            stored = {}
+        own = f"{self.manager.instance_id}:"
+        now = time.time()
+        statuses = {}
+        for user_id in user_ids:
+            records = {key: record for key, record in stored.get(user_id, {}).items() if not key.startswith(own)}
+            records.update(self._local_records(user_id))
+            statuses[user_id] = self._status(records.values(), now)
+        return statuses
+
+    def get_status(self, user_id: int) -> str:
+        return self.get_statuses([user_id])[user_id]
+
+    def connected_users(self) -> List[int]:
+        """在任一进程上有连接的用户"""
+        try:
+            users = set(self.store.users(time.time() - self.expire_after))
+        except Exception as e:
+            logger.error(f"读取在线用户失败: {e}")
+            users = set()
+        users.update(self.manager.active_connections)
+        return sorted(users)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        # 删除本进程连接的记录，其他进程不必等记录过期
+        written, self._written = self._written, {}
+        if written:
+            try:
+                await asyncio.to_thread(self.store.remove, {user_id: list(keys) for user_id, keys in written.items()})
+            except Exception as e:
+                logger.error(f"删除在线状态记录失败: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"更新在线状态失败: {e}")
+
+    def expire(self) -> int:
+        """移除超过 expire_after 秒没有消息的连接，返回移除的数量"""
+        deadline = time.monotonic() - self.expire_after
+        expired = [
+            connection
+            for connections in list(self.manager.active_connections.values())
+            for connection in connections
+            if connection.last_seen < deadline
+        ]
+        for connection in expired:
+            self.manager.evict(connection, "心跳超时")
+        return len(expired)
+
+    def _sync_store(self, local: Dict[int, Dict[str, Record]], removed: Dict[int, List[str]],
+                    user_ids: List[int]) -> Dict[int, Dict[str, Record]]:
+        """在线程池中执行：刷新本进程的连接记录，读取关注用户的全部记录"""
+        if removed:
+            self.store.remove(removed)
+        if local:
+            self.store.put(local, self.expire_after)
+        return self.store.load(user_ids)
+
+    async def sweep(self):
+        """清理僵尸连接，同步存储，计算状态变化并按团队发布"""
+        self.expire()
+        local = {user_id: self._local_records(user_id) for user_id in list(self.manager.active_connections)}
+        removed = {}
+        for user_id, keys in self._written.items():
+            gone = keys - local.get(user_id, {}).keys()
+            if gone:
+                removed[user_id] = list(gone)
+        self._written = {user_id: set(records) for user_id, records in local.items()}
+        tracked = list(local.keys() | self.states.keys())
+        teams = {user_id: self.manager.user_teams.get(user_id, frozenset()) for user_id in local}
+
+        try:
+            stored = await asyncio.to_thread(self._sync_store, local, removed, tracked)
+        except Exception as e:
+            # 存储不可用时按本进程的连接计算，也不与其他进程去重
+            logger.error(f"同步在线状态失败: {e}")
+            stored = None
+        now = time.time()
+        records = stored if stored is not None else local
+        states = {user_id: self._status(records.get(user_id, {}).values(), now) for user_id in tracked}
+        changed = {user_id: status for user_id, status in states.items() if status != self.states.get(user_id, OFFLINE)}
+
+        previous: Optional[Dict[int, Optional[str]]] = None
+        if changed and stored is not None:
+            try:
+                previous = await asyncio.to_thread(self.store.swap_statuses, changed)
+            except Exception as e:
+                logger.error(f"记录在线状态失败: {e}")
+        changes: Dict[int, List[dict]] = {}
+        for user_id, status in changed.items():
+            # 其他进程已经发布过同一状态
+            if previous is not None and (previous.get(user_id) or OFFLINE) == status:
+                continue
+            # 离线用户已不在团队索引中，使用上次记录的团队
+            for team_id in teams.get(user_id) or self._teams.get(user_id, ()):
+                changes.setdefault(team_id, []).append({"user_id": user_id, "status": status})
+
+        self.states = {user_id: status for user_id, status in states.items() if user_id in local}
+        self._teams = teams
+        for team_id, team_changes in changes.items():
+            await self.manager.send_to_team(team_id, {
+                "type": "presence",
+                "team_id": team_id,
+                "changes": team_changes
+            })
+
+
+presence_service = PresenceService(ws_manager)
@@ -2,67 +2,120 @@
 """
 提醒服务
 用于发送定时通知，如工作日志提醒、任务截止提醒等
+
+ReminderScheduler 按每个用户的设置发送工作记录提醒：
+1. 用户的提醒时刻为 work_hours_start + 偏移 + k * reminder_interval，只落在工作时间内；
+   偏移按用户id在一个间隔内均匀分散，提醒分布在整个小时内而不是集中在整点
+2. 各用户的下次提醒时间保存在最小堆中，只处理已到期的用户
+3. 用户设置先按id分批加载，之后只加载 updated_at 变化的用户，修改设置后重新排期
+4. 同一时刻到期的用户一次查询最近的工作日志、一次批量写入 Reminder 记录；
+   间隔内已经记录过工作的用户跳过（记录为 skipped）
+
+多实例部署时由 JobCoordinator（app/core/job_lock.py）协调：
+ReminderScheduler 只在持有 work_record_reminders 租约的实例上运行，接管时重新加载全部用户，
+last_reminder_at 不早于提醒时刻的用户视为已发送；整点任务、工作日志提醒和每日总结按时间窗口的幂等键各执行一次
 """
 
 import asyncio
+import heapq
 import logging
-from datetime import datetime, timedelta
-from typing import List
+import math
+from datetime import datetime, time, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import bindparam, func, insert, update
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.db.session import SessionLocal
+from app.models.reminder import Reminder
 from app.models.user import User
 from app.models.team import Team
 from app.models.team_member import TeamMember
-from app.models.task import Task
+from app.models.task import Task, TaskStatus
+from app.models.enums import TEAM_ADMIN
 from app.models.work_log import WorkLog
+from app.core.membership import membership_service
 from app.core.message_service import message_push_service
+from app.core.notification_outbox import NotificationOutbox, notification_outbox
+from app.core.job_lock import JobCoordinator, job_coordinator
 
 logger = logging.getLogger(__name__)
 
+
+class TeamSummary(NamedTuple):
+    """团队当天的工作统计"""
+    team_id: int
+    team_name: str
+    admin_ids: List[int]
+    worklog_count: int
+    completed_tasks: int
+
+
 class ReminderService:
     """提醒服务"""
     
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        outbox: NotificationOutbox = notification_outbox
+    ):
+        self.session_factory = session_factory
+        self.outbox = outbox
+    
     @staticmethod
-    async def send_worklog_reminders():
-        """发送工作日志提醒"""
+    def find_missing_worklogs(db: Session, since: datetime) -> Dict[int, List[int]]:
+        """
+        查找 since 之后还没有提交工作日志的活跃用户，按团队分组返回 {team_id: [user_id]}
+        一次 NOT EXISTS 反连接查询完成，不再逐个用户查询
+        """
+        logged = db.query(WorkLog.id).filter(
+            WorkLog.user_id == TeamMember.user_id,
+            WorkLog.created_at >= since
+        ).exists()
+        rows = db.query(TeamMember.team_id, TeamMember.user_id).join(
+            User, User.id == TeamMember.user_id
+        ).filter(
+            User.is_active == True,
+            ~logged
+        ).order_by(TeamMember.team_id, TeamMember.user_id).all()
+        
+        missing: Dict[int, List[int]] = {}
+        for team_id, user_id in rows:
+            missing.setdefault(team_id, []).append(user_id)
+        return missing
+    
+    async def send_worklog_reminders(self) -> int:
+        """
+        发送工作日志提醒，返回提醒的人次
+        每个团队一条提醒消息（每个接收者一条收件箱记录），经通知发件箱批量入库和推送
+        """
         try:
-            db = SessionLocal()
+            db = self.session_factory()
+            try:
+                today = datetime.combine(datetime.now().date(), time.min)
+                missing = self.find_missing_worklogs(db, today)
+                # 分发时按团队决定推送方式，提前一次加载全部团队名单
+                membership_service.prefetch_teams(db, list(missing))
+            finally:
+                db.close()
             
-            # 获取所有活跃用户
-            users = db.query(User).filter(User.is_active == True).all()
+            for team_id, user_ids in missing.items():
+                self.outbox.publish("notify_worklog_reminders", team_id, user_ids)
+            await self.outbox.drain(raise_on_failure=True)
             
-            for user in users:
-                # 检查用户今天是否已经提交了工作日志
-                today = datetime.now().date()
-                existing_worklog = db.query(WorkLog).filter(
-                    WorkLog.user_id == user.id,
-                    WorkLog.created_at >= today
-                ).first()
-                
-                if not existing_worklog:
-                    # 获取用户所在的团队
-                    user_teams = db.query(TeamMember).filter(
-                        TeamMember.user_id == user.id
-                    ).all()
-                    
-                    for team_member in user_teams:
-                        await message_push_service.notify_worklog_reminder(
-                            db, user.id, team_member.team_id
-                        )
-                        logger.info(f"已发送工作日志提醒给用户 {user.username}")
-            
-            db.close()
+            reminded = sum(len(user_ids) for user_ids in missing.values())
+            logger.info(f"已发送工作日志提醒：{len(missing)} 个团队，{reminded} 人次")
+            return reminded
             
         except Exception as e:
+            # 抛出异常，由 JobCoordinator 删除执行记录并在下次检查时重试
             logger.error(f"发送工作日志提醒失败: {e}")
+            raise
     
-    @staticmethod
-    async def send_task_due_reminders():
+    async def send_task_due_reminders(self):
         """发送任务截止提醒"""
+        db = self.session_factory()
         try:
-            db = SessionLocal()
-            
             # 获取即将到期的任务（3天内）
             three_days_later = datetime.now() + timedelta(days=3)
             tasks = db.query(Task).filter(
@@ -82,69 +135,380 @@ class ReminderService:
                     )
                     logger.info(f"已发送任务截止提醒：任务 {task.title}，剩余 {days_remaining} 天")
             
-            db.close()
-            
         except Exception as e:
             logger.error(f"发送任务截止提醒失败: {e}")
+            raise
+        finally:
+            db.close()
     
     @staticmethod
-    async def send_daily_summary():
-        """发送每日总结"""
+    def summarize_teams(db: Session, since: datetime) -> List[TeamSummary]:
+        """
+        统计 since 之后各团队的工作日志数和完成任务数，返回有管理员的团队的总结
+        两次分组聚合查询加一次管理员名单查询，在内存中按团队合并，查询次数与团队数无关
+        """
+        worklog_counts = dict(db.query(WorkLog.team_id, func.count(WorkLog.id)).filter(
+            WorkLog.team_id.isnot(None),
+            WorkLog.created_at >= since
+        ).group_by(WorkLog.team_id).all())
+        completed_counts = dict(db.query(Task.team_id, func.count(Task.id)).filter(
+            Task.team_id.isnot(None),
+            Task.status == TaskStatus.COMPLETED,
+            Task.completed_at >= since
+        ).group_by(Task.team_id).all())
+        
+        admins = db.query(TeamMember.team_id, Team.name, TeamMember.user_id).join(
+            Team, Team.id == TeamMember.team_id
+        ).filter(TeamMember.role == TEAM_ADMIN).order_by(TeamMember.team_id, TeamMember.user_id).all()
+        
+        summaries: Dict[int, TeamSummary] = {}
+        for team_id, team_name, user_id in admins:
+            if team_id not in summaries:
+                summaries[team_id] = TeamSummary(
+                    team_id, team_name, [],
+                    worklog_counts.get(team_id, 0), completed_counts.get(team_id, 0)
+                )
+            summaries[team_id].admin_ids.append(user_id)
+        return list(summaries.values())
+    
+    async def send_daily_summary(self) -> int:
+        """发送每日总结给各团队管理员，每个团队一条消息，经通知发件箱批量入库和推送，返回团队数"""
         try:
-            db = SessionLocal()
+            db = self.session_factory()
+            try:
+                today = datetime.combine(datetime.now().date(), time.min)
+                summaries = self.summarize_teams(db, today)
+            finally:
+                db.close()
             
-            # 获取所有团队
-            teams = db.query(Team).all()
-            
-            for team in teams:
-                # 获取团队成员
-                members = db.query(TeamMember).filter(
-                    TeamMember.team_id == team.id
-                ).all()
-                
-                if members:
-                    # 统计今日工作日志
-                    today = datetime.now().date()
-                    worklog_count = db.query(WorkLog).filter(
-                        WorkLog.team_id == team.id,
-                        WorkLog.created_at >= today
-                    ).count()
-                    
-                    # 统计今日完成任务
-                    completed_tasks = db.query(Task).filter(
-                        Task.team_id == team.id,
-                        Task.status == "completed",
-                        Task.completed_at >= today
-                    ).count()
-                    
-                    # 发送每日总结给团队管理员
-                    admin_members = [m for m in members if m.role == "admin"]
-                    for admin in admin_members:
-                        await message_push_service.send_system_notification(
-                            db,
-                            f"团队 {team.name} 每日总结",
-                            f"今日工作日志：{worklog_count} 条\n今日完成任务：{completed_tasks} 个",
-                            [admin.user_id],
-                            "daily_summary"
-                        )
+            for summary in summaries:
+                self.outbox.publish(
+                    "send_system_notification",
+                    f"团队 {summary.team_name} 每日总结",
+                    f"今日工作日志：{summary.worklog_count} 条\n今日完成任务：{summary.completed_tasks} 个",
+                    summary.admin_ids,
+                    "daily_summary",
+                    {
+                        "team_id": summary.team_id,
+                        "worklog_count": summary.worklog_count,
+                        "completed_tasks": summary.completed_tasks
+                    }
+                )
+            await self.outbox.drain(raise_on_failure=True)
             
-            db.close()
+            logger.info(f"已发送每日总结：{len(summaries)} 个团队")
+            return len(summaries)
             
         except Exception as e:
             logger.error(f"发送每日总结失败: {e}")
+            raise
     
-    @staticmethod
-    async def run_all_reminders():
-        """运行所有提醒"""
+    async def run_all_reminders(self):
+        """运行所有提醒，工作记录提醒由 ReminderScheduler 按用户设置单独发送；某项失败不影响其他提醒"""
         logger.info("开始运行定时提醒...")
         
         await asyncio.gather(
-            ReminderService.send_worklog_reminders(),
-            ReminderService.send_task_due_reminders(),
-            ReminderService.send_daily_summary()
+            self.send_worklog_reminders(),
+            self.send_task_due_reminders(),
+            self.send_daily_summary(),
+            return_exceptions=True
         )
         
         logger.info("定时提醒运行完成")
+    
+    async def run_scheduled_jobs(self, coordinator: JobCoordinator, now: Optional[datetime] = None) -> List[str]:
+        """
+        多实例部署时运行整点任务：任务截止提醒每小时一次，
+        工作日志提醒在 WORKLOG_REMINDER_HOUR 之后、每日总结在 DAILY_SUMMARY_HOUR 之后每天一次
+        幂等键包含时间窗口，同一窗口内无论哪个实例、检查多少次都只执行一次，返回本次执行的任务键；
+        任务抛出异常时不计入，下次检查时重试
+        """
+        now = now or datetime.now()
+        jobs = [(f"task_due_reminders:{now:%Y-%m-%d-%H}", self.send_task_due_reminders)]
+        if now.hour >= settings.WORKLOG_REMINDER_HOUR:
+            jobs.append((f"worklog_reminders:{now:%Y-%m-%d}", self.send_worklog_reminders))
+        if now.hour >= settings.DAILY_SUMMARY_HOUR:
+            jobs.append((f"daily_summary:{now:%Y-%m-%d}", self.send_daily_summary))
+        
+        executed = []
+        for key, job in jobs:
+            if await coordinator.run_once(key, job):
+                executed.append(key)
+        return executed
 
 # 创建全局实例
-reminder_service = ReminderService() 
\ No newline at end of file
+reminder_service = ReminderService()
+
+
+class ReminderProfile(NamedTuple):
+    """用户的提醒设置"""
+    user_id: int
+    interval: timedelta
+    start: time
+    end: time
+    offset: timedelta
+
+
+def reminder_offset(user_id: int, interval: timedelta) -> timedelta:
+    """用户在一个提醒间隔内的固定偏移，使各用户的提醒时刻均匀分散"""
+    seconds = int(interval.total_seconds())
+    return timedelta(seconds=(user_id * 2654435761) % seconds) if seconds > 0 else timedelta()
+
+
+def next_reminder_at(profile: ReminderProfile, after: datetime, max_days: int = 7) -> Optional[datetime]:
+    """after 之后（含）最近一个落在工作时间内的提醒时刻；结束时间不晚于开始时间表示跨越午夜"""
+    day = after.date()
+    for _ in range(max_days + 1):
+        start = datetime.combine(day, profile.start) + profile.offset
+        end = datetime.combine(day, profile.end)
+        if profile.end <= profile.start:
+            end += timedelta(days=1)
+        if after <= start:
+            candidate = start
+        else:
+            steps = math.ceil((after - start) / profile.interval)
+            candidate = start + steps * profile.interval
+        if candidate < end:
+            return candidate
+        day += timedelta(days=1)
+    return None
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    # 提醒时间统一使用本地时间，数据库返回带时区的值时去掉时区
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class ReminderScheduler:
+    """按用户设置定时发送工作记录提醒"""
+    
+    LEASE_NAME = "work_record_reminders"
+    
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        outbox: NotificationOutbox = notification_outbox,
+        refresh_interval: float = settings.REMINDER_REFRESH_INTERVAL,
+        load_batch_size: int = settings.REMINDER_LOAD_BATCH_SIZE,
+        coordinator: Optional[JobCoordinator] = None
+    ):
+        self.session_factory = session_factory
+        self.coordinator = coordinator
+        self.outbox = outbox
+        self.refresh_interval = refresh_interval
+        self.load_batch_size = load_batch_size
+        self.profiles: Dict[int, ReminderProfile] = {}
+        # (到期时间, user_id, 版本)；用户设置变化后版本加一，旧的堆元素在弹出时丢弃
+        self._heap: List[Tuple[datetime, int, int]] = []
+        self._versions: Dict[int, int] = {}
+        self._watermark: Optional[datetime] = None
+    
+    def reset(self):
+        """清空排期，失去租约后由新的负责实例发送"""
+        self.profiles.clear()
+        self._heap.clear()
+        self._versions.clear()
+        self._watermark = None
+    
+    def refresh(self, now: datetime) -> int:
+        """加载新增或修改过设置的用户并重新排期，返回处理的用户数"""
+        db = self.session_factory()
+        try:
+            query = db.query(
+                User.id, User.is_active, User.reminder_enabled, User.reminder_interval,
+                User.work_hours_start, User.work_hours_end, User.last_reminder_at, User.updated_at
+            )
+            if self._watermark is not None:
+                # 时间可能只精确到秒（SQLite 还按字符串比较），往前留一秒避免漏掉同一秒内的修改；
+                # 重复加载的用户设置不变时不会重新排期
+                query = query.filter(User.updated_at >= self._watermark - timedelta(seconds=1))
+            loaded = 0
+            last_id = 0
+            while True:
+                rows = query.filter(User.id > last_id).order_by(User.id).limit(self.load_batch_size).all()
+                for row in rows:
+                    self._apply(row, now)
+                    updated_at = _naive(row.updated_at)
+                    if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                        self._watermark = updated_at
+                loaded += len(rows)
+                if len(rows) < self.load_batch_size:
+                    return loaded
+                last_id = rows[-1].id
+        finally:
+            db.close()
+    
+    def _apply(self, row, now: datetime):
+        user_id = row.id
+        if not row.is_active or not row.reminder_enabled or not row.work_hours_start or not row.work_hours_end:
+            if self.profiles.pop(user_id, None) is not None:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            return
+        interval = timedelta(minutes=max(row.reminder_interval or settings.DEFAULT_REMINDER_INTERVAL,
+                                         settings.REMINDER_MIN_INTERVAL))
+        profile = ReminderProfile(
+            user_id, interval, row.work_hours_start, row.work_hours_end, reminder_offset(user_id, interval)
+        )
+        if self.profiles.get(user_id) == profile:
+            return
+        self.profiles[user_id] = profile
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        # 重启后不重复发送上次已经发送过的时刻
+        after = now
+        last_reminder_at = _naive(row.last_reminder_at)
+        if last_reminder_at is not None and last_reminder_at >= now:
+            after = last_reminder_at + timedelta(seconds=1)
+        self._schedule(profile, after)
+    
+    def _schedule(self, profile: ReminderProfile, after: datetime):
+        due = next_reminder_at(profile, after)
+        if due is not None:
+            heapq.heappush(self._heap, (due, profile.user_id, self._versions[profile.user_id]))
+    
+    def next_due(self) -> Optional[datetime]:
+        """最近一次到期时间，堆顶可能是已失效的元素，只用于决定休眠时长"""
+        return self._heap[0][0] if self._heap else None
+    
+    def pop_due(self, now: datetime) -> List[Tuple[int, datetime]]:
+        """取出已到期的 (user_id, 提醒时刻)"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            at, user_id, version = heapq.heappop(self._heap)
+            if user_id in self.profiles and self._versions.get(user_id) == version:
+                due.append((user_id, at))
+        return due
+    
+    async def run_due(self, now: datetime) -> int:
+        """发送已到期的提醒并为这些用户排下一次，返回发送的提醒数"""
+        due = self.pop_due(now)
+        if not due:
+            return 0
+        try:
+            sent = await self._fire(due, now)
+        finally:
+            # 错过的时刻不补发，从当前时间之后排期
+            for user_id, at in due:
+                self._schedule(self.profiles[user_id], max(at, now) + timedelta(seconds=1))
+        return sent
+    
+    async def _fire(self, due: List[Tuple[int, datetime]], now: datetime) -> int:
+        planned = self._plan(due, now)
+        if planned is None:
+            return 0
+        reminders, notifications = planned
+        if notifications:
+            for user_id, minutes in notifications:
+                self.outbox.publish("notify_work_record_reminder", user_id, minutes)
+            # 消息保存失败时抛出异常，不记录提醒和 last_reminder_at，避免未送达的提醒被当作已发送
+            await self.outbox.drain(raise_on_failure=True)
+        
+        db = self.session_factory()
+        try:
+            db.execute(insert(Reminder), reminders)
+            if notifications:
+                # 保留 updated_at，避免发送提醒本身触发重新加载
+                db.execute(
+                    update(User).where(User.id == bindparam("reminded_user_id")).values(
+                        last_reminder_at=bindparam("reminded_at"), updated_at=User.updated_at
+                    ),
+                    [{"reminded_user_id": user_id, "reminded_at": now} for user_id, _ in notifications]
+                )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"记录工作记录提醒失败: {e}")
+        finally:
+            db.close()
+        
+        logger.info(f"已发送工作记录提醒 {len(notifications)} 条，跳过 {len(reminders) - len(notifications)} 条")
+        return len(notifications)
+    
+    def _plan(self, due: List[Tuple[int, datetime]], now: datetime) -> Optional[Tuple[List[dict], List[Tuple[int, Optional[int]]]]]:
+        """查询到期用户的发送状态，返回 (Reminder 记录, 待发送的 (user_id, 距上次记录分钟数))，查询失败时返回None"""
+        db = self.session_factory()
+        try:
+            user_ids = [user_id for user_id, _ in due]
+            # 幂等：last_reminder_at 不早于提醒时刻说明该时刻已经由其他实例（或接管前的负责实例）发送过
+            last_reminded = dict(db.query(User.id, User.last_reminder_at).filter(User.id.in_(user_ids)).all())
+            due = [
+                (user_id, at) for user_id, at in due
+                if last_reminded.get(user_id) is None or _naive(last_reminded[user_id]) < at
+            ]
+            if not due:
+                return None
+            user_ids = [user_id for user_id, _ in due]
+            today = datetime.combine(now.date(), time.min)
+            last_records = dict(db.query(WorkLog.user_id, func.max(WorkLog.created_at)).filter(
+                WorkLog.user_id.in_(user_ids),
+                WorkLog.created_at >= today
+            ).group_by(WorkLog.user_id).all())
+        except Exception as e:
+            logger.error(f"查询工作记录提醒失败: {e}")
+            return None
+        finally:
+            db.close()
+        
+        reminders = []
+        notifications = []
+        for user_id, at in due:
+            last_record = _naive(last_records.get(user_id))
+            # 间隔内已经记录过工作的用户不打扰
+            skipped = last_record is not None and now - last_record < self.profiles[user_id].interval
+            reminders.append({
+                "user_id": user_id, "scheduled_at": at,
+                "sent_at": None if skipped else now,
+                "status": "skipped" if skipped else "sent",
+                "notification_method": "system", "reminder_type": "regular",
+                "message": "工作记录提醒"
+            })
+            if not skipped:
+                minutes = int((now - last_record).total_seconds() // 60) if last_record else None
+                notifications.append((user_id, minutes))
+        return reminders, notifications
+    
+    def is_leader(self) -> bool:
+        """未配置协调器时单实例运行，总是负责发送"""
+        return self.coordinator is None or self.coordinator.is_leader(self.LEASE_NAME)
+    
+    async def run(self):
+        """持续运行：定期加载设置变化，到期时发送提醒；多实例部署时只有持有租约的实例发送"""
+        next_refresh = datetime.min
+        leading = False
+        try:
+            while True:
+                now = datetime.now()
+                try:
+                    if not self.is_leader():
+                        if leading:
+                            logger.warning("工作记录提醒租约已被其他实例接管")
+                            self.reset()
+                            leading = False
+                    else:
+                        if not leading:
+                            # 接管时重新加载全部用户，已发送的时刻按 last_reminder_at 跳过
+                            logger.info("开始负责发送工作记录提醒")
+                            self.reset()
+                            next_refresh = datetime.min
+                            leading = True
+                        if now >= next_refresh:
+                            self.refresh(now)
+                            next_refresh = now + timedelta(seconds=self.refresh_interval)
+                        await self.run_due(now)
+                except Exception as e:
+                    logger.error(f"运行工作记录提醒失败: {e}")
+                wait = self.refresh_interval
+                next_due = self.next_due()
+                if next_due is not None:
+                    wait = min(wait, (next_due - datetime.now()).total_seconds())
+                if self.coordinator is not None:
+                    # 在租约到期前续约
+                    wait = min(wait, self.coordinator.ttl / 3)
+                await asyncio.sleep(max(wait, 0.5))
+        finally:
+            if leading:
+                self.coordinator.resign(self.LEASE_NAME)
+
+
+reminder_scheduler = ReminderScheduler(coordinator=job_coordinator)
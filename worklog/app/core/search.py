@@ -0,0 +1,381 @@
+"""
+全文搜索
+
+任务（标题、描述）、工作日志（内容、详细内容、遇到的问题、解决方案、阻碍因素）和任务评论
+写入 search_documents 表，按数据库使用不同的全文索引：
+1. SQLite：FTS5 虚拟表 search_fts，写入前在应用内分词。中日韩文字的连续字符切成相邻的二元组，
+   并在末尾补一个单字，使单字查询可以用前缀匹配；字母数字串整体作为一个词。按 bm25 排序，标题权重加倍
+2. MySQL：title、body 上的 ngram FULLTEXT 索引（ngram_token_size=2），由 InnoDB 分词，
+   BOOLEAN MODE 按相关度排序
+3. 其他数据库退回 LIKE 匹配，不排序
+查询中的每个词都必须命中：中日韩词按短语匹配（等同于子串匹配），字母数字词按前缀匹配。
+通过ORM增删改任务、工作日志、评论时，在同一次flush中更新搜索文档，随业务事务一起提交或回滚；
+绕过ORM的批量修改需要用 rebuild() 或 rebuild_search_index.py 重建
+"""
+import logging
+import re
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Float, Integer, and_, delete, event, insert, inspect, literal, or_, select, text, update
+from sqlalchemy.orm import Session, object_session
+
+from app.core.config import settings
+from app.models.search import SearchDocument
+from app.models.task import Task, TaskComment
+from app.models.work_log import WorkLog
+
+logger = logging.getLogger(__name__)
+
+DOC_TYPES = ("task", "work_log", "comment")
+
+# 中日韩文字：假名、中日韩统一表意文字（含扩展A）、兼容表意文字、谚文
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_SEGMENT = re.compile(f"([{_CJK}]+)|([0-9A-Za-z\u00c0-\u024f]+)")
+
+_WORK_LOG_BODY = ("details", "issues_encountered", "solutions_applied", "blockers")
+# 影响搜索文档的字段
+_TRACKED = {
+    "task": ("title", "description", "team_id", "is_deleted"),
+    "work_log": ("content", "team_id", "user_id", "task_id") + _WORK_LOG_BODY,
+    "comment": ("content", "task_id"),
+}
+_PENDING = "search_pending"
+
+table = SearchDocument.__table__
+
+
+def segments(value: Optional[str]) -> List[Tuple[str, bool]]:
+    """切分出 (片段, 是否中日韩文字)，字母统一小写"""
+    result = []
+    for match in _SEGMENT.finditer(value or ""):
+        cjk, word = match.groups()
+        result.append((cjk, True) if cjk else (word.lower(), False))
+    return result
+
+
+def _bigrams(segment: str) -> List[str]:
+    return [segment[i:i + 2] for i in range(len(segment) - 1)]
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    """索引分词：中日韩连续字符切成相邻二元组再补末尾单字，字母数字串整体作为一个词"""
+    tokens = []
+    for segment, cjk in segments(value):
+        if cjk:
+            tokens.extend(_bigrams(segment))
+            tokens.append(segment[-1])
+        else:
+            tokens.append(segment)
+    return tokens
+
+
+def parse_query(q: str) -> List[Tuple[str, bool]]:
+    """查询词，去重后最多 SEARCH_MAX_TERMS 个"""
+    return list(dict.fromkeys(segments(q)))[:settings.SEARCH_MAX_TERMS]
+
+
+class SearchBackend(ABC):
+    """全文索引后端，matches 返回 (id, score) 子查询，score 越大越相关；索引随表维护的后端不需要实现写入"""
+
+    def write(self, connection, row_id: int, title: Optional[str], body: Optional[str]):
+        pass
+
+    def remove(self, connection, row_id: int):
+        pass
+
+    def clear(self, connection):
+        pass
+
+    @abstractmethod
+    def matches(self, terms: Sequence[Tuple[str, bool]]):
+        """匹配全部词的文档"""
+
+
+class Fts5Backend(SearchBackend):
+    """SQLite FTS5，rowid 与 search_documents.id 相同"""
+
+    def write(self, connection, row_id, title, body):
+        self.remove(connection, row_id)
+        connection.execute(
+            text("INSERT INTO search_fts (rowid, title, body) VALUES (:id, :title, :body)"),
+            {"id": row_id, "title": " ".join(tokenize(title)), "body": " ".join(tokenize(body))}
+        )
+
+    def remove(self, connection, row_id):
+        connection.execute(text("DELETE FROM search_fts WHERE rowid = :id"), {"id": row_id})
+
+    def clear(self, connection):
+        connection.execute(text("DELETE FROM search_fts"))
+
+    @staticmethod
+    def build_query(terms: Sequence[Tuple[str, bool]]) -> str:
+        parts = []
+        for segment, cjk in terms:
+            if cjk and len(segment) > 1:
+                # 相邻二元组组成短语，要求连续出现
+                parts.append('"%s"' % " ".join(_bigrams(segment)))
+            else:
+                # 单字匹配以它开头的二元组或末尾单字，字母数字词按前缀匹配
+                parts.append('"%s"*' % segment)
+        return " ".join(parts)
+
+    def matches(self, terms):
+        return text(
+            "SELECT rowid AS id, -bm25(search_fts, 2.0, 1.0) AS score "
+            "FROM search_fts WHERE search_fts MATCH :q"
+        ).bindparams(q=self.build_query(terms)).columns(id=Integer, score=Float).subquery("matches")
+
+
+class MysqlNgramBackend(SearchBackend):
+    """MySQL ngram FULLTEXT 索引，InnoDB 随 search_documents 一起维护"""
+
+    @staticmethod
+    def build_query(terms: Sequence[Tuple[str, bool]]) -> str:
+        # 比 ngram_token_size 短的词只能用前缀匹配
+        return " ".join(
+            f"+{segment}*" if len(segment) < 2 else f'+"{segment}"' for segment, _ in terms
+        )
+
+    def matches(self, terms):
+        return text(
+            "SELECT id, MATCH (title, body) AGAINST (:q IN BOOLEAN MODE) AS score "
+            "FROM search_documents WHERE MATCH (title, body) AGAINST (:q IN BOOLEAN MODE)"
+        ).bindparams(q=self.build_query(terms)).columns(id=Integer, score=Float).subquery("matches")
+
+
+class LikeBackend(SearchBackend):
+    """没有全文索引的数据库，逐个词 LIKE 匹配"""
+
+    def matches(self, terms):
+        conditions = [
+            or_(table.c.title.contains(segment), table.c.body.contains(segment))
+            for segment, _ in terms
+        ]
+        return select(table.c.id, literal(0.0).label("score")).where(and_(*conditions)).subquery("matches")
+
+
+_backends = {"sqlite": Fts5Backend(), "mysql": MysqlNgramBackend()}
+
+
+def backend_for(dialect: str) -> SearchBackend:
+    backend = _backends.get(dialect)
+    if backend is None:
+        logger.warning(f"数据库 {dialect} 不支持全文索引，搜索退回 LIKE 匹配")
+        backend = _backends[dialect] = LikeBackend()
+    return backend
+
+
+def _join(*values: Optional[str]) -> str:
+    return "\n".join(value for value in values if value)
+
+
+def _task_document(task) -> Optional[Dict[str, Any]]:
+    if task.is_deleted:
+        return None
+    return {"team_id": task.team_id, "user_id": None, "task_id": task.id,
+            "title": task.title, "body": task.description}
+
+
+def _work_log_document(work_log) -> Dict[str, Any]:
+    return {"team_id": work_log.team_id, "user_id": work_log.user_id, "task_id": work_log.task_id,
+            "title": work_log.content, "body": _join(*[getattr(work_log, name) for name in _WORK_LOG_BODY])}
+
+
+def _comment_document(comment, team_id: Optional[int]) -> Optional[Dict[str, Any]]:
+    if team_id is None:
+        return None
+    return {"team_id": team_id, "user_id": None, "task_id": comment.task_id, "title": None, "body": comment.content}
+
+
+def _write(connection, doc_type: str, doc_id: int, document: Optional[Dict[str, Any]]):
+    """写入或删除一个搜索文档"""
+    backend = backend_for(connection.dialect.name)
+    row_id = connection.execute(
+        select(table.c.id).where(table.c.doc_type == doc_type, table.c.doc_id == doc_id)
+    ).scalar()
+    if document is None:
+        if row_id is not None:
+            backend.remove(connection, row_id)
+            connection.execute(delete(table).where(table.c.id == row_id))
+        return
+    values = {**document, "updated_at": datetime.now()}
+    if row_id is None:
+        row_id = connection.execute(
+            insert(table).values(doc_type=doc_type, doc_id=doc_id, **values)
+        ).inserted_primary_key[0]
+    else:
+        connection.execute(update(table).where(table.c.id == row_id).values(**values))
+    backend.write(connection, row_id, document["title"], document["body"])
+
+
+def _build(connection, doc_type: str, target) -> Optional[Dict[str, Any]]:
+    if doc_type == "task":
+        return _task_document(target)
+    if doc_type == "work_log":
+        return _work_log_document(target)
+    team_id = connection.execute(
+        select(Task.team_id).where(Task.id == target.task_id, Task.is_deleted == False)
+    ).scalar()
+    return _comment_document(target, team_id)
+
+
+def _mark(target, key, value):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING, {})[key] = value
+
+
+def _register(model, doc_type: str):
+    tracked = _TRACKED[doc_type]
+
+    @event.listens_for(model, "after_insert")
+    def _inserted(mapper, connection, target):
+        _mark(target, (doc_type, target.id), target)
+
+    @event.listens_for(model, "after_update")
+    def _updated(mapper, connection, target):
+        attrs = inspect(target).attrs
+        if any(attrs[name].history.has_changes() for name in tracked):
+            _mark(target, (doc_type, target.id), target)
+        if doc_type == "task" and (attrs.team_id.history.has_changes() or attrs.is_deleted.history.has_changes()):
+            # 评论的可见范围跟随任务：转移团队后对新团队可见，任务删除后不再可见
+            _mark(target, ("task_comments", target.id), target)
+
+    @event.listens_for(model, "after_delete")
+    def _deleted(mapper, connection, target):
+        _mark(target, (doc_type, target.id), None)
+        if doc_type == "task":
+            # 评论可能没有随任务删除（或由数据库级联删除），按文档的 task_id 删除评论的搜索文档
+            _mark(target, ("task_comments", target.id), None)
+
+
+_register(Task, "task")
+_register(WorkLog, "work_log")
+_register(TaskComment, "comment")
+
+
+@event.listens_for(Session, "before_flush")
+def _reset_pending(session, flush_context, instances):
+    # 上一次flush失败时留下的文档作废
+    session.info.pop(_PENDING, None)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_pending(session, flush_context):
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return
+    connection = session.connection()
+    for (doc_type, doc_id), target in pending.items():
+        if doc_type == "task_comments":
+            if target is None:
+                comment_ids = connection.execute(
+                    select(table.c.doc_id).where(table.c.doc_type == "comment", table.c.task_id == doc_id)
+                ).scalars().all()
+                for comment_id in comment_ids:
+                    _write(connection, "comment", comment_id, None)
+                continue
+            team_id = None if target.is_deleted else target.team_id
+            comments = connection.execute(
+                select(TaskComment.id, TaskComment.task_id, TaskComment.content).where(TaskComment.task_id == doc_id)
+            ).all()
+            for comment in comments:
+                _write(connection, "comment", comment.id, _comment_document(comment, team_id))
+            continue
+        _write(connection, doc_type, doc_id, None if target is None else _build(connection, doc_type, target))
+
+
+def rebuild(db: Session) -> int:
+    """按任务、工作日志、评论重建全部搜索文档，返回文档数，由调用方提交"""
+    connection = db.connection()
+    backend_for(connection.dialect.name).clear(connection)
+    connection.execute(delete(table))
+
+    batch = settings.SEARCH_REBUILD_BATCH
+    count = 0
+    for task in db.query(Task).filter(Task.is_deleted == False).yield_per(batch):
+        _write(connection, "task", task.id, _task_document(task))
+        count += 1
+    for work_log in db.query(WorkLog).yield_per(batch):
+        _write(connection, "work_log", work_log.id, _work_log_document(work_log))
+        count += 1
+    comments = db.query(TaskComment, Task.team_id).join(Task, Task.id == TaskComment.task_id).filter(
+        Task.is_deleted == False
+    )
+    for comment, team_id in comments.yield_per(batch):
+        _write(connection, "comment", comment.id, _comment_document(comment, team_id))
+        count += 1
+    logger.info(f"已重建搜索索引，共 {count} 个文档")
+    return count
+
+
+def parse_doc_types(value: Optional[str]) -> List[str]:
+    if not value:
+        return list(DOC_TYPES)
+    doc_types = list(dict.fromkeys(t.strip() for t in value.split(",") if t.strip()))
+    unknown = [t for t in doc_types if t not in DOC_TYPES]
+    if unknown:
+        raise ValueError(f"不支持的搜索类型: {', '.join(unknown)}，可选: {', '.join(DOC_TYPES)}")
+    return doc_types
+
+
+def _snippet(document: Dict[str, Any], terms: Sequence[Tuple[str, bool]]) -> str:
+    """正文中第一个命中词附近的片段，正文未命中时取标题"""
+    length = settings.SEARCH_SNIPPET_LENGTH
+    for value in (document["body"], document["title"]):
+        if not value:
+            continue
+        lowered = value.lower()
+        positions = [lowered.find(segment) for segment, _ in terms]
+        positions = [position for position in positions if position >= 0]
+        if positions:
+            start = max(min(positions) - length // 4, 0)
+            snippet = value[start:start + length]
+            return ("…" if start > 0 else "") + snippet + ("…" if start + length < len(value) else "")
+    return (document["body"] or document["title"] or "")[:length]
+
+
+def matching_doc_ids(connection, doc_type: str, q: str):
+    """命中查询的某类文档ID子查询，可用于 Model.id.in_()；查询中没有可检索的词时返回 None"""
+    terms = parse_query(q)
+    if not terms:
+        return None
+    matches = backend_for(connection.dialect.name).matches(terms)
+    return select(table.c.doc_id).join(matches, matches.c.id == table.c.id).where(table.c.doc_type == doc_type)
+
+
+def search(db: Session, user_id: int, team_ids: Iterable[int], q: str,
+           doc_types: Optional[Sequence[str]] = None, team_id: Optional[int] = None,
+           limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """
+    按相关度搜索当前用户可见的文档：所在团队的任务、工作日志、评论，以及自己的个人工作日志
+    返回 {"query", "items", "has_more"}
+    """
+    terms = parse_query(q)
+    if not terms:
+        raise ValueError("搜索关键词中没有可检索的文字")
+
+    matches = backend_for(db.connection().dialect.name).matches(terms)
+    visible = or_(table.c.team_id.in_(list(team_ids)), table.c.user_id == user_id)
+    query = select(table, matches.c.score).join(matches, matches.c.id == table.c.id).where(
+        visible, table.c.doc_type.in_(list(doc_types or DOC_TYPES))
+    )
+    if team_id is not None:
+        query = query.where(table.c.team_id == team_id)
+    rows = db.execute(
+        query.order_by(matches.c.score.desc(), table.c.id.desc()).limit(limit + 1).offset(offset)
+    ).mappings().all()
+
+    items = [{
+        "doc_type": row["doc_type"],
+        "doc_id": row["doc_id"],
+        "team_id": row["team_id"],
+        "task_id": row["task_id"],
+        "title": row["title"],
+        "snippet": _snippet(row, terms),
+        "score": float(row["score"] or 0.0),
+        "updated_at": row["updated_at"],
+    } for row in rows[:limit]]
+    return {"query": q, "items": items, "has_more": len(rows) > limit}
@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta
 from typing import Any, Union, Optional
 from pydantic import BaseModel
-from jose import jwt, JWTError
+from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
 from fastapi import Depends, HTTPException, status
@@ -9,6 +9,7 @@ from fastapi.security import OAuth2PasswordBearer
 from app.db.session import get_db
 from sqlalchemy.orm import Session
 from app.models.user import User
+from app.core import user_cache
 
 class TokenPayload(BaseModel):
     sub: Optional[str] = None
@@ -59,15 +60,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         detail="无效的认证凭据",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
+    user = user_cache.get_user_from_token(db, token)
     if user is None:
         raise credentials_exception
     return user
@@ -76,13 +69,4 @@ def get_current_user_from_token(token: str, db: Session) -> Optional[User]:
     """
     从token字符串直接获取用户（用于WebSocket等场景）
     """
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-    except JWTError:
-        return None
-    
-    user = db.query(User).filter(User.username == username).first()
-    return user 
\ No newline at end of file
+    return user_cache.get_user_from_token(db, token) 
\ No newline at end of file
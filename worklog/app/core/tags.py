@@ -0,0 +1,265 @@
+"""
+标签索引
+
+任务和工作日志的 tags 字段仍然保存原始字符串（逗号分隔，或任务使用的 JSON 数组），
+解析后的标签写入 tags / entity_tags 两张表，团队内每个标签的使用次数保存在 team_tag_counts：
+1. 通过ORM增删改任务、工作日志时，flush结束时按数据库中的最新值重新同步这些记录的标签，
+   增删 entity_tags 并按差值更新 team_tag_counts，随业务事务一起提交或回滚
+2. 按标签筛选时每个标签对应一个 entity_tags 索引查询，多个标签由数据库对结果求交集，
+   标签按整词匹配（大小写不敏感），不再用 LIKE '%tag%'
+3. 标签自动补全直接读取 team_tag_counts，不扫描任务和工作日志
+绕过ORM的批量修改需要用 rebuild() 或 migrate_tags.py 重建
+"""
+import json
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, event, false, func, insert, inspect, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Query, Session, object_session
+
+from app.core.config import settings
+from app.models.tag import EntityTag, Tag, TeamTagCount
+from app.models.task import Task
+from app.models.work_log import WorkLog
+
+logger = logging.getLogger(__name__)
+
+ENTITY_TYPES = {"task": Task, "work_log": WorkLog}
+
+# 影响标签记录的字段
+_TRACKED = ("tags", "team_id", "is_deleted", "created_at")
+_SEPARATORS = re.compile(r"[,，;；]")
+_PENDING = "tags_pending"
+
+entity_tags = EntityTag.__table__
+counts = TeamTagCount.__table__
+
+
+def parse_tags(value: Optional[str]) -> List[str]:
+    """解析 tags 字段：JSON 数组或逗号（含中文逗号、分号）分隔，去空白、转小写、去重"""
+    if not value or not value.strip():
+        return []
+    value = value.strip()
+    names = None
+    if value.startswith("["):
+        try:
+            loaded = json.loads(value)
+            if isinstance(loaded, list):
+                names = [str(item) for item in loaded if item is not None]
+        except ValueError:
+            pass
+    if names is None:
+        names = _SEPARATORS.split(value)
+    normalized = (name.strip().lower()[:settings.TAG_MAX_LENGTH].strip() for name in names)
+    return [name for name in dict.fromkeys(normalized) if name]
+
+
+def _insert_ignore(connection, table, rows: List[Dict[str, Any]]):
+    dialect = connection.dialect.name
+    if dialect == "mysql":
+        connection.execute(mysql_insert(table).prefix_with("IGNORE"), rows)
+    elif dialect == "sqlite":
+        connection.execute(sqlite_insert(table).on_conflict_do_nothing(), rows)
+    else:
+        connection.execute(insert(table), rows)
+
+
+def _get_or_create_tags(connection, names: Iterable[str]) -> Dict[str, int]:
+    """标签名 -> 标签ID，不存在的标签先创建（并发创建同名标签时忽略冲突）"""
+    names = sorted(set(names))
+    if not names:
+        return {}
+    tag_ids = dict(connection.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+    missing = [name for name in names if name not in tag_ids]
+    if missing:
+        now = datetime.now()
+        _insert_ignore(connection, Tag.__table__, [{"name": name, "created_at": now} for name in missing])
+        tag_ids.update(connection.execute(select(Tag.name, Tag.id).where(Tag.name.in_(missing))).all())
+    return tag_ids
+
+
+def _upsert_count(connection, values: Dict[str, Any]):
+    dialect = connection.dialect.name
+    if dialect == "mysql":
+        stmt = mysql_insert(counts).values(**values)
+        connection.execute(stmt.on_duplicate_key_update(count=counts.c.count + stmt.inserted["count"]))
+    elif dialect == "sqlite":
+        stmt = sqlite_insert(counts).values(**values)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=["team_id", "entity_type", "tag_id"],
+            set_={"count": counts.c.count + stmt.excluded["count"]}
+        ))
+    else:
+        where = [counts.c[name] == values[name] for name in ("team_id", "entity_type", "tag_id")]
+        updated = connection.execute(update(counts).where(*where).values(count=counts.c.count + values["count"]))
+        if not updated.rowcount:
+            connection.execute(insert(counts).values(**values))
+
+
+def _apply_counts(connection, entity_type: str, deltas: Dict[tuple, int]):
+    """把 {(团队ID, 标签ID): 次数增量} 写入 team_tag_counts，次数减到 0 的行删除"""
+    for (team_id, tag_id), delta in deltas.items():
+        if delta == 0:
+            continue
+        _upsert_count(connection, {"team_id": team_id, "entity_type": entity_type, "tag_id": tag_id, "count": delta})
+        if delta < 0:
+            connection.execute(delete(counts).where(
+                counts.c.team_id == team_id, counts.c.entity_type == entity_type,
+                counts.c.tag_id == tag_id, counts.c.count <= 0
+            ))
+
+
+def sync(connection, entity_type: str, entity_ids: Iterable[int]):
+    """按数据库中的 tags 字段同步一批任务/工作日志的标签记录，已删除的记录清除全部标签"""
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return
+    model = ENTITY_TYPES[entity_type]
+    query = select(model.id, model.tags, model.team_id, model.created_at).where(model.id.in_(entity_ids))
+    if entity_type == "task":
+        query = query.where(model.is_deleted == False)
+    entities = {row.id: row for row in connection.execute(query)}
+
+    current: Dict[int, Dict[int, Any]] = defaultdict(dict)
+    for row in connection.execute(
+        select(entity_tags.c.id, entity_tags.c.entity_id, entity_tags.c.tag_id, entity_tags.c.team_id).where(
+            entity_tags.c.entity_type == entity_type, entity_tags.c.entity_id.in_(entity_ids)
+        )
+    ):
+        current[row.entity_id][row.tag_id] = row
+
+    wanted_names = {entity_id: parse_tags(row.tags) for entity_id, row in entities.items()}
+    tag_ids = _get_or_create_tags(connection, (name for names in wanted_names.values() for name in names))
+
+    removed, added = [], []
+    deltas: Dict[tuple, int] = defaultdict(int)
+    for entity_id in entity_ids:
+        entity = entities.get(entity_id)
+        team_id = entity.team_id if entity is not None else None
+        wanted = {tag_ids[name] for name in wanted_names.get(entity_id, ())}
+        existing = current.get(entity_id, {})
+        for tag_id, row in existing.items():
+            # 转移团队时按删除旧记录、插入新记录处理
+            if tag_id not in wanted or row.team_id != team_id:
+                removed.append(row.id)
+                if row.team_id is not None:
+                    deltas[(row.team_id, tag_id)] -= 1
+        for tag_id in wanted:
+            row = existing.get(tag_id)
+            if row is None or row.team_id != team_id:
+                added.append({"tag_id": tag_id, "entity_type": entity_type, "entity_id": entity_id,
+                              "team_id": team_id, "created_at": entity.created_at})
+                if team_id is not None:
+                    deltas[(team_id, tag_id)] += 1
+
+    if removed:
+        connection.execute(delete(entity_tags).where(entity_tags.c.id.in_(removed)))
+    if added:
+        connection.execute(insert(entity_tags), added)
+    _apply_counts(connection, entity_type, deltas)
+
+
+def _mark(target, entity_type: str):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING, defaultdict(set))[entity_type].add(target.id)
+
+
+def _register(model, entity_type: str):
+    tracked = [name for name in _TRACKED if hasattr(model, name)]
+
+    @event.listens_for(model, "after_insert")
+    @event.listens_for(model, "after_delete")
+    def _changed(mapper, connection, target):
+        _mark(target, entity_type)
+
+    @event.listens_for(model, "after_update")
+    def _updated(mapper, connection, target):
+        attrs = inspect(target).attrs
+        if any(attrs[name].history.has_changes() for name in tracked):
+            _mark(target, entity_type)
+
+
+_register(Task, "task")
+_register(WorkLog, "work_log")
+
+
+@event.listens_for(Session, "before_flush")
+def _reset_pending(session, flush_context, instances):
+    # 上一次flush失败时留下的记录作废
+    session.info.pop(_PENDING, None)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_pending(session, flush_context):
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return
+    connection = session.connection()
+    for entity_type, entity_ids in pending.items():
+        sync(connection, entity_type, sorted(entity_ids))
+
+
+def rebuild(db: Session) -> int:
+    """清空标签记录和计数，按 tags 字段全部重新同步，返回处理的任务和工作日志数，由调用方提交"""
+    connection = db.connection()
+    connection.execute(delete(entity_tags))
+    connection.execute(delete(counts))
+
+    total = 0
+    for entity_type, model in ENTITY_TYPES.items():
+        last_id = 0
+        while True:
+            batch = connection.execute(
+                select(model.id).where(model.id > last_id, model.tags != None, model.tags != "")
+                .order_by(model.id).limit(settings.TAG_SYNC_BATCH)
+            ).scalars().all()
+            if not batch:
+                break
+            sync(connection, entity_type, batch)
+            total += len(batch)
+            last_id = batch[-1]
+    logger.info(f"已重建标签索引，共处理 {total} 条任务和工作日志")
+    return total
+
+
+def filter_by_tags(db: Session, query: Query, entity_type: str, value: str) -> Query:
+    """
+    筛选带有全部给定标签的任务/工作日志（value 格式同 tags 字段）
+    每个标签一个走 ix_entity_tags_tag 索引的 IN 子查询，由数据库求交集；有标签不存在时直接返回空结果
+    """
+    names = parse_tags(value)
+    if not names:
+        return query
+    tag_ids = dict(db.query(Tag.name, Tag.id).filter(Tag.name.in_(names)).all())
+    if len(tag_ids) < len(names):
+        return query.filter(false())
+    model = ENTITY_TYPES[entity_type]
+    for name in names:
+        query = query.filter(model.id.in_(
+            select(entity_tags.c.entity_id).where(
+                entity_tags.c.tag_id == tag_ids[name], entity_tags.c.entity_type == entity_type
+            )
+        ))
+    return query
+
+
+def get_team_tags(db: Session, team_id: int, prefix: Optional[str] = None,
+                  entity_type: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """团队内的常用标签，按使用次数降序，prefix 按标签名前缀筛选（用于自动补全）"""
+    total = func.sum(TeamTagCount.count)
+    query = db.query(Tag.name, total).join(Tag, Tag.id == TeamTagCount.tag_id).filter(
+        TeamTagCount.team_id == team_id
+    )
+    if entity_type:
+        query = query.filter(TeamTagCount.entity_type == entity_type)
+    if prefix and prefix.strip():
+        escaped = prefix.strip().lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(Tag.name.like(f"{escaped}%", escape="\\"))
+    rows = query.group_by(Tag.id, Tag.name).having(total > 0).order_by(total.desc(), Tag.name).limit(limit).all()
+    return [{"name": name, "count": int(count)} for name, count in rows]
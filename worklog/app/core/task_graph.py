@@ -0,0 +1,298 @@
+"""
+任务依赖图
+
+task_dependencies 表中 prerequisite_task_id → dependent_task_id 表示「前置任务完成后才能开始后续任务」。
+按团队在内存中构建依赖图：
+1. 一次查询加载团队全部未删除任务及其前置任务（tasks LEFT JOIN task_dependencies），
+   保存在进程内 TTL + LRU 缓存中
+2. 通过ORM增删改任务或依赖并提交后，涉及的团队的依赖图失效，下次访问时重新加载；
+   回滚时不失效。绕过ORM的批量修改只能等 TTL 过期
+3. 提供添加依赖时的环检测、拓扑排序、每个任务的阻塞状态和关键路径，均为 O(V+E)
+多进程部署时其他进程的修改最多在 TTL 内不可见，所以添加依赖时的环检测总是重新加载依赖图
+"""
+import heapq
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.task import Task, TaskDependency, TaskStatus
+
+logger = logging.getLogger(__name__)
+
+# 已结束的任务不再阻塞后续任务
+FINISHED_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.CANCELLED.value)
+
+# 影响依赖图的任务字段
+_TRACKED = ("team_id", "project_id", "title", "status", "estimated_hours", "due_date", "is_deleted")
+_DIRTY = "task_graph_dirty"
+
+_EPSILON = 1e-9
+
+
+class TaskNode(NamedTuple):
+    id: int
+    title: str
+    status: str
+    project_id: Optional[int]
+    estimated_hours: float
+    due_date: Optional[datetime]
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+
+class TaskGraph:
+    """一个团队的任务依赖图，加载后只读"""
+
+    def __init__(self, team_id: int, nodes: Dict[int, TaskNode], edges: Iterable[tuple]):
+        self.team_id = team_id
+        self.nodes = nodes
+        # 前置任务 -> 后续任务，后续任务 -> 前置任务
+        self.successors: Dict[int, Set[int]] = defaultdict(set)
+        self.predecessors: Dict[int, Set[int]] = defaultdict(set)
+        for prerequisite_id, dependent_id in edges:
+            # 指向已删除或其他团队任务的依赖不参与计算
+            if prerequisite_id in nodes and dependent_id in nodes:
+                self.successors[prerequisite_id].add(dependent_id)
+                self.predecessors[dependent_id].add(prerequisite_id)
+
+    def edges(self) -> List[tuple]:
+        return sorted((p, d) for p, dependents in self.successors.items() for d in dependents)
+
+    def subgraph(self, task_ids: Iterable[int]) -> "TaskGraph":
+        """只保留给定任务及其之间的依赖"""
+        nodes = {task_id: self.nodes[task_id] for task_id in task_ids if task_id in self.nodes}
+        return TaskGraph(self.team_id, nodes, self.edges())
+
+    def project_task_ids(self, project_id: int) -> List[int]:
+        return [task_id for task_id, node in self.nodes.items() if node.project_id == project_id]
+
+    def would_create_cycle(self, prerequisite_id: int, dependent_id: int) -> Optional[List[int]]:
+        """
+        添加 prerequisite → dependent 是否形成环
+        从 dependent 沿后续任务深度优先搜索，能到达 prerequisite 即成环，返回环上的任务ID
+        （dependent, ..., prerequisite），否则返回 None
+        """
+        if prerequisite_id == dependent_id:
+            return [dependent_id]
+        parents: Dict[int, Optional[int]] = {dependent_id: None}
+        stack = [dependent_id]
+        while stack:
+            current = stack.pop()
+            for successor in self.successors.get(current, ()):
+                if successor in parents:
+                    continue
+                parents[successor] = current
+                if successor == prerequisite_id:
+                    path = [successor]
+                    while parents[path[-1]] is not None:
+                        path.append(parents[path[-1]])
+                    return path[::-1]
+                stack.append(successor)
+        return None
+
+    def topological_order(self) -> tuple:
+        """
+        Kahn 算法拓扑排序，同一层按任务ID排序
+        返回 (排序后的任务ID, 处在环上或依赖环的任务ID)，无环时第二项为空
+        """
+        in_degree = {task_id: len(self.predecessors.get(task_id, ())) for task_id in self.nodes}
+        ready = [task_id for task_id, degree in in_degree.items() if degree == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            current = heapq.heappop(ready)
+            order.append(current)
+            for successor in self.successors.get(current, ()):
+                in_degree[successor] -= 1
+                if in_degree[successor] == 0:
+                    heapq.heappush(ready, successor)
+        ordered = set(order)
+        return order, sorted(task_id for task_id in self.nodes if task_id not in ordered)
+
+    def blocked_by(self, task_id: int) -> List[int]:
+        """阻塞任务的未结束前置任务，任务本身已结束时为空"""
+        node = self.nodes.get(task_id)
+        if node is None or node.finished:
+            return []
+        return sorted(p for p in self.predecessors.get(task_id, ()) if not self.nodes[p].finished)
+
+    def describe(self, task_id: int) -> Dict[str, Any]:
+        """任务信息及阻塞状态"""
+        blocked_by = self.blocked_by(task_id)
+        return {**self.nodes[task_id]._asdict(), "blocked": bool(blocked_by), "blocked_by": blocked_by}
+
+    def critical_path(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        关键路径
+        - 任务工期取 estimated_hours，已结束的任务工期为 0
+        - 正向计算最早开始/完成时间（从现在起的小时数）
+        - 反向计算最晚完成时间：不晚于后续任务的最晚开始时间，有截止日期时也不晚于截止时间，
+          没有后续任务也没有截止日期时取全部任务的最早完工时间
+        - 松弛时间 = 最晚完成 - 最早完成，不大于 0 的任务在关键路径上，小于 0 表示按估算会逾期
+        截止时间按自然小时计算，不考虑工作日历。环上的任务不参与计算，在 cycle 中返回
+        """
+        now = now or datetime.now()
+        order, cycle = self.topological_order()
+        duration = {
+            task_id: 0.0 if self.nodes[task_id].finished else max(self.nodes[task_id].estimated_hours, 0.0)
+            for task_id in order
+        }
+
+        earliest_start: Dict[int, float] = {}
+        earliest_finish: Dict[int, float] = {}
+        for task_id in order:
+            start = max((earliest_finish[p] for p in self.predecessors.get(task_id, ()) if p in earliest_finish),
+                        default=0.0)
+            earliest_start[task_id] = start
+            earliest_finish[task_id] = start + duration[task_id]
+        total_hours = max(earliest_finish.values(), default=0.0)
+
+        latest_finish: Dict[int, float] = {}
+        latest_start: Dict[int, float] = {}
+        for task_id in reversed(order):
+            finish = min((latest_start[s] for s in self.successors.get(task_id, ()) if s in latest_start),
+                         default=total_hours)
+            due_date = self.nodes[task_id].due_date
+            if due_date is not None:
+                finish = min(finish, (due_date - now).total_seconds() / 3600)
+            latest_finish[task_id] = finish
+            latest_start[task_id] = finish - duration[task_id]
+
+        tasks = []
+        for task_id in order:
+            slack = latest_finish[task_id] - earliest_finish[task_id]
+            tasks.append({
+                "task_id": task_id,
+                "title": self.nodes[task_id].title,
+                "duration": duration[task_id],
+                "earliest_start": round(earliest_start[task_id], 6),
+                "earliest_finish": round(earliest_finish[task_id], 6),
+                "latest_start": round(latest_start[task_id], 6),
+                "latest_finish": round(latest_finish[task_id], 6),
+                "slack": round(slack, 6),
+                "critical": slack <= _EPSILON and duration[task_id] > 0
+            })
+
+        # 从最晚完工的任务沿「最早开始 = 前置任务最早完成」的前置任务回溯出最长链
+        path = []
+        if order and total_hours > 0:
+            current = max(order, key=lambda t: (earliest_finish[t], -t))
+            while current is not None:
+                path.append(current)
+                current = min(
+                    (p for p in self.predecessors.get(current, ())
+                     if p in earliest_finish and abs(earliest_finish[p] - earliest_start[current]) <= _EPSILON
+                     and duration[p] > 0),
+                    default=None
+                )
+            path.reverse()
+
+        return {
+            "total_hours": round(total_hours, 6),
+            "critical_path": path,
+            "tasks": tasks,
+            "cycle": cycle
+        }
+
+
+class TaskGraphService:
+    """任务依赖图服务"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.cache = TTLCache(ttl, max_size)
+
+    def load(self, db: Session, team_id: int) -> TaskGraph:
+        """一次查询加载团队任务及其前置任务"""
+        rows = db.execute(
+            select(
+                Task.id, Task.title, Task.status, Task.project_id, Task.estimated_hours, Task.due_date,
+                TaskDependency.prerequisite_task_id
+            ).outerjoin(
+                TaskDependency, TaskDependency.dependent_task_id == Task.id
+            ).where(
+                Task.team_id == team_id,
+                Task.is_deleted == False
+            )
+        ).all()
+
+        nodes: Dict[int, TaskNode] = {}
+        edges = []
+        for task_id, title, task_status, project_id, estimated_hours, due_date, prerequisite_id in rows:
+            if task_id not in nodes:
+                nodes[task_id] = TaskNode(
+                    task_id, title, getattr(task_status, "value", task_status), project_id,
+                    float(estimated_hours or 0.0), due_date
+                )
+            if prerequisite_id is not None:
+                edges.append((prerequisite_id, task_id))
+        return TaskGraph(team_id, nodes, edges)
+
+    def get(self, db: Session, team_id: int, fresh: bool = False) -> TaskGraph:
+        graph = None if fresh else self.cache.get(team_id)
+        if graph is None:
+            graph = self.load(db, team_id)
+            self.cache.set(team_id, graph)
+        return graph
+
+    def invalidate(self, team_ids: Iterable[int]):
+        for team_id in team_ids:
+            self.cache.pop(team_id)
+
+
+task_graph_service = TaskGraphService(ttl=settings.TASK_GRAPH_CACHE_TTL, max_size=settings.TASK_GRAPH_CACHE_SIZE)
+
+
+def _mark(target, *team_ids):
+    session = object_session(target)
+    if session is None:
+        return
+    dirty = session.info.setdefault(_DIRTY, set())
+    dirty.update(team_id for team_id in team_ids if team_id is not None)
+
+
+def _task_teams(target) -> List[int]:
+    # 转移团队时新旧团队的依赖图都要失效
+    history = inspect(target).attrs.team_id.history
+    return list(history.added or ()) + list(history.deleted or ()) + [target.team_id]
+
+
+@event.listens_for(Task, "after_insert")
+@event.listens_for(Task, "after_delete")
+def _task_changed(mapper, connection, target):
+    _mark(target, *_task_teams(target))
+
+
+@event.listens_for(Task, "after_update")
+def _task_updated(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if any(attrs[name].history.has_changes() for name in _TRACKED):
+        _mark(target, *_task_teams(target))
+
+
+@event.listens_for(TaskDependency, "after_insert")
+@event.listens_for(TaskDependency, "after_update")
+@event.listens_for(TaskDependency, "after_delete")
+def _dependency_changed(mapper, connection, target):
+    task_ids = [target.prerequisite_task_id, target.dependent_task_id]
+    team_ids = connection.execute(select(Task.team_id).where(Task.id.in_(task_ids))).scalars().all()
+    _mark(target, *team_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    team_ids = session.info.pop(_DIRTY, None)
+    if team_ids:
+        task_graph_service.invalidate(team_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_dirty(session):
+    session.info.pop(_DIRTY, None)
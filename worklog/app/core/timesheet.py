@@ -0,0 +1,211 @@
+"""
+工时表统计
+
+按团队和日期范围统计工时，按 user / project / work_type / day 中的一到多个维度分组，
+返回可以直接做透视表的稠密矩阵：
+1. 从 work_logs 流式读取所需的列（一条查询，按 TIMESHEET_FETCH_SIZE 分批），
+   工时按日志的 start_time 计入日期，没有开始时间的日志按 created_at，
+   与按天汇总表和工时立方体的日期一致；两种日志分成 UNION ALL 的两支分别按范围过滤，
+   都可以使用 (team_id, start_time) 索引
+2. 各维度的取值先映射为坐标轴上的位置，再按展开后的单元格下标分组求和；
+   安装了 numpy 时用 bincount 向量化计算，否则逐行累加，结果相同
+3. 用户轴包含团队全部成员（没有工时的成员显示为 0），日期轴包含范围内的每一天
+"""
+import logging
+import math
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, union_all
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.membership import membership_service
+from app.models.project import Project
+from app.models.user import User
+from app.models.work_log import WorkLog
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ("user", "project", "work_type", "day")
+
+_COLUMNS = {
+    "user": WorkLog.user_id,
+    "project": WorkLog.project_id,
+    "work_type": WorkLog.work_type,
+}
+
+
+def parse_group_by(group_by: str) -> List[str]:
+    """解析逗号分隔的分组维度，保持顺序并去重"""
+    dims = list(dict.fromkeys(d.strip() for d in group_by.split(",") if d.strip()))
+    if not dims:
+        raise ValueError("至少需要一个分组维度")
+    unknown = [d for d in dims if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"不支持的分组维度: {', '.join(unknown)}，可选: {', '.join(DIMENSIONS)}")
+    return dims
+
+
+def load_columns(db: Session, team_id: int, start: date, end: date,
+                 dims: Sequence[str]) -> Tuple[Dict[str, list], list, list]:
+    """流式读取日期范围内开始的工作日志，按列返回 ({维度: 取值}, 工时, 条数)"""
+    lower = datetime.combine(start, time.min)
+    upper = datetime.combine(end + timedelta(days=1), time.min)
+
+    def branch(worked_at, *conditions):
+        return select(
+            *[worked_at if d == "day" else _COLUMNS[d] for d in dims], WorkLog.duration
+        ).where(WorkLog.team_id == team_id, *conditions)
+
+    stmt = union_all(
+        branch(WorkLog.start_time, WorkLog.start_time >= lower, WorkLog.start_time < upper),
+        branch(WorkLog.created_at, WorkLog.start_time.is_(None),
+               WorkLog.created_at >= lower, WorkLog.created_at < upper)
+    ).execution_options(yield_per=settings.TIMESHEET_FETCH_SIZE)
+
+    columns: Dict[str, list] = {d: [] for d in dims}
+    hours: list = []
+    for partition in db.execute(stmt).partitions():
+        for row in partition:
+            for i, d in enumerate(dims):
+                value = row[i]
+                if d == "day":
+                    value = value.date()
+                elif d == "project":
+                    value = value or 0
+                elif d == "work_type":
+                    value = getattr(value, "value", value)
+                columns[d].append(value)
+            hours.append(row[-1] or 0.0)
+    return columns, hours, [1] * len(hours)
+
+
+def _axis_keys(db: Session, team_id: int, start: date, end: date, dim: str, values: list) -> List[Any]:
+    if dim == "day":
+        return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    if dim == "user":
+        return sorted(set(membership_service.get_team_member_ids(db, team_id)) | set(values))
+    return sorted(set(values))
+
+
+def _axis_labels(db: Session, dim: str, keys: List[Any]) -> List[Any]:
+    if dim == "user":
+        names = dict(db.query(User.id, User.username).filter(User.id.in_(keys)).all()) if keys else {}
+        return [names.get(key) for key in keys]
+    if dim == "project":
+        ids = [key for key in keys if key]
+        names = dict(db.query(Project.id, Project.name).filter(Project.id.in_(ids)).all()) if ids else {}
+        return [names.get(key, "无项目") if key else "无项目" for key in keys]
+    if dim == "day":
+        return [key.isoformat() for key in keys]
+    return list(keys)
+
+
+def _aggregate_numpy(positions: List[list], shape: Tuple[int, ...], hours: list, counts: list):
+    index = np.ravel_multi_index([np.asarray(p, dtype=np.int64) for p in positions], shape)
+    size = math.prod(shape)
+    hour_cells = np.bincount(index, weights=np.asarray(hours, dtype=np.float64), minlength=size)
+    count_cells = np.bincount(index, weights=np.asarray(counts, dtype=np.float64), minlength=size)
+    return (
+        np.round(hour_cells, 6).reshape(shape).tolist(),
+        count_cells.astype(np.int64).reshape(shape).tolist()
+    )
+
+
+def _empty(shape: Tuple[int, ...], value):
+    if len(shape) == 1:
+        return [value] * shape[0]
+    return [_empty(shape[1:], value) for _ in range(shape[0])]
+
+
+def _aggregate_python(positions: List[list], shape: Tuple[int, ...], hours: list, counts: list):
+    hour_cells = _empty(shape, 0.0)
+    count_cells = _empty(shape, 0)
+    for row, (duration, count) in enumerate(zip(hours, counts)):
+        hour_row, count_row = hour_cells, count_cells
+        for axis in positions[:-1]:
+            hour_row, count_row = hour_row[axis[row]], count_row[axis[row]]
+        last = positions[-1][row]
+        hour_row[last] += duration
+        count_row[last] += count
+    return hour_cells, count_cells
+
+
+def _round(cells):
+    if cells and isinstance(cells[0], list):
+        return [_round(row) for row in cells]
+    return [round(value, 6) for value in cells]
+
+
+def _margins(positions: List[list], shape: Tuple[int, ...], hours: list, vectorized: bool) -> List[List[float]]:
+    """每个坐标轴上的工时合计（对其他维度求和）"""
+    if vectorized:
+        weights = np.asarray(hours, dtype=np.float64)
+        return [
+            np.round(np.bincount(np.asarray(axis, dtype=np.int64), weights=weights, minlength=size), 6).tolist()
+            for axis, size in zip(positions, shape)
+        ]
+    margins = []
+    for axis, size in zip(positions, shape):
+        sums = [0.0] * size
+        for position, duration in zip(axis, hours):
+            sums[position] += duration
+        margins.append([round(value, 6) for value in sums])
+    return margins
+
+
+def build_timesheet(db: Session, team_id: int, start: date, end: date, group_by: str,
+                    use_numpy: Optional[bool] = None) -> Dict[str, Any]:
+    """统计团队在 [start, end] 的工时，按 group_by 维度返回工时和日志条数矩阵"""
+    dims = parse_group_by(group_by)
+    if end < start:
+        raise ValueError("结束日期不能早于开始日期")
+    if (end - start).days + 1 > settings.TIMESHEET_MAX_DAYS:
+        raise ValueError(f"查询范围不能超过 {settings.TIMESHEET_MAX_DAYS} 天")
+
+    columns, hours, counts = load_columns(db, team_id, start, end, dims)
+    keys = {d: _axis_keys(db, team_id, start, end, d, columns[d]) for d in dims}
+    shape = tuple(len(keys[d]) for d in dims)
+    if math.prod(shape) > settings.TIMESHEET_MAX_CELLS:
+        raise ValueError("统计结果过大，请缩小日期范围或减少分组维度")
+
+    positions = []
+    for d in dims:
+        if d == "day":
+            origin = start.toordinal()
+            positions.append([value.toordinal() - origin for value in columns[d]])
+        else:
+            lookup = {key: i for i, key in enumerate(keys[d])}
+            positions.append([lookup[value] for value in columns[d]])
+
+    if use_numpy is None:
+        use_numpy = np is not None
+    vectorized = use_numpy and np is not None and math.prod(shape) > 0
+    if vectorized:
+        hour_cells, count_cells = _aggregate_numpy(positions, shape, hours, counts)
+    else:
+        hour_cells, count_cells = _aggregate_python(positions, shape, hours, counts)
+        hour_cells = _round(hour_cells)
+
+    return {
+        "team_id": team_id,
+        "start_date": start,
+        "end_date": end,
+        "group_by": dims,
+        "axes": [
+            {"dimension": d, "keys": [k.isoformat() if d == "day" else k for k in keys[d]],
+             "labels": _axis_labels(db, d, keys[d])}
+            for d in dims
+        ],
+        "hours": hour_cells,
+        "counts": count_cells,
+        "margins": _margins(positions, shape, hours, vectorized),
+        "total_hours": round(float(sum(hours)), 6),
+        "total_count": int(sum(counts))
+    }
@@ -0,0 +1,106 @@
+"""
+已认证用户缓存
+
+get_current_user 是几乎每个请求都会执行的依赖，这里缓存两层数据：
+1. token -> (username, exp)：解码结果，有效期与令牌的 exp 对齐，过期令牌不会命中
+2. username -> 用户字段快照：有效期 USER_CACHE_TTL 秒
+
+缓存中只保存字段快照，不保存 ORM 对象；命中时通过 merge(load=False) 在当前会话中
+还原出持久化的 User 对象，不发出 SQL，调用方仍可正常修改、提交和访问关联关系。
+用户信息变更或账号停用后需调用 invalidate_user；User 的 ORM 更新也会自动触发失效。
+"""
+import time
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from jose import jwt, JWTError
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.user import User
+
+_token_cache = TTLCache(ttl=settings.USER_CACHE_TTL, max_size=settings.USER_CACHE_MAX_SIZE)
+_user_cache = TTLCache(ttl=settings.USER_CACHE_TTL, max_size=settings.USER_CACHE_MAX_SIZE)
+
+# 直接读取表的列名；导入时其他模型可能尚未加载，不能触发映射配置
+_USER_COLUMNS = [column.key for column in User.__table__.columns]
+
+
+def decode_token(token: str) -> Optional[str]:
+    """
+    解码令牌得到用户名，令牌无效或已过期时返回None
+    """
+    cached: Optional[Tuple[str, Optional[float]]] = _token_cache.get(token)
+    if cached is not None:
+        username, exp = cached
+        if exp is None or exp > time.time():
+            return username
+        _token_cache.pop(token)
+        return None
+
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+    except JWTError:
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+
+    exp = payload.get("exp")
+    if isinstance(exp, datetime):
+        exp = exp.replace(tzinfo=exp.tzinfo or timezone.utc).timestamp()
+    ttl = settings.USER_CACHE_TTL
+    if exp is not None:
+        ttl = min(ttl, float(exp) - time.time())
+    if ttl > 0:
+        _token_cache.set(token, (username, exp), ttl=ttl)
+    return username
+
+
+def get_user_by_username(db: Session, username: str) -> Optional[User]:
+    """
+    按用户名获取用户，优先使用缓存的字段快照
+    """
+    snapshot = _user_cache.get(username)
+    if snapshot is not None:
+        existing = db.identity_map.get(db.identity_key(User, snapshot["id"]))
+        if existing is not None:
+            return existing
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    user = db.query(User).filter(User.username == username).first()
+    if user is not None:
+        _user_cache.set(username, {key: getattr(user, key) for key in _USER_COLUMNS})
+    return user
+
+
+def get_user_from_token(db: Session, token: str) -> Optional[User]:
+    """解码令牌并获取对应用户，任一步失败返回None"""
+    username = decode_token(token)
+    if username is None:
+        return None
+    return get_user_by_username(db, username)
+
+
+def invalidate_user(username: str):
+    """用户信息变更或账号停用后使缓存失效"""
+    _user_cache.pop(username)
+
+
+def clear():
+    _token_cache.clear()
+    _user_cache.clear()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_write(mapper, connection, target):
+    # 任何通过ORM对用户的修改（包括停用账号）都让快照失效，避免继续使用旧数据
+    invalidate_user(target.username)
+    history = inspect(target).attrs.username.history
+    for old_username in history.deleted or ():
+        invalidate_user(old_username)
@@ -0,0 +1,273 @@
+"""
+工时立方体
+
+按 (团队, 项目, 用户, 工作类型) 在周、月两种粒度上保存工时和日志条数，供看板做切片、切块和上卷：
+1. 团队的立方体在第一次查询时从 work_log_daily_rollup 一次分组查询加载
+   （最近 CUBE_HISTORY_MONTHS 个月），保存在进程内 TTL + LRU 缓存中；
+   加载期间有增量提交时不缓存本次结果（无法确定增量是否已包含在查询结果中），下次查询重新加载
+2. 工作日志写入提交后，work_log_rollup 把本事务的汇总增量传给 apply，已加载的团队立方体随之增量更新
+3. query 的 filters 做切片（单个取值）/切块（多个取值），group_by 中省略的维度被上卷汇总；
+   粒度为周/月、维度不含任务、且范围在已加载的历史之内时直接在内存中计算，
+   按天或按任务下钻、或者更早的范围才回退到 work_log_daily_rollup 的分组查询
+日志按工作发生的日期（start_time，没有开始时间时按 created_at）计入周期，与工时表统计一致。
+开始日期按粒度对齐到周期开始（周一/月初），统计截止到结束日期（含）：
+结束日期落在周期中间时，最后一个不完整的周期从汇总表按天读取，与下钻的结果一致。
+多进程部署时其他进程写入的日志最多在 TTL 内不可见
+"""
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core import work_log_rollup
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.work_log_rollup import RollupKey
+from app.models.work_log_rollup import WorkLogDailyRollup
+
+logger = logging.getLogger(__name__)
+
+GRAINS = ("day", "week", "month")
+# 立方体保存的维度，period 为粒度对应的周期开始日期
+CUBE_DIMENSIONS = ("period", "project", "user", "work_type")
+# 只能从汇总表下钻的维度
+DRILL_DIMENSIONS = ("task",)
+
+# 维度在结果中的字段名
+FIELDS = {"period": "period", "project": "project_id", "user": "user_id", "work_type": "work_type", "task": "task_id"}
+
+# 单元格键：(period, project_id, user_id, work_type)
+CellKey = Tuple[date, int, int, str]
+
+
+def period_start(day: date, grain: str) -> date:
+    """日期所在周期的开始日期"""
+    if grain == "week":
+        return day - timedelta(days=day.weekday())
+    if grain == "month":
+        return day.replace(day=1)
+    return day
+
+
+def period_end(period: date, grain: str) -> date:
+    """周期的最后一天"""
+    if grain == "week":
+        return period + timedelta(days=6)
+    if grain == "month":
+        return _months_before(period, -1) - timedelta(days=1)
+    return period
+
+
+def _months_before(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def parse_dimensions(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    dims = list(dict.fromkeys(d.strip() for d in value.split(",") if d.strip()))
+    allowed = CUBE_DIMENSIONS + DRILL_DIMENSIONS
+    unknown = [d for d in dims if d not in allowed]
+    if unknown:
+        raise ValueError(f"不支持的维度: {', '.join(unknown)}，可选: {', '.join(allowed)}")
+    return dims
+
+
+def _matches(values: Dict[str, Any], filters: Dict[str, set]) -> bool:
+    return all(values[dim] in accepted for dim, accepted in filters.items())
+
+
+def _collect(rows: Iterable[Tuple[Dict[str, Any], int, float]], group_by: Sequence[str],
+             filters: Dict[str, set]) -> List[Dict[str, Any]]:
+    """按 group_by 上卷，filters 做切片/切块，返回按维度排序的结果行"""
+    totals: Dict[tuple, List] = defaultdict(lambda: [0, 0.0])
+    for values, count, hours in rows:
+        if not _matches(values, filters):
+            continue
+        total = totals[tuple(values[dim] for dim in group_by)]
+        total[0] += count
+        total[1] += hours
+
+    result = []
+    for key in sorted(totals):
+        count, hours = totals[key]
+        if count == 0 and abs(hours) < 1e-9:
+            continue
+        row = {FIELDS[dim]: value for dim, value in zip(group_by, key)}
+        row["count"] = count
+        row["hours"] = round(hours, 6)
+        result.append(row)
+    return result
+
+
+class TeamCube:
+    """一个团队从 since 开始的周、月粒度单元格"""
+
+    def __init__(self, team_id: int, since: date):
+        self.team_id = team_id
+        self.since = since
+        self.cells: Dict[str, Dict[CellKey, List]] = {"week": {}, "month": {}}
+
+    def add(self, day: date, project_id: int, user_id: int, work_type: str, count: int, hours: float):
+        if day < self.since:
+            return
+        for grain, cells in self.cells.items():
+            key = (period_start(day, grain), project_id, user_id, work_type)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = [0, 0.0]
+            cell[0] += count
+            cell[1] += hours
+            if cell[0] <= 0:
+                del cells[key]
+
+    def covers(self, grain: str, start: date) -> bool:
+        # since 是月初，之前开始的周在立方体中不完整
+        return grain in self.cells and period_start(start, grain) >= self.since
+
+    def rows(self, grain: str, start: date, end: date):
+        """在 end 之前（含）结束的周期的单元格"""
+        first = period_start(start, grain)
+        for (period, project_id, user_id, work_type), (count, hours) in self.cells[grain].items():
+            if first <= period and period_end(period, grain) <= end:
+                yield (
+                    {"period": period, "project": project_id, "user": user_id, "work_type": work_type},
+                    count, hours
+                )
+
+
+class WorkHoursCube:
+    """工时立方体服务"""
+
+    def __init__(self, ttl: float, max_size: int, history_months: int):
+        self.cache = TTLCache(ttl, max_size)
+        self.history_months = history_months
+        self._lock = threading.Lock()
+        # 每个团队收到过的增量次数，用于判断加载期间是否有写入提交
+        self._versions: Dict[int, int] = defaultdict(int)
+
+    def load(self, db: Session, team_id: int, today: Optional[date] = None) -> TeamCube:
+        """从汇总表加载团队立方体，一次分组查询"""
+        since = _months_before((today or date.today()).replace(day=1), self.history_months - 1)
+        rows = db.query(
+            WorkLogDailyRollup.day,
+            WorkLogDailyRollup.project_id,
+            WorkLogDailyRollup.user_id,
+            WorkLogDailyRollup.work_type,
+            func.sum(WorkLogDailyRollup.count),
+            func.sum(WorkLogDailyRollup.total_duration)
+        ).filter(
+            WorkLogDailyRollup.team_id == team_id,
+            WorkLogDailyRollup.day >= since
+        ).group_by(
+            WorkLogDailyRollup.day, WorkLogDailyRollup.project_id,
+            WorkLogDailyRollup.user_id, WorkLogDailyRollup.work_type
+        ).all()
+
+        cube = TeamCube(team_id, since)
+        for day, project_id, user_id, work_type, count, hours in rows:
+            cube.add(day, project_id, user_id, work_type, int(count), float(hours or 0.0))
+        return cube
+
+    def get_team(self, db: Session, team_id: int) -> TeamCube:
+        cube = self.cache.get(team_id)
+        if cube is not None:
+            return cube
+        with self._lock:
+            version = self._versions[team_id]
+        cube = self.load(db, team_id)
+        with self._lock:
+            # 加载期间提交的增量不会合并到尚未缓存的立方体，这时只用于本次查询
+            if self._versions[team_id] == version:
+                self.cache.set(team_id, cube)
+        return cube
+
+    def apply(self, deltas: Dict[RollupKey, List]):
+        """把已提交的汇总增量合并到已加载的团队立方体，未加载的团队下次查询时再加载"""
+        with self._lock:
+            for key, (count, hours) in deltas.items():
+                if not key.team_id:
+                    continue
+                self._versions[key.team_id] += 1
+                cube = self.cache.get(key.team_id)
+                if cube is not None:
+                    cube.add(key.day, key.project_id, key.user_id, key.work_type, count, hours)
+
+    def _drill_down(self, db: Session, team_id: int, grain: str, start: date, end: date,
+                    dims: Sequence[str]):
+        """从汇总表按天分组读取，再归入周期"""
+        columns = {
+            "project": WorkLogDailyRollup.project_id,
+            "user": WorkLogDailyRollup.user_id,
+            "work_type": WorkLogDailyRollup.work_type,
+            "task": WorkLogDailyRollup.task_id,
+        }
+        selected = [columns[dim] for dim in dims]
+        rows = db.query(
+            WorkLogDailyRollup.day, *selected,
+            func.sum(WorkLogDailyRollup.count), func.sum(WorkLogDailyRollup.total_duration)
+        ).filter(
+            WorkLogDailyRollup.team_id == team_id,
+            WorkLogDailyRollup.day >= period_start(start, grain),
+            WorkLogDailyRollup.day <= end
+        ).group_by(WorkLogDailyRollup.day, *selected).all()
+        for row in rows:
+            values = {"period": period_start(row[0], grain)}
+            values.update(zip(dims, row[1:-2]))
+            yield values, int(row[-2]), float(row[-1] or 0.0)
+
+    def query(self, db: Session, team_id: int, grain: str, start: date, end: date,
+              group_by: Sequence[str], filters: Optional[Dict[str, Iterable]] = None) -> Dict[str, Any]:
+        """
+        查询团队工时
+        - group_by: 保留的维度，其余维度上卷
+        - filters: {维度: 取值列表}，单个取值为切片，多个取值为切块
+        """
+        if grain not in GRAINS:
+            raise ValueError(f"不支持的粒度: {grain}，可选: {', '.join(GRAINS)}")
+        if end < start:
+            raise ValueError("结束日期不能早于开始日期")
+        filters = {dim: set(values) for dim, values in (filters or {}).items()}
+        allowed = CUBE_DIMENSIONS + DRILL_DIMENSIONS
+        unknown = [dim for dim in list(group_by) + list(filters) if dim not in allowed]
+        if unknown:
+            raise ValueError(f"不支持的维度: {', '.join(unknown)}")
+
+        needed = list(dict.fromkeys(dim for dim in list(group_by) + list(filters) if dim != "period"))
+        in_memory = grain != "day" and not any(dim in DRILL_DIMENSIONS for dim in needed)
+        if in_memory:
+            cube = self.get_team(db, team_id)
+            in_memory = cube.covers(grain, start)
+        if in_memory:
+            with self._lock:
+                cells = list(cube.rows(grain, start, end))
+            last = period_start(end, grain)
+            if period_end(last, grain) > end:
+                # 最后一个周期不完整，这部分按天从汇总表读取
+                cells.extend(self._drill_down(db, team_id, grain, last, end, needed))
+            rows = _collect(cells, group_by, filters)
+        else:
+            rows = _collect(self._drill_down(db, team_id, grain, start, end, needed), group_by, filters)
+
+        return {
+            "team_id": team_id,
+            "grain": grain,
+            "start_date": period_start(start, grain),
+            "end_date": end,
+            "group_by": list(group_by),
+            "source": "cube" if in_memory else "rollup",
+            "rows": rows
+        }
+
+
+work_hours_cube = WorkHoursCube(
+    ttl=settings.CUBE_CACHE_TTL,
+    max_size=settings.CUBE_CACHE_SIZE,
+    history_months=settings.CUBE_HISTORY_MONTHS
+)
+work_log_rollup.add_listener(work_hours_cube.apply)
@@ -0,0 +1,311 @@
+"""
+工作日志按天汇总
+
+work_log_daily_rollup 表按 (日期, 团队, 项目, 任务, 用户, 工作类型) 保存日志条数和总时长，
+团队日报和任务工作汇总直接读取汇总行，不再加载当天全部日志：
+1. 通过ORM增删改工作日志时，在同一次flush中读取日志修改前后的汇总键，
+   flush结束时合并成增量，每个汇总键一条 upsert（MySQL ON DUPLICATE KEY / SQLite ON CONFLICT），
+   随业务事务一起提交或回滚；条数减到 0 的汇总行删除
+2. 绕过ORM的批量修改（query.update/delete、手工SQL）不会更新汇总表，
+   需要用 rebuild() 或 rebuild_work_log_rollup.py 按日期范围重建
+3. 事务提交后，本事务内的增量依次传给 add_listener 注册的回调（如工时立方体），回滚时丢弃
+汇总日期取工作发生的日期：start_time，没有开始时间的日志按 created_at，与工时表统计（timesheet）一致；
+补录的日志计入实际工作的日期
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, delete, event, func, insert, inspect, or_, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, object_session
+
+from app.models.user import User
+from app.models.work_log import WorkLog
+from app.models.work_log_rollup import WorkLogDailyRollup
+
+logger = logging.getLogger(__name__)
+
+# 决定汇总键和汇总值的日志字段
+_TRACKED = ("start_time", "created_at", "team_id", "project_id", "task_id", "user_id", "work_type", "duration")
+_PENDING = "work_log_rollup"
+# 已写入汇总表、等待事务提交的增量
+_UNCOMMITTED = "work_log_rollup_uncommitted"
+
+
+# 工作发生的时间
+WORKED_AT = func.coalesce(WorkLog.start_time, WorkLog.created_at)
+
+
+def worked_between(start: Optional[datetime], end: Optional[datetime]):
+    """
+    工作发生时间在 [start, end) 内的条件，None 表示不限
+    分成 start_time 和没有 start_time 时的 created_at 两支，不对 coalesce 做范围比较
+    """
+    def in_range(column):
+        conditions = []
+        if start is not None:
+            conditions.append(column >= start)
+        if end is not None:
+            conditions.append(column < end)
+        return conditions
+
+    return or_(
+        and_(*in_range(WorkLog.start_time)),
+        and_(WorkLog.start_time.is_(None), *in_range(WorkLog.created_at))
+    )
+
+
+class RollupKey(NamedTuple):
+    day: date
+    team_id: int
+    project_id: int
+    task_id: int
+    user_id: int
+    work_type: str
+
+
+# 汇总增量回调：listener({RollupKey: [条数增量, 时长增量]})，在事务提交后调用
+RollupListener = Callable[[Dict[RollupKey, List]], None]
+_listeners: List[RollupListener] = []
+
+
+def add_listener(listener: RollupListener):
+    _listeners.append(listener)
+
+
+def _load(connection, work_log_id: int) -> Optional[Tuple[RollupKey, float]]:
+    """读取数据库中日志当前的汇总键和时长"""
+    row = connection.execute(
+        select(*[getattr(WorkLog, name) for name in _TRACKED]).where(WorkLog.id == work_log_id)
+    ).first()
+    if row is None:
+        return None
+    worked_at = row.start_time or row.created_at or datetime.now()
+    key = RollupKey(
+        worked_at.date(), row.team_id or 0, row.project_id or 0, row.task_id or 0, row.user_id,
+        getattr(row.work_type, "value", row.work_type)
+    )
+    return key, row.duration or 0.0
+
+
+def _record(target, entry: Optional[Tuple[RollupKey, float]], sign: int):
+    if entry is None:
+        return
+    session = object_session(target)
+    if session is None:
+        return
+    key, duration = entry
+    deltas = session.info.setdefault(_PENDING, defaultdict(lambda: [0, 0.0]))
+    deltas[key][0] += sign
+    deltas[key][1] += sign * duration
+
+
+def _tracked_changed(target) -> bool:
+    attrs = inspect(target).attrs
+    return any(attrs[name].history.has_changes() for name in _TRACKED)
+
+
+@event.listens_for(WorkLog, "after_insert")
+def _after_insert(mapper, connection, target):
+    # created_at 由数据库默认值生成，flush后才能读到
+    _record(target, _load(connection, target.id), 1)
+
+
+@event.listens_for(WorkLog, "before_update")
+def _before_update(mapper, connection, target):
+    if _tracked_changed(target):
+        _record(target, _load(connection, target.id), -1)
+
+
+@event.listens_for(WorkLog, "after_update")
+def _after_update(mapper, connection, target):
+    if _tracked_changed(target):
+        _record(target, _load(connection, target.id), 1)
+
+
+@event.listens_for(WorkLog, "before_delete")
+def _before_delete(mapper, connection, target):
+    _record(target, _load(connection, target.id), -1)
+
+
+@event.listens_for(Session, "before_flush")
+def _reset_pending(session, flush_context, instances):
+    # 上一次flush失败时留下的增量作废
+    session.info.pop(_PENDING, None)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_pending(session, flush_context):
+    deltas = session.info.pop(_PENDING, None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+        if _listeners:
+            session.info.setdefault(_UNCOMMITTED, []).append(dict(deltas))
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_committed(session):
+    for deltas in session.info.pop(_UNCOMMITTED, ()):
+        for listener in _listeners:
+            try:
+                listener(deltas)
+            except Exception as e:
+                logger.error(f"工作日志汇总回调失败: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_uncommitted(session):
+    session.info.pop(_UNCOMMITTED, None)
+
+
+def _upsert(connection, values: Dict[str, Any]):
+    table = WorkLogDailyRollup.__table__
+    dialect = connection.dialect.name
+    if dialect == "mysql":
+        stmt = mysql_insert(table).values(**values)
+        connection.execute(stmt.on_duplicate_key_update(
+            count=table.c.count + stmt.inserted["count"],
+            total_duration=table.c.total_duration + stmt.inserted.total_duration
+        ))
+    elif dialect == "sqlite":
+        stmt = sqlite_insert(table).values(**values)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=list(RollupKey._fields),
+            set_={
+                "count": table.c.count + stmt.excluded["count"],
+                "total_duration": table.c.total_duration + stmt.excluded.total_duration
+            }
+        ))
+    else:
+        where = [table.c[name] == values[name] for name in RollupKey._fields]
+        updated = connection.execute(update(table).where(*where).values(
+            count=table.c.count + values["count"],
+            total_duration=table.c.total_duration + values["total_duration"]
+        ))
+        if not updated.rowcount:
+            connection.execute(insert(table).values(**values))
+
+
+def apply_deltas(connection, deltas: Dict[RollupKey, List]):
+    """把 {汇总键: [条数增量, 时长增量]} 写入汇总表"""
+    table = WorkLogDailyRollup.__table__
+    for key, (count, duration) in deltas.items():
+        if count == 0 and abs(duration) < 1e-9:
+            continue
+        values = key._asdict()
+        _upsert(connection, {**values, "count": count, "total_duration": duration})
+        if count < 0:
+            connection.execute(delete(table).where(
+                *[table.c[name] == value for name, value in values.items()],
+                table.c.count <= 0
+            ))
+
+
+def rebuild(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """
+    按工作日志重建 [start, end] 日期范围（默认全部）的汇总行，返回重建后的汇总行数
+    一条 DELETE 加一条 INSERT ... SELECT ... GROUP BY，由调用方提交
+    """
+    day = func.date(WORKED_AT)
+    source = select(
+        day,
+        func.coalesce(WorkLog.team_id, 0),
+        func.coalesce(WorkLog.project_id, 0),
+        func.coalesce(WorkLog.task_id, 0),
+        WorkLog.user_id,
+        WorkLog.work_type,
+        func.count(WorkLog.id),
+        func.coalesce(func.sum(WorkLog.duration), 0.0)
+    )
+    clear = delete(WorkLogDailyRollup)
+    if start is not None or end is not None:
+        source = source.where(worked_between(
+            datetime.combine(start, datetime.min.time()) if start is not None else None,
+            datetime.combine(end + timedelta(days=1), datetime.min.time()) if end is not None else None
+        ))
+    if start is not None:
+        clear = clear.where(WorkLogDailyRollup.day >= start)
+    if end is not None:
+        clear = clear.where(WorkLogDailyRollup.day <= end)
+    source = source.group_by(
+        day, func.coalesce(WorkLog.team_id, 0), func.coalesce(WorkLog.project_id, 0),
+        func.coalesce(WorkLog.task_id, 0), WorkLog.user_id, WorkLog.work_type
+    )
+
+    db.execute(clear)
+    result = db.execute(insert(WorkLogDailyRollup).from_select(
+        list(RollupKey._fields) + ["count", "total_duration"], source
+    ))
+    logger.info(f"已重建工作日志汇总: {start or '最早'} ~ {end or '最新'}，{result.rowcount} 行")
+    return result.rowcount
+
+
+def _add(stats: Dict[str, Any], count: int, duration: float):
+    stats["count"] += count
+    stats["total_duration"] += duration
+
+
+def get_daily_report(db: Session, day: date) -> Dict[str, Any]:
+    """某一天的日志统计：按工作类型、按用户（含用户下的工作类型），一次汇总查询"""
+    rows = db.query(
+        WorkLogDailyRollup.user_id,
+        User.username,
+        WorkLogDailyRollup.work_type,
+        func.sum(WorkLogDailyRollup.count),
+        func.sum(WorkLogDailyRollup.total_duration)
+    ).join(User, User.id == WorkLogDailyRollup.user_id).filter(
+        WorkLogDailyRollup.day == day
+    ).group_by(WorkLogDailyRollup.user_id, User.username, WorkLogDailyRollup.work_type).all()
+
+    total_logs = 0
+    work_type_stats: Dict[str, Dict[str, Any]] = {}
+    user_stats: Dict[int, Dict[str, Any]] = {}
+    for user_id, username, work_type, count, duration in rows:
+        count, duration = int(count), float(duration or 0.0)
+        total_logs += count
+        _add(work_type_stats.setdefault(work_type, {"count": 0, "total_duration": 0}), count, duration)
+        user = user_stats.setdefault(
+            user_id, {"username": username, "count": 0, "total_duration": 0, "work_types": {}}
+        )
+        _add(user, count, duration)
+        _add(user["work_types"].setdefault(work_type, {"count": 0, "total_duration": 0}), count, duration)
+
+    return {
+        "date": day,
+        "total_logs": total_logs,
+        "work_type_stats": work_type_stats,
+        "user_stats": user_stats
+    }
+
+
+def get_task_summary(db: Session, task_id: int) -> Dict[str, Any]:
+    """任务的工时统计：总工时、日志数、按工作类型、按用户，一次汇总查询"""
+    rows = db.query(
+        WorkLogDailyRollup.user_id,
+        WorkLogDailyRollup.work_type,
+        func.sum(WorkLogDailyRollup.count),
+        func.sum(WorkLogDailyRollup.total_duration)
+    ).filter(
+        WorkLogDailyRollup.task_id == task_id
+    ).group_by(WorkLogDailyRollup.user_id, WorkLogDailyRollup.work_type).all()
+
+    by_type: Dict[str, Dict[str, Any]] = {}
+    by_user: Dict[int, Dict[str, Any]] = {}
+    for user_id, work_type, count, hours in rows:
+        count, hours = int(count), float(hours or 0.0)
+        stat = by_type.setdefault(work_type, {"work_type": work_type, "count": 0, "hours": 0.0})
+        stat["count"] += count
+        stat["hours"] += hours
+        stat = by_user.setdefault(user_id, {"user_id": user_id, "count": 0, "hours": 0.0})
+        stat["count"] += count
+        stat["hours"] += hours
+
+    return {
+        "total_hours": sum(stat["hours"] for stat in by_type.values()),
+        "work_log_count": sum(stat["count"] for stat in by_type.values()),
+        "work_type_stats": list(by_type.values()),
+        "user_stats": list(by_user.values())
+    }
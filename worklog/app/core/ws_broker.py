@@ -0,0 +1,196 @@
+"""
+WebSocket 消息代理
+
+ConnectionManager 只持有本进程的连接，推送先发布到代理的频道，再由订阅了该频道的
+进程投递给自己持有的连接，多个 worker 之间也能实时送达：
+- 用户频道 ws:user:{user_id}：进程中有该用户的连接时订阅
+- 团队频道 ws:team:{team_id}：按团队推送时使用
+- 广播频道 ws:broadcast：每个进程启动时订阅，投递给本进程的全部连接
+- 事件频道 ws:events：每个进程启动时订阅，传递成员关系变更等需要各进程各自处理的事件
+后端由 WS_BROKER 配置选择：
+- memory：进程内直接投递，适用于单进程部署和测试
+- redis：使用 Redis pub/sub，适用于多 worker / 多实例部署
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 收到频道消息时的回调：handler(channel, message)
+MessageHandler = Callable[[str, str], None]
+
+USER_CHANNEL_PREFIX = "ws:user:"
+TEAM_CHANNEL_PREFIX = "ws:team:"
+BROADCAST_CHANNEL = "ws:broadcast"
+EVENT_CHANNEL = "ws:events"
+
+
+def user_channel(user_id: int) -> str:
+    return f"{USER_CHANNEL_PREFIX}{user_id}"
+
+
+def team_channel(team_id: int) -> str:
+    return f"{TEAM_CHANNEL_PREFIX}{team_id}"
+
+
+class Broker(ABC):
+    """消息代理接口"""
+
+    # 是否跨进程投递；为True时本进程没有某用户的连接，不代表该用户离线
+    distributed = False
+
+    def __init__(self):
+        self.handler: Optional[MessageHandler] = None
+
+    def set_handler(self, handler: MessageHandler):
+        self.handler = handler
+
+    async def start(self):
+        """建立与后端的连接，应用启动时调用"""
+
+    async def stop(self):
+        """断开与后端的连接，应用停止时调用"""
+
+    @abstractmethod
+    async def subscribe(self, channel: str):
+        """订阅频道，此后发布到该频道的消息交给 handler"""
+
+    @abstractmethod
+    async def unsubscribe(self, channel: str):
+        """取消订阅频道"""
+
+    async def publish(self, channel: str, message: str):
+        await self.publish_many([channel], message)
+
+    @abstractmethod
+    async def publish_many(self, channels: Iterable[str], message: str):
+        """把同一条消息发布到多个频道"""
+
+
+class InMemoryBroker(Broker):
+    """
+    进程内代理，发布时同步调用订阅方的回调
+    共享同一个 hub 的多个实例之间可以互相投递，用于在测试中模拟多个 worker
+    """
+
+    def __init__(self, hub: Optional[Dict[str, Set["InMemoryBroker"]]] = None):
+        super().__init__()
+        # 共享 hub 时相当于多个进程，推送不能只看本实例的连接
+        self.distributed = hub is not None
+        self.hub = hub if hub is not None else {}
+
+    async def subscribe(self, channel: str):
+        self.hub.setdefault(channel, set()).add(self)
+
+    async def unsubscribe(self, channel: str):
+        subscribers = self.hub.get(channel)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self.hub[channel]
+
+    async def publish_many(self, channels: Iterable[str], message: str):
+        for channel in channels:
+            for broker in list(self.hub.get(channel, ())):
+                if broker.handler is not None:
+                    broker.handler(channel, message)
+
+    def subscriptions(self) -> Set[str]:
+        return {channel for channel, subscribers in self.hub.items() if self in subscribers}
+
+
+class RedisBroker(Broker):
+    """基于 Redis pub/sub 的代理，每个进程一个订阅连接和一个读取任务"""
+
+    distributed = True
+
+    def __init__(self, client=None):
+        super().__init__()
+        self._client = client
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._reader is not None:
+            return
+        if self._client is None:
+            # 仅在启用redis代理时才需要安装redis
+            import redis.asyncio as aioredis
+            self._client = aioredis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD,
+                db=settings.REDIS_DB
+            )
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._reader = asyncio.create_task(self._read())
+        logger.info("Redis消息代理已启动")
+
+    async def stop(self):
+        reader, self._reader = self._reader, None
+        if reader is not None:
+            reader.cancel()
+            try:
+                await reader
+            except asyncio.CancelledError:
+                pass
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def subscribe(self, channel: str):
+        await self._pubsub.subscribe(channel)
+
+    async def unsubscribe(self, channel: str):
+        await self._pubsub.unsubscribe(channel)
+
+    async def publish_many(self, channels: Iterable[str], message: str):
+        channels = list(channels)
+        if not channels:
+            return
+        if len(channels) == 1:
+            await self._client.publish(channels[0], message)
+            return
+        # 多个频道在一次往返中发布
+        async with self._client.pipeline(transaction=False) as pipe:
+            for channel in channels:
+                pipe.publish(channel, message)
+            await pipe.execute()
+
+    async def _read(self):
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None or self.handler is None:
+                    continue
+                channel = message["channel"]
+                data = message["data"]
+                self.handler(
+                    channel.decode() if isinstance(channel, bytes) else channel,
+                    data.decode() if isinstance(data, bytes) else data
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 连接中断时redis客户端会在下次读取时重连并恢复订阅
+                logger.error(f"读取Redis订阅消息失败: {e}")
+                await asyncio.sleep(1)
+
+
+def create_broker(kind: Optional[str] = None) -> Broker:
+    kind = kind or settings.WS_BROKER
+    if kind == "memory":
+        return InMemoryBroker()
+    if kind == "redis":
+        return RedisBroker()
+    raise ValueError(f"未知的WebSocket消息代理: {kind}")
@@ -1,89 +1,492 @@
-from typing import Dict, List, Any
+"""
+WebSocket 连接管理
+
+每个连接有一个有界发送队列和一个独立的写任务：
+1. 推送时消息只序列化一次，然后放入各连接的队列，不等待网络发送，也不持有全局锁
+2. 写任务逐条发送队列中的消息，单条发送超过 WS_SEND_TIMEOUT 秒视为连接失效并移除
+3. 队列已满（客户端消费太慢）时按 WS_SLOW_CONSUMER_POLICY 处理：
+   drop_oldest 丢弃最旧的消息，drop_newest 丢弃新消息，disconnect 断开该连接
+某个客户端卡住只会影响它自己的队列，不会拖慢其他用户的推送
+
+断线重连时客户端带上最后收到的消息id，连接先进入补发状态：期间到达的实时消息暂存，
+补发完历史消息后再按顺序发送暂存的消息，已补发过的消息不会重复发送
+
+推送经由消息代理（见 ws_broker）发布到用户频道，由持有该用户连接的进程投递，
+多 worker 部署时也能送达其他进程上的连接；广播发布到所有进程都订阅的广播频道
+
+团队频道：连接时按用户的团队成员关系登记到 team_members 索引（team_id -> 本进程在线的成员），
+并订阅对应的团队频道；成员关系变更后通过 refresh_teams 重新加载。
+向团队推送时只发布一次到团队频道，各进程查一次索引即可投递，不再逐个用户查询和发布
+
+进程间事件：publish_event(kind, *args) 发布到事件频道，其他进程调用 add_event_handler 登记的
+handler(*args)，发布者自己不会收到。用于成员关系变更、消息计数变化等需要各进程同步的状态
+"""
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, List, Any, Optional, Tuple
 from fastapi import WebSocket
 import asyncio
 import json
 import logging
+import time
+import uuid
+
+from app.core.config import settings
+from app.core.ws_broker import (
+    BROADCAST_CHANNEL, Broker, EVENT_CHANNEL, TEAM_CHANNEL_PREFIX, USER_CHANNEL_PREFIX, create_broker,
+    team_channel, user_channel
+)
 
 logger = logging.getLogger(__name__)
 
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+
+def _message_id(message: str) -> Optional[int]:
+    if '"message_id"' not in message:
+        return None
+    try:
+        return json.loads(message).get("message_id")
+    except (ValueError, AttributeError):
+        return None
+
+
+class Connection:
+    """单个WebSocket连接及其发送队列"""
+
+    def __init__(self, manager: "ConnectionManager", user_id: int, websocket: WebSocket):
+        self.manager = manager
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=manager.queue_size)
+        self.dropped = 0
+        self.closed = False
+        self.writer: Optional[asyncio.Task] = None
+        # 补发历史消息期间暂存的实时消息，None表示不在补发状态
+        self._replay_buffer: Optional[List[str]] = None
+        # 补发覆盖到的最后一条消息id，补发结束后推送晚到的更早消息仍按它跳过
+        self._replayed_through: Optional[int] = None
+        # 最后一次收到客户端消息的时间（time.monotonic）和客户端报告的空闲状态，见 presence
+        self.last_seen = time.monotonic()
+        self.idle = False
+
+    def start(self):
+        self.writer = asyncio.get_running_loop().create_task(self._write())
+
+    def send(self, message: str) -> bool:
+        """
+        把已序列化的消息放入发送队列，立即返回
+        返回False表示消息被丢弃或连接已关闭
+        """
+        if self.closed:
+            return False
+        if self._replay_buffer is not None:
+            self._replay_buffer.append(message)
+            return True
+        if self._already_replayed(message):
+            return True
+        return self._enqueue(message)
+
+    def _already_replayed(self, message: str) -> bool:
+        if self._replayed_through is None:
+            return False
+        message_id = _message_id(message)
+        return message_id is not None and message_id <= self._replayed_through
+
+    def begin_replay(self):
+        self._replay_buffer = []
+
+    def finish_replay(self, frames: List[str], last_id: Optional[int]):
+        """
+        发送补发的历史消息，然后发送补发期间暂存的实时消息
+        暂存消息和之后推送的消息中 message_id 不大于 last_id 的已在补发中发送过，跳过
+        """
+        buffered, self._replay_buffer = self._replay_buffer or [], None
+        self._replayed_through = last_id
+        for frame in frames:
+            self._enqueue(frame)
+        for message in buffered:
+            if not self._already_replayed(message):
+                self._enqueue(message)
+
+    def _enqueue(self, message: str) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        self.dropped += 1
+        policy = self.manager.slow_consumer_policy
+        if policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.queue.put_nowait(message)
+            logger.warning(f"用户 {self.user_id} 的发送队列已满，丢弃最旧的消息")
+            return True
+        if policy == "drop_newest":
+            logger.warning(f"用户 {self.user_id} 的发送队列已满，丢弃新消息")
+            return False
+        self.manager.evict(self, "发送队列已满")
+        return False
+
+    async def _write(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(message), self.manager.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                self.manager.evict(self, "发送超时")
+                return
+            except Exception as e:
+                self.manager.evict(self, f"发送失败: {e}")
+                return
+            finally:
+                self.queue.task_done()
+
+    def close(self):
+        """停止写任务并关闭底层连接，可以重复调用"""
+        if self.closed:
+            return
+        self.closed = True
+        # 丢弃未发送的消息，避免flush一直等待
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+        if self.writer is not None and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        asyncio.get_running_loop().create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close()
+        except Exception:
+            # 连接可能已经断开
+            pass
+
+
 class ConnectionManager:
-    def __init__(self):
-        # user_id -> List[WebSocket]
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-        self.lock = asyncio.Lock()
+    def __init__(
+        self,
+        queue_size: int = settings.WS_SEND_QUEUE_SIZE,
+        send_timeout: float = settings.WS_SEND_TIMEOUT,
+        slow_consumer_policy: str = settings.WS_SLOW_CONSUMER_POLICY,
+        broker: Optional[Broker] = None
+    ):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"未知的慢连接处理策略: {slow_consumer_policy}")
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        # user_id -> 连接元组；增删连接时整体替换，推送时遍历的是不会被修改的快照
+        self.active_connections: Dict[int, Tuple[Connection, ...]] = {}
+        self.broker = broker or create_broker()
+        self.broker.set_handler(self._on_broker_message)
+        # team_id -> 本进程有连接的成员；user_id -> 所在团队。与连接元组一样整体替换
+        self.team_members: Dict[int, FrozenSet[int]] = {}
+        self.user_teams: Dict[int, FrozenSet[int]] = {}
+        # 成员关系变更后重新加载用户所在团队：team_loader(user_id) -> team_ids，在线程池中执行
+        self.team_loader: Optional[Callable[[int], Iterable[int]]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 进程间事件：本进程标识用于忽略自己发布的事件；kind -> handler(*args)，在事件循环中调用
+        self.instance_id = uuid.uuid4().hex
+        self._event_handlers: Dict[str, Callable[..., None]] = {}
+
+    async def start(self):
+        """连接消息代理并订阅广播频道和事件频道，应用启动时调用"""
+        self._loop = asyncio.get_running_loop()
+        await self.broker.start()
+        await self.broker.subscribe(BROADCAST_CHANNEL)
+        await self.broker.subscribe(EVENT_CHANNEL)
 
-    async def connect(self, user_id: int, websocket: WebSocket):
+    def set_team_loader(self, loader: Callable[[int], Iterable[int]]):
+        self.team_loader = loader
+
+    async def connect(
+        self,
+        user_id: int,
+        websocket: WebSocket,
+        replay: bool = False,
+        team_ids: Iterable[int] = ()
+    ) -> Connection:
+        """
+        接受连接并开始接收推送，team_ids 为用户所在团队，用于接收团队频道的推送
+        replay为True时连接处于补发状态，调用方补发完历史消息后需调用 connection.finish_replay
+        """
         await websocket.accept()
-        async with self.lock:
-            if user_id not in self.active_connections:
-                self.active_connections[user_id] = []
-            self.active_connections[user_id].append(websocket)
+        connection = Connection(self, user_id, websocket)
+        if replay:
+            connection.begin_replay()
+        connection.start()
+        first = user_id not in self.active_connections
+        self.active_connections[user_id] = self.active_connections.get(user_id, ()) + (connection,)
+        if first:
+            await self.broker.subscribe(user_channel(user_id))
+        await self.set_user_teams(user_id, team_ids)
         logger.info(f"用户 {user_id} 已连接WebSocket")
+        return connection
+
+    async def set_user_teams(self, user_id: int, team_ids: Iterable[int]):
+        """更新在线用户所在的团队，订阅新出现的团队频道，取消不再有成员在线的团队频道"""
+        new = frozenset(team_ids) if user_id in self.active_connections else frozenset()
+        old = self.user_teams.get(user_id, frozenset())
+        if new:
+            self.user_teams[user_id] = new
+        else:
+            self.user_teams.pop(user_id, None)
+        for team_id in new - old:
+            members = self.team_members.get(team_id, frozenset())
+            self.team_members[team_id] = members | {user_id}
+            if not members:
+                await self.broker.subscribe(team_channel(team_id))
+        emptied = self._leave_teams(user_id, old - new)
+        for team_id in emptied:
+            await self._unsubscribe_team(team_id)
+
+    def _leave_teams(self, user_id: int, team_ids: Iterable[int]) -> List[int]:
+        """从团队索引中移除用户，返回因此没有在线成员的团队"""
+        emptied = []
+        for team_id in team_ids:
+            members = self.team_members.get(team_id, frozenset()) - {user_id}
+            if members:
+                self.team_members[team_id] = members
+            else:
+                self.team_members.pop(team_id, None)
+                emptied.append(team_id)
+        return emptied
+
+    def refresh_teams(self, user_ids: Iterable[int], team_id: Optional[int] = None):
+        """
+        成员关系变更后重新加载这些用户所在的团队，可以在任意线程调用
+        team_id 不为空时该团队的在线成员也一并重新加载
+        """
+        user_ids = set(user_ids)
+        if team_id is not None:
+            user_ids.update(self.team_members.get(team_id, ()))
+        user_ids = [user_id for user_id in user_ids if user_id in self.active_connections]
+        if user_ids and self.team_loader is not None:
+            self._schedule(lambda: self._reload_teams(user_ids))
+
+    def _schedule(self, coroutine: Callable[[], Awaitable]) -> bool:
+        """在 start 绑定的事件循环中运行协程，可以在任意线程调用；事件循环不可用时返回False"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return False
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(coroutine())
+        else:
+            loop.call_soon_threadsafe(lambda: loop.create_task(coroutine()))
+        return True
+
+    async def _reload_teams(self, user_ids: List[int]):
+        for user_id in user_ids:
+            try:
+                team_ids = await asyncio.to_thread(self.team_loader, user_id)
+                await self.set_user_teams(user_id, team_ids)
+            except Exception as e:
+                logger.error(f"更新用户 {user_id} 的团队频道失败: {e}")
 
     async def disconnect(self, user_id: int, websocket: WebSocket):
-        async with self.lock:
-            if user_id in self.active_connections:
-                if websocket in self.active_connections[user_id]:
-                    self.active_connections[user_id].remove(websocket)
-                if not self.active_connections[user_id]:
-                    del self.active_connections[user_id]
+        for connection in self.active_connections.get(user_id, ()):
+            if connection.websocket is websocket:
+                self._remove(connection)
+                connection.closed = True
+                if connection.writer is not None:
+                    connection.writer.cancel()
         logger.info(f"用户 {user_id} 已断开WebSocket连接")
 
+    def evict(self, connection: Connection, reason: str):
+        """移除失效或消费过慢的连接"""
+        logger.warning(f"移除用户 {connection.user_id} 的WebSocket连接: {reason}")
+        self._remove(connection)
+        connection.close()
+
+    def _remove(self, connection: Connection):
+        remaining = tuple(c for c in self.active_connections.get(connection.user_id, ()) if c is not connection)
+        if remaining:
+            self.active_connections[connection.user_id] = remaining
+        elif self.active_connections.pop(connection.user_id, None) is not None:
+            emptied = self._leave_teams(connection.user_id, self.user_teams.pop(connection.user_id, ()))
+            asyncio.get_running_loop().create_task(self._unsubscribe_user(connection.user_id, emptied))
+
+    async def _unsubscribe_user(self, user_id: int, team_ids: Iterable[int] = ()):
+        for team_id in team_ids:
+            await self._unsubscribe_team(team_id)
+        # 取消订阅前用户可能已重新连接
+        if user_id in self.active_connections:
+            return
+        try:
+            await self.broker.unsubscribe(user_channel(user_id))
+        except Exception as e:
+            logger.error(f"取消订阅用户 {user_id} 的频道失败: {e}")
+
+    async def _unsubscribe_team(self, team_id: int):
+        # 取消订阅前团队可能又有成员连接
+        if team_id in self.team_members:
+            return
+        try:
+            await self.broker.unsubscribe(team_channel(team_id))
+        except Exception as e:
+            logger.error(f"取消订阅团队 {team_id} 的频道失败: {e}")
+
+    def add_event_handler(self, kind: str, handler: Callable[..., None]):
+        self._event_handlers[kind] = handler
+
+    def publish_event(self, kind: str, *args):
+        """
+        把事件发布给其他进程，参数需可以JSON序列化，可以在任意线程调用，不会抛出异常
+        单进程部署时没有其他进程，直接跳过
+        """
+        if not self.broker.distributed:
+            return
+        try:
+            message = json.dumps({"kind": kind, "origin": self.instance_id, "args": args}, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            logger.error(f"序列化进程间事件 {kind} 失败: {e}")
+            return
+        if not self._schedule(lambda: self._publish_event(kind, message)):
+            logger.warning(f"消息代理未启动，进程间事件 {kind} 未发布")
+
+    async def _publish_event(self, kind: str, message: str):
+        try:
+            await self.broker.publish(EVENT_CHANNEL, message)
+        except Exception as e:
+            logger.error(f"发布进程间事件 {kind} 失败: {e}")
+
+    def _on_event(self, message: str):
+        try:
+            event = json.loads(message)
+        except ValueError:
+            logger.error("无法解析进程间事件")
+            return
+        if event.get("origin") == self.instance_id:
+            return
+        handler = self._event_handlers.get(event.get("kind"))
+        if handler is None:
+            return
+        try:
+            handler(*event.get("args", ()))
+        except Exception as e:
+            logger.error(f"处理进程间事件 {event.get('kind')} 失败: {e}")
+
+    def _on_broker_message(self, channel: str, message: str):
+        if channel == EVENT_CHANNEL:
+            self._on_event(message)
+        elif channel == BROADCAST_CHANNEL:
+            self.deliver_local(list(self.active_connections), message)
+        elif channel.startswith(USER_CHANNEL_PREFIX):
+            self.deliver_local([int(channel[len(USER_CHANNEL_PREFIX):])], message)
+        elif channel.startswith(TEAM_CHANNEL_PREFIX):
+            # 团队频道的消息第一行是逗号分隔的排除用户，json.dumps 的结果不含换行
+            header, _, message = message.partition("\n")
+            exclude = {int(user_id) for user_id in header.split(",") if user_id}
+            self.deliver_team(int(channel[len(TEAM_CHANNEL_PREFIX):]), message, exclude)
+
+    async def publish(self, user_ids: List[int], message: str):
+        """把已序列化的消息发布到这些用户的频道"""
+        user_ids = list(dict.fromkeys(user_ids))
+        if not self.broker.distributed:
+            # 单进程时只需投递给本进程持有连接的用户
+            user_ids = [user_id for user_id in user_ids if user_id in self.active_connections]
+        if not user_ids:
+            return
+        try:
+            await self.broker.publish_many([user_channel(user_id) for user_id in user_ids], message)
+        except Exception as e:
+            logger.error(f"发布WebSocket消息失败: {e}")
+
+    async def publish_team(self, team_id: int, message: str, exclude_user_ids: Iterable[int] = ()):
+        """把已序列化的消息发布到团队频道，投递给团队中除 exclude_user_ids 外的在线成员"""
+        if not self.broker.distributed and team_id not in self.team_members:
+            return
+        header = ",".join(str(user_id) for user_id in exclude_user_ids)
+        try:
+            await self.broker.publish(team_channel(team_id), f"{header}\n{message}")
+        except Exception as e:
+            logger.error(f"发布团队 {team_id} 的WebSocket消息失败: {e}")
+
+    def deliver_team(self, team_id: int, message: str, exclude_user_ids: Iterable[int] = ()) -> int:
+        """投递给团队在本进程的在线成员"""
+        members = self.team_members.get(team_id)
+        if not members:
+            return 0
+        exclude = set(exclude_user_ids)
+        return self.deliver_local([user_id for user_id in members if user_id not in exclude], message)
+
+    def deliver_local(self, user_ids: List[int], message: str) -> int:
+        """把已序列化的消息放入这些用户在本进程的所有连接的发送队列，返回成功入队的连接数"""
+        delivered = 0
+        for user_id in user_ids:
+            for connection in self.active_connections.get(user_id, ()):
+                if connection.send(message):
+                    delivered += 1
+        return delivered
+
     async def send_personal_message(self, user_id: int, message: str):
         """发送文本消息给指定用户"""
-        async with self.lock:
-            conns = self.active_connections.get(user_id, [])
-            for ws in conns:
-                try:
-                    await ws.send_text(message)
-                except Exception as e:
-                    logger.error(f"发送消息给用户 {user_id} 失败: {e}")
-                    # 移除断开的连接
-                    if ws in conns:
-                        conns.remove(ws)
+        await self.publish([user_id], message)
 
     async def send_json_message(self, user_id: int, data: Any):
         """发送JSON消息给指定用户"""
         try:
             message = json.dumps(data, ensure_ascii=False)
-            await self.send_personal_message(user_id, message)
         except Exception as e:
             logger.error(f"发送JSON消息给用户 {user_id} 失败: {e}")
+            return
+        await self.publish([user_id], message)
 
     async def send_team_message(self, team_member_ids: List[int], data: Any):
-        """发送消息给团队成员"""
+        """发送消息给团队成员，消息只序列化一次"""
         message = json.dumps(data, ensure_ascii=False)
-        async with self.lock:
-            for user_id in team_member_ids:
-                conns = self.active_connections.get(user_id, [])
-                for ws in conns:
-                    try:
-                        await ws.send_text(message)
-                    except Exception as e:
-                        logger.error(f"发送团队消息给用户 {user_id} 失败: {e}")
-                        # 移除断开的连接
-                        if ws in conns:
-                            conns.remove(ws)
+        await self.publish(team_member_ids, message)
+
+    async def send_to_team(self, team_id: int, data: Any, exclude_user_ids: Iterable[int] = ()):
+        """通过团队频道发送消息给团队在线成员"""
+        await self.publish_team(team_id, json.dumps(data, ensure_ascii=False), exclude_user_ids)
 
     async def broadcast(self, message: str):
-        """广播消息给所有连接的用户"""
-        async with self.lock:
-            for user_id, conns in self.active_connections.items():
-                for ws in conns:
-                    try:
-                        await ws.send_text(message)
-                    except Exception as e:
-                        logger.error(f"广播消息给用户 {user_id} 失败: {e}")
-                        # 移除断开的连接
-                        if ws in conns:
-                            conns.remove(ws)
+        """广播消息给所有进程上连接的用户"""
+        if not self.broker.distributed:
+            self.deliver_local(list(self.active_connections), message)
+            return
+        try:
+            await self.broker.publish(BROADCAST_CHANNEL, message)
+        except Exception as e:
+            logger.error(f"发布广播消息失败: {e}")
+
+    async def flush(self, timeout: Optional[float] = None):
+        """等待所有连接的发送队列清空"""
+        queues = [c.queue.join() for conns in list(self.active_connections.values()) for c in conns]
+        if queues:
+            await asyncio.wait_for(asyncio.gather(*queues), timeout)
+
+    async def close_all(self, timeout: float = 5):
+        """应用停止时尽量发完队列中的消息，然后关闭全部连接"""
+        try:
+            await self.flush(timeout)
+        except asyncio.TimeoutError:
+            logger.warning("关闭前未能发完全部WebSocket消息")
+        for conns in list(self.active_connections.values()):
+            for connection in conns:
+                self.evict(connection, "服务关闭")
+        await self.broker.stop()
 
     def get_connected_users(self) -> List[int]:
         """获取当前连接的用户ID列表"""
         return list(self.active_connections.keys())
 
     def is_user_connected(self, user_id: int) -> bool:
-        """检查用户是否在线"""
-        return user_id in self.active_connections and len(self.active_connections[user_id]) > 0
+        """检查用户在本进程是否有连接"""
+        return bool(self.active_connections.get(user_id))
+
+    def is_user_reachable(self, user_id: int) -> bool:
+        """推送是否可能送达该用户：本进程有连接，或者代理会投递给其他进程"""
+        return self.broker.distributed or self.is_user_connected(user_id)
 
-ws_manager = ConnectionManager() 
\ No newline at end of file
+ws_manager = ConnectionManager()
@@ -1,34 +1,85 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import and_, or_, case, func
 from datetime import datetime, timedelta
 
-from app.models.message import Message, MessageTemplate
+from app.core.message_counters import add_message, empty_stats, message_counters
+from app.core.pagination import CursorKey, apply_keyset, split_page
+from app.models.message import Message, MessageRecipient, MessageTemplate
 from app.schemas.message import MessageCreate, MessageUpdate, MessageTemplateCreate, MessageTemplateUpdate
 
 class MessageCRUD:
+    """
+    消息的收件状态（已读、删除）按接收者保存在 message_recipients 中，
+    返回给某个用户的消息对象上的 is_read/read_at/is_deleted 为该用户自己的状态
+    """
+
     def create(self, db: Session, *, obj_in: MessageCreate) -> Message:
         """
         创建消息，支持多接收人
         """
-        db_obj = Message(
+        db_obj = self._build(obj_in)
+        db.add(db_obj)
+        db.commit()
+        db.refresh(db_obj)
+        self._count_created(db, [obj_in])
+        return db_obj
+
+    def create_many(self, db: Session, *, objs_in: List[MessageCreate]) -> List[int]:
+        """
+        批量创建消息，一次提交，按传入顺序返回消息id
+        提交后不再逐条刷新对象
+        """
+        db_objs = [self._build(obj_in) for obj_in in objs_in]
+        if not db_objs:
+            return []
+        db.add_all(db_objs)
+        db.flush()
+        ids = [db_obj.id for db_obj in db_objs]
+        db.commit()
+        self._count_created(db, objs_in)
+        return ids
+
+    def _count_created(self, db: Session, objs_in: List[MessageCreate]):
+        for obj_in in objs_in:
+            message_counters.update(
+                db, obj_in.recipients,
+                lambda stats, obj_in=obj_in: add_message(stats, obj_in.message_type, obj_in.priority, False),
+                self._count_stats
+            )
+
+    def _build(self, obj_in: MessageCreate) -> Message:
+        created_at = datetime.now()
+        return Message(
             title=obj_in.title,
             content=obj_in.content,
             message_type=obj_in.message_type,
             priority=obj_in.priority,
             sender_id=obj_in.sender_id,
             recipients=obj_in.recipients,
-            message_data=obj_in.message_data or {}
+            message_data=obj_in.message_data or {},
+            created_at=created_at,
+            recipient_states=[
+                MessageRecipient(user_id=user_id, is_read=False, is_deleted=False, created_at=created_at)
+                for user_id in dict.fromkeys(obj_in.recipients)
+            ]
         )
-        db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
-        return db_obj
 
     def get(self, db: Session, message_id: int) -> Optional[Message]:
         """获取单个消息"""
         return db.query(Message).filter(Message.id == message_id).first()
 
+    def get_for_receiver(self, db: Session, message_id: int, user_id: int) -> Optional[Message]:
+        """获取用户收到的单个消息，不是接收者时返回None"""
+        row = db.query(Message, MessageRecipient).join(
+            MessageRecipient, MessageRecipient.message_id == Message.id
+        ).filter(
+            MessageRecipient.message_id == message_id,
+            MessageRecipient.user_id == user_id
+        ).first()
+        return self._as_receiver_view(*row) if row else None
+
     def get_by_receiver(
         self, 
         db: Session, 
@@ -41,98 +92,168 @@ class MessageCRUD:
         """
         获取用户接收的消息
         """
-        query = db.query(Message).filter(
-            Message.recipients.contains([receiver_id]),
-            Message.is_deleted == False
+        query = self._receiver_query(db, receiver_id, unread_only, message_type)
+        rows = query.order_by(
+            MessageRecipient.created_at.desc(), MessageRecipient.message_id.desc()
+        ).offset(skip).limit(limit).all()
+        return [self._as_receiver_view(message, state) for message, state in rows]
+
+    def get_by_receiver_after(
+        self,
+        db: Session,
+        receiver_id: int,
+        cursor_key: Optional[CursorKey] = None,
+        limit: int = 100,
+        unread_only: bool = False,
+        message_type: Optional[str] = None
+    ) -> Tuple[List[Message], Optional[str]]:
+        """
+        按 (created_at, id) 游标获取用户接收的消息，返回消息列表和下一页游标
+        """
+        query = self._receiver_query(db, receiver_id, unread_only, message_type)
+        rows = apply_keyset(
+            query, MessageRecipient.created_at, MessageRecipient.message_id, cursor_key, limit
+        ).all()
+        rows, next_cursor = split_page(rows, limit, lambda r: r[1].created_at, lambda r: r[1].message_id)
+        return [self._as_receiver_view(message, state) for message, state in rows], next_cursor
+
+    def get_missed(
+        self, db: Session, receiver_id: int, last_seen_id: int, limit: int = 100
+    ) -> Tuple[List[Message], bool]:
+        """
+        获取id大于 last_seen_id 的消息，按id升序，用于断线重连后补发
+        返回消息列表和是否还有更多（超出limit）
+        """
+        rows = self._receiver_query(db, receiver_id).filter(
+            MessageRecipient.message_id > last_seen_id
+        ).order_by(MessageRecipient.message_id).limit(limit + 1).all()
+        truncated = len(rows) > limit
+        return [self._as_receiver_view(message, state) for message, state in rows[:limit]], truncated
+
+    def _receiver_query(
+        self,
+        db: Session,
+        receiver_id: int,
+        unread_only: bool = False,
+        message_type: Optional[str] = None
+    ):
+        # 从收件箱表按 (user_id, is_read, created_at) 索引取数，再按主键关联消息
+        query = db.query(Message, MessageRecipient).join(
+            MessageRecipient, MessageRecipient.message_id == Message.id
+        ).filter(
+            MessageRecipient.user_id == receiver_id,
+            MessageRecipient.is_deleted == False
         )
         if unread_only:
-            query = query.filter(Message.is_read == False)
+            query = query.filter(MessageRecipient.is_read == False)
         if message_type:
             query = query.filter(Message.message_type == message_type)
-        return query.order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
+        return query
 
-    def mark_as_read(self, db: Session, message_id: int, user_id: int) -> Optional[Message]:
-        message = db.query(Message).filter(
-            Message.id == message_id,
-            Message.recipients.contains([user_id])
+    def _as_receiver_view(self, message: Message, state: MessageRecipient) -> Message:
+        # 用接收者自己的状态覆盖消息上的共享字段，不会把消息标记为已修改
+        set_committed_value(message, 'is_read', state.is_read)
+        set_committed_value(message, 'read_at', state.read_at)
+        set_committed_value(message, 'is_deleted', state.is_deleted)
+        return message
+
+    def _get_state(self, db: Session, message_id: int, user_id: int) -> Optional[MessageRecipient]:
+        return db.query(MessageRecipient).filter(
+            MessageRecipient.message_id == message_id,
+            MessageRecipient.user_id == user_id
         ).first()
-        if message:
-            message.is_read = True
-            message.read_at = datetime.utcnow()
-            db.add(message)
+
+    def mark_as_read(self, db: Session, message_id: int, user_id: int) -> Optional[Message]:
+        state = self._get_state(db, message_id, user_id)
+        if not state:
+            return None
+        if not state.is_read:
+            # 条件更新：同一条消息被并发标记已读时只有一次生效，未读数只减一次
+            updated = db.query(MessageRecipient).filter(
+                MessageRecipient.message_id == message_id,
+                MessageRecipient.user_id == user_id,
+                MessageRecipient.is_read == False
+            ).update({
+                "is_read": True,
+                "read_at": datetime.utcnow()
+            }, synchronize_session=False)
             db.commit()
-            db.refresh(message)
-        return message
+            if updated == 1 and not state.is_deleted:
+                message_counters.update(db, [user_id], _decrement_unread(1), self._count_stats)
+        return self._as_receiver_view(state.message, state)
 
     def mark_all_as_read(self, db: Session, user_id: int, message_type: Optional[str] = None) -> int:
-        query = db.query(Message).filter(
-            Message.recipients.contains([user_id]),
-            Message.is_read == False,
-            Message.is_deleted == False
+        query = db.query(MessageRecipient).filter(
+            MessageRecipient.user_id == user_id,
+            MessageRecipient.is_read == False,
+            MessageRecipient.is_deleted == False
         )
         if message_type:
-            query = query.filter(Message.message_type == message_type)
-        count = query.count()
-        query.update({
+            query = query.filter(MessageRecipient.message_id.in_(
+                db.query(Message.id).filter(Message.message_type == message_type)
+            ))
+        count = query.update({
             "is_read": True,
             "read_at": datetime.utcnow()
-        })
+        }, synchronize_session=False)
         db.commit()
+        if count:
+            message_counters.update(db, [user_id], _decrement_unread(count), self._count_stats)
         return count
 
     def delete_message(self, db: Session, message_id: int, user_id: int) -> Optional[Message]:
-        message = db.query(Message).filter(
-            Message.id == message_id,
-            Message.recipients.contains([user_id])
-        ).first()
-        if message:
-            message.is_deleted = True
-            db.add(message)
+        state = self._get_state(db, message_id, user_id)
+        if not state:
+            return None
+        if not state.is_deleted:
+            state.is_deleted = True
             db.commit()
-            db.refresh(message)
-        return message
+            message = state.message
+            message_counters.update(
+                db, [user_id],
+                lambda stats: add_message(stats, message.message_type, message.priority, state.is_read, sign=-1),
+                self._count_stats
+            )
+        return self._as_receiver_view(state.message, state)
 
     def get_unread_count(self, db: Session, user_id: int) -> int:
-        return db.query(Message).filter(
-            Message.recipients.contains([user_id]),
-            Message.is_read == False,
-            Message.is_deleted == False
-        ).count()
+        return self.get_stats(db, user_id)["unread_messages"]
 
     def get_stats(self, db: Session, user_id: int) -> Dict[str, Any]:
-        total_messages = db.query(Message).filter(
-            Message.recipients.contains([user_id]),
-            Message.is_deleted == False
-        ).count()
-        unread_messages = db.query(Message).filter(
-            Message.recipients.contains([user_id]),
-            Message.is_read == False,
-            Message.is_deleted == False
-        ).count()
-        urgent_messages = db.query(Message).filter(
-            Message.recipients.contains([user_id]),
-            Message.priority == "urgent",
-            Message.is_deleted == False
-        ).count()
-        important_messages = db.query(Message).filter(
-            Message.recipients.contains([user_id]),
-            Message.priority == "important",
-            Message.is_deleted == False
-        ).count()
-        messages_by_type = db.query(
+        """用户消息统计，优先使用增量维护的计数缓存"""
+        return message_counters.get(db, user_id, self._count_stats)
+
+    def _count_stats(self, db: Session, user_id: int) -> Dict[str, Any]:
+        """按消息类型和优先级分组，一次查询得到全部统计"""
+        rows = db.query(
             Message.message_type,
-            func.count(Message.id)
+            Message.priority,
+            func.count(),
+            func.coalesce(func.sum(case((MessageRecipient.is_read == False, 1), else_=0)), 0)
+        ).join(
+            MessageRecipient, MessageRecipient.message_id == Message.id
         ).filter(
-            Message.recipients.contains([user_id]),
-            Message.is_deleted == False
-        ).group_by(Message.message_type).all()
-        return {
-            "total_messages": total_messages,
-            "unread_messages": unread_messages,
-            "urgent_messages": urgent_messages,
-            "important_messages": important_messages,
-            "messages_by_type": dict(messages_by_type)
-        }
+            MessageRecipient.user_id == user_id,
+            MessageRecipient.is_deleted == False
+        ).group_by(Message.message_type, Message.priority).all()
+
+        stats = empty_stats()
+        for message_type, priority, total, unread in rows:
+            stats["total_messages"] += total
+            stats["unread_messages"] += int(unread)
+            if priority == "urgent":
+                stats["urgent_messages"] += total
+            elif priority == "important":
+                stats["important_messages"] += total
+            by_type = stats["messages_by_type"]
+            by_type[message_type] = by_type.get(message_type, 0) + total
+        return stats
+
+
+def _decrement_unread(count: int):
+    def change(stats: Dict[str, Any]):
+        stats["unread_messages"] = max(stats["unread_messages"] - count, 0)
+    return change
 
 class MessageTemplateCRUD:
     def create(self, db: Session, *, obj_in: MessageTemplateCreate) -> MessageTemplate:
@@ -194,4 +315,5 @@ class MessageTemplateCRUD:
         return obj
 
 message_crud = MessageCRUD()
+message_counters.bind_loader(message_crud._count_stats)
 message_template_crud = MessageTemplateCRUD() 
\ No newline at end of file
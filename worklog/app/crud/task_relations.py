@@ -0,0 +1,50 @@
+from typing import Iterable, List
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models.project import Project
+from app.models.task import Task, TaskComment
+from app.models.user import User
+
+
+def load_task_relations(db: Session, tasks: List[Task], known_users: Iterable[User] = ()) -> List[Task]:
+    """
+    批量加载任务列表的创建者、负责人、项目和评论数量
+    无论任务数量多少，最多执行三次 IN 查询（用户、项目、评论计数）
+    known_users 为调用方已持有的用户（如当前用户），可以省去查询
+    """
+    if not tasks:
+        return tasks
+
+    users = {user.id: user for user in known_users}
+    user_ids = {t.creator_id for t in tasks} | {t.assignee_id for t in tasks if t.assignee_id}
+    missing_user_ids = user_ids - set(users)
+    if missing_user_ids:
+        for user in db.query(User).filter(User.id.in_(missing_user_ids)).all():
+            users[user.id] = user
+
+    projects = {}
+    project_ids = {t.project_id for t in tasks if t.project_id}
+    if project_ids:
+        projects = {
+            project.id: project
+            for project in db.query(Project).filter(Project.id.in_(project_ids)).all()
+        }
+
+    comment_counts = dict(
+        db.query(TaskComment.task_id, func.count(TaskComment.id))
+        .filter(TaskComment.task_id.in_([t.id for t in tasks]))
+        .group_by(TaskComment.task_id)
+        .all()
+    )
+
+    for task in tasks:
+        # 使用set_committed_value填充关系，既不触发懒加载，也不会把任务标记为已修改
+        set_committed_value(task, 'creator', users.get(task.creator_id))
+        set_committed_value(task, 'assignee', users.get(task.assignee_id) if task.assignee_id else None)
+        set_committed_value(task, 'project', projects.get(task.project_id) if task.project_id else None)
+        set_committed_value(task, 'comments', [])
+        task.comment_count = comment_counts.get(task.id, 0)
+    return tasks
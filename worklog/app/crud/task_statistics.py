@@ -0,0 +1,98 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Query, Session
+
+from app.models.task import Task
+from app.schemas.task import TaskStatistics
+
+# 视为未结束的任务状态，用于逾期统计
+OPEN_STATUSES = ('pending', 'in_progress', 'review')
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _aggregate_columns(now: datetime):
+    """
+    所有统计字段的条件聚合列，一次扫描得到全部结果
+    """
+    return [
+        func.count(Task.id).label('total'),
+        _count_if(Task.status == 'pending').label('pending'),
+        _count_if(Task.status == 'in_progress').label('in_progress'),
+        _count_if(Task.status == 'completed').label('completed'),
+        _count_if(Task.status == 'review').label('review'),
+        _count_if(Task.status == 'cancelled').label('cancelled'),
+        _count_if((Task.due_date < now) & Task.status.in_(OPEN_STATUSES)).label('overdue'),
+        func.coalesce(func.sum(Task.estimated_hours), 0).label('total_estimated_hours'),
+        func.coalesce(func.sum(
+            case((Task.status == 'completed', Task.actual_hours), else_=0)
+        ), 0).label('completed_hours'),
+    ]
+
+
+def _to_statistics(row) -> TaskStatistics:
+    total = row.total if row is not None else 0
+    if not total:
+        return empty_statistics()
+    completed = int(row.completed)
+    return TaskStatistics(
+        total=total,
+        pending=int(row.pending),
+        in_progress=int(row.in_progress),
+        completed=completed,
+        review=int(row.review),
+        cancelled=int(row.cancelled),
+        overdue=int(row.overdue),
+        total_estimated_hours=float(row.total_estimated_hours or 0),
+        completed_hours=float(row.completed_hours or 0),
+        completion_rate=completed / total * 100
+    )
+
+
+def empty_statistics() -> TaskStatistics:
+    return TaskStatistics(
+        total=0, pending=0, in_progress=0, completed=0, review=0, cancelled=0,
+        overdue=0, total_estimated_hours=0, completed_hours=0, completion_rate=0
+    )
+
+
+def get_statistics(query: Query, now: Optional[datetime] = None) -> TaskStatistics:
+    """
+    对已按权限、筛选条件过滤好的任务查询做一次聚合统计
+    """
+    row = query.with_entities(*_aggregate_columns(now or datetime.now())).order_by(None).first()
+    return _to_statistics(row)
+
+
+def get_statistics_by(
+    db: Session,
+    group_column,
+    group_ids: Iterable[int],
+    *criteria,
+    now: Optional[datetime] = None
+) -> Dict[int, TaskStatistics]:
+    """
+    按团队或项目分组统计，一次查询返回多个分组的结果
+    group_column 为 Task.team_id 或 Task.project_id，criteria 为额外的过滤条件
+    没有任务的分组返回全零统计
+    """
+    group_ids = list(group_ids)
+    if not group_ids:
+        return {}
+    rows = db.query(
+        group_column.label('group_id'),
+        *_aggregate_columns(now or datetime.now())
+    ).filter(
+        Task.is_deleted == False,
+        group_column.in_(group_ids),
+        *criteria
+    ).group_by(group_column).all()
+
+    statistics = {group_id: empty_statistics() for group_id in group_ids}
+    for row in rows:
+        statistics[row.group_id] = _to_statistics(row)
+    return statistics
@@ -0,0 +1,127 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import literal, select
+from sqlalchemy.orm import Session, aliased
+
+from app.core.config import settings
+from app.models.task import Task
+
+# 参与计算的任务字段，顺序即递归查询的列顺序
+_COLUMNS = ("id", "parent_task_id", "project_id", "title", "status", "assignee_id",
+            "estimated_hours", "actual_hours")
+# 自下而上累加的字段，下划线开头的只用于计算完成度
+_PRIVATE = ("_hours", "_done_hours", "_count", "_done_count")
+_SUMMED = ("total_estimated_hours", "total_actual_hours", "task_count") + _PRIVATE
+
+
+def _load_subtrees(db: Session, *root_conditions) -> List[Any]:
+    """
+    递归CTE一次查询满足条件的根任务及其全部未删除的子孙任务（MySQL 8 / SQLite 均支持 WITH RECURSIVE）
+    最多向下 TASK_TREE_MAX_DEPTH 层，防止 parent_task_id 成环时无限递归
+    """
+    tree = select(
+        *[getattr(Task, name) for name in _COLUMNS], literal(0).label("depth")
+    ).where(
+        Task.is_deleted == False, *root_conditions
+    ).cte("task_tree", recursive=True)
+
+    child = aliased(Task)
+    tree = tree.union_all(
+        select(
+            *[getattr(child, name) for name in _COLUMNS], (tree.c.depth + 1).label("depth")
+        ).where(
+            child.parent_task_id == tree.c.id,
+            child.is_deleted == False,
+            tree.c.depth < settings.TASK_TREE_MAX_DEPTH
+        )
+    )
+    return db.execute(select(tree).order_by(tree.c.depth, tree.c.id)).all()
+
+
+def _progress(node: Dict[str, Any]) -> float:
+    # 有预估工时时按完成任务的预估工时加权，否则按完成任务数
+    if node["_hours"] > 0:
+        return round(node["_done_hours"] / node["_hours"] * 100, 1)
+    if node["_count"] > 0:
+        return round(node["_done_count"] / node["_count"] * 100, 1)
+    return 0.0
+
+
+def _build(rows: List[Any]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    按深度从深到浅一遍累加子树工时和完成度，返回嵌套的根节点列表和全部根节点的汇总
+    - total_estimated_hours / total_actual_hours：任务本身加全部子孙任务
+    - progress：子树中（不含已取消的任务）已完成任务的预估工时占比，均无预估工时时按任务数计算
+    """
+    nodes: Dict[int, Dict[str, Any]] = {}
+    for row in rows:
+        # parent_task_id 成环时同一任务会重复出现，保留最浅的一次
+        if row.id in nodes:
+            continue
+        status = getattr(row.status, "value", row.status)
+        estimated = float(row.estimated_hours or 0.0)
+        actual = float(row.actual_hours or 0.0)
+        counted = status != "cancelled"
+        done = status == "completed"
+        nodes[row.id] = {
+            "id": row.id,
+            "parent_task_id": row.parent_task_id,
+            "project_id": row.project_id,
+            "title": row.title,
+            "status": status,
+            "assignee_id": row.assignee_id,
+            "depth": row.depth,
+            "estimated_hours": estimated,
+            "actual_hours": actual,
+            "total_estimated_hours": estimated,
+            "total_actual_hours": actual,
+            "task_count": 1,
+            "children": [],
+            "_hours": estimated if counted else 0.0,
+            "_done_hours": estimated if done else 0.0,
+            "_count": 1 if counted else 0,
+            "_done_count": 1 if done else 0,
+        }
+
+    roots = []
+    for node in sorted(nodes.values(), key=lambda n: (-n["depth"], n["id"])):
+        node["progress"] = _progress(node)
+        parent = nodes.get(node["parent_task_id"])
+        if parent is None or parent["depth"] >= node["depth"]:
+            roots.append(node)
+            continue
+        parent["children"].append(node)
+        for key in _SUMMED:
+            parent[key] += node[key]
+
+    summary = {key: sum(root[key] for root in roots) for key in _SUMMED}
+    summary["progress"] = _progress(summary)
+    for key in _PRIVATE:
+        del summary[key]
+    for node in nodes.values():
+        node["children"].sort(key=lambda n: n["id"])
+        for key in _PRIVATE:
+            del node[key]
+    roots.sort(key=lambda n: n["id"])
+    return roots, summary
+
+
+def get_task_tree(db: Session, task_id: int) -> Optional[Dict[str, Any]]:
+    """任务及其全部子孙任务，带工时和完成度汇总，任务不存在时返回 None"""
+    roots, _ = _build(_load_subtrees(db, Task.id == task_id))
+    return roots[0] if roots else None
+
+
+def get_project_tree(db: Session, project_id: int) -> Dict[str, Any]:
+    """
+    项目的任务树：父任务为空、已删除或不属于本项目的项目任务作为根
+    返回根任务列表和整个项目的工时、完成度汇总
+    """
+    parent = aliased(Task)
+    in_project_parents = select(parent.id).where(parent.project_id == project_id, parent.is_deleted == False)
+    roots, summary = _build(_load_subtrees(
+        db,
+        Task.project_id == project_id,
+        (Task.parent_task_id == None) | Task.parent_task_id.notin_(in_project_parents)
+    ))
+    return {"project_id": project_id, **summary, "roots": roots}
@@ -10,7 +10,11 @@ from app.models.reminder import Reminder  # noqa
 from app.models.work_log_template import WorkLogTemplate  # noqa
 from app.models.task import Task, TaskDependency, TaskComment, TaskAttachment  # noqa
 from app.models.task_log import TaskLog, TaskStatusChange  # noqa
-from app.models.message import Message, MessageTemplate  # noqa
+from app.models.message import Message, MessageRecipient, MessageTemplate  # noqa
+from app.models.job import JobLease, JobRun  # noqa
+from app.models.work_log_rollup import WorkLogDailyRollup  # noqa
+from app.models.search import SearchDocument  # noqa
+from app.models.tag import Tag, EntityTag, TeamTagCount  # noqa
 
 # 导入所有模型，以便 Alembic 可以检测到它们 
 
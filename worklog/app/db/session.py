@@ -57,6 +57,15 @@ else:
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 注册工作日志汇总表的维护监听器，所有通过ORM写入的工作日志都同步更新汇总
+import app.core.work_log_rollup  # noqa
+# 注册任务依赖图的缓存失效监听器
+import app.core.task_graph  # noqa
+# 注册全文搜索索引的维护监听器
+import app.core.search  # noqa
+# 注册标签索引的维护监听器
+import app.core.tags  # noqa
+
 # 创建线程安全的会话工厂
 db_session = scoped_session(SessionLocal)
 
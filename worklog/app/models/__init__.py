@@ -5,8 +5,12 @@ from app.models.project import Project
 from app.models.task import Task, TaskDependency, TaskComment, TaskAttachment
 from app.models.task_log import TaskLog, TaskStatusChange
 from app.models.work_log import WorkLog
-from app.models.message import Message, MessageTemplate
+from app.models.message import Message, MessageRecipient, MessageTemplate
 from app.models.team_invite import TeamInvite
+from app.models.job import JobLease, JobRun
+from app.models.work_log_rollup import WorkLogDailyRollup
+from app.models.search import SearchDocument
+from app.models.tag import Tag, EntityTag, TeamTagCount
 
 __all__ = [
     "User",
@@ -21,6 +25,14 @@ __all__ = [
     "TaskStatusChange",
     "WorkLog",
     "Message",
+    "MessageRecipient",
     "MessageTemplate",
-    "TeamInvite"
+    "TeamInvite",
+    "JobLease",
+    "JobRun",
+    "WorkLogDailyRollup",
+    "SearchDocument",
+    "Tag",
+    "EntityTag",
+    "TeamTagCount"
 ] 
\ No newline at end of file
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+class JobLease(Base):
+    """定时任务租约：持有者在到期前续约，过期后其他实例可以接管"""
+    __tablename__ = "job_leases"
+
+    name = Column(String(100), primary_key=True)
+    owner = Column(String(100), nullable=False)
+    expires_at = Column(DateTime, nullable=False)  # UTC
+    acquired_at = Column(DateTime, nullable=False)  # UTC
+
+class JobRun(Base):
+    """定时任务在某个时间窗口的执行记录，key 作为幂等键，同一窗口只执行一次"""
+    __tablename__ = "job_runs"
+
+    key = Column(String(200), primary_key=True)  # 如 daily_summary:2024-06-03
+    owner = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False, default="running")  # running, done
+    expires_at = Column(DateTime, nullable=False)  # UTC，running 状态超过该时间视为执行者已失效
+    created_at = Column(DateTime, default=func.now())
+    finished_at = Column(DateTime)
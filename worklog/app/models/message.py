@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Enum, Text, JSON
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Enum, Text, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
@@ -37,6 +37,32 @@ class Message(Base):
     
     # 关联
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_messages")
+    recipient_states = relationship("MessageRecipient", back_populates="message", cascade="all, delete-orphan")
+
+
+class MessageRecipient(Base):
+    """
+    消息收件箱：每个接收者一行，保存该接收者自己的已读/删除状态
+    recipients 字段仍保留在消息上用于推送，查询收件箱只走这张表
+    """
+    __tablename__ = "message_recipients"
+
+    message_id = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+    is_read = Column(Boolean, default=False, nullable=False)
+    read_at = Column(DateTime(timezone=True))
+    is_deleted = Column(Boolean, default=False, nullable=False)
+    # 与消息的 created_at 相同，冗余在此以便按索引顺序分页
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    message = relationship("Message", back_populates="recipient_states")
+
+    __table_args__ = (
+        Index("ix_message_recipients_user_read_created", "user_id", "is_read", "created_at"),
+        # 断线重连时按消息id补发
+        Index("ix_message_recipients_user_message", "user_id", "message_id"),
+    )
 
 class MessageTemplate(Base):
     __tablename__ = "message_templates"
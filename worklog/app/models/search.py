@@ -0,0 +1,41 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index, DDL, event
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+class SearchDocument(Base):
+    """
+    全文搜索文档：每个任务、工作日志、任务评论一行
+    由 app/core/search.py 在业务数据增删改的同一事务中维护。
+    SQLite 另建 FTS5 虚拟表 search_fts（rowid 与本表 id 相同）保存分词后的文本；
+    MySQL 在 title、body 上建 ngram 分词的 FULLTEXT 索引
+    """
+    __tablename__ = "search_documents"
+    __table_args__ = (
+        Index("uq_search_documents_doc", "doc_type", "doc_id", unique=True),
+        Index("ix_search_documents_team", "team_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    doc_type = Column(String(20), nullable=False)  # task / work_log / comment
+    doc_id = Column(Integer, nullable=False)
+    team_id = Column(Integer)  # 为空表示个人工作日志，只有作者可见
+    user_id = Column(Integer)  # 工作日志作者
+    task_id = Column(Integer)  # 任务ID，评论和工作日志为所属任务
+    title = Column(Text)
+    body = Column(Text)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+# 分词后的文本，token 之间用空格分隔，由 unicode61 分词器按空格切分
+CREATE_SEARCH_FTS = DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(title, body, tokenize='unicode61')"
+)
+DROP_SEARCH_FTS = DDL("DROP TABLE IF EXISTS search_fts")
+# 需要 MySQL 5.7.6+，ngram_token_size 保持默认的 2
+CREATE_SEARCH_FULLTEXT = DDL(
+    "ALTER TABLE search_documents ADD FULLTEXT INDEX ft_search_documents (title, body) WITH PARSER ngram"
+)
+
+event.listen(SearchDocument.__table__, "after_create", CREATE_SEARCH_FTS.execute_if(dialect="sqlite"))
+event.listen(SearchDocument.__table__, "after_create", CREATE_SEARCH_FULLTEXT.execute_if(dialect="mysql"))
+event.listen(SearchDocument.__table__, "before_drop", DROP_SEARCH_FTS.execute_if(dialect="sqlite"))
@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+class Tag(Base):
+    """标签，名称统一小写，全局唯一"""
+    __tablename__ = "tags"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(50), nullable=False, unique=True)
+    created_at = Column(DateTime, default=func.now())
+
+
+class EntityTag(Base):
+    """
+    任务、工作日志与标签的关联，由 app/core/tags.py 根据 tags 字段在同一事务中维护
+    created_at 为任务/工作日志的创建时间，按标签筛选时可以直接按时间范围取
+    """
+    __tablename__ = "entity_tags"
+    __table_args__ = (
+        Index("uq_entity_tags_entity", "entity_type", "entity_id", "tag_id", unique=True),
+        # 按标签筛选：末尾带上 entity_id，筛选只需读索引
+        Index("ix_entity_tags_tag", "tag_id", "entity_type", "created_at", "entity_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tag_id = Column(Integer, nullable=False)
+    entity_type = Column(String(20), nullable=False)  # task / work_log
+    entity_id = Column(Integer, nullable=False)
+    team_id = Column(Integer)  # 为空表示个人工作日志
+    created_at = Column(DateTime)
+
+
+class TeamTagCount(Base):
+    """团队内每个标签被任务/工作日志使用的次数，供标签自动补全读取"""
+    __tablename__ = "team_tag_counts"
+    __table_args__ = (
+        Index("uq_team_tag_counts", "team_id", "entity_type", "tag_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    team_id = Column(Integer, nullable=False)
+    entity_type = Column(String(20), nullable=False)
+    tag_id = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Enum, DateTime, ForeignKey, DECIMAL, Float
+from sqlalchemy import Column, Integer, String, Text, Enum, DateTime, ForeignKey, DECIMAL, Float, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
@@ -21,6 +21,12 @@ class WorkLogStatus(str, enum.Enum):
 
 class WorkLog(Base):
     __tablename__ = "work_logs"
+    __table_args__ = (
+        # 提醒服务按用户查找当天是否已提交日志
+        Index("ix_work_logs_user_created", "user_id", "created_at"),
+        # 工时表按团队和开始时间读取日志
+        Index("ix_work_logs_team_start", "team_id", "start_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
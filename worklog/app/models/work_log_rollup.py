@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, Date, Float, Index
+from app.db.base_class import Base
+
+class WorkLogDailyRollup(Base):
+    """
+    工作日志按天汇总：每个 (日期, 团队, 项目, 任务, 用户, 工作类型) 一行
+    由 app/core/work_log_rollup.py 在工作日志增删改的同一事务中维护，
+    团队/项目/任务为空时记为 0，使唯一索引可以覆盖这些行
+    """
+    __tablename__ = "work_log_daily_rollup"
+    __table_args__ = (
+        Index("uq_work_log_daily_rollup", "day", "team_id", "project_id", "task_id", "user_id", "work_type",
+              unique=True),
+        # 任务工作汇总按任务读取
+        Index("ix_work_log_daily_rollup_task", "task_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)  # 工作发生的日期：start_time，没有开始时间时按 created_at
+    team_id = Column(Integer, nullable=False, default=0)
+    project_id = Column(Integer, nullable=False, default=0)
+    task_id = Column(Integer, nullable=False, default=0)
+    user_id = Column(Integer, nullable=False)
+    work_type = Column(String(20), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    total_duration = Column(Float, nullable=False, default=0.0)
@@ -0,0 +1,29 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List
+from datetime import date
+
+class TimesheetAxis(BaseModel):
+    dimension: str = Field(..., description="维度：user / project / work_type / day")
+    keys: List[Any] = Field(..., description="坐标轴上的取值（用户id、项目id（0 表示无项目）、工作类型、日期）")
+    labels: List[Any] = Field(..., description="显示名称，与 keys 一一对应")
+
+class TimesheetResponse(BaseModel):
+    team_id: int
+    start_date: date
+    end_date: date
+    group_by: List[str]
+    axes: List[TimesheetAxis]
+    hours: List[Any] = Field(..., description="工时矩阵，维度顺序与 axes 相同")
+    counts: List[Any] = Field(..., description="日志条数矩阵，维度顺序与 axes 相同")
+    margins: List[List[float]] = Field(..., description="每个坐标轴上的工时合计")
+    total_hours: float
+    total_count: int
+
+class CubeResponse(BaseModel):
+    team_id: int
+    grain: str
+    start_date: date = Field(..., description="按粒度对齐后的开始日期")
+    end_date: date
+    group_by: List[str]
+    source: str = Field(..., description="cube：内存立方体（不完整的最后一个周期从汇总表读取）；rollup：按天汇总表下钻")
+    rows: List[Dict[str, Any]] = Field(..., description="每行包含 group_by 维度字段及 count、hours")
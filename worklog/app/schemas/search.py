@@ -0,0 +1,18 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+class SearchResult(BaseModel):
+    doc_type: str = Field(..., description="task：任务；work_log：工作日志；comment：任务评论")
+    doc_id: int
+    team_id: Optional[int] = None
+    task_id: Optional[int] = Field(None, description="任务ID，评论和工作日志为所属任务")
+    title: Optional[str] = None
+    snippet: str = Field(..., description="命中词附近的摘要")
+    score: float = Field(..., description="相关度，越大越相关")
+    updated_at: Optional[datetime] = None
+
+class SearchResponse(BaseModel):
+    query: str
+    items: List[SearchResult]
+    has_more: bool
@@ -0,0 +1,5 @@
+from pydantic import BaseModel, Field
+
+class TagCount(BaseModel):
+    name: str
+    count: int = Field(..., description="团队内使用该标签的任务/工作日志数")
@@ -122,10 +122,11 @@ class TaskResponse(TaskBase):
 # 列表响应模型
 class TaskListResponse(BaseModel):
     items: List[TaskResponse]
-    total: int
+    total: Optional[int] = None  # 游标模式下默认不统计总数
     page: int
     page_size: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 # 任务统计模型
 class TaskStatistics(BaseModel):
@@ -140,6 +141,10 @@ class TaskStatistics(BaseModel):
     completed_hours: float
     completion_rate: float
 
+# 按团队分组的任务统计
+class TeamTaskStatistics(TaskStatistics):
+    team_id: int
+
 # 任务筛选模型
 class TaskFilter(BaseModel):
     status: Optional[TaskStatus] = None
@@ -151,4 +156,81 @@ class TaskFilter(BaseModel):
     due_date_from: Optional[datetime] = None
     due_date_to: Optional[datetime] = None
     tags: Optional[str] = None
-    search: Optional[str] = None 
\ No newline at end of file
+    search: Optional[str] = None
+
+
+# 任务依赖
+class TaskDependencyCreate(BaseModel):
+    prerequisite_task_id: int
+
+class TaskGraphNode(BaseModel):
+    id: int
+    title: str
+    status: str
+    project_id: Optional[int] = None
+    estimated_hours: float = 0
+    due_date: Optional[datetime] = None
+    blocked: bool = False
+    blocked_by: List[int] = []
+
+class TaskGraphEdge(BaseModel):
+    prerequisite_task_id: int
+    dependent_task_id: int
+
+class TaskDependencyGraph(BaseModel):
+    team_id: int
+    project_id: Optional[int] = None
+    nodes: List[TaskGraphNode]
+    edges: List[TaskGraphEdge]
+    order: List[int]  # 拓扑顺序
+    cycle: List[int] = []  # 处在环上或依赖环的任务
+
+class TaskDependencyList(BaseModel):
+    task_id: int
+    blocked: bool
+    prerequisites: List[TaskGraphNode]
+    dependents: List[TaskGraphNode]
+
+class CriticalPathTask(BaseModel):
+    task_id: int
+    title: str
+    duration: float
+    earliest_start: float
+    earliest_finish: float
+    latest_start: float
+    latest_finish: float
+    slack: float
+    critical: bool
+
+class CriticalPathResponse(BaseModel):
+    team_id: int
+    project_id: Optional[int] = None
+    total_hours: float
+    critical_path: List[int]
+    tasks: List[CriticalPathTask]
+    cycle: List[int] = []
+
+# 任务树
+class TaskTreeNode(BaseModel):
+    id: int
+    parent_task_id: Optional[int] = None
+    project_id: Optional[int] = None
+    title: str
+    status: str
+    assignee_id: Optional[int] = None
+    depth: int
+    estimated_hours: float
+    actual_hours: float
+    total_estimated_hours: float  # 包含全部子孙任务
+    total_actual_hours: float
+    task_count: int
+    progress: float  # 完成百分比
+    children: List["TaskTreeNode"] = []
+
+class ProjectTaskTree(BaseModel):
+    project_id: int
+    total_estimated_hours: float
+    total_actual_hours: float
+    task_count: int
+    progress: float
+    roots: List[TaskTreeNode]
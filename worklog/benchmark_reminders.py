@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+工作日志提醒性能测试
+
+在临时 SQLite 数据库中生成用户、团队和当天的工作日志，比较：
+1. 旧做法：逐个用户查询当天日志和所在团队（每个用户两次查询）
+2. 新做法：ReminderService.find_missing_worklogs 一次反连接查询
+3. 完整的 send_worklog_reminders：查询 + 按团队批量入库提醒消息
+
+用法：python benchmark_reminders.py [--users 10000] [--team-size 20] [--logged-ratio 0.6]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, time as dt_time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.core.notification_outbox import NotificationOutbox
+from app.core.reminder_service import ReminderService
+from app.models.enums import TEAM_ADMIN, TEAM_MEMBER
+from app.models.message import Message, MessageRecipient
+from app.models.team import Team
+from app.models.team_member import TeamMember
+from app.models.user import User
+from app.models.work_log import WorkLog
+
+
+def populate(session_factory, users: int, team_size: int, logged_ratio: float):
+    now = datetime.now()
+    rng = random.Random(42)
+    db = session_factory()
+    try:
+        db.bulk_insert_mappings(User, [
+            {
+                "id": i, "username": f"user{i}", "email": f"user{i}@example.com",
+                "hashed_password": "x", "is_active": True,
+                "work_hours_start": dt_time(9, 0), "work_hours_end": dt_time(18, 0),
+                "created_at": now, "updated_at": now
+            }
+            for i in range(1, users + 1)
+        ])
+        teams = (users + team_size - 1) // team_size
+        db.bulk_insert_mappings(Team, [
+            {"id": t, "name": f"团队{t}", "description": "", "created_at": now, "updated_at": now}
+            for t in range(1, teams + 1)
+        ])
+        db.bulk_insert_mappings(TeamMember, [
+            {
+                "team_id": (i - 1) // team_size + 1, "user_id": i,
+                "role": TEAM_ADMIN if (i - 1) % team_size == 0 else TEAM_MEMBER
+            }
+            for i in range(1, users + 1)
+        ])
+        db.bulk_insert_mappings(WorkLog, [
+            {
+                "user_id": i, "team_id": (i - 1) // team_size + 1, "content": "日志",
+                "duration": 1, "date": now, "created_at": now, "updated_at": now
+            }
+            for i in range(1, users + 1) if rng.random() < logged_ratio
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def legacy_missing(db, since):
+    """旧做法：逐个用户查询"""
+    missing = {}
+    for user in db.query(User).filter(User.is_active == True).all():
+        logged = db.query(WorkLog).filter(WorkLog.user_id == user.id, WorkLog.created_at >= since).first()
+        if not logged:
+            for member in db.query(TeamMember).filter(TeamMember.user_id == user.id).all():
+                missing.setdefault(member.team_id, []).append(user.id)
+    return missing
+
+
+def timed(label, func, engine):
+    statements = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _count)
+    started = time.perf_counter()
+    try:
+        result = func()
+    finally:
+        elapsed = time.perf_counter() - started
+        event.remove(engine, "before_cursor_execute", _count)
+    print(f"{label:<28} {elapsed * 1000:>10.1f} ms  {len(statements):>6} 条SQL")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工作日志提醒性能测试")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--team-size", type=int, default=20)
+    parser.add_argument("--logged-ratio", type=float, default=0.6)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'benchmark.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+        populate(session_factory, args.users, args.team_size, args.logged_ratio)
+        print(f"用户 {args.users}，每队 {args.team_size} 人，当天已提交比例 {args.logged_ratio}")
+
+        since = datetime.combine(datetime.now().date(), dt_time.min)
+        db = session_factory()
+        try:
+            legacy = timed("逐个用户查询", lambda: legacy_missing(db, since), engine)
+            db.expunge_all()
+            missing = timed("反连接查询", lambda: ReminderService.find_missing_worklogs(db, since), engine)
+        finally:
+            db.close()
+        assert legacy == missing, "两种做法的结果不一致"
+
+        service = ReminderService(session_factory, NotificationOutbox(session_factory=session_factory))
+        reminded = timed("查询 + 批量入库提醒", lambda: asyncio.run(service.send_worklog_reminders()), engine)
+
+        db = session_factory()
+        try:
+            print(f"提醒 {reminded} 人次，生成消息 {db.query(Message).count()} 条，"
+                  f"收件箱记录 {db.query(MessageRecipient).count()} 条")
+        finally:
+            db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
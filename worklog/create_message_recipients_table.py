@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+创建消息收件箱表 message_recipients，并根据 messages.recipients 回填数据
+
+回填时沿用消息上原有的 is_read/read_at/is_deleted 作为每个接收者的初始状态，
+已存在的收件箱记录不会重复写入，脚本可以重复执行。
+"""
+
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.db.base import Base
+from app.models.message import Message, MessageRecipient
+
+BATCH_SIZE = 1000
+
+
+def backfill_message_recipients(db) -> int:
+    """按消息id分批回填，返回新写入的收件箱记录数"""
+    inserted = 0
+    last_id = 0
+    while True:
+        messages = db.query(
+            Message.id, Message.recipients, Message.is_read, Message.read_at,
+            Message.is_deleted, Message.created_at
+        ).filter(Message.id > last_id).order_by(Message.id).limit(BATCH_SIZE).all()
+        if not messages:
+            return inserted
+        last_id = messages[-1].id
+
+        existing = set(db.query(MessageRecipient.message_id, MessageRecipient.user_id).filter(
+            MessageRecipient.message_id.in_([m.id for m in messages])
+        ).all())
+        rows = []
+        for message in messages:
+            for user_id in dict.fromkeys(message.recipients or []):
+                if (message.id, user_id) in existing:
+                    continue
+                rows.append({
+                    "message_id": message.id,
+                    "user_id": user_id,
+                    "is_read": bool(message.is_read),
+                    "read_at": message.read_at,
+                    "is_deleted": bool(message.is_deleted),
+                    "created_at": message.created_at or datetime.now(),
+                })
+        if rows:
+            db.bulk_insert_mappings(MessageRecipient, rows)
+            db.commit()
+            inserted += len(rows)
+        print(f"已处理消息至 id={last_id}，累计回填 {inserted} 条")
+
+
+def create_message_recipients_table():
+    """创建收件箱表并回填"""
+    engine = create_engine(settings.SQLALCHEMY_DATABASE_URL)
+
+    try:
+        print("创建消息收件箱表...")
+        # 通过 Base 建表，收件箱表对 users 的外键要在注册了全部模型的元数据中解析
+        Base.metadata.create_all(engine, tables=[MessageRecipient.__table__], checkfirst=True)
+        print("✓ 消息收件箱表创建成功")
+
+        print("回填收件箱数据...")
+        db = sessionmaker(bind=engine)()
+        try:
+            inserted = backfill_message_recipients(db)
+        finally:
+            db.close()
+        print(f"✓ 回填完成，共写入 {inserted} 条")
+
+        print("\n🎉 消息收件箱迁移完成！")
+
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    create_message_recipients_table()
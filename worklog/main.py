@@ -2,11 +2,18 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.api import api_router
 from app.core.config import settings
+from app.core.membership import membership_service
+from app.core.notification_outbox import notification_outbox
+from app.core.presence import presence_service
+from app.core.message_counters import message_counters
+from app.core.ws_manager import ws_manager
 from app.db.base import Base
-from app.db.session import engine
+from app.db.session import SessionLocal, engine
 from fastapi.responses import JSONResponse
 from sqlalchemy import text
+import asyncio
 import logging
+from functools import partial
 
 # 设置日志
 logging.basicConfig(
@@ -41,6 +48,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # 消息列表游标分页
 )
 
 # 测试数据库连接
@@ -61,6 +69,53 @@ logger.info("数据库表创建完成！")
 # 注册路由
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# WebSocket推送的消息代理
+@app.on_event("startup")
+async def start_websocket_broker():
+    await ws_manager.start()
+
+def load_user_team_ids(user_id: int):
+    db = SessionLocal()
+    try:
+        return membership_service.team_ids(db, user_id)
+    finally:
+        db.close()
+
+# 成员关系变更后更新在线用户订阅的团队频道，并经消息代理通知其他进程
+@app.on_event("startup")
+async def bind_team_channels():
+    ws_manager.set_team_loader(load_user_team_ids)
+    membership_service.add_listener(ws_manager.refresh_teams)
+    membership_service.set_publisher(partial(ws_manager.publish_event, "membership"))
+    ws_manager.add_event_handler("membership", membership_service.apply_remote)
+
+# 在线状态定期合并推送，并清理僵尸连接
+@app.on_event("startup")
+async def start_presence_service():
+    await presence_service.start()
+
+# 通知分发器随应用启停
+@app.on_event("startup")
+async def start_notification_outbox():
+    await notification_outbox.start()
+
+# 消息计数变化时在主事件循环中推送未读数量
+@app.on_event("startup")
+async def bind_message_counters():
+    message_counters.bind_loop(asyncio.get_running_loop())
+
+@app.on_event("shutdown")
+async def stop_notification_outbox():
+    await notification_outbox.stop()
+
+@app.on_event("shutdown")
+async def stop_presence_service():
+    await presence_service.stop()
+
+@app.on_event("shutdown")
+async def close_websocket_connections():
+    await ws_manager.close_all()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to WorkLog Pro API"} 
\ No newline at end of file
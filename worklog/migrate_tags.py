@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+创建标签表 tags、entity_tags、team_tag_counts，并根据任务和工作日志现有的 tags 字段回填
+
+首次上线时运行一次；绕过ORM批量修改过 tags 字段后再次运行。脚本可以重复执行。
+
+用法：python migrate_tags.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.core import tags
+from app.models.tag import Tag, EntityTag, TeamTagCount
+
+
+def migrate_tags():
+    """创建标签表并回填"""
+    engine = create_engine(settings.SQLALCHEMY_DATABASE_URL)
+
+    try:
+        print("创建标签表...")
+        for model in (Tag, EntityTag, TeamTagCount):
+            model.__table__.create(engine, checkfirst=True)
+        print("✓ 标签表创建成功")
+
+        print("回填标签...")
+        db = sessionmaker(bind=engine)()
+        try:
+            count = tags.rebuild(db)
+            db.commit()
+        finally:
+            db.close()
+        print(f"✓ 回填完成，共处理 {count} 条任务和工作日志")
+
+    except Exception as e:
+        print(f"❌ 回填失败: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    migrate_tags()
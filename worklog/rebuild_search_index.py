@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+创建全文搜索文档表 search_documents（SQLite 另建 FTS5 虚拟表 search_fts，
+MySQL 建 ngram FULLTEXT 索引），并根据任务、工作日志、评论重建全部搜索文档
+
+首次上线时运行一次；绕过ORM批量修改过任务、工作日志或评论后再次运行。脚本可以重复执行。
+
+用法：python rebuild_search_index.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.core import search
+from app.models.search import SearchDocument, CREATE_SEARCH_FTS
+
+
+def rebuild_search_index():
+    """创建搜索表并重建索引"""
+    engine = create_engine(settings.SQLALCHEMY_DATABASE_URL)
+
+    try:
+        print("创建全文搜索表...")
+        # 表已存在时不会触发建索引的 DDL，FTS5 虚拟表单独确认
+        SearchDocument.__table__.create(engine, checkfirst=True)
+        if engine.dialect.name == "sqlite":
+            with engine.begin() as connection:
+                connection.execute(CREATE_SEARCH_FTS)
+        print("✓ 全文搜索表创建成功")
+
+        print("重建搜索索引...")
+        db = sessionmaker(bind=engine)()
+        try:
+            count = search.rebuild(db)
+            db.commit()
+        finally:
+            db.close()
+        print(f"✓ 重建完成，共索引 {count} 个文档")
+
+    except Exception as e:
+        print(f"❌ 重建失败: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    rebuild_search_index()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+创建工作日志按天汇总表 work_log_daily_rollup，并根据 work_logs 重建汇总数据
+
+首次上线时不带参数运行，重建全部日期；绕过ORM批量修改过工作日志后，
+用 --start/--end 重建受影响的日期范围。脚本可以重复执行。
+汇总日期改为按工作发生的日期（start_time）之后，已有的汇总表需要不带参数重建一次。
+
+用法：python rebuild_work_log_rollup.py [--start 2024-06-01] [--end 2024-06-30]
+"""
+
+import argparse
+import sys
+import os
+from datetime import date
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.core import work_log_rollup
+from app.models.work_log_rollup import WorkLogDailyRollup
+
+
+def rebuild_work_log_rollup(start: date = None, end: date = None):
+    """创建汇总表并重建指定日期范围"""
+    engine = create_engine(settings.SQLALCHEMY_DATABASE_URL)
+
+    try:
+        print("创建工作日志汇总表...")
+        WorkLogDailyRollup.__table__.create(engine, checkfirst=True)
+        print("✓ 工作日志汇总表创建成功")
+
+        print(f"重建汇总数据: {start or '最早'} ~ {end or '最新'}...")
+        db = sessionmaker(bind=engine)()
+        try:
+            rows = work_log_rollup.rebuild(db, start, end)
+            db.commit()
+        finally:
+            db.close()
+        print(f"✓ 重建完成，共写入 {rows} 行汇总")
+
+    except Exception as e:
+        print(f"❌ 重建失败: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="重建工作日志按天汇总表")
+    parser.add_argument("--start", type=date.fromisoformat, help="开始日期（含），默认最早")
+    parser.add_argument("--end", type=date.fromisoformat, help="结束日期（含），默认最新")
+    args = parser.parse_args()
+    rebuild_work_log_rollup(args.start, args.end)
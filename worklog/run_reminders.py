@@ -2,14 +2,18 @@
 """
 定时提醒运行脚本
 用于定期发送各种提醒通知
+
+可以在多个节点上同时运行：工作记录提醒只在持有租约的实例上发送，
+整点任务按时间窗口的幂等键只执行一次（见 app/core/job_lock.py）
 """
 
 import asyncio
 import logging
-import time
-from datetime import datetime
 
-from app.core.reminder_service import reminder_service
+from app.core.config import settings
+from app.core.job_lock import job_coordinator
+from app.core.reminder_service import reminder_scheduler, reminder_service
+from app.core.ws_manager import ws_manager
 
 # 配置日志
 logging.basicConfig(
@@ -21,15 +25,18 @@ logger = logging.getLogger(__name__)
 async def main():
     """主函数"""
     logger.info("启动定时提醒服务...")
+    # 连接消息代理，使用redis代理时提醒可以推送到各个应用进程上的连接
+    await ws_manager.start()
+    # 工作记录提醒按每个用户的间隔和工作时间分散发送
+    scheduler_task = asyncio.create_task(reminder_scheduler.run())
     
     while True:
         try:
-            # 运行所有提醒
-            await reminder_service.run_all_reminders()
-            
-            # 等待1小时后再运行
-            logger.info("提醒运行完成，等待1小时后再次运行...")
-            await asyncio.sleep(3600)  # 1小时 = 3600秒
+            # 定期检查，当前时间窗口内其他实例已经执行过的任务会被跳过
+            executed = await reminder_service.run_scheduled_jobs(job_coordinator)
+            if executed:
+                logger.info(f"提醒运行完成：{', '.join(executed)}")
+            await asyncio.sleep(settings.JOB_CHECK_INTERVAL)
             
         except KeyboardInterrupt:
             logger.info("收到中断信号，正在停止服务...")
@@ -38,6 +45,8 @@ async def main():
             logger.error(f"运行提醒时发生错误: {e}")
             # 等待5分钟后重试
             await asyncio.sleep(300)
+    
+    scheduler_task.cancel()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -0,0 +1,205 @@
+import json
+import os
+import sys
+from datetime import time, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# 将项目根目录加入sys.path，确保app模块能被正确导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.base import Base
+from app.db import session as db_session_module
+from app.api.v1 import deps as v1_deps
+from app.core import deps as core_deps
+from app.core.config import settings
+from app.core.security import create_access_token, get_password_hash
+from app.models.user import User
+from app.models.team import Team
+from app.models.team_member import TeamMember
+from app.models.enums import TEAM_ADMIN, TEAM_MEMBER
+
+
+class QueryCounter:
+    """统计SQL语句执行次数"""
+
+    def __init__(self):
+        self.statements = []
+        self.enabled = False
+
+    def __enter__(self):
+        self.statements = []
+        self.enabled = True
+        return self
+
+    def __exit__(self, *exc):
+        self.enabled = False
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+class FakeWebSocket:
+    """记录发送内容的WebSocket替身"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        self.sent.append(json.loads(message))
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+@pytest.fixture
+def engine():
+    """每个测试使用独立的内存SQLite数据库"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def query_counter(engine):
+    counter = QueryCounter()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if counter.enabled:
+            counter.statements.append(statement)
+
+    yield counter
+    event.remove(engine, "before_cursor_execute", _count)
+
+
+@pytest.fixture
+def app(session_factory):
+    from app.api.v1.api import api_router
+
+    def override_get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    application = FastAPI()
+    application.include_router(api_router, prefix=settings.API_V1_STR)
+    for get_db in (db_session_module.get_db, v1_deps.get_db, core_deps.get_db):
+        application.dependency_overrides[get_db] = override_get_db
+    return application
+
+
+@pytest.fixture
+def client(app):
+    return TestClient(app)
+
+
+@pytest.fixture
+def make_user(db):
+    def _make_user(username: str, **kwargs) -> User:
+        # 模型上的工作时间默认值为字符串，SQLite的Time类型不接受，这里显式给出
+        kwargs.setdefault("work_hours_start", time(9, 0))
+        kwargs.setdefault("work_hours_end", time(18, 0))
+        user = User(
+            username=username,
+            email=f"{username}@example.com",
+            hashed_password=get_password_hash("password123"),
+            **kwargs
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user
+    return _make_user
+
+
+@pytest.fixture
+def make_team(db):
+    def _make_team(name: str, admin: User, members=()) -> Team:
+        team = Team(name=name, description=f"{name} 描述")
+        db.add(team)
+        db.flush()
+        db.add(TeamMember(team_id=team.id, user_id=admin.id, role=TEAM_ADMIN))
+        for member in members:
+            db.add(TeamMember(team_id=team.id, user_id=member.id, role=TEAM_MEMBER))
+        db.commit()
+        db.refresh(team)
+        return team
+    return _make_team
+
+
+@pytest.fixture
+def auth_headers():
+    def _auth_headers(user: User) -> dict:
+        token = create_access_token(
+            data={"sub": user.username},
+            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+        return {"Authorization": f"Bearer {token}"}
+    return _auth_headers
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """进程内缓存跨测试共享，每个测试前后清空，避免不同数据库间的用户ID串用"""
+    from app.core.membership import membership_service
+    from app.core.message_counters import message_counters
+    from app.core import user_cache
+    from app.core.work_hours_cube import work_hours_cube
+    from app.core.task_graph import task_graph_service
+    caches = [membership_service.cache, membership_service.team_cache, message_counters.cache, user_cache,
+              work_hours_cube.cache, task_graph_service.cache]
+    for cache in caches:
+        cache.clear()
+    yield
+    for cache in caches:
+        cache.clear()
+    # 连接的写任务属于各测试自己的事件循环，不能跨测试保留
+    from app.core.ws_broker import InMemoryBroker
+    from app.core.ws_manager import ws_manager
+    ws_manager.active_connections.clear()
+    ws_manager.team_members.clear()
+    ws_manager.user_teams.clear()
+    from app.core.presence import InMemoryPresenceStore, presence_service
+    presence_service.states.clear()
+    presence_service._written.clear()
+    if isinstance(presence_service.store, InMemoryPresenceStore):
+        presence_service.store.clear()
+    if isinstance(ws_manager.broker, InMemoryBroker):
+        ws_manager.broker.hub.clear()
+
+
+@pytest.fixture
+def fake_websocket():
+    return FakeWebSocket
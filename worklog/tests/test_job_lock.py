@@ -0,0 +1,174 @@
+import asyncio
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from app.core.job_lock import DatabaseLease, JobCoordinator, LeaseBackend
+from app.core.notification_outbox import NotificationDeliveryError, NotificationOutbox
+from app.core.reminder_service import ReminderScheduler, ReminderService
+from app.crud.message import message_crud
+from app.models.job import JobRun
+from app.models.message import Message
+from app.models.reminder import Reminder
+from app.models.user import User
+
+NOW = datetime(2024, 6, 3, 10, 0)
+
+
+def test_lease_is_exclusive_until_it_expires(session_factory):
+    lease = DatabaseLease(session_factory)
+    assert lease.acquire("job", "a", ttl=60, now=NOW)
+    assert not lease.acquire("job", "b", ttl=60, now=NOW + timedelta(seconds=30))
+    # 持有者续约
+    assert lease.acquire("job", "a", ttl=60, now=NOW + timedelta(seconds=50))
+    assert not lease.acquire("job", "b", ttl=60, now=NOW + timedelta(seconds=100))
+    # 持有者失效，租约过期后由其他实例接管
+    assert lease.acquire("job", "b", ttl=60, now=NOW + timedelta(seconds=111))
+    assert not lease.acquire("job", "a", ttl=60, now=NOW + timedelta(seconds=120))
+
+    lease.release("job", "b")
+    assert lease.acquire("job", "a", ttl=60, now=NOW + timedelta(seconds=121))
+
+
+def test_claim_runs_each_key_once_and_takes_over_stale_runs(db, session_factory):
+    first = JobCoordinator(DatabaseLease(session_factory), session_factory, owner="a", ttl=60)
+    second = JobCoordinator(DatabaseLease(session_factory), session_factory, owner="b", ttl=60)
+    calls = []
+
+    async def job():
+        calls.append("run")
+
+    assert asyncio.run(first.run_once("daily_summary:2024-06-03", job))
+    assert not asyncio.run(second.run_once("daily_summary:2024-06-03", job))
+    assert calls == ["run"]
+    assert db.get(JobRun, "daily_summary:2024-06-03").status == "done"
+
+    # 执行者在执行中失效，记录过期前不能接管，过期后可以
+    assert first.claim("task_due_reminders:2024-06-03-10", now=NOW)
+    assert not second.claim("task_due_reminders:2024-06-03-10", now=NOW + timedelta(seconds=30))
+    assert second.claim("task_due_reminders:2024-06-03-10", now=NOW + timedelta(seconds=61))
+    db.expire_all()
+    assert db.get(JobRun, "task_due_reminders:2024-06-03-10").owner == "b"
+
+
+def test_failed_job_can_be_retried(session_factory):
+    coordinator = JobCoordinator(DatabaseLease(session_factory), session_factory, owner="a", ttl=60)
+
+    async def broken():
+        raise RuntimeError("boom")
+
+    async def fixed():
+        pass
+
+    assert not asyncio.run(coordinator.run_once("job:1", broken))
+    assert asyncio.run(coordinator.run_once("job:1", fixed))
+
+
+def test_running_job_keeps_its_claim_past_the_ttl(db, session_factory):
+    first = JobCoordinator(DatabaseLease(session_factory), session_factory, owner="a", ttl=0.3)
+    second = JobCoordinator(DatabaseLease(session_factory), session_factory, owner="b", ttl=0.3)
+    taken_over = []
+
+    async def slow():
+        # 执行时间超过 ttl，执行记录由心跳续期，其他实例不能接管
+        for _ in range(4):
+            await asyncio.sleep(0.2)
+            taken_over.append(second.claim("slow:1"))
+
+    assert asyncio.run(first.run_once("slow:1", slow))
+    assert taken_over == [False] * 4
+    db.expire_all()
+    run = db.get(JobRun, "slow:1")
+    assert (run.owner, run.status) == ("a", "done")
+
+
+def test_failed_daily_summary_is_retried(session_factory):
+    coordinator = JobCoordinator(DatabaseLease(session_factory), session_factory, owner="a", ttl=60)
+
+    def unavailable():
+        raise RuntimeError("数据库不可用")
+
+    broken = ReminderService(unavailable, NotificationOutbox(session_factory=session_factory))
+    working = ReminderService(session_factory, NotificationOutbox(session_factory=session_factory))
+    evening = NOW.replace(hour=19)
+
+    assert asyncio.run(coordinator.run_once("daily_summary:2024-06-03", broken.send_daily_summary)) is False
+    assert asyncio.run(coordinator.run_once("daily_summary:2024-06-03", working.send_daily_summary))
+    assert asyncio.run(broken.run_scheduled_jobs(coordinator, evening)) == []
+
+
+def test_job_whose_messages_fail_to_store_is_not_marked_done(db, session_factory, make_user, make_team,
+                                                              monkeypatch):
+    make_team("团队A", make_user("admin"))
+    coordinator = JobCoordinator(DatabaseLease(session_factory), session_factory, owner="a", ttl=60)
+    service = ReminderService(session_factory, NotificationOutbox(session_factory=session_factory))
+
+    def unavailable(db, *, objs_in):
+        raise RuntimeError("数据库不可用")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(message_crud, "create_many", unavailable)
+        assert asyncio.run(coordinator.run_once("daily_summary:2024-06-03", service.send_daily_summary)) is False
+    db.expire_all()
+    assert db.get(JobRun, "daily_summary:2024-06-03") is None
+    assert db.query(Message).count() == 0
+
+    assert asyncio.run(coordinator.run_once("daily_summary:2024-06-03", service.send_daily_summary))
+    assert db.query(Message).count() == 1
+
+
+def test_reminder_is_not_recorded_when_delivery_fails(db, session_factory, make_user, monkeypatch):
+    user = make_user("alice", reminder_interval=30)
+    now = datetime.combine(datetime.now().date(), time(10, 0))
+    scheduler = ReminderScheduler(session_factory, NotificationOutbox(session_factory=session_factory))
+    scheduler.refresh(now)
+
+    def unavailable(db, *, objs_in):
+        raise RuntimeError("数据库不可用")
+
+    monkeypatch.setattr(message_crud, "create_many", unavailable)
+    with pytest.raises(NotificationDeliveryError):
+        asyncio.run(scheduler.run_due(now + timedelta(minutes=30)))
+
+    db.expire_all()
+    assert db.query(Reminder).count() == 0
+    assert db.get(User, user.id).last_reminder_at is None
+
+
+def test_lease_backend_is_abstract():
+    with pytest.raises(TypeError):
+        LeaseBackend()
+
+
+def test_scheduled_jobs_run_once_per_window(session_factory):
+    service = ReminderService(session_factory, NotificationOutbox(session_factory=session_factory))
+    first = JobCoordinator(DatabaseLease(session_factory), session_factory, owner="a")
+    second = JobCoordinator(DatabaseLease(session_factory), session_factory, owner="b")
+    evening = NOW.replace(hour=19)
+
+    assert asyncio.run(service.run_scheduled_jobs(first, NOW)) == ["task_due_reminders:2024-06-03-10"]
+    assert asyncio.run(service.run_scheduled_jobs(second, NOW + timedelta(minutes=5))) == []
+    assert asyncio.run(service.run_scheduled_jobs(second, evening)) == [
+        "task_due_reminders:2024-06-03-19", "worklog_reminders:2024-06-03", "daily_summary:2024-06-03"
+    ]
+    assert asyncio.run(service.run_scheduled_jobs(first, evening + timedelta(hours=1))) == [
+        "task_due_reminders:2024-06-03-20"
+    ]
+
+
+def test_new_leader_does_not_resend_reminder_slots(db, session_factory, make_user):
+    alice = make_user("alice", reminder_interval=30)
+    now = datetime.combine(datetime.now().date(), time(10, 0))
+    outbox = NotificationOutbox(session_factory=session_factory)
+
+    old_leader = ReminderScheduler(session_factory, outbox)
+    new_leader = ReminderScheduler(session_factory, outbox)
+    old_leader.refresh(now)
+    # 接管的实例在旧负责实例发送之前加载，排到了同一个时刻
+    new_leader.refresh(now)
+    slot = now + timedelta(minutes=30)
+    assert asyncio.run(old_leader.run_due(slot)) == 1
+    assert asyncio.run(new_leader.run_due(slot + timedelta(seconds=5))) == 0
+
+    assert [r.user_id for r in db.query(Reminder).all()] == [alice.id]
+    assert [m.recipients for m in db.query(Message).all()] == [[alice.id]]
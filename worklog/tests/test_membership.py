@@ -0,0 +1,61 @@
+import time
+
+from app.core.cache import TTLCache
+
+
+def _team_member_queries(statements):
+    return [s for s in statements if "FROM team_members" in s]
+
+
+def test_roles_loaded_once_across_requests(client, db, make_user, make_team, auth_headers, query_counter):
+    admin = make_user("cacheadmin")
+    team = make_team("缓存团队", admin)
+    url, headers = f"/api/v1/tasks/statistics/team/{team.id}", auth_headers(admin)
+
+    with query_counter:
+        assert client.get(url, headers=headers).status_code == 200
+    assert len(_team_member_queries(query_counter.statements)) == 1
+
+    with query_counter:
+        assert client.get(url, headers=headers).status_code == 200
+        assert client.get("/api/v1/tasks/statistics", headers=headers).status_code == 200
+    assert _team_member_queries(query_counter.statements) == []
+
+
+def test_membership_writes_invalidate_cache(client, db, make_user, make_team, auth_headers):
+    admin = make_user("owner")
+    outsider = make_user("worker")
+    team = make_team("变更团队", admin)
+    team_id, outsider_id = team.id, outsider.id
+    admin_headers, outsider_headers = auth_headers(admin), auth_headers(outsider)
+    url = f"/api/v1/tasks/statistics/team/{team_id}"
+
+    # 非成员的空角色映射也会被缓存
+    assert client.get(url, headers=outsider_headers).status_code == 403
+
+    # 邀请已注册用户会直接加入团队，加入后立即生效
+    response = client.post(f"/api/v1/teams/{team_id}/invite",
+                           json={"email": "worker@example.com", "role": "team_member"},
+                           headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert client.get(url, headers=outsider_headers).status_code == 200
+
+    # 移除成员后立即失去访问权限
+    response = client.delete(f"/api/v1/teams/{team_id}/members/{outsider_id}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert client.get(url, headers=outsider_headers).status_code == 403
+
+
+def test_ttl_cache_expiry_and_lru_eviction():
+    cache = TTLCache(ttl=60, max_size=2)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+    # 2 最久未使用，被淘汰
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+
+    cache.set(4, "d", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get(4) is None
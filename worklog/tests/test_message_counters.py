@@ -0,0 +1,145 @@
+import asyncio
+
+from app.core.message_counters import empty_stats, message_counters
+from app.core.ws_manager import ws_manager
+from app.crud.message import message_crud
+from app.schemas.message import MessageCreate
+
+
+def _send(db, recipients, priority="normal", message_type="system"):
+    return message_crud.create(db, obj_in=MessageCreate(
+        title="通知", content="内容", message_type=message_type, priority=priority, recipients=recipients
+    ))
+
+
+def test_stats_are_served_from_counters(client, db, make_user, auth_headers, query_counter):
+    alice = make_user("alice")
+    headers = auth_headers(alice)
+    _send(db, [alice.id], priority="urgent")
+    client.get("/api/v1/messages/stats", headers=headers)
+
+    with query_counter:
+        stats = client.get("/api/v1/messages/stats", headers=headers).json()
+        count = client.get("/api/v1/messages/unread-count", headers=headers).json()
+    assert query_counter.count == 0
+    assert stats["unread_messages"] == 1
+    assert stats["urgent_messages"] == 1
+    assert count == {"unread_count": 1}
+
+
+def test_counters_follow_create_read_mark_all_and_delete(db, make_user):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    message_crud.get_stats(db, alice.id)
+
+    first = _send(db, [alice.id, bob.id], priority="important", message_type="task")
+    second = _send(db, [alice.id], message_type="team")
+    _send(db, [alice.id], priority="urgent", message_type="team")
+    message_crud.mark_as_read(db, first.id, alice.id)
+    message_crud.mark_as_read(db, first.id, alice.id)
+    message_crud.delete_message(db, second.id, alice.id)
+    message_crud.delete_message(db, second.id, alice.id)
+    assert message_crud.get_stats(db, alice.id) == message_crud._count_stats(db, alice.id)
+    assert message_crud.get_unread_count(db, alice.id) == 1
+
+    message_crud.mark_all_as_read(db, alice.id)
+    assert message_crud.get_stats(db, alice.id) == message_crud._count_stats(db, alice.id)
+    assert message_crud.get_unread_count(db, alice.id) == 0
+    # bob的计数不受alice操作影响，未缓存时从数据库统计
+    assert message_crud.get_unread_count(db, bob.id) == 1
+
+
+def test_concurrent_mark_as_read_decrements_once(db, session_factory, make_user):
+    alice = make_user("alice")
+    message = _send(db, [alice.id])
+    _send(db, [alice.id])
+    assert message_crud.get_unread_count(db, alice.id) == 2
+
+    # 另一个请求已经读出了未读状态，随后本请求把消息标记为已读
+    other = session_factory()
+    try:
+        stale = message_crud._get_state(other, message.id, alice.id)
+        message_crud.mark_as_read(db, message.id, alice.id)
+        assert not stale.is_read
+        read = message_crud.mark_as_read(other, message.id, alice.id)
+    finally:
+        other.close()
+    assert read.is_read
+    assert message_crud.get_unread_count(db, alice.id) == 1
+    assert message_crud.get_stats(db, alice.id) == message_crud._count_stats(db, alice.id)
+
+
+def test_change_committed_during_load_is_not_lost(db, session_factory, make_user):
+    alice = make_user("alice")
+    _send(db, [alice.id])
+    other = session_factory()
+
+    def loader(load_db, user_id):
+        stats = message_crud._count_stats(load_db, user_id)
+        # 统计完成、写入缓存之前，另一个请求提交了新消息
+        _send(other, [alice.id])
+        return stats
+
+    try:
+        assert message_counters.get(db, alice.id, loader)["unread_messages"] == 1
+    finally:
+        other.close()
+    # 过期的统计没有写入缓存，下次读取重新统计
+    assert message_crud.get_unread_count(db, alice.id) == 2
+    _send(db, [alice.id])
+    assert message_crud.get_stats(db, alice.id) == message_crud._count_stats(db, alice.id)
+    assert message_crud.get_unread_count(db, alice.id) == 3
+
+
+def test_counter_changes_are_pushed_to_connected_users(db, make_user, fake_websocket):
+    alice = make_user("alice")
+    socket = fake_websocket()
+
+    async def scenario():
+        message_counters.bind_loop(asyncio.get_running_loop())
+        await ws_manager.connect(alice.id, socket)
+        try:
+            # 请求处理函数运行在线程池中
+            message = await asyncio.to_thread(_send, db, [alice.id])
+            await asyncio.to_thread(message_crud.mark_as_read, db, message.id, alice.id)
+            for _ in range(100):
+                if len(socket.sent) == 2:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            message_counters.bind_loop(None)
+
+    asyncio.run(scenario())
+    assert [frame["type"] for frame in socket.sent] == ["unread_count", "unread_count"]
+    assert [frame["unread_count"] for frame in socket.sent] == [1, 0]
+
+
+def test_changes_from_other_processes_refresh_counters(db, session_factory, make_user, fake_websocket,
+                                                       monkeypatch):
+    alice = make_user("alice")
+    socket = fake_websocket()
+    published = []
+    monkeypatch.setattr(message_counters, "session_factory", session_factory)
+    monkeypatch.setattr(ws_manager, "publish_event", lambda kind, *args: published.append((kind, *args)))
+    message_crud.get_stats(db, alice.id)
+    _send(db, [alice.id])
+    # 本进程的变更通知其他进程
+    assert published == [("message_counters", [alice.id])]
+
+    async def scenario():
+        message_counters.bind_loop(asyncio.get_running_loop())
+        await ws_manager.connect(alice.id, socket)
+        try:
+            # 另一个进程（如提醒脚本）创建了消息，本进程缓存的计数已过时
+            message_counters.cache.set(alice.id, empty_stats())
+            message_counters.apply_remote([alice.id])
+            for _ in range(100):
+                if socket.sent:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            message_counters.bind_loop(None)
+
+    asyncio.run(scenario())
+    assert [frame["unread_count"] for frame in socket.sent] == [1]
+    assert message_crud.get_stats(db, alice.id) == message_crud._count_stats(db, alice.id)
@@ -0,0 +1,113 @@
+from app.core.message_counters import message_counters
+from app.core.pagination import decode_cursor
+from app.crud.message import message_crud
+from app.models.message import Message, MessageRecipient
+from app.schemas.message import MessageCreate
+
+
+def _send(db, recipients, title="通知", priority="normal", message_type="system"):
+    return message_crud.create(db, obj_in=MessageCreate(
+        title=title, content="内容", message_type=message_type, priority=priority, recipients=recipients
+    ))
+
+
+def test_read_state_is_per_recipient(client, db, make_user, auth_headers):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    message = _send(db, [alice.id, bob.id])
+    message_id = message.id
+
+    response = client.put(f"/api/v1/messages/{message_id}/read", headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    assert response.json()["is_read"] is True
+
+    assert client.get("/api/v1/messages/unread-count", headers=auth_headers(alice)).json() == {"unread_count": 0}
+    assert client.get("/api/v1/messages/unread-count", headers=auth_headers(bob)).json() == {"unread_count": 1}
+    bob_view = client.get(f"/api/v1/messages/{message_id}", headers=auth_headers(bob)).json()
+    assert bob_view["is_read"] is False
+
+
+def test_delete_and_mark_all_read_only_affect_current_user(client, db, make_user, auth_headers):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    first = _send(db, [alice.id, bob.id], message_type="task")
+    _send(db, [alice.id, bob.id], message_type="team")
+    first_id = first.id
+
+    assert client.delete(f"/api/v1/messages/{first_id}", headers=auth_headers(alice)).status_code == 200
+    alice_messages = client.get("/api/v1/messages/", headers=auth_headers(alice)).json()
+    assert [m["message_type"] for m in alice_messages] == ["team"]
+    assert len(client.get("/api/v1/messages/", headers=auth_headers(bob)).json()) == 2
+
+    response = client.put("/api/v1/messages/mark-all-read", params={"message_type": "task"},
+                          headers=auth_headers(bob))
+    assert response.json() == {"marked_count": 1}
+    unread = client.get("/api/v1/messages/", params={"unread_only": True}, headers=auth_headers(bob)).json()
+    assert [m["message_type"] for m in unread] == ["team"]
+
+
+def test_stats_use_a_single_grouped_query(client, db, make_user, auth_headers, query_counter):
+    alice = make_user("alice")
+    headers = auth_headers(alice)
+    _send(db, [alice.id], priority="urgent", message_type="task")
+    _send(db, [alice.id], priority="important", message_type="task")
+    read = _send(db, [alice.id], message_type="team")
+    message_crud.mark_as_read(db, read.id, alice.id)
+    client.get("/api/v1/messages/stats", headers=headers)
+    # 清空计数缓存，统计回退到数据库
+    message_counters.cache.clear()
+
+    with query_counter:
+        stats = client.get("/api/v1/messages/stats", headers=headers).json()
+    assert query_counter.count == 1
+    assert stats == {
+        "total_messages": 3,
+        "unread_messages": 2,
+        "urgent_messages": 1,
+        "important_messages": 1,
+        "messages_by_type": {"task": 2, "team": 1},
+    }
+
+
+def test_mailbox_queries_do_not_scan_messages_json(client, db, make_user, auth_headers, query_counter):
+    alice = make_user("alice")
+    headers = auth_headers(alice)
+    _send(db, [alice.id])
+    client.get("/api/v1/messages/unread-count", headers=headers)
+
+    with query_counter:
+        client.get("/api/v1/messages/unread-count", headers=headers)
+        client.get("/api/v1/messages/", headers=headers)
+    assert all("message_recipients.user_id" in s for s in query_counter.statements)
+    assert not any("recipients LIKE" in s or "json_each" in s for s in query_counter.statements)
+
+
+def test_cursor_pagination_over_inbox(db, make_user):
+    alice = make_user("alice")
+    ids = [_send(db, [alice.id], title=f"通知{i}").id for i in range(5)]
+
+    seen = []
+    cursor_key = None
+    while True:
+        messages, next_cursor = message_crud.get_by_receiver_after(db, alice.id, cursor_key, limit=2)
+        seen.extend(m.id for m in messages)
+        if next_cursor is None:
+            break
+        cursor_key = decode_cursor(next_cursor)
+    assert seen == sorted(ids, reverse=True)
+
+
+def test_backfill_creates_inbox_rows_from_legacy_recipients(db, make_user):
+    from create_message_recipients_table import backfill_message_recipients
+    alice = make_user("alice")
+    bob = make_user("bob")
+    legacy = Message(title="旧消息", content="内容", message_type="system",
+                     recipients=[alice.id, bob.id], is_read=True)
+    db.add(legacy)
+    db.commit()
+
+    assert backfill_message_recipients(db) == 2
+    assert backfill_message_recipients(db) == 0
+    states = db.query(MessageRecipient).filter(MessageRecipient.message_id == legacy.id).all()
+    assert {s.user_id for s in states} == {alice.id, bob.id}
+    assert all(s.is_read for s in states)
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.notification_outbox import notification_outbox, NotificationOutbox
+from app.core.ws_manager import ws_manager
+from app.models.message import Message
+from app.models.work_log import WorkLog
+
+
+@pytest.fixture
+def outbox(session_factory, monkeypatch):
+    """全局发件箱改用测试数据库，前后清空其他测试登记的事件"""
+    monkeypatch.setattr(notification_outbox, "session_factory", session_factory)
+    while notification_outbox._take_batch():
+        pass
+    yield notification_outbox
+    while notification_outbox._take_batch():
+        pass
+
+
+def test_handlers_only_enqueue_events(client, outbox, make_user, make_team, auth_headers):
+    admin = make_user("admin")
+    member = make_user("member")
+    team = make_team("团队A", admin, members=[member])
+
+    response = client.post("/api/v1/work-logs", headers=auth_headers(member), json={
+        "team_id": team.id,
+        "work_type": "feature",
+        "content": "写代码",
+        "start_time": "2024-01-01T09:00:00",
+        "end_time": "2024-01-01T10:00:00",
+    })
+    assert response.status_code == 200, response.text
+    assert outbox.pending() == 1
+
+
+def test_drain_stores_batch_and_pushes_with_message_id(db, outbox, make_user, make_team, fake_websocket,
+                                                       query_counter):
+    admin = make_user("admin")
+    members = [make_user(f"member{i}") for i in range(5)]
+    team = make_team("团队B", admin, members=members)
+    admin_socket = fake_websocket()
+
+    work_logs = [WorkLog(user_id=m.id, team_id=team.id, content="日志", duration=1) for m in members]
+    db.add_all(work_logs)
+    db.commit()
+    for work_log, member in zip(work_logs, members):
+        outbox.publish("notify_worklog_submitted", work_log.id, member.id, team.id)
+
+    async def scenario():
+        await ws_manager.connect(admin.id, admin_socket)
+        with query_counter:
+            await outbox.drain()
+        await ws_manager.flush(timeout=1)
+
+    asyncio.run(scenario())
+    assert outbox.pending() == 0
+    # 所有消息在同一个事务中入库
+    assert sum(1 for s in query_counter.statements if s.strip().upper() == "COMMIT") <= 1
+
+    messages = db.query(Message).order_by(Message.id).all()
+    assert len(messages) == 5
+    assert all(m.recipients == [admin.id] for m in messages)
+    frames = [frame for frame in admin_socket.sent if frame["type"] == "worklog_notification"]
+    assert [frame["message_id"] for frame in frames] == [m.id for m in messages]
+    assert {frame["worklog_id"] for frame in frames} == {w.id for w in work_logs}
+
+
+def test_orm_arguments_are_snapshotted_at_publish(db, session_factory, make_user, make_team, fake_websocket):
+    from app.models.task import Task
+    creator = make_user("creator")
+    assignee = make_user("assignee")
+    team = make_team("团队C", creator, members=[assignee])
+    task = Task(title="任务", team_id=team.id, creator_id=creator.id, assignee_id=assignee.id)
+    db.add(task)
+    db.commit()
+    socket = fake_websocket()
+
+    outbox = NotificationOutbox(session_factory=session_factory)
+    assert outbox.publish("notify_task_assigned", task, assignee.id, creator.id)
+    # 登记后的修改不影响通知内容
+    assignee_id = assignee.id
+    task.title = "改名后的任务"
+    db.commit()
+    db.close()
+
+    async def scenario():
+        await ws_manager.connect(assignee_id, socket)
+        await outbox.drain()
+        await ws_manager.flush(timeout=1)
+
+    asyncio.run(scenario())
+
+    assert len(socket.sent) == 1
+    assert socket.sent[0]["task_title"] == "任务"
+
+
+def test_database_work_runs_off_the_event_loop_thread(session_factory, make_user):
+    user = make_user("frank")
+    threads = []
+
+    def factory():
+        threads.append(threading.get_ident())
+        return session_factory()
+
+    outbox = NotificationOutbox(session_factory=factory)
+    outbox.publish("send_system_notification", "标题", "内容", [user.id])
+
+    async def scenario():
+        await outbox.drain()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert threads and threads[0] != loop_thread
+
+
+def test_publish_never_raises(session_factory):
+    outbox = NotificationOutbox(session_factory=session_factory, max_pending=1)
+    assert outbox.publish("no_such_method") is False
+    assert outbox.publish("send_system_notification", "标题", "内容", [1]) is True
+    # 队列已满
+    assert outbox.publish("send_system_notification", "标题", "内容", [1]) is False
+
+
+def test_dispatcher_task_delivers_events_published_from_threads(db, session_factory, make_user,
+                                                               fake_websocket):
+    user = make_user("eve")
+    socket = fake_websocket()
+    outbox = NotificationOutbox(session_factory=session_factory, flush_interval=0.01)
+
+    async def scenario():
+        await ws_manager.connect(user.id, socket)
+        await outbox.start()
+        await asyncio.gather(*[
+            asyncio.to_thread(outbox.publish, "send_system_notification", f"通知{i}", "内容", [user.id])
+            for i in range(3)
+        ])
+        for _ in range(100):
+            if len(socket.sent) == 3:
+                break
+            await asyncio.sleep(0.01)
+        await outbox.stop()
+        await ws_manager.flush(timeout=1)
+
+    asyncio.run(scenario())
+    assert sorted(frame["title"] for frame in socket.sent) == ["通知0", "通知1", "通知2"]
+    assert db.query(Message).count() == 3
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+from app.core.presence import IDLE, OFFLINE, ONLINE, InMemoryPresenceStore, PresenceService
+from app.core.ws_broker import InMemoryBroker
+from app.core.ws_manager import ConnectionManager
+
+
+def _presence_frames(socket):
+    return [frame for frame in socket.sent if frame.get("type") == "presence"]
+
+
+def test_status_follows_heartbeats_and_idle_reports(fake_websocket):
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        presence = PresenceService(manager, idle_after=30, expire_after=60, publish_interval=1)
+        connection = await manager.connect(1, fake_websocket())
+        statuses = [presence.get_status(1)]
+
+        presence.touch(connection, idle=True)
+        statuses.append(presence.get_status(1))
+        presence.touch(connection, idle=False)
+        statuses.append(presence.get_status(1))
+        connection.last_seen = time.monotonic() - 45
+        statuses.append(presence.get_status(1))
+        statuses.append(presence.get_status(2))
+        return statuses
+
+    assert asyncio.run(scenario()) == [ONLINE, IDLE, ONLINE, IDLE, OFFLINE]
+
+
+def test_sweep_publishes_coalesced_diffs_to_teams(fake_websocket):
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        presence = PresenceService(manager, idle_after=30, expire_after=60, publish_interval=1)
+        watcher, other_socket, outsider = fake_websocket(), fake_websocket(), fake_websocket()
+        await manager.connect(1, watcher, team_ids=[10])
+        other = await manager.connect(2, other_socket, team_ids=[10])
+        await manager.connect(3, outsider, team_ids=[20])
+        await presence.sweep()
+        await manager.flush(timeout=1)
+        first = _presence_frames(watcher)
+
+        # 同一间隔内先空闲又恢复，不产生推送
+        presence.touch(other, idle=True)
+        presence.touch(other, idle=False)
+        await presence.sweep()
+        await manager.flush(timeout=1)
+        second = _presence_frames(watcher)[len(first):]
+
+        await manager.disconnect(2, other_socket)
+        await presence.sweep()
+        await manager.flush(timeout=1)
+        third = _presence_frames(watcher)[len(first) + len(second):]
+        return first, second, third, _presence_frames(outsider)
+
+    first, second, third, outsider_frames = asyncio.run(scenario())
+    assert len(first) == 1 and first[0]["team_id"] == 10
+    assert sorted((c["user_id"], c["status"]) for c in first[0]["changes"]) == [(1, ONLINE), (2, ONLINE)]
+    assert second == []
+    assert third == [{"type": "presence", "team_id": 10, "changes": [{"user_id": 2, "status": OFFLINE}]}]
+    assert [frame["team_id"] for frame in outsider_frames] == [20]
+
+
+def test_sweep_expires_zombie_connections(fake_websocket):
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        presence = PresenceService(manager, idle_after=30, expire_after=60, publish_interval=1)
+        watcher, zombie_socket = fake_websocket(), fake_websocket()
+        await manager.connect(1, watcher, team_ids=[10])
+        zombie = await manager.connect(2, zombie_socket, team_ids=[10])
+        await presence.sweep()
+
+        zombie.last_seen = time.monotonic() - 90
+        await presence.sweep()
+        await manager.flush(timeout=1)
+        await asyncio.sleep(0)
+        return manager, watcher, zombie_socket
+
+    manager, watcher, zombie_socket = asyncio.run(scenario())
+    assert not manager.is_user_connected(2)
+    assert zombie_socket.closed
+    assert _presence_frames(watcher)[-1]["changes"] == [{"user_id": 2, "status": OFFLINE}]
+
+
+def test_connection_status_lists_team_presence(client, make_user, make_team, auth_headers):
+    admin = make_user("admin")
+    member = make_user("member")
+    outsider = make_user("outsider")
+    team = make_team("团队A", admin, members=[member])
+
+    response = client.get("/api/v1/messages/connection-status", params={"team_id": team.id},
+                          headers=auth_headers(admin))
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["status"] == OFFLINE
+    assert sorted(p["user_id"] for p in body["team_presence"]) == sorted([admin.id, member.id])
+    assert {p["status"] for p in body["team_presence"]} == {OFFLINE}
+
+    response = client.get("/api/v1/messages/connection-status", params={"team_id": team.id},
+                          headers=auth_headers(outsider))
+    assert response.status_code == 403
+
+
+def test_presence_is_shared_between_workers(fake_websocket):
+    async def scenario():
+        hub, store = {}, InMemoryPresenceStore()
+        worker_a = ConnectionManager(broker=InMemoryBroker(hub), queue_size=10, send_timeout=5)
+        worker_b = ConnectionManager(broker=InMemoryBroker(hub), queue_size=10, send_timeout=5)
+        presence_a = PresenceService(worker_a, store, idle_after=30, expire_after=60, publish_interval=1)
+        presence_b = PresenceService(worker_b, store, idle_after=30, expire_after=60, publish_interval=1)
+        watcher, socket_a, socket_b = fake_websocket(), fake_websocket(), fake_websocket()
+        await worker_a.connect(1, watcher, team_ids=[10])
+        await worker_a.connect(2, socket_a, team_ids=[10])
+        await worker_b.connect(2, socket_b, team_ids=[10])
+
+        await presence_a.sweep()
+        await presence_b.sweep()
+        await worker_a.flush(timeout=1)
+        # 两个进程都发现用户2上线，只推送一次
+        first = _presence_frames(watcher)
+
+        # 用户2在进程A断开但仍连接进程B：进程A仍看到在线，不推送离线
+        await worker_a.disconnect(2, socket_a)
+        await presence_a.sweep()
+        await worker_a.flush(timeout=1)
+        second = _presence_frames(watcher)[len(first):]
+        status_after_local_disconnect = presence_a.get_status(2)
+        connected = presence_a.connected_users()
+
+        # 最后一个连接断开后推送离线
+        await worker_b.disconnect(2, socket_b)
+        await presence_b.sweep()
+        await worker_a.flush(timeout=1)
+        third = _presence_frames(watcher)[len(first) + len(second):]
+        return first, second, status_after_local_disconnect, connected, third, presence_a.get_status(2)
+
+    first, second, status, connected, third, final = asyncio.run(scenario())
+    changes = [(c["user_id"], c["status"]) for frame in first for c in frame["changes"]]
+    assert sorted(changes) == [(1, ONLINE), (2, ONLINE)]
+    assert second == []
+    assert status == ONLINE
+    assert connected == [1, 2]
+    assert third == [{"type": "presence", "team_id": 10, "changes": [{"user_id": 2, "status": OFFLINE}]}]
+    assert final == OFFLINE
@@ -0,0 +1,88 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from app.core.notification_outbox import NotificationOutbox
+from app.core.reminder_service import ReminderProfile, ReminderScheduler, next_reminder_at, reminder_offset
+from app.models.message import Message
+from app.models.reminder import Reminder
+from app.models.user import User
+from app.models.work_log import WorkLog
+
+MONDAY = datetime(2024, 6, 3)
+
+
+def _profile(user_id=1, minutes=60, start=time(9, 0), end=time(18, 0), offset=timedelta()):
+    return ReminderProfile(user_id, timedelta(minutes=minutes), start, end, offset)
+
+
+def test_next_reminder_stays_inside_work_window():
+    profile = _profile(offset=timedelta(minutes=15))
+    assert next_reminder_at(profile, MONDAY.replace(hour=7)) == MONDAY.replace(hour=9, minute=15)
+    assert next_reminder_at(profile, MONDAY.replace(hour=10, minute=20)) == MONDAY.replace(hour=11, minute=15)
+    # 17:15 之后当天没有提醒时刻，顺延到第二天
+    assert next_reminder_at(profile, MONDAY.replace(hour=17, minute=16)) == \
+        MONDAY.replace(hour=9, minute=15) + timedelta(days=1)
+
+    night = _profile(start=time(22, 0), end=time(2, 0))
+    assert next_reminder_at(night, MONDAY.replace(hour=23, minute=30)) == MONDAY.replace(hour=23) + timedelta(hours=1)
+
+
+def test_offsets_spread_reminders_across_the_hour():
+    interval = timedelta(minutes=60)
+    minutes = Counter(
+        next_reminder_at(_profile(user_id, offset=reminder_offset(user_id, interval)), MONDAY.replace(hour=10)).minute
+        for user_id in range(1, 3001)
+    )
+    assert len(minutes) == 60
+    assert max(minutes.values()) < 3 * 3000 / 60
+
+
+def test_scheduler_sends_per_user_reminders_in_bulk(db, session_factory, make_user, query_counter):
+    active = make_user("active", reminder_interval=30)
+    busy = make_user("busy", reminder_interval=30)
+    make_user("disabled", reminder_enabled=False)
+    make_user("inactive", is_active=False)
+    now = datetime.combine(datetime.now().date(), time(10, 0))
+    db.add(WorkLog(user_id=busy.id, content="日志", duration=1, created_at=now + timedelta(minutes=25)))
+    db.commit()
+
+    scheduler = ReminderScheduler(session_factory, NotificationOutbox(session_factory=session_factory))
+    scheduler.refresh(now)
+    assert set(scheduler.profiles) == {active.id, busy.id}
+
+    with query_counter:
+        sent = asyncio.run(scheduler.run_due(now + timedelta(minutes=30)))
+    assert sent == 1
+    # 一次查询最近日志、一次批量写入提醒、一次批量更新用户
+    assert sum(1 for s in query_counter.statements if s.lstrip().upper().startswith("INSERT INTO REMINDERS")) == 1
+
+    statuses = {r.user_id: r.status for r in db.query(Reminder).all()}
+    assert statuses == {active.id: "sent", busy.id: "skipped"}
+    db.expire_all()
+    assert db.get(User, active.id).last_reminder_at is not None
+    messages = db.query(Message).all()
+    assert [m.recipients for m in messages] == [[active.id]]
+    # 下一次在一个间隔之后
+    assert asyncio.run(scheduler.run_due(now + timedelta(minutes=30))) == 0
+
+
+def test_refresh_reschedules_changed_users(db, session_factory, make_user):
+    user = make_user("alice", reminder_interval=60)
+    now = datetime.combine(datetime.now().date(), time(10, 0))
+    scheduler = ReminderScheduler(session_factory, NotificationOutbox(session_factory=session_factory))
+    scheduler.refresh(now)
+    assert user.id in scheduler.profiles
+
+    user.reminder_enabled = False
+    db.commit()
+    scheduler.refresh(now)
+    assert user.id not in scheduler.profiles
+    assert scheduler.pop_due(now + timedelta(hours=2)) == []
+
+    user.reminder_enabled = True
+    user.reminder_interval = 15
+    db.commit()
+    scheduler.refresh(now)
+    assert scheduler.profiles[user.id].interval == timedelta(minutes=15)
+    assert [user_id for user_id, _ in scheduler.pop_due(now + timedelta(minutes=15))] == [user.id]
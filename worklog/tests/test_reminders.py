@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, time, timedelta
+
+from app.core.notification_outbox import NotificationOutbox
+from app.core.reminder_service import ReminderService, TeamSummary
+from app.core.ws_manager import ws_manager
+from app.models.enums import TEAM_ADMIN
+from app.models.message import Message
+from app.models.task import Task
+from app.models.team_member import TeamMember
+from app.models.work_log import WorkLog
+
+
+def _log(db, user, team, created_at):
+    db.add(WorkLog(user_id=user.id, team_id=team.id, content="日志", duration=1, created_at=created_at))
+    db.commit()
+
+
+def test_find_missing_worklogs_uses_one_query(db, make_user, make_team, query_counter):
+    today = datetime.combine(datetime.now().date(), time.min)
+    admin = make_user("admin")
+    logged = make_user("logged")
+    yesterday_only = make_user("yesterday")
+    inactive = make_user("inactive", is_active=False)
+    first = make_team("团队A", admin, members=[logged, yesterday_only, inactive])
+    second = make_team("团队B", yesterday_only, members=[logged])
+    _log(db, logged, first, today + timedelta(hours=1))
+    _log(db, yesterday_only, first, today - timedelta(hours=1))
+
+    with query_counter:
+        missing = ReminderService.find_missing_worklogs(db, today)
+
+    assert query_counter.count == 1
+    assert missing == {first.id: [admin.id, yesterday_only.id], second.id: [yesterday_only.id]}
+
+
+def test_send_worklog_reminders_fans_out_one_message_per_team(db, session_factory, make_user, make_team,
+                                                              fake_websocket):
+    admin = make_user("admin")
+    members = [make_user(f"member{i}") for i in range(3)]
+    team = make_team("团队A", admin, members=members)
+    _log(db, members[0], team, datetime.now())
+    socket = fake_websocket()
+    service = ReminderService(session_factory, NotificationOutbox(session_factory=session_factory))
+
+    async def scenario():
+        await ws_manager.connect(members[1].id, socket, team_ids=[team.id])
+        reminded = await service.send_worklog_reminders()
+        await ws_manager.flush(timeout=1)
+        return reminded
+
+    assert asyncio.run(scenario()) == 3
+    messages = db.query(Message).all()
+    assert len(messages) == 1
+    assert sorted(messages[0].recipients) == sorted([admin.id, members[1].id, members[2].id])
+    assert [(frame["notification_type"], frame["message_id"]) for frame in socket.sent
+            if frame.get("type") == "worklog_notification"] == [("worklog_reminder", messages[0].id)]
+
+
+def test_daily_summary_uses_grouped_queries(db, session_factory, make_user, make_team, query_counter):
+    admin = make_user("admin")
+    co_admin = make_user("co_admin")
+    member = make_user("member")
+    first = make_team("团队A", admin, members=[member])
+    second = make_team("团队B", member)
+    db.query(TeamMember).filter(TeamMember.team_id == first.id, TeamMember.user_id == member.id).update(
+        {"role": TEAM_ADMIN}
+    )
+    db.add(TeamMember(team_id=first.id, user_id=co_admin.id, role=TEAM_ADMIN))
+    now = datetime.now()
+    _log(db, member, first, now)
+    _log(db, admin, first, now)
+    _log(db, member, second, now - timedelta(days=1))
+    db.add(Task(title="完成", team_id=first.id, creator_id=admin.id, status="completed", completed_at=now))
+    db.add(Task(title="进行中", team_id=first.id, creator_id=admin.id, status="in_progress"))
+    db.commit()
+    today = datetime.combine(now.date(), time.min)
+
+    with query_counter:
+        summaries = ReminderService.summarize_teams(db, today)
+    assert query_counter.count == 3
+    assert summaries == [
+        TeamSummary(first.id, "团队A", sorted([admin.id, co_admin.id, member.id]), 2, 1),
+        TeamSummary(second.id, "团队B", [member.id], 0, 0),
+    ]
+
+    service = ReminderService(session_factory, NotificationOutbox(session_factory=session_factory))
+    assert asyncio.run(service.send_daily_summary()) == 2
+    messages = {m.title: m for m in db.query(Message).all()}
+    assert sorted(messages) == ["团队 团队A 每日总结", "团队 团队B 每日总结"]
+    assert sorted(messages["团队 团队A 每日总结"].recipients) == sorted([admin.id, co_admin.id, member.id])
+    assert messages["团队 团队A 每日总结"].content == "今日工作日志：2 条\n今日完成任务：1 个"
@@ -0,0 +1,143 @@
+import pytest
+from sqlalchemy import text
+
+from app.core import search
+from app.models.search import SearchDocument
+from app.models.task import Task, TaskComment
+from app.models.user import User
+from app.models.work_log import WorkLog
+
+
+def _seed(db, make_user, make_team):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    carol = make_user("carol")
+    team = make_team("团队A", alice, members=[bob])
+    other = make_team("团队B", carol)
+    tasks = [
+        Task(title="数据库迁移", description="把订单表迁移到新的数据库集群", team_id=team.id, creator_id=alice.id),
+        Task(title="登录页面", description="修复登录接口的数据校验", team_id=team.id, creator_id=alice.id,
+             assignee_id=bob.id),
+        Task(title="数据库备份", description="其他团队的任务", team_id=other.id, creator_id=carol.id),
+    ]
+    db.add_all(tasks)
+    db.flush()
+    db.add_all([
+        WorkLog(user_id=bob.id, team_id=team.id, task_id=tasks[1].id, content="调试登录API",
+                issues_encountered="数据库连接池耗尽", solutions_applied="调大连接池"),
+        WorkLog(user_id=alice.id, team_id=None, content="个人笔记：数据库索引调优"),
+        TaskComment(task_id=tasks[0].id, user_id=bob.id, content="迁移脚本需要先在测试库演练"),
+    ])
+    db.commit()
+    return team.id, other.id, [t.id for t in tasks], alice.id, bob.id
+
+
+def _search(db, user_id, q, **kwargs):
+    from app.core.membership import membership_service
+    return search.search(db, user_id, membership_service.team_ids(db, user_id), q, **kwargs)
+
+
+def test_tokenize_splits_cjk_into_bigrams():
+    assert search.tokenize("数据库设计 API接口v2") == ["数据", "据库", "库设", "设计", "计", "api", "接口", "口", "v2"]
+    assert search.tokenize("库") == ["库"]
+    assert search.Fts5Backend.build_query(search.parse_query("数据库 库 API")) == '"数据 据库" "库"* "api"*'
+    assert search.MysqlNgramBackend.build_query(search.parse_query("数据库 库 API")) == '+"数据库" +库* +"api"'
+
+
+def test_search_backend_is_abstract():
+    with pytest.raises(TypeError):
+        search.SearchBackend()
+
+
+def test_search_is_ranked_and_scoped_to_visible_documents(db, make_user, make_team):
+    team_id, other_id, (migrate, login, backup), alice_id, bob_id = _seed(db, make_user, make_team)
+
+    result = _search(db, alice_id, "数据库")
+    found = [(item["doc_type"], item["doc_id"]) for item in result["items"]]
+    bob_log = db.query(WorkLog.id).filter(WorkLog.user_id == bob_id).scalar()
+    # 只有正文命中的排在标题命中之后；其他团队的任务不可见，个人日志只有作者可见
+    assert found[-1] == ("work_log", bob_log)
+    assert ("task", migrate) in found and ("task", backup) not in found
+    assert len(found) == 3
+    assert len(_search(db, bob_id, "数据库")["items"]) == 2
+
+    work_log = next(item for item in result["items"] if item["task_id"] == login)
+    assert "数据库连接池" in work_log["snippet"]
+
+    # 单字和字母前缀
+    assert [i["doc_id"] for i in _search(db, bob_id, "演", doc_types=["comment"])["items"]] == \
+        [db.query(TaskComment.id).scalar()]
+    assert [i["doc_type"] for i in _search(db, bob_id, "ap")["items"]] == ["work_log"]
+    # 每个词都要命中，词内按子串匹配
+    assert [i["doc_id"] for i in _search(db, bob_id, "登录 校验")["items"]] == [login]
+    assert _search(db, bob_id, "库数据")["items"] == []
+
+    page = _search(db, alice_id, "数据", limit=2)
+    assert len(page["items"]) == 2 and page["has_more"]
+
+
+def test_index_follows_orm_writes(db, make_user, make_team):
+    team_id, other_id, (migrate, login, backup), alice_id, bob_id = _seed(db, make_user, make_team)
+
+    task = db.get(Task, login)
+    task.title = "注册页面"
+    db.commit()
+    assert [i["doc_id"] for i in _search(db, bob_id, "注册", doc_types=["task"])["items"]] == [login]
+    assert _search(db, bob_id, "登录页面")["items"] == []
+
+    db.add(Task(title="注册回归测试", team_id=team_id, creator_id=alice_id))
+    db.flush()
+    db.rollback()
+    assert len(_search(db, bob_id, "注册")["items"]) == 1
+
+    # 任务删除后，任务和评论都不再可见
+    db.get(Task, migrate).is_deleted = True
+    db.commit()
+    assert _search(db, bob_id, "迁移")["items"] == []
+
+    db.delete(db.query(WorkLog).filter(WorkLog.user_id == bob_id).one())
+    db.commit()
+    assert _search(db, bob_id, "连接池")["items"] == []
+
+    documents = db.query(SearchDocument).count()
+    fts_rows = db.execute(text("SELECT count(*) FROM search_fts")).scalar()
+    assert search.rebuild(db) == documents == fts_rows
+    db.commit()
+    assert [i["doc_id"] for i in _search(db, bob_id, "注册")["items"]] == [login]
+
+
+def test_search_endpoints(client, db, make_user, make_team, auth_headers):
+    team_id, other_id, (migrate, login, backup), alice_id, bob_id = _seed(db, make_user, make_team)
+    alice = db.get(User, alice_id)
+
+    response = client.get("/api/v1/search", params={"q": "数据库", "types": "task"}, headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    assert [item["doc_id"] for item in response.json()["items"]] == [migrate]
+
+    assert client.get("/api/v1/search", params={"q": "数据库", "types": "project"},
+                      headers=auth_headers(alice)).status_code == 400
+    assert client.get("/api/v1/search", params={"q": "？！"}, headers=auth_headers(alice)).status_code == 400
+    assert client.get("/api/v1/search", params={"q": "数据库", "team_id": other_id},
+                      headers=auth_headers(alice)).status_code == 403
+
+    # 任务列表的关键词筛选使用全文索引
+    response = client.get("/api/v1/tasks", params={"team_id": team_id, "search": "数据校验"},
+                          headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    assert [item["id"] for item in response.json()["items"]] == [login]
+
+
+def test_deleting_task_removes_comment_documents(db, make_user, make_team):
+    team_id, other_id, (migrate, login, backup), alice_id, bob_id = _seed(db, make_user, make_team)
+    comment_id = db.query(TaskComment.id).filter(TaskComment.task_id == migrate).scalar()
+    fts_rows = db.execute(text("SELECT count(*) FROM search_fts")).scalar()
+
+    # 评论由数据库级联删除，不经过ORM
+    db.execute(text("DELETE FROM task_comments WHERE task_id = :id"), {"id": migrate})
+    db.delete(db.get(Task, migrate))
+    db.commit()
+
+    assert db.query(SearchDocument).filter(SearchDocument.doc_type == "comment",
+                                           SearchDocument.doc_id == comment_id).count() == 0
+    assert db.execute(text("SELECT count(*) FROM search_fts")).scalar() == fts_rows - 2
+    assert _search(db, bob_id, "演练")["items"] == []
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+from app.core import tags
+from app.models.tag import EntityTag, Tag, TeamTagCount
+from app.models.task import Task
+from app.models.user import User
+from app.models.work_log import WorkLog
+
+
+def _counts(db, team_id):
+    return {row["name"]: row["count"] for row in tags.get_team_tags(db, team_id, limit=100)}
+
+
+def _log(user_id, team_id, content, tag_value):
+    start = datetime(2024, 1, 1, 9, 0)
+    return WorkLog(user_id=user_id, team_id=team_id, content=content, tags=tag_value,
+                   start_time=start, end_time=start.replace(hour=10), duration=1.0)
+
+
+def _seed(db, make_user, make_team):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    team = make_team("团队A", alice, members=[bob])
+    other = make_team("团队B", make_user("carol"))
+    logs = [
+        _log(alice.id, team.id, "日志1", "API,后端"),
+        _log(alice.id, team.id, "日志2", "api，前端"),
+        _log(alice.id, team.id, "日志3", "rapid"),
+        _log(alice.id, None, "个人日志", "api"),
+        _log(bob.id, team.id, "日志4", "api,后端"),
+    ]
+    db.add_all(logs)
+    db.add(Task(title="任务", team_id=team.id, creator_id=alice.id, tags='["API", "发布"]'))
+    db.commit()
+    return team.id, other.id, [log.id for log in logs], alice.id, bob.id
+
+
+def test_parse_tags():
+    assert tags.parse_tags("API, 后端，后端;;") == ["api", "后端"]
+    assert tags.parse_tags('["API", " 发布 ", null]') == ["api", "发布"]
+    assert tags.parse_tags("[未闭合") == ["[未闭合"]
+    assert tags.parse_tags(None) == []
+
+
+def test_tags_are_indexed_and_counted(db, make_user, make_team):
+    team_id, other_id, log_ids, alice_id, bob_id = _seed(db, make_user, make_team)
+
+    assert _counts(db, team_id) == {"api": 4, "后端": 2, "前端": 1, "rapid": 1, "发布": 1}
+    assert tags.get_team_tags(db, team_id, prefix="a") == [{"name": "api", "count": 4}]
+    assert tags.get_team_tags(db, team_id, entity_type="task") == [
+        {"name": "api", "count": 1}, {"name": "发布", "count": 1}]
+    # 个人日志只建关联，不计入团队
+    assert db.query(EntityTag).filter(EntityTag.team_id == None).count() == 1
+
+    log = db.get(WorkLog, log_ids[0])
+    log.tags = "后端"
+    db.commit()
+    log = db.get(WorkLog, log_ids[1])
+    log.team_id = other_id
+    db.commit()
+    db.delete(db.get(WorkLog, log_ids[4]))
+    db.commit()
+    assert _counts(db, team_id) == {"rapid": 1, "后端": 1, "api": 1, "发布": 1}
+    assert _counts(db, other_id) == {"api": 1, "前端": 1}
+
+    db.query(Task).one().is_deleted = True
+    db.commit()
+    assert "发布" not in _counts(db, team_id)
+
+    # 回滚的修改不生效
+    db.get(WorkLog, log_ids[2]).tags = "新标签"
+    db.flush()
+    db.rollback()
+    assert db.query(Tag).filter(Tag.name == "新标签").count() == 0
+
+    before = {(r.team_id, r.entity_type, r.tag_id, r.count) for r in db.query(TeamTagCount)}
+    links = {(r.entity_type, r.entity_id, r.tag_id, r.team_id) for r in db.query(EntityTag)}
+    assert tags.rebuild(db) == 5
+    db.commit()
+    assert {(r.team_id, r.entity_type, r.tag_id, r.count) for r in db.query(TeamTagCount)} == before
+    assert {(r.entity_type, r.entity_id, r.tag_id, r.team_id) for r in db.query(EntityTag)} == links
+
+
+def test_tag_filtered_listing(client, db, make_user, make_team, auth_headers, query_counter):
+    team_id, other_id, log_ids, alice_id, bob_id = _seed(db, make_user, make_team)
+    alice = db.get(User, alice_id)
+    headers = auth_headers(alice)
+
+    def listed(**params):
+        response = client.get("/api/v1/work-logs", params={"page_size": 100, **params}, headers=headers)
+        assert response.status_code == 200, response.text
+        return sorted(item["id"] for item in response.json()["items"])
+
+    # 整词匹配，api 不再命中 rapid
+    assert listed(tags="api") == [log_ids[0], log_ids[1], log_ids[3]]
+    assert listed(tags="API,后端") == [log_ids[0]]
+    assert listed(tags="api,不存在") == []
+
+    response = client.get("/api/v1/tasks", params={"team_id": team_id, "tags": "发布"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert len(response.json()["items"]) == 1
+
+    with query_counter:
+        response = client.get(f"/api/v1/teams/{team_id}/tags", params={"prefix": "后"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == [{"name": "后端", "count": 2}]
+    assert not any("FROM work_logs" in s or "FROM tasks" in s for s in query_counter.statements)
+
+    outsider = make_user("outsider")
+    assert client.get(f"/api/v1/teams/{team_id}/tags", headers=auth_headers(outsider)).status_code == 403
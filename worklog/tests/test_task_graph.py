@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta
+
+from app.core.task_graph import TaskGraph, TaskNode, task_graph_service
+from app.models.project import Project
+from app.models.task import Task, TaskDependency, TaskStatus
+from app.models.user import User
+
+NOW = datetime(2024, 6, 3, 9, 0)
+
+
+def _graph(hours, edges, status=None, due=None):
+    nodes = {
+        task_id: TaskNode(task_id, f"任务{task_id}", (status or {}).get(task_id, "pending"), None, estimated,
+                          (due or {}).get(task_id))
+        for task_id, estimated in hours.items()
+    }
+    return TaskGraph(1, nodes, edges)
+
+
+def test_cycle_detection_and_topological_order():
+    graph = _graph({1: 1, 2: 1, 3: 1, 4: 1}, [(1, 2), (2, 3), (1, 4)])
+    assert graph.would_create_cycle(3, 1) == [1, 2, 3]
+    assert graph.would_create_cycle(4, 4) == [4]
+    assert graph.would_create_cycle(4, 3) is None
+    assert graph.topological_order() == ([1, 2, 3, 4], [])
+
+    cyclic = _graph({1: 1, 2: 1, 3: 1, 4: 1}, [(1, 2), (2, 3), (3, 2), (3, 4)])
+    assert cyclic.topological_order() == ([1], [2, 3, 4])
+
+
+def test_blocked_status_ignores_finished_prerequisites():
+    graph = _graph({1: 1, 2: 1, 3: 1}, [(1, 3), (2, 3)], status={1: "completed"})
+    assert graph.blocked_by(3) == [2]
+    assert graph.describe(3)["blocked"] is True
+    graph = _graph({1: 1, 2: 1, 3: 1}, [(1, 3), (2, 3)], status={1: "completed", 2: "cancelled"})
+    assert graph.blocked_by(3) == []
+
+
+def test_critical_path_uses_estimates_and_due_dates():
+    # 1(2h) → 2(3h) → 4(1h)，1 → 3(1h) → 4
+    graph = _graph({1: 2, 2: 3, 3: 1, 4: 1}, [(1, 2), (1, 3), (2, 4), (3, 4)])
+    result = graph.critical_path(NOW)
+    assert result["total_hours"] == 6
+    assert result["critical_path"] == [1, 2, 4]
+    tasks = {t["task_id"]: t for t in result["tasks"]}
+    assert tasks[3]["slack"] == 2 and not tasks[3]["critical"]
+    assert [t for t in tasks if tasks[t]["critical"]] == [1, 2, 4]
+
+    # 任务3 两小时后截止，只能在最早完成时间 3 小时之后完成，逾期 1 小时
+    graph = _graph({1: 2, 2: 3, 3: 1, 4: 1}, [(1, 2), (1, 3), (2, 4), (3, 4)],
+                   due={3: NOW + timedelta(hours=2)})
+    tasks = {t["task_id"]: t for t in graph.critical_path(NOW)["tasks"]}
+    assert tasks[3]["slack"] == -1 and tasks[3]["critical"]
+    assert tasks[1]["slack"] == -1
+
+    # 已完成的任务工期为 0
+    graph = _graph({1: 2, 2: 3}, [(1, 2)], status={1: "completed"})
+    assert graph.critical_path(NOW)["critical_path"] == [2]
+
+
+def _seed(db, make_user, make_team):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    team = make_team("团队A", alice, members=[bob])
+    project = Project(name="项目A", team_id=team.id, creator_id=alice.id)
+    db.add(project)
+    db.flush()
+    tasks = []
+    for title, hours, project_id in [("设计", 4, project.id), ("开发", 8, project.id), ("测试", 2, project.id),
+                                     ("文档", 1, None)]:
+        task = Task(title=title, team_id=team.id, project_id=project_id, creator_id=alice.id,
+                    estimated_hours=hours)
+        db.add(task)
+        tasks.append(task)
+    db.flush()
+    design, develop, test, docs = tasks
+    db.add_all([
+        TaskDependency(prerequisite_task_id=design.id, dependent_task_id=develop.id),
+        TaskDependency(prerequisite_task_id=develop.id, dependent_task_id=test.id),
+    ])
+    db.commit()
+    return team.id, project.id, [t.id for t in tasks], alice.id, bob.id
+
+
+def test_graph_is_cached_and_invalidated_on_commit(db, make_user, make_team, query_counter):
+    team_id, _, (design, develop, test, docs), alice_id, _ = _seed(db, make_user, make_team)
+
+    with query_counter:
+        graph = task_graph_service.get(db, team_id)
+        assert task_graph_service.get(db, team_id) is graph
+    assert query_counter.count == 1
+    assert graph.blocked_by(test) == [develop]
+
+    # 回滚的修改不影响缓存
+    db.add(TaskDependency(prerequisite_task_id=docs, dependent_task_id=design))
+    db.flush()
+    db.rollback()
+    assert task_graph_service.get(db, team_id) is graph
+
+    db.add(TaskDependency(prerequisite_task_id=docs, dependent_task_id=design))
+    db.commit()
+    graph = task_graph_service.get(db, team_id)
+    assert graph.predecessors[design] == {docs}
+
+    db.get(Task, develop).status = TaskStatus.COMPLETED
+    db.commit()
+    assert task_graph_service.get(db, team_id).blocked_by(test) == []
+
+    # 删除的任务不在依赖图中
+    db.get(Task, docs).is_deleted = True
+    db.commit()
+    graph = task_graph_service.get(db, team_id)
+    assert docs not in graph.nodes and graph.blocked_by(design) == []
+
+
+def test_dependency_endpoints(client, db, make_user, make_team, auth_headers):
+    team_id, project_id, (design, develop, test, docs), alice_id, bob_id = _seed(db, make_user, make_team)
+    other_team = make_team("团队B", make_user("carol"))
+    foreign = Task(title="外部任务", team_id=other_team.id, creator_id=alice_id)
+    db.add(foreign)
+    db.commit()
+    foreign_id = foreign.id
+    alice, bob = db.get(User, alice_id), db.get(User, bob_id)
+    outsider = make_user("outsider")
+
+    response = client.post(f"/api/v1/tasks/{design}/dependencies", json={"prerequisite_task_id": test},
+                           headers=auth_headers(alice))
+    assert response.status_code == 400
+    assert "设计 → 开发 → 测试 → 设计" in response.json()["detail"]
+    response = client.post(f"/api/v1/tasks/{design}/dependencies", json={"prerequisite_task_id": foreign_id},
+                           headers=auth_headers(alice))
+    assert response.status_code == 400
+    response = client.post(f"/api/v1/tasks/{design}/dependencies", json={"prerequisite_task_id": docs},
+                           headers=auth_headers(bob))
+    assert response.status_code == 403
+
+    response = client.post(f"/api/v1/tasks/{test}/dependencies", json={"prerequisite_task_id": docs},
+                           headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["blocked"] is True
+    assert [t["id"] for t in body["prerequisites"]] == [develop, docs]
+    assert client.post(f"/api/v1/tasks/{test}/dependencies", json={"prerequisite_task_id": docs},
+                       headers=auth_headers(alice)).status_code == 400
+
+    response = client.get("/api/v1/tasks/dependency-graph", params={"team_id": team_id},
+                          headers=auth_headers(bob))
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["order"] == [design, develop, docs, test]
+    assert {(e["prerequisite_task_id"], e["dependent_task_id"]) for e in body["edges"]} == {
+        (design, develop), (develop, test), (docs, test)}
+    assert {n["id"]: n["blocked_by"] for n in body["nodes"]}[test] == [develop, docs]
+
+    body = client.get("/api/v1/tasks/dependency-graph", params={"team_id": team_id, "project_id": project_id},
+                      headers=auth_headers(bob)).json()
+    assert body["order"] == [design, develop, test]
+    # 项目外的前置任务仍然阻塞
+    assert {n["id"]: n["blocked_by"] for n in body["nodes"]}[test] == [develop, docs]
+
+    response = client.get("/api/v1/tasks/critical-path", params={"team_id": team_id},
+                          headers=auth_headers(bob))
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["total_hours"] == 14
+    assert body["critical_path"] == [design, develop, test]
+
+    assert client.get("/api/v1/tasks/dependency-graph", params={"team_id": team_id},
+                      headers=auth_headers(outsider)).status_code == 403
+
+    response = client.delete(f"/api/v1/tasks/{test}/dependencies/{docs}", headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    assert [t["id"] for t in response.json()["prerequisites"]] == [develop]
+    assert client.delete(f"/api/v1/tasks/{test}/dependencies/{docs}",
+                         headers=auth_headers(alice)).status_code == 404
+    response = client.get(f"/api/v1/tasks/{develop}/dependencies", headers=auth_headers(bob))
+    assert [t["id"] for t in response.json()["dependents"]] == [test]
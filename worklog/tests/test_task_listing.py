@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+from app.models.project import Project
+from app.models.task import Task, TaskComment
+
+
+def _seed_tasks(db, user, team, count):
+    base = datetime(2024, 1, 1, 9, 0)
+    for i in range(count):
+        db.add(Task(title=f"任务{i}", team_id=team.id, creator_id=user.id, assignee_id=user.id,
+                    created_at=base + timedelta(minutes=i // 2)))
+    db.commit()
+
+
+def test_cursor_pagination_walks_all_tasks(client, db, make_user, make_team, auth_headers):
+    admin = make_user("admin1")
+    team = make_team("团队T", admin)
+    _seed_tasks(db, admin, team, 9)
+    headers = auth_headers(admin)
+
+    seen = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get("/api/v1/tasks", params={"cursor": cursor, "page_size": 4,
+                                                       "team_id": team.id}, headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["total"] is None
+        seen.extend(item["id"] for item in data["items"])
+        cursor = data["next_cursor"]
+
+    expected = [t.id for t in db.query(Task).order_by(Task.created_at.desc(), Task.id.desc())]
+    assert seen == expected
+
+    # 偏移分页保持原有响应
+    response = client.get("/api/v1/tasks", params={"page": 2, "page_size": 4, "team_id": team.id},
+                          headers=headers)
+    data = response.json()
+    assert data["total"] == 9
+    assert data["total_pages"] == 3
+    assert data["next_cursor"] is None
+
+
+def test_task_page_loads_relations_in_constant_queries(client, db, make_user, make_team, auth_headers,
+                                                       query_counter):
+    admin = make_user("admin2")
+    members = [make_user(f"member{i}") for i in range(3)]
+    team = make_team("团队R", admin, members=members)
+    project = Project(name="项目R", team_id=team.id, creator_id=admin.id)
+    db.add(project)
+    db.commit()
+    team_id, project_id = team.id, project.id
+    member_ids = [m.id for m in members]
+    headers = auth_headers(admin)
+
+    def seed(count):
+        for i in range(count):
+            task = Task(title=f"任务{i}", team_id=team_id, project_id=project_id, creator_id=admin.id,
+                        assignee_id=member_ids[i % len(member_ids)])
+            db.add(task)
+            db.flush()
+            db.add(TaskComment(task_id=task.id, user_id=admin.id, content="评论"))
+        db.commit()
+
+    def list_tasks():
+        with query_counter:
+            response = client.get("/api/v1/tasks", params={"team_id": team_id, "page_size": 100},
+                                  headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()["items"]
+
+    seed(2)
+    list_tasks()
+    small_page_count = query_counter.count
+
+    seed(40)
+    items = list_tasks()
+    assert len(items) == 42
+    # 第二次请求的成员角色来自缓存，查询次数只会更少
+    assert query_counter.count <= small_page_count
+    item = items[0]
+    assert item["creator"]["username"] == "admin2"
+    assert item["assignee"]["username"].startswith("member")
+    assert item["project"]["name"] == "项目R"
+    assert item["comment_count"] == 1
+
+
+def test_get_task_detail_includes_relations(client, db, make_user, make_team, auth_headers):
+    admin = make_user("admin3")
+    team = make_team("团队D", admin)
+    task = Task(title="详情任务", team_id=team.id, creator_id=admin.id)
+    db.add(task)
+    db.commit()
+
+    response = client.get(f"/api/v1/tasks/{task.id}", headers=auth_headers(admin))
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["creator"]["username"] == "admin3"
+    assert data["assignee"] is None
+    assert data["comment_count"] == 0
+
+    response = client.post("/api/v1/tasks/quick", json={"title": "快速任务", "team_id": team.id},
+                           headers=auth_headers(admin))
+    assert response.status_code == 200, response.text
+    assert response.json()["creator"]["username"] == "admin3"
+
+
+def test_non_member_cannot_list_team_or_project_tasks(client, db, make_user, make_team, auth_headers):
+    admin = make_user("admin3")
+    outsider = make_user("outsider")
+    team = make_team("团队X", admin)
+    make_team("团队Y", outsider)
+    project = Project(name="项目X", team_id=team.id, creator_id=admin.id)
+    db.add(project)
+    db.commit()
+    headers = auth_headers(outsider)
+
+    response = client.get("/api/v1/tasks", params={"team_id": team.id}, headers=headers)
+    assert response.status_code == 403, response.text
+
+    response = client.get("/api/v1/tasks", params={"project_id": project.id}, headers=headers)
+    assert response.status_code == 403, response.text
+
+    response = client.get("/api/v1/tasks", params={"project_id": project.id + 100}, headers=headers)
+    assert response.status_code == 404, response.text
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+from app.crud import task_statistics
+from app.models.project import Project
+from app.models.task import Task
+
+
+def _task(team, creator, status, **kwargs):
+    return Task(title=f"{status}任务", team_id=team.id, creator_id=creator.id, status=status, **kwargs)
+
+
+def _seed(db, team, admin, member):
+    past = datetime.now() - timedelta(days=1)
+    db.add_all([
+        _task(team, admin, "pending", assignee_id=member.id, due_date=past, estimated_hours=2),
+        _task(team, admin, "in_progress", assignee_id=member.id, estimated_hours=3),
+        _task(team, admin, "review", assignee_id=admin.id, due_date=past, estimated_hours=1),
+        _task(team, admin, "completed", assignee_id=admin.id, due_date=past,
+              estimated_hours=4, actual_hours=5),
+        _task(team, admin, "cancelled", assignee_id=admin.id),
+        _task(team, admin, "completed", assignee_id=admin.id, is_deleted=True, actual_hours=100),
+    ])
+    db.commit()
+
+
+def test_statistics_single_aggregate_query(client, db, make_user, make_team, auth_headers, query_counter):
+    admin = make_user("statadmin")
+    member = make_user("statmember")
+    team = make_team("统计团队", admin, members=[member])
+    _seed(db, team, admin, member)
+    url, headers = f"/api/v1/tasks/statistics/team/{team.id}", auth_headers(admin)
+
+    with query_counter:
+        response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data == {
+        "total": 5, "pending": 1, "in_progress": 1, "completed": 1, "review": 1, "cancelled": 1,
+        "overdue": 2, "total_estimated_hours": 10.0, "completed_hours": 5.0, "completion_rate": 20.0,
+    }
+    # 当前用户 + 成员校验 + 聚合统计
+    assert query_counter.count == 3
+
+
+def test_statistics_for_many_teams_in_one_call(client, db, make_user, make_team, auth_headers, query_counter):
+    admin = make_user("teamsadmin")
+    member = make_user("teamsmember")
+    team_a = make_team("团队甲", admin, members=[member])
+    team_b = make_team("团队乙", member)
+    empty = make_team("空团队", admin)
+    _seed(db, team_a, admin, member)
+    db.add(_task(team_b, member, "completed", assignee_id=member.id, estimated_hours=1, actual_hours=1))
+    db.commit()
+    team_a_id, team_b_id, empty_id = team_a.id, team_b.id, empty.id
+    headers = auth_headers(member)
+
+    with query_counter:
+        response = client.get("/api/v1/tasks/statistics/teams", headers=headers)
+    assert response.status_code == 200, response.text
+    by_team = {item["team_id"]: item for item in response.json()}
+    # 普通成员只统计自己负责的任务，管理员统计整个团队
+    assert by_team[team_a_id]["total"] == 2
+    assert by_team[team_b_id]["total"] == 1
+    assert by_team[team_b_id]["completion_rate"] == 100.0
+    assert query_counter.count == 3
+
+    response = client.get("/api/v1/tasks/statistics/teams",
+                          params={"team_ids": f"{team_a_id},{empty_id}"}, headers=auth_headers(admin))
+    by_team = {item["team_id"]: item for item in response.json()}
+    assert by_team[team_a_id]["total"] == 5
+    assert by_team[empty_id]["total"] == 0
+
+    response = client.get("/api/v1/tasks/statistics/teams",
+                          params={"team_ids": str(empty_id)}, headers=headers)
+    assert response.status_code == 403
+
+
+def test_statistics_grouped_by_project(db, make_user, make_team):
+    admin = make_user("projadmin")
+    team = make_team("项目团队", admin)
+    projects = [Project(name=f"项目{i}", team_id=team.id, creator_id=admin.id) for i in range(2)]
+    db.add_all(projects)
+    db.flush()
+    db.add_all([
+        _task(team, admin, "completed", project_id=projects[0].id),
+        _task(team, admin, "pending", project_id=projects[0].id),
+        _task(team, admin, "pending", project_id=projects[1].id),
+    ])
+    db.commit()
+
+    stats = task_statistics.get_statistics_by(db, Task.project_id, [p.id for p in projects])
+    assert stats[projects[0].id].completion_rate == 50.0
+    assert stats[projects[1].id].pending == 1
@@ -0,0 +1,87 @@
+from app.crud import task_tree
+from app.models.project import Project
+from app.models.task import Task
+from app.models.user import User
+
+
+def _task(db, title, team_id, creator_id, parent=None, project_id=None, status="pending",
+          estimated=0.0, actual=0.0, is_deleted=False):
+    task = Task(title=title, team_id=team_id, project_id=project_id, creator_id=creator_id,
+                parent_task_id=parent.id if parent else None, status=status,
+                estimated_hours=estimated, actual_hours=actual, is_deleted=is_deleted)
+    db.add(task)
+    db.flush()
+    return task
+
+
+def _seed(db, make_user, make_team):
+    alice = make_user("alice")
+    team = make_team("团队A", alice)
+    project = Project(name="项目A", team_id=team.id, creator_id=alice.id)
+    db.add(project)
+    db.flush()
+    ids = dict(team_id=team.id, creator_id=alice.id, project_id=project.id)
+    root = _task(db, "版本发布", **ids, estimated=2)
+    backend = _task(db, "后端", **ids, parent=root, estimated=4, actual=3)
+    _task(db, "接口", **ids, parent=backend, status="completed", estimated=6, actual=7)
+    _task(db, "迁移", **ids, parent=backend, estimated=2)
+    _task(db, "废弃方案", **ids, parent=backend, status="cancelled", estimated=10)
+    _task(db, "已删除", **ids, parent=backend, is_deleted=True, estimated=100)
+    frontend = _task(db, "前端", **ids, parent=root, status="completed", estimated=4, actual=5)
+    other = _task(db, "独立任务", **ids, status="completed")
+    db.commit()
+    return dict(team_id=team.id, project_id=project.id, alice_id=alice.id, root=root.id,
+                backend=backend.id, frontend=frontend.id, other=other.id)
+
+
+def test_task_tree_rolls_up_in_one_query(db, make_user, make_team, query_counter):
+    ids = _seed(db, make_user, make_team)
+
+    with query_counter:
+        tree = task_tree.get_task_tree(db, ids["root"])
+    assert query_counter.count == 1
+    assert "RECURSIVE" in query_counter.statements[0].upper()
+
+    assert [child["title"] for child in tree["children"]] == ["后端", "前端"]
+    backend = tree["children"][0]
+    assert [child["title"] for child in backend["children"]] == ["接口", "迁移", "废弃方案"]
+    assert backend["children"][0]["depth"] == 2
+    assert backend["total_estimated_hours"] == 22 and backend["total_actual_hours"] == 10
+    assert backend["task_count"] == 4
+    # 已取消的任务不计入完成度：6 / (4 + 6 + 2)
+    assert backend["progress"] == 50.0
+    assert tree["total_estimated_hours"] == 28 and tree["task_count"] == 6
+    assert tree["progress"] == 55.6
+
+    assert task_tree.get_task_tree(db, 999) is None
+
+
+def test_project_tree(db, make_user, make_team):
+    ids = _seed(db, make_user, make_team)
+    result = task_tree.get_project_tree(db, ids["project_id"])
+    assert [root["id"] for root in result["roots"]] == [ids["root"], ids["other"]]
+    assert result["task_count"] == 7
+    assert result["total_estimated_hours"] == 28
+    # 只有「独立任务」没有预估工时，按预估工时加权
+    assert result["progress"] == 55.6
+
+
+def test_tree_endpoints(client, db, make_user, make_team, auth_headers):
+    ids = _seed(db, make_user, make_team)
+    alice = db.get(User, ids["alice_id"])
+    outsider = make_user("outsider")
+
+    response = client.get(f"/api/v1/tasks/{ids['backend']}/tree", headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["id"] == ids["backend"] and len(body["children"]) == 3
+
+    response = client.get("/api/v1/tasks/tree", params={"project_id": ids["project_id"]},
+                          headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    assert response.json()["roots"][0]["children"][1]["id"] == ids["frontend"]
+
+    assert client.get(f"/api/v1/tasks/{ids['root']}/tree", headers=auth_headers(outsider)).status_code == 403
+    assert client.get("/api/v1/tasks/tree", params={"project_id": ids["project_id"]},
+                      headers=auth_headers(outsider)).status_code == 403
+    assert client.get("/api/v1/tasks/999/tree", headers=auth_headers(alice)).status_code == 404
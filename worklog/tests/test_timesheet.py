@@ -0,0 +1,116 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.core import timesheet
+from app.models.project import Project
+from app.models.work_log import WorkLog
+
+START = date(2024, 6, 3)
+
+
+def _seed(db, make_user, make_team):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    idle = make_user("idle")
+    team = make_team("团队A", alice, members=[bob, idle])
+    project = Project(name="项目A", team_id=team.id, creator_id=alice.id)
+    db.add(project)
+    db.flush()
+    for offset, user, project_id, work_type, duration in [
+        (0, alice, project.id, "feature", 2.0),
+        (0, alice, project.id, "feature", 1.5),
+        (0, bob, None, "meeting", 1.0),
+        (2, bob, project.id, "bug", 3.0),
+        (5, alice, project.id, "feature", 8.0),  # 超出查询范围
+    ]:
+        start_time = datetime.combine(START + timedelta(days=offset), datetime.min.time()) + timedelta(hours=10)
+        # 日志在第二天补录，工时仍计入开始的那一天
+        db.add(WorkLog(user_id=user.id, team_id=team.id, project_id=project_id, work_type=work_type,
+                       content="日志", duration=duration, start_time=start_time,
+                       created_at=start_time + timedelta(days=1)))
+    # 没有开始时间的日志按创建时间计入，在查询范围之前
+    db.add(WorkLog(user_id=alice.id, team_id=team.id, work_type="meeting", content="日志", duration=4.0,
+                   created_at=datetime.combine(START - timedelta(days=1), datetime.min.time())))
+    db.commit()
+    return team, project, alice, bob, idle
+
+
+def test_timesheet_returns_pivot_matrices(client, db, make_user, make_team, auth_headers, query_counter):
+    team, project, alice, bob, idle = _seed(db, make_user, make_team)
+    params = {"team_id": team.id, "from": "2024-06-03", "to": "2024-06-05"}
+
+    with query_counter:
+        response = client.get("/api/v1/analytics/timesheet", params=params, headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    assert sum("FROM work_logs" in s for s in query_counter.statements) == 1
+    body = response.json()
+    users, days = body["axes"]
+    assert users["keys"] == sorted([alice.id, bob.id, idle.id])
+    assert users["labels"] == ["alice", "bob", "idle"]
+    assert days["keys"] == ["2024-06-03", "2024-06-04", "2024-06-05"]
+    assert body["hours"] == [[3.5, 0.0, 0.0], [1.0, 0.0, 3.0], [0.0, 0.0, 0.0]]
+    assert body["counts"] == [[2, 0, 0], [1, 0, 1], [0, 0, 0]]
+    assert body["margins"] == [[3.5, 4.0, 0.0], [4.5, 0.0, 3.0]]
+    assert body["total_hours"] == 7.5 and body["total_count"] == 4
+
+    params["group_by"] = "project,work_type"
+    body = client.get("/api/v1/analytics/timesheet", params=params, headers=auth_headers(alice)).json()
+    projects, work_types = body["axes"]
+    assert projects["keys"] == [0, project.id] and projects["labels"] == ["无项目", "项目A"]
+    assert work_types["keys"] == ["bug", "feature", "meeting"]
+    assert body["hours"] == [[0.0, 0.0, 1.0], [3.0, 3.5, 0.0]]
+
+
+def test_timesheet_validates_access_and_parameters(client, db, make_user, make_team, auth_headers):
+    team, _, alice, bob, _ = _seed(db, make_user, make_team)
+    outsider = make_user("outsider")
+    params = {"team_id": team.id, "from": "2024-06-03", "to": "2024-06-05"}
+
+    assert client.get("/api/v1/analytics/timesheet", params=params,
+                      headers=auth_headers(bob)).status_code == 403
+    assert client.get("/api/v1/analytics/timesheet", params=params,
+                      headers=auth_headers(outsider)).status_code == 403
+    response = client.get("/api/v1/analytics/timesheet", params={**params, "group_by": "user,team"},
+                          headers=auth_headers(alice))
+    assert response.status_code == 400
+    response = client.get("/api/v1/analytics/timesheet", params={**params, "from": "2023-01-01"},
+                          headers=auth_headers(alice))
+    assert response.status_code == 400
+
+
+def test_timesheet_without_numpy(db, make_user, make_team, monkeypatch):
+    monkeypatch.setattr(timesheet, "np", None)
+    team, project, alice, bob, idle = _seed(db, make_user, make_team)
+    result = timesheet.build_timesheet(db, team.id, START - timedelta(days=1), START + timedelta(days=2),
+                                       "work_type,day", use_numpy=True)
+    assert result["axes"][0]["keys"] == ["bug", "feature", "meeting"]
+    assert result["hours"] == [[0.0, 0.0, 0.0, 3.0], [0.0, 3.5, 0.0, 0.0], [4.0, 1.0, 0.0, 0.0]]
+    assert result["counts"] == [[0, 0, 0, 1], [0, 2, 0, 0], [1, 1, 0, 0]]
+    assert result["total_hours"] == 11.5 and result["total_count"] == 5
+
+
+def test_numpy_and_python_aggregation_agree(db, make_user, make_team):
+    pytest.importorskip("numpy")
+    team, *_ = _seed(db, make_user, make_team)
+    for group_by in ("user,day", "project,work_type,day", "work_type"):
+        vectorized = timesheet.build_timesheet(db, team.id, START, START + timedelta(days=6), group_by,
+                                               use_numpy=True)
+        plain = timesheet.build_timesheet(db, team.id, START, START + timedelta(days=6), group_by,
+                                          use_numpy=False)
+        assert vectorized == plain
+
+
+def test_range_filter_uses_team_start_index(db, engine, make_user, make_team, query_counter):
+    team, *_ = _seed(db, make_user, make_team)
+    with query_counter:
+        timesheet.load_columns(db, team.id, START, START + timedelta(days=90), ["user", "day"])
+    statement = query_counter.statements[-1]
+    assert "coalesce" not in statement.lower()
+
+    with engine.connect() as connection:
+        plan = [row[-1] for row in connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, (team.id, START, START, team.id, START, START)
+        )]
+    assert "SEARCH work_logs USING INDEX ix_work_logs_team_start (team_id=? AND start_time>? AND start_time<?)" in plan
+    assert "SEARCH work_logs USING INDEX ix_work_logs_team_start (team_id=? AND start_time=?)" in plan
@@ -0,0 +1,61 @@
+import time
+from datetime import timedelta
+
+from app.core.security import create_access_token
+from app.models.user import User
+
+
+def _user_queries(statements):
+    return [s for s in statements if "FROM users" in s]
+
+
+def test_current_user_is_cached_between_requests(client, make_user, auth_headers, query_counter):
+    user = make_user("cached")
+    headers = auth_headers(user)
+
+    with query_counter:
+        assert client.get("/api/v1/users/me", headers=headers).status_code == 200
+    assert len(_user_queries(query_counter.statements)) == 1
+
+    with query_counter:
+        response = client.get("/api/v1/users/me", headers=headers)
+        # v1 deps 中的 get_current_user 共用同一份缓存
+        assert client.get("/api/v1/tasks/statistics", headers=headers).status_code == 200
+    assert response.json()["username"] == "cached"
+    assert _user_queries(query_counter.statements) == []
+
+
+def test_update_me_invalidates_cached_user(client, make_user, auth_headers):
+    user = make_user("updater")
+    headers = auth_headers(user)
+    assert client.get("/api/v1/users/me", headers=headers).json()["email"] == "updater@example.com"
+
+    response = client.put("/api/v1/users/me", json={"email": "new@example.com"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert client.get("/api/v1/users/me", headers=headers).json()["email"] == "new@example.com"
+
+
+def test_deactivation_elsewhere_invalidates_cached_user(client, session_factory, make_user, auth_headers):
+    user = make_user("deactivated")
+    headers = auth_headers(user)
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 200
+
+    other = session_factory()
+    stored = other.query(User).filter_by(username="deactivated").one()
+    stored.is_active = False
+    stored.email = "gone@example.com"
+    other.commit()
+    other.close()
+
+    # 任何ORM更新都会使快照失效，下一次请求读取到最新数据
+    assert client.get("/api/v1/users/me", headers=headers).json()["email"] == "gone@example.com"
+
+
+def test_cached_token_still_expires(client, make_user):
+    make_user("shortlived")
+    token = create_access_token(data={"sub": "shortlived"}, expires_delta=timedelta(seconds=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 200
+
+    time.sleep(2.1)
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 401
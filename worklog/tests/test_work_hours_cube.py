@@ -0,0 +1,201 @@
+from datetime import date, datetime, timedelta
+
+from app.core.timesheet import build_timesheet
+from app.core.work_hours_cube import period_start, work_hours_cube
+from app.models.project import Project
+from app.models.task import Task
+from app.models.user import User
+from app.models.work_log import WorkLog
+
+MONDAY = period_start(date.today(), "week")
+SUNDAY = MONDAY + timedelta(days=6)
+LAST_MONDAY = MONDAY - timedelta(days=7)
+
+
+def _log(db, user_id, team_id, day, work_type="feature", duration=1.0, project_id=None, task_id=None):
+    log = WorkLog(user_id=user_id, team_id=team_id, project_id=project_id, task_id=task_id,
+                  work_type=work_type, content="日志", duration=duration,
+                  created_at=datetime.combine(day, datetime.min.time()) + timedelta(hours=10))
+    db.add(log)
+    return log
+
+
+def _seed(db, make_user, make_team):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    team = make_team("团队A", alice, members=[bob])
+    project = Project(name="项目A", team_id=team.id, creator_id=alice.id)
+    db.add(project)
+    db.flush()
+    task = Task(title="任务A", team_id=team.id, project_id=project.id, creator_id=alice.id)
+    db.add(task)
+    db.flush()
+    _log(db, alice.id, team.id, LAST_MONDAY, duration=2, project_id=project.id, task_id=task.id)
+    _log(db, alice.id, team.id, LAST_MONDAY + timedelta(days=1), work_type="bug", duration=1, project_id=project.id)
+    _log(db, bob.id, team.id, LAST_MONDAY + timedelta(days=2), work_type="meeting", duration=1.5)
+    _log(db, bob.id, team.id, MONDAY, duration=3, project_id=project.id, task_id=task.id)
+    db.commit()
+    # 提交后对象已过期，先读出id，避免统计查询次数时重新加载
+    return team.id, project.id, task.id, alice.id, bob.id
+
+
+def test_cube_answers_slice_dice_and_rollup_in_memory(db, make_user, make_team, query_counter):
+    team_id, project_id, task_id, alice_id, bob_id = _seed(db, make_user, make_team)
+
+    with query_counter:
+        weekly = work_hours_cube.query(db, team_id, "week", LAST_MONDAY, SUNDAY, ["period"])
+    assert query_counter.count == 1
+    assert weekly["source"] == "cube"
+    assert weekly["rows"] == [
+        {"period": LAST_MONDAY, "count": 3, "hours": 4.5},
+        {"period": MONDAY, "count": 1, "hours": 3.0},
+    ]
+
+    with query_counter:
+        by_user = work_hours_cube.query(db, team_id, "week", LAST_MONDAY, SUNDAY, ["user", "work_type"])
+        sliced = work_hours_cube.query(db, team_id, "week", LAST_MONDAY, SUNDAY, ["period"],
+                                       {"user": [bob_id]})
+        diced = work_hours_cube.query(db, team_id, "week", LAST_MONDAY, SUNDAY, ["project"],
+                                      {"work_type": ["feature", "bug"], "user": [alice_id, bob_id]})
+    assert query_counter.count == 0
+    assert by_user["rows"] == [
+        {"user_id": alice_id, "work_type": "bug", "count": 1, "hours": 1.0},
+        {"user_id": alice_id, "work_type": "feature", "count": 1, "hours": 2.0},
+        {"user_id": bob_id, "work_type": "feature", "count": 1, "hours": 3.0},
+        {"user_id": bob_id, "work_type": "meeting", "count": 1, "hours": 1.5},
+    ]
+    assert sliced["rows"] == [
+        {"period": LAST_MONDAY, "count": 1, "hours": 1.5},
+        {"period": MONDAY, "count": 1, "hours": 3.0},
+    ]
+    assert diced["rows"] == [{"project_id": project_id, "count": 3, "hours": 6.0}]
+
+    monthly = work_hours_cube.query(db, team_id, "month", MONDAY, MONDAY, ["period"])
+    assert monthly["start_date"] == MONDAY.replace(day=1)
+    assert monthly["rows"][-1]["period"] == MONDAY.replace(day=1)
+
+
+def test_drill_down_falls_back_to_rollup(db, make_user, make_team):
+    team_id, project_id, task_id, alice_id, bob_id = _seed(db, make_user, make_team)
+
+    by_task = work_hours_cube.query(db, team_id, "week", LAST_MONDAY, MONDAY, ["task"])
+    assert by_task["source"] == "rollup"
+    assert by_task["rows"] == [
+        {"task_id": 0, "count": 2, "hours": 2.5},
+        {"task_id": task_id, "count": 2, "hours": 5.0},
+    ]
+    daily = work_hours_cube.query(db, team_id, "day", MONDAY, MONDAY, ["period", "user"])
+    assert daily["source"] == "rollup"
+    assert daily["rows"] == [{"period": MONDAY, "user_id": bob_id, "count": 1, "hours": 3.0}]
+
+
+def test_cube_follows_committed_writes(db, make_user, make_team, query_counter):
+    team_id, project_id, task_id, alice_id, bob_id = _seed(db, make_user, make_team)
+    work_hours_cube.query(db, team_id, "week", MONDAY, SUNDAY, ["user"])
+
+    log = _log(db, alice_id, team_id, MONDAY, duration=2)
+    db.commit()
+    log.duration = 4
+    db.commit()
+    _log(db, alice_id, team_id, MONDAY, duration=10)
+    db.flush()
+    db.rollback()
+
+    with query_counter:
+        result = work_hours_cube.query(db, team_id, "week", MONDAY, SUNDAY, ["user"])
+    assert query_counter.count == 0
+    assert result["rows"] == [
+        {"user_id": alice_id, "count": 1, "hours": 4.0},
+        {"user_id": bob_id, "count": 1, "hours": 3.0},
+    ]
+
+    db.delete(log)
+    db.commit()
+    result = work_hours_cube.query(db, team_id, "week", MONDAY, SUNDAY, ["user"])
+    assert result["rows"] == [{"user_id": bob_id, "count": 1, "hours": 3.0}]
+
+    # 与重新加载的结果一致
+    work_hours_cube.cache.clear()
+    assert work_hours_cube.query(db, team_id, "week", MONDAY, SUNDAY, ["user"]) == result
+
+
+def test_end_in_mid_period_matches_drill_down(db, make_user, make_team, query_counter):
+    team_id, project_id, task_id, alice_id, bob_id = _seed(db, make_user, make_team)
+    end = LAST_MONDAY + timedelta(days=1)
+
+    with query_counter:
+        weekly = work_hours_cube.query(db, team_id, "week", LAST_MONDAY, end, ["period"])
+    drilled = work_hours_cube.query(db, team_id, "week", LAST_MONDAY, end, ["period", "task"])
+    assert weekly["source"] == "cube"
+    # 加载立方体，再从汇总表读取不完整的最后一周
+    assert query_counter.count == 2
+    assert weekly["rows"] == [{"period": LAST_MONDAY, "count": 2, "hours": 3.0}]
+    assert drilled["source"] == "rollup"
+    assert sum(row["hours"] for row in drilled["rows"]) == 3.0
+
+
+def test_writes_committed_while_loading_are_not_lost(db, session_factory, make_user, make_team, monkeypatch):
+    team_id, project_id, task_id, alice_id, bob_id = _seed(db, make_user, make_team)
+    load = work_hours_cube.load
+
+    def load_then_write(*args, **kwargs):
+        cube = load(*args, **kwargs)
+        # 查询之后、缓存之前另一个请求提交了日志
+        other = session_factory()
+        _log(other, alice_id, team_id, MONDAY, duration=5)
+        other.commit()
+        other.close()
+        return cube
+
+    monkeypatch.setattr(work_hours_cube, "load", load_then_write)
+    stale = work_hours_cube.query(db, team_id, "week", MONDAY, SUNDAY, ["period"])
+    monkeypatch.setattr(work_hours_cube, "load", load)
+    fresh = work_hours_cube.query(db, team_id, "week", MONDAY, SUNDAY, ["period"])
+    assert stale["rows"] == [{"period": MONDAY, "count": 1, "hours": 3.0}]
+    assert fresh["rows"] == [{"period": MONDAY, "count": 2, "hours": 8.0}]
+
+
+def test_cube_endpoint(client, db, make_user, make_team, auth_headers):
+    team_id, project_id, task_id, alice_id, bob_id = _seed(db, make_user, make_team)
+    params = {"team_id": team_id, "from": LAST_MONDAY.isoformat(), "to": MONDAY.isoformat(),
+              "grain": "week", "group_by": "user", "work_type": "feature,meeting"}
+
+    alice, bob = db.get(User, alice_id), db.get(User, bob_id)
+    response = client.get("/api/v1/analytics/cube", params=params, headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["source"] == "cube"
+    assert body["rows"] == [
+        {"user_id": alice_id, "count": 1, "hours": 2.0},
+        {"user_id": bob_id, "count": 2, "hours": 4.5},
+    ]
+
+    assert client.get("/api/v1/analytics/cube", params=params, headers=auth_headers(bob)).status_code == 403
+    response = client.get("/api/v1/analytics/cube", params={**params, "group_by": "team"},
+                          headers=auth_headers(alice))
+    assert response.status_code == 400
+    response = client.get("/api/v1/analytics/cube", params={**params, "user": "x"},
+                          headers=auth_headers(alice))
+    assert response.status_code == 400
+
+
+def test_cube_and_timesheet_agree_on_backfilled_logs(db, make_user, make_team):
+    alice = make_user("alice")
+    team = make_team("团队A", alice)
+    team_id = team.id
+    # 本周补录上周的工作
+    db.add(WorkLog(user_id=alice.id, team_id=team_id, work_type="feature", content="补录", duration=2,
+                   start_time=datetime.combine(LAST_MONDAY, datetime.min.time()) + timedelta(hours=9),
+                   created_at=datetime.combine(MONDAY, datetime.min.time()) + timedelta(hours=10)))
+    _log(db, alice.id, team_id, MONDAY, duration=1)
+    db.commit()
+
+    weekly = work_hours_cube.query(db, team_id, "week", LAST_MONDAY, SUNDAY, ["period"])
+    assert weekly["rows"] == [
+        {"period": LAST_MONDAY, "count": 1, "hours": 2.0},
+        {"period": MONDAY, "count": 1, "hours": 1.0},
+    ]
+    for week in (LAST_MONDAY, MONDAY):
+        sheet = build_timesheet(db, team_id, week, week + timedelta(days=6), "user")
+        cube = work_hours_cube.query(db, team_id, "week", week, week + timedelta(days=6), ["period"])
+        assert sheet["total_hours"] == sum(row["hours"] for row in cube["rows"])
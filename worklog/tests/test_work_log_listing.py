@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+from app.models.project import Project
+from app.models.task import Task
+from app.models.work_log import WorkLog
+
+
+def _seed_work_logs(db, user, team, count):
+    project = Project(name="项目A", team_id=team.id, creator_id=user.id)
+    db.add(project)
+    db.flush()
+    task = Task(title="任务A", team_id=team.id, project_id=project.id, creator_id=user.id)
+    db.add(task)
+    db.flush()
+    base = datetime(2024, 1, 1, 9, 0)
+    for i in range(count):
+        db.add(WorkLog(
+            user_id=user.id,
+            team_id=team.id,
+            project_id=project.id,
+            task_id=task.id,
+            work_type="feature",
+            content=f"日志{i}",
+            start_time=base + timedelta(hours=i),
+            end_time=base + timedelta(hours=i, minutes=30),
+            duration=0.5,
+        ))
+    db.commit()
+
+
+def test_list_work_logs_includes_relation_names(client, db, make_user, make_team, auth_headers):
+    user = make_user("alice")
+    team = make_team("团队A", user)
+    _seed_work_logs(db, user, team, 3)
+
+    response = client.get("/api/v1/work-logs", headers=auth_headers(user))
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["total"] == 3
+    item = data["items"][0]
+    assert item["content"] == "日志2"
+    assert item["user_name"] == "alice"
+    assert item["team_name"] == "团队A"
+    assert item["project_name"] == "项目A"
+    assert item["task_title"] == "任务A"
+
+
+def test_list_work_logs_query_count_is_constant(client, db, make_user, make_team, auth_headers,
+                                                query_counter):
+    user = make_user("bob")
+    team = make_team("团队B", user)
+    headers = auth_headers(user)
+
+    _seed_work_logs(db, user, team, 2)
+    with query_counter:
+        response = client.get("/api/v1/work-logs", params={"page_size": 100}, headers=headers)
+    assert response.status_code == 200
+    small_page_count = query_counter.count
+
+    _seed_work_logs(db, user, team, 40)
+    with query_counter:
+        response = client.get("/api/v1/work-logs", params={"page_size": 100}, headers=headers)
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 42
+
+    # 总数统计 + 分页查询，当前用户第二次请求时来自缓存
+    assert query_counter.count <= small_page_count
+    assert query_counter.count <= 2
+
+
+def test_cursor_pagination_walks_all_work_logs(client, db, make_user, make_team, auth_headers,
+                                               query_counter):
+    user = make_user("carol")
+    team = make_team("团队C", user)
+    headers = auth_headers(user)
+    _seed_work_logs(db, user, team, 7)
+    # 相同开始时间的日志按id区分先后
+    db.add(WorkLog(user_id=user.id, content="同时刻", start_time=datetime(2024, 1, 1, 12, 0), duration=1))
+    db.commit()
+
+    seen = []
+    cursor = ""
+    while cursor is not None:
+        with query_counter:
+            response = client.get("/api/v1/work-logs",
+                                  params={"cursor": cursor, "page_size": 3}, headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["total"] is None
+        assert not any("count(" in s.lower() for s in query_counter.statements)
+        seen.extend(item["id"] for item in data["items"])
+        cursor = data["next_cursor"]
+
+    expected = [log.id for log in db.query(WorkLog).order_by(WorkLog.start_time.desc(), WorkLog.id.desc())]
+    assert seen == expected
+
+
+def test_invalid_cursor_is_rejected(client, make_user, auth_headers):
+    user = make_user("dave")
+    response = client.get("/api/v1/work-logs", params={"cursor": "not-a-cursor"},
+                          headers=auth_headers(user))
+    assert response.status_code == 400
+
+
+def test_single_and_task_views_match_list_serialization(client, db, make_user, make_team, auth_headers):
+    user = make_user("erin")
+    team = make_team("团队E", user)
+    headers = auth_headers(user)
+    _seed_work_logs(db, user, team, 2)
+
+    listed = client.get("/api/v1/work-logs", headers=headers).json()["items"]
+
+    single = client.get(f"/api/v1/work-logs/{listed[0]['id']}", headers=headers)
+    assert single.status_code == 200, single.text
+    assert single.json() == listed[0]
+
+    by_task = client.get(f"/api/v1/work-logs/task/{listed[0]['task_id']}", headers=headers)
+    assert by_task.status_code == 200, by_task.text
+    assert by_task.json() == listed
+
+
+def test_task_view_without_work_logs_returns_empty_list(client, db, make_user, make_team, auth_headers):
+    user = make_user("frank")
+    team = make_team("团队F", user)
+    headers = auth_headers(user)
+    _seed_work_logs(db, user, team, 1)
+    task_id = client.get("/api/v1/work-logs", headers=headers).json()["items"][0]["task_id"]
+
+    past_end = client.get(f"/api/v1/work-logs/task/{task_id}", params={"skip": 5}, headers=headers)
+    assert past_end.status_code == 200, past_end.text
+    assert past_end.json() == []
+
+    empty_task = Task(title="空任务", team_id=team.id, creator_id=user.id)
+    db.add(empty_task)
+    db.commit()
+    response = client.get(f"/api/v1/work-logs/task/{empty_task.id}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == []
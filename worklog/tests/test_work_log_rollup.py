@@ -0,0 +1,136 @@
+from datetime import date, datetime, timedelta
+
+from app.core import work_log_rollup
+from app.models.task import Task
+from app.models.work_log import WorkLog
+from app.models.work_log_rollup import WorkLogDailyRollup
+
+DAY = datetime(2024, 6, 3, 10, 0)
+
+
+def _rollup(db):
+    db.expire_all()
+    return sorted(
+        (r.day, r.team_id, r.project_id, r.task_id, r.user_id, r.work_type, r.count, round(r.total_duration, 6))
+        for r in db.query(WorkLogDailyRollup).all()
+    )
+
+
+def _log(db, user, team=None, task=None, work_type="feature", duration=1.0, created_at=DAY):
+    log = WorkLog(user_id=user.id, team_id=team.id if team else None, task_id=task.id if task else None,
+                  work_type=work_type, content="日志", duration=duration, created_at=created_at)
+    db.add(log)
+    return log
+
+
+def test_rollup_follows_create_update_delete(db, make_user, make_team):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    team = make_team("团队A", alice, members=[bob])
+    task = Task(title="任务A", team_id=team.id, creator_id=alice.id)
+    db.add(task)
+    db.commit()
+
+    first = _log(db, alice, team, task, duration=2)
+    _log(db, alice, team, task, duration=1.5)
+    moved = _log(db, bob, team, work_type="bug", duration=1)
+    personal = _log(db, bob, duration=3, created_at=DAY - timedelta(days=1))
+    db.commit()
+    assert _rollup(db) == [
+        (date(2024, 6, 2), 0, 0, 0, bob.id, "feature", 1, 3.0),
+        (date(2024, 6, 3), team.id, 0, 0, bob.id, "bug", 1, 1.0),
+        (date(2024, 6, 3), team.id, 0, task.id, alice.id, "feature", 2, 3.5),
+    ]
+
+    # 修改时长、工作类型和任务：旧汇总键减一条，新汇总键加一条
+    first.duration = 4
+    moved.work_type = "meeting"
+    moved.task_id = task.id
+    db.commit()
+    db.delete(personal)
+    db.commit()
+    assert _rollup(db) == [
+        (date(2024, 6, 3), team.id, 0, task.id, alice.id, "feature", 2, 5.5),
+        (date(2024, 6, 3), team.id, 0, task.id, bob.id, "meeting", 1, 1.0),
+    ]
+
+    # 失败的事务不留下汇总
+    _log(db, alice, team, task)
+    db.flush()
+    db.rollback()
+    incremental = _rollup(db)
+    assert incremental[0][6] == 2
+
+    assert work_log_rollup.rebuild(db) == 2
+    db.commit()
+    assert _rollup(db) == incremental
+
+
+def test_rebuild_limits_to_date_range(db, make_user):
+    alice = make_user("alice")
+    _log(db, alice, created_at=DAY)
+    _log(db, alice, created_at=DAY - timedelta(days=1))
+    db.commit()
+    db.query(WorkLogDailyRollup).update({"count": 99})
+    db.commit()
+
+    assert work_log_rollup.rebuild(db, start=DAY.date(), end=DAY.date()) == 1
+    db.commit()
+    assert [(r[0], r[6]) for r in _rollup(db)] == [(date(2024, 6, 2), 99), (date(2024, 6, 3), 1)]
+
+
+def test_rollup_dates_logs_by_start_time(db, make_user):
+    alice = make_user("alice")
+    # 补录的日志计入开始时间的日期，没有开始时间的按创建时间
+    backfilled = WorkLog(user_id=alice.id, work_type="feature", content="补录", duration=2.0,
+                         start_time=DAY - timedelta(days=3), created_at=DAY)
+    db.add(backfilled)
+    _log(db, alice, duration=1.0)
+    db.commit()
+    assert [(r[0], r[6], r[7]) for r in _rollup(db)] == [
+        (date(2024, 5, 31), 1, 2.0),
+        (date(2024, 6, 3), 1, 1.0),
+    ]
+
+    backfilled.start_time = DAY - timedelta(days=2)
+    db.commit()
+    incremental = _rollup(db)
+    assert [(r[0], r[6]) for r in incremental] == [(date(2024, 6, 1), 1), (date(2024, 6, 3), 1)]
+
+    assert work_log_rollup.rebuild(db, start=date(2024, 6, 1), end=date(2024, 6, 1)) == 1
+    db.commit()
+    assert _rollup(db) == incremental
+
+
+def test_reports_read_rollup(client, db, make_user, make_team, auth_headers, query_counter):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    team = make_team("团队A", alice, members=[bob])
+    task = Task(title="任务A", team_id=team.id, creator_id=alice.id)
+    db.add(task)
+    db.commit()
+    for i in range(20):
+        _log(db, alice if i % 2 else bob, team, task, work_type="bug" if i % 4 == 0 else "feature", duration=0.5)
+    _log(db, alice, team, created_at=DAY + timedelta(days=1))
+    db.commit()
+
+    with query_counter:
+        response = client.get("/api/v1/teams/team-daily-report", params={"target_date": "2024-06-03"},
+                              headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    assert not any("FROM work_logs" in s for s in query_counter.statements)
+    report = response.json()
+    assert report["total_logs"] == 20
+    assert report["work_type_stats"] == {"bug": {"count": 5, "total_duration": 2.5},
+                                         "feature": {"count": 15, "total_duration": 7.5}}
+    assert report["user_stats"][str(alice.id)]["username"] == "alice"
+    assert report["user_stats"][str(alice.id)]["count"] == 10
+    assert report["user_stats"][str(bob.id)]["work_types"]["bug"] == {"count": 5, "total_duration": 2.5}
+
+    response = client.get(f"/api/v1/work-logs/task/{task.id}/summary", headers=auth_headers(alice))
+    assert response.status_code == 200, response.text
+    summary = response.json()
+    assert summary["total_hours"] == 10.0
+    assert summary["work_log_count"] == 20
+    assert sorted((s["work_type"], s["count"]) for s in summary["work_type_stats"]) == [("bug", 5), ("feature", 15)]
+    assert sorted((s["user_id"], s["hours"]) for s in summary["user_stats"]) == [(alice.id, 5.0), (bob.id, 5.0)]
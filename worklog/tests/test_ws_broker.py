@@ -0,0 +1,106 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.core.ws_broker import Broker, InMemoryBroker, RedisBroker, create_broker, user_channel
+from app.core.ws_manager import ConnectionManager
+
+
+def test_message_reaches_user_connected_to_another_worker(fake_websocket):
+    async def scenario():
+        hub = {}
+        worker_a = ConnectionManager(broker=InMemoryBroker(hub))
+        worker_b = ConnectionManager(broker=InMemoryBroker(hub))
+        socket = fake_websocket()
+        await worker_b.connect(7, socket)
+
+        await worker_a.send_team_message([7, 8], {"type": "team_notification", "team_id": 1})
+        await worker_b.flush(timeout=1)
+        assert socket.sent == [{"type": "team_notification", "team_id": 1}]
+        assert not worker_a.is_user_connected(7)
+
+    asyncio.run(scenario())
+
+
+def test_channel_is_unsubscribed_after_last_connection_closes(fake_websocket):
+    async def scenario():
+        broker = InMemoryBroker()
+        manager = ConnectionManager(broker=broker)
+        first, second = fake_websocket(), fake_websocket()
+        await manager.connect(3, first)
+        await manager.connect(3, second)
+        assert broker.subscriptions() == {user_channel(3)}
+
+        await manager.disconnect(3, first)
+        await asyncio.sleep(0)
+        assert broker.subscriptions() == {user_channel(3)}
+
+        await manager.disconnect(3, second)
+        await asyncio.sleep(0)
+        assert broker.subscriptions() == set()
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_reaches_every_worker(fake_websocket):
+    async def scenario():
+        hub = {}
+        worker_a = ConnectionManager(broker=InMemoryBroker(hub))
+        worker_b = ConnectionManager(broker=InMemoryBroker(hub))
+        await worker_a.start()
+        await worker_b.start()
+        local, remote = fake_websocket(), fake_websocket()
+        await worker_a.connect(1, local)
+        await worker_b.connect(2, remote)
+
+        await worker_a.broadcast('{"type": "announcement"}')
+        await worker_a.flush(timeout=1)
+        await worker_b.flush(timeout=1)
+        return local.sent, remote.sent
+
+    assert asyncio.run(scenario()) == ([{"type": "announcement"}], [{"type": "announcement"}])
+
+
+def test_broker_interface_is_abstract():
+    with pytest.raises(TypeError):
+        Broker()
+
+
+def test_create_broker_rejects_unknown_backend():
+    assert isinstance(create_broker("memory"), InMemoryBroker)
+    with pytest.raises(ValueError):
+        create_broker("kafka")
+
+
+def test_redis_broker_delivers_across_managers(fake_websocket):
+    redis = pytest.importorskip("redis.asyncio")
+
+    async def scenario():
+        probe = redis.Redis()
+        try:
+            await probe.ping()
+        except Exception:
+            pytest.skip("本地没有可用的Redis服务")
+        finally:
+            await probe.aclose()
+
+        worker_a = ConnectionManager(broker=RedisBroker())
+        worker_b = ConnectionManager(broker=RedisBroker())
+        await worker_a.start()
+        await worker_b.start()
+        user_id = uuid.uuid4().int % 10 ** 9
+        socket = fake_websocket()
+        try:
+            await worker_b.connect(user_id, socket)
+            await worker_a.send_json_message(user_id, {"type": "ping"})
+            for _ in range(100):
+                if socket.sent:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await worker_a.close_all()
+            await worker_b.close_all()
+        assert socket.sent == [{"type": "ping"}]
+
+    asyncio.run(scenario())
@@ -0,0 +1,133 @@
+import asyncio
+import json
+
+from app.core import ws_manager as ws_manager_module
+from app.core.ws_manager import ConnectionManager
+
+
+class BlockedWebSocket:
+    """send_text 一直阻塞直到放行，模拟网络很慢的客户端"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self.release = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        await self.release.wait()
+        self.sent.append(json.loads(message))
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+def test_slow_client_does_not_delay_others(fake_websocket):
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        slow, fast = BlockedWebSocket(), fake_websocket()
+        await manager.connect(1, slow)
+        await manager.connect(2, fast)
+
+        for i in range(3):
+            await manager.send_team_message([1, 2], {"seq": i})
+        await asyncio.sleep(0.01)
+        assert [frame["seq"] for frame in fast.sent] == [0, 1, 2]
+        assert slow.sent == []
+
+        slow.release.set()
+        await manager.flush(timeout=1)
+        assert [frame["seq"] for frame in slow.sent] == [0, 1, 2]
+
+    asyncio.run(scenario())
+
+
+def test_drop_oldest_policy_keeps_latest_messages():
+    async def scenario():
+        manager = ConnectionManager(queue_size=2, send_timeout=5, slow_consumer_policy="drop_oldest")
+        slow = BlockedWebSocket()
+        connection = await manager.connect(1, slow)
+
+        await manager.send_json_message(1, {"seq": 0})
+        await asyncio.sleep(0)  # 写任务取走第0条后阻塞在发送上
+        for i in range(1, 5):
+            await manager.send_json_message(1, {"seq": i})
+
+        slow.release.set()
+        await manager.flush(timeout=1)
+        assert [frame["seq"] for frame in slow.sent] == [0, 3, 4]
+        assert connection.dropped == 2
+        assert manager.is_user_connected(1)
+
+    asyncio.run(scenario())
+
+
+def test_disconnect_policy_evicts_slow_consumer():
+    async def scenario():
+        manager = ConnectionManager(queue_size=1, send_timeout=5, slow_consumer_policy="disconnect")
+        slow = BlockedWebSocket()
+        await manager.connect(1, slow)
+
+        for i in range(3):
+            await manager.send_json_message(1, {"seq": i})
+        await asyncio.sleep(0)
+        assert not manager.is_user_connected(1)
+        assert slow.closed
+
+    asyncio.run(scenario())
+
+
+def test_send_timeout_evicts_connection():
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=0.05)
+        slow = BlockedWebSocket()
+        await manager.connect(1, slow)
+
+        await manager.send_json_message(1, {"seq": 0})
+        await asyncio.sleep(0.2)
+        assert not manager.is_user_connected(1)
+        assert slow.closed
+
+    asyncio.run(scenario())
+
+
+def test_team_message_is_serialized_once(monkeypatch, fake_websocket):
+    calls = []
+    real_dumps = json.dumps
+
+    def counting_dumps(*args, **kwargs):
+        calls.append(args)
+        return real_dumps(*args, **kwargs)
+
+    monkeypatch.setattr(ws_manager_module.json, "dumps", counting_dumps)
+
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        sockets = [fake_websocket() for _ in range(3)]
+        for user_id, socket in enumerate(sockets, start=1):
+            await manager.connect(user_id, socket)
+        await manager.send_team_message([1, 2, 3], {"type": "team_notification"})
+        await manager.flush(timeout=1)
+        return sockets
+
+    sockets = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(len(socket.sent) == 1 for socket in sockets)
+
+
+def test_disconnect_removes_only_that_socket(fake_websocket):
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        first, second = fake_websocket(), fake_websocket()
+        await manager.connect(1, first)
+        await manager.connect(1, second)
+        await manager.disconnect(1, first)
+
+        await manager.send_json_message(1, {"seq": 0})
+        await manager.flush(timeout=1)
+        assert first.sent == []
+        assert second.sent == [{"seq": 0}]
+
+    asyncio.run(scenario())
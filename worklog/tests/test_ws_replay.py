@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+from app.core.ws_manager import ConnectionManager
+from app.crud.message import message_crud
+from app.schemas.message import MessageCreate
+
+
+def _send(db, recipients, title="通知"):
+    return message_crud.create(db, obj_in=MessageCreate(
+        title=title, content="内容", message_type="system", priority="normal", recipients=recipients
+    ))
+
+
+def test_get_missed_returns_newer_messages_in_id_order(db, make_user):
+    alice = make_user("alice")
+    bob = make_user("bob")
+    ids = [_send(db, [alice.id], title=f"消息{i}").id for i in range(5)]
+    _send(db, [bob.id])
+
+    messages, truncated = message_crud.get_missed(db, alice.id, ids[1], limit=10)
+    assert [m.id for m in messages] == ids[2:]
+    assert not truncated
+
+    messages, truncated = message_crud.get_missed(db, alice.id, ids[0], limit=2)
+    assert [m.id for m in messages] == ids[1:3]
+    assert truncated
+
+
+def test_live_messages_wait_for_replay_without_duplicates(fake_websocket):
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        socket = fake_websocket()
+        connection = await manager.connect(1, socket, replay=True)
+
+        # 补发查询期间到达的实时消息：id 11 同时在补发结果中，id 12 不在
+        await manager.send_json_message(1, {"type": "system_notification", "message_id": 11})
+        await manager.send_json_message(1, {"type": "system_notification", "message_id": 12})
+        await manager.send_json_message(1, {"type": "unread_count", "unread_count": 3})
+        await asyncio.sleep(0.01)
+        assert socket.sent == []
+
+        frames = [json.dumps({"type": "system_notification", "message_id": i, "replayed": True}) for i in (10, 11)]
+        connection.finish_replay(frames, 11)
+        await manager.flush(timeout=1)
+        return socket.sent
+
+    sent = asyncio.run(scenario())
+    assert [(frame["type"], frame.get("message_id")) for frame in sent] == [
+        ("system_notification", 10),
+        ("system_notification", 11),
+        ("system_notification", 12),
+        ("unread_count", None),
+    ]
+
+
+def test_late_push_of_replayed_message_is_skipped(fake_websocket):
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        socket = fake_websocket()
+        connection = await manager.connect(1, socket, replay=True)
+        frames = [json.dumps({"type": "system_notification", "message_id": 11, "replayed": True})]
+        connection.finish_replay(frames, 11)
+
+        # 查询补发前已提交、补发结束后才推送的消息不再重复发送
+        await manager.send_json_message(1, {"type": "system_notification", "message_id": 11})
+        await manager.send_json_message(1, {"type": "system_notification", "message_id": 12})
+        await manager.flush(timeout=1)
+        return socket.sent
+
+    sent = asyncio.run(scenario())
+    assert [(frame.get("message_id"), frame.get("replayed", False)) for frame in sent] == [(11, True), (12, False)]
+
+
+def test_reconnect_with_last_seen_id_replays_missed_messages(client, db, make_user, auth_headers):
+    alice = make_user("alice")
+    token = auth_headers(alice)["Authorization"].split()[1]
+    seen = _send(db, [alice.id]).id
+    missed = [_send(db, [alice.id], title=f"离线消息{i}").id for i in range(2)]
+
+    with client.websocket_connect(f"/api/v1/ws/messages/?token={token}&last_seen_id={seen}") as websocket:
+        replayed = [websocket.receive_json() for _ in missed]
+        complete = websocket.receive_json()
+        # 补发期间的实时推送在补发完成后发送
+        assert websocket.receive_json()["type"] == "unread_count"
+
+    assert [frame["message_id"] for frame in replayed] == missed
+    assert all(frame["replayed"] for frame in replayed)
+    assert complete == {"type": "replay_complete", "last_id": missed[-1], "count": 2, "truncated": False}
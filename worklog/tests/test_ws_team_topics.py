@@ -0,0 +1,150 @@
+import asyncio
+import threading
+from functools import partial
+
+from app.core.membership import MembershipService
+from app.core.message_service import message_push_service
+from app.core.ws_broker import InMemoryBroker, team_channel
+from app.core.ws_manager import ConnectionManager, ws_manager
+
+
+def test_team_publish_reaches_online_members_except_excluded(fake_websocket):
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        sockets = {user_id: fake_websocket() for user_id in (1, 2, 3, 4)}
+        await manager.connect(1, sockets[1], team_ids=[10])
+        await manager.connect(2, sockets[2], team_ids=[10, 20])
+        await manager.connect(3, sockets[3], team_ids=[10])
+        await manager.connect(4, sockets[4], team_ids=[20])
+
+        await manager.send_to_team(10, {"type": "team_notification"}, exclude_user_ids=[3])
+        await manager.flush(timeout=1)
+        assert manager.team_members[10] == {1, 2, 3}
+        return sockets
+
+    sockets = asyncio.run(scenario())
+    assert [len(sockets[user_id].sent) for user_id in (1, 2, 3, 4)] == [1, 1, 0, 0]
+
+
+def test_team_channel_follows_online_members(fake_websocket):
+    async def scenario():
+        broker = InMemoryBroker()
+        manager = ConnectionManager(queue_size=10, send_timeout=5, broker=broker)
+        first, second = fake_websocket(), fake_websocket()
+        await manager.connect(1, first, team_ids=[10])
+        await manager.connect(2, second, team_ids=[10])
+        assert team_channel(10) in broker.subscriptions()
+
+        await manager.disconnect(1, first)
+        await asyncio.sleep(0)
+        assert team_channel(10) in broker.subscriptions()
+
+        await manager.disconnect(2, second)
+        await asyncio.sleep(0)
+        assert team_channel(10) not in broker.subscriptions()
+        assert manager.team_members == {} and manager.user_teams == {}
+
+    asyncio.run(scenario())
+
+
+def test_team_publish_reaches_members_on_other_workers(fake_websocket):
+    async def scenario():
+        hub = {}
+        worker_a = ConnectionManager(queue_size=10, send_timeout=5, broker=InMemoryBroker(hub))
+        worker_b = ConnectionManager(queue_size=10, send_timeout=5, broker=InMemoryBroker(hub))
+        socket = fake_websocket()
+        await worker_b.connect(1, socket, team_ids=[10])
+
+        await worker_a.send_to_team(10, {"type": "team_notification"})
+        await worker_b.flush(timeout=1)
+        return socket.sent
+
+    assert asyncio.run(scenario()) == [{"type": "team_notification"}]
+
+
+def test_membership_change_refreshes_team_index(fake_websocket):
+    memberships = {1: [10]}
+    service = MembershipService(ttl=60, max_size=100)
+
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        await manager.start()
+        manager.set_team_loader(lambda user_id: memberships[user_id])
+        service.add_listener(manager.refresh_teams)
+        await manager.connect(1, fake_websocket(), team_ids=memberships[1])
+
+        # 成员关系在请求线程中变更并失效缓存
+        memberships[1] = [20]
+        thread = threading.Thread(target=service.invalidate, args=(1,))
+        thread.start()
+        thread.join()
+        for _ in range(50):
+            if 20 in manager.team_members:
+                break
+            await asyncio.sleep(0.01)
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert manager.team_members == {20: frozenset({1})}
+    assert manager.user_teams == {1: frozenset({20})}
+
+
+def test_team_notification_uses_cached_roster_and_team_channel(db, make_user, make_team, fake_websocket,
+                                                               query_counter):
+    admin = make_user("admin")
+    members = [make_user(f"member{i}") for i in range(3)]
+    team = make_team("团队A", admin, members=members)
+    joined = members[0]
+    sockets = {user.id: fake_websocket() for user in [admin, *members]}
+    message_push_service.get_team_member_ids(db, team.id)
+
+    async def scenario():
+        for user_id, socket in sockets.items():
+            await ws_manager.connect(user_id, socket, team_ids=[team.id])
+        with query_counter:
+            await message_push_service.notify_team_member_joined(db, team.id, joined.id)
+        await ws_manager.flush(timeout=1)
+
+    asyncio.run(scenario())
+    assert not [s for s in query_counter.statements if "team_members" in s]
+    received = {user_id for user_id, socket in sockets.items() if socket.sent}
+    assert received == {admin.id, members[1].id, members[2].id}
+    assert all(socket.sent[0]["type"] == "team_notification" for socket in sockets.values() if socket.sent)
+
+
+def test_membership_change_reaches_other_workers(fake_websocket):
+    memberships = {1: [10]}
+    hub = {}
+
+    async def scenario():
+        workers, services = [], []
+        for _ in range(2):
+            manager = ConnectionManager(queue_size=10, send_timeout=5, broker=InMemoryBroker(hub))
+            await manager.start()
+            manager.set_team_loader(lambda user_id: memberships[user_id])
+            service = MembershipService(ttl=60, max_size=100)
+            service.add_listener(manager.refresh_teams)
+            service.set_publisher(partial(manager.publish_event, "membership"))
+            manager.add_event_handler("membership", service.apply_remote)
+            workers.append(manager)
+            services.append(service)
+        worker_a, worker_b = workers
+        socket = fake_websocket()
+        await worker_b.connect(1, socket, team_ids=memberships[1])
+        services[1].team_cache.set(10, {1: "member"})
+
+        # 用户在 worker_a 处理的请求中被移出团队
+        memberships[1] = []
+        services[0].invalidate(1)
+        for _ in range(50):
+            if 10 not in worker_b.team_members:
+                break
+            await asyncio.sleep(0.01)
+        await worker_a.send_to_team(10, {"type": "team_notification"})
+        await worker_b.flush(timeout=1)
+        return worker_b, services[1], socket
+
+    worker_b, service_b, socket = asyncio.run(scenario())
+    assert worker_b.team_members == {} and worker_b.user_teams == {}
+    assert service_b.team_cache.get(10) is None
+    assert socket.sent == []